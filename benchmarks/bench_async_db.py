@@ -0,0 +1,156 @@
+# benchmarks/bench_async_db.py
+"""
+Requests/s de GET /products/{id} con alta concurrencia: modo síncrono (threadpool de
+Starlette, 40 hilos) frente a DB_ASYNC=true (AsyncSession en el event loop).
+
+Para que la latencia de red de MySQL cuente, cada sentencia SQL duerme --latency-ms
+en el hilo que la ejecuta (hilo del threadpool en modo síncrono, hilo de aiosqlite
+en modo async). Con el mismo pool, el modo síncrono no pasa de 40 consultas en vuelo.
+Cliente y app comparten proceso, así que con latencias bajas ambos modos topan con la
+CPU antes que con la BD; por eso la latencia por defecto es alta. La concurrencia no
+debe superar el pool en modo síncrono: el cierre de la sesión también necesita un hilo.
+
+Resultado de referencia (2000 requests, concurrencia 100, pool 100, 100 ms/sentencia):
+sync 187 req/s (p50 519 ms) · async 267 req/s (p50 337 ms).
+
+Uso (desde la raíz; importa catalog_service completo, así que necesita el MySQL del
+.env accesible al arrancar, como los self-tests):
+> python benchmarks/bench_async_db.py [--requests 2000] [--concurrency 100] [--pool 100] [--latency-ms 100]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+CATALOG = ROOT / "services" / "catalog_service"
+
+
+def add_latency(sync_engine, seconds: float) -> None:
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_conn, rec):
+        raw = getattr(dbapi_conn, "driver_connection", dbapi_conn)  # aiosqlite.Connection o sqlite3
+        raw = getattr(raw, "_conn", raw)
+        raw.set_trace_callback(lambda _stmt: time.sleep(seconds))
+
+
+async def run_mode(args) -> dict:
+    sys.path.insert(0, str(CATALOG))
+    import httpx
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.main import app
+    from app.database import Base
+    from app.deps import get_async_db, get_db
+    from app.models import Category, Product
+    from common.db import make_async_sessionmaker, make_sessionmaker
+
+    path = Path(tempfile.mkdtemp()) / "bench.db"
+    pool = dict(pool_size=args.pool, max_overflow=0, pool_timeout=60)
+    engine = create_engine(f"sqlite+pysqlite:///{path}", connect_args={"check_same_thread": False}, **pool)
+    Base.metadata.create_all(bind=engine)
+    Session = make_sessionmaker(engine)
+    with Session() as db:
+        cat = Category(name="Bench"); db.add(cat); db.flush()
+        db.add_all(
+            Product(category_id=cat.id, name=f"Producto {i}", price=Decimal("1000.00"), vat_rate=Decimal("19.00"), stock=10)
+            for i in range(args.products)
+        )
+        db.commit()
+
+    async_engine = None
+    if os.environ.get("DB_ASYNC") == "true":
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"check_same_thread": False}, **pool)
+        add_latency(async_engine.sync_engine, args.latency_ms / 1000)
+        AsyncSession = make_async_sessionmaker(async_engine)
+
+        async def override_async():
+            async with AsyncSession() as db:
+                yield db
+
+        app.dependency_overrides[get_async_db] = override_async
+    else:
+        add_latency(engine, args.latency_ms / 1000)
+
+        def override_sync():
+            db = Session()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = override_sync
+
+    sem = asyncio.Semaphore(args.concurrency)
+    lat: list[float] = []
+    errors = 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def one(i: int):
+            nonlocal errors
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.get(f"/products/{i % args.products + 1}")
+                lat.append(time.perf_counter() - t0)
+                errors += r.status_code != 200
+
+        await asyncio.gather(*(one(i) for i in range(min(200, args.requests))))  # calentar el pool
+        lat.clear()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - t0
+
+    if async_engine is not None:
+        await async_engine.dispose()  # cierra los hilos de aiosqlite; si no, el proceso no termina
+    engine.dispose()
+    lat.sort()
+    return {
+        "rps": args.requests / elapsed,
+        "p50_ms": statistics.median(lat) * 1000,
+        "p99_ms": lat[int(len(lat) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=100)
+    ap.add_argument("--pool", type=int, default=100)
+    ap.add_argument("--latency-ms", type=float, default=100.0)
+    ap.add_argument("--products", type=int, default=500)
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(run_mode(args))))
+        return
+
+    # cada modo en su propio proceso: DB_ASYNC se lee al importar la app
+    print(f"{args.requests} requests, concurrencia {args.concurrency}, pool {args.pool}, {args.latency_ms} ms por sentencia")
+    print(f"{'modo':<8} | {'req/s':>8} | {'p50 ms':>8} | {'p99 ms':>8} | {'errores':>7}")
+    print("-" * 50)
+    for mode, flag in (("sync", "false"), ("async", "true")):
+        cp = subprocess.run(
+            [sys.executable, __file__, "--child", *sys.argv[1:]],
+            cwd=CATALOG, env={**os.environ, "DB_ASYNC": flag}, capture_output=True, text=True,
+        )
+        if cp.returncode != 0:
+            print(f"{mode:<8} | error:\n{cp.stderr}")
+            continue
+        res = json.loads(cp.stdout.strip().splitlines()[-1])
+        print(f"{mode:<8} | {res['rps']:>8.0f} | {res['p50_ms']:>8.1f} | {res['p99_ms']:>8.1f} | {res['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/bench_auth_deps.py
+"""
+Coste por request de la dependencia de autenticación (catalog_service.deps):
+
+- db:         jwt.decode + db.get(User) (modo AUTH_VERIFIED_PRINCIPAL=false, SQLite en memoria)
+- principal:  jwt.decode + caché de usuarios (sin caché de tokens)
+- principal+: caché de tokens verificados + caché de usuarios
+
+Uso (desde la raíz):
+> python benchmarks/bench_auth_deps.py [--n 20000]
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "services" / "catalog_service"))
+
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.deps as deps
+from app.config import settings
+from app.database import Base
+from app.models import User
+
+
+def per_call_us(fn, n: int) -> float:
+    for _ in range(min(1000, n)):  # calentar cachés
+        fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    args = ap.parse_args()
+
+    engine = create_engine("sqlite+pysqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        u = User(email="bench@example.com", hashed_password="x", is_admin=0)
+        db.add(u); db.commit()
+        uid = u.id
+    deps.SessionLocal = Session
+    deps.auth.revocations.interval = 0  # sin auth_service: solo la búsqueda en memoria
+
+    exp = datetime.now(timezone.utc) + timedelta(hours=1)
+    token = jwt.encode({"sub": str(uid), "exp": exp, "adm": False, "ver": 0}, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    db = Session()
+
+    def db_mode():
+        deps.get_current_db_user(creds, db)
+        db.expunge_all()  # como una sesión nueva por request
+
+    cached = deps.auth.token_cache
+    deps.auth.token_cache = type(cached)(max_entries=0)
+    t_db = per_call_us(db_mode, args.n)
+    t_principal = per_call_us(lambda: deps.get_current_principal(creds), args.n)
+    deps.auth.token_cache = cached
+    t_cached = per_call_us(lambda: deps.get_current_principal(creds), args.n)
+    db.close()
+
+    print(f"{'modo':<34} | {'µs/request':>10} | {'req/s (1 core)':>14}")
+    print("-" * 66)
+    for name, t in (
+        ("db (decode + db.get)", t_db),
+        ("principal (decode + caché users)", t_principal),
+        ("principal + caché de tokens", t_cached),
+    ):
+        print(f"{name:<34} | {t:>10.1f} | {1e6 / t:>14.0f}")
+    print(f"token_cache: {cached.stats()}")
+    print(f"user_cache:  {deps.user_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
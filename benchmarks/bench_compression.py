@@ -0,0 +1,83 @@
+# benchmarks/bench_compression.py
+"""
+Tamaño y coste de comprimir las respuestas grandes (los mismos bytes que sirven GET
+/products y GET /cart, generados como en bench_serialization), por códec y nivel:
+
+- KB:     cuerpo comprimido (frente al JSON sin comprimir)
+- ms:     comprimirlo una vez
+- caché:  servirlo de nuevo desde CompressedCache (blake2b del cuerpo + búsqueda)
+
+brotli y zstd aparecen solo si están instalados. Resultado de referencia (Python 3.11,
+gzip 5): 100 productos 18,5 -> 1,0 KB en ~0,1 ms; carrito de 300 líneas 81,5 -> 3,8 KB
+en ~0,3 ms (nivel 9: ~0,85 ms para el mismo tamaño); desde la caché ~0,04 / ~0,11 ms.
+Los datos sintéticos se repiten más que los reales, así que el ratio es optimista; la
+forma de la curva no: por encima del nivel 5 el tamaño apenas baja y el tiempo crece,
+de ahí los valores por defecto de ServiceSettings.
+
+Uso (desde la raíz):
+> python benchmarks/bench_compression.py [--n 200] [--rounds 5]
+"""
+import argparse
+import asyncio
+import gzip
+import time
+
+from bench_serialization import cart_case, products_case
+from datagen import load_service
+from common.compression import CompressedCache, brotli, zstandard
+
+LEVELS = {"gzip": (1, 5, 9)}
+if brotli is not None:
+    LEVELS["br"] = (1, 4, 11)
+if zstandard is not None:
+    LEVELS["zstd"] = (1, 3, 10)
+
+
+def compressor(encoding: str, level: int):
+    if encoding == "gzip":
+        return lambda b: gzip.compress(b, level, mtime=0)
+    if encoding == "br":
+        return lambda b: brotli.compress(b, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress
+
+
+def best_ms(fn, n: int, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / n * 1000)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200)
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+
+    bodies = (
+        ("100 productos", asyncio.run(products_case(load_service("catalog_service"))[1]())),
+        ("carrito 300 líneas", asyncio.run(cart_case(load_service("cart_service"))[1]())),
+    )
+    print(f"{'respuesta':<20} | {'códec':<9} | {'KB':>6} | {'%':>5} | {'ms':>7} | {'caché ms':>8}")
+    print("-" * 70)
+    for name, body in bodies:
+        print(f"{name:<20} | {'identity':<9} | {len(body) / 1024:>6.1f} | {100:>5.0f} | {'-':>7} | {'-':>8}")
+        for encoding, levels in LEVELS.items():
+            for level in levels:
+                compress = compressor(encoding, level)
+                out = compress(body)
+                cache = CompressedCache(16)
+                cache.get_or_compress(encoding, body, compress)
+                t = best_ms(lambda: compress(body), args.n, args.rounds)
+                t_hit = best_ms(lambda: cache.get_or_compress(encoding, body, compress), args.n, args.rounds)
+                print(
+                    f"{name:<20} | {f'{encoding}-{level}':<9} | {len(out) / 1024:>6.1f} | "
+                    f"{len(out) / len(body) * 100:>5.1f} | {t:>7.3f} | {t_hit:>8.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
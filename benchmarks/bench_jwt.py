@@ -0,0 +1,87 @@
+# benchmarks/bench_jwt.py
+"""
+Throughput de firma y verificación de JWT por algoritmo (python-jose):
+
+- HS256: secreto compartido (modo actual por defecto)
+- RS256 / ES256: clave privada en auth_service, verificación con la pública vía
+  JWKSCache (como hacen catalog/cart/order)
+- + caché de tokens: verificación servida desde common.tokens.TokenCache
+
+python-jose no implementa EdDSA; se incluye Ed25519 con ``cryptography`` directo
+(solo la operación de firma sobre el mismo input) como referencia.
+
+Uso (desde la raíz):
+> python benchmarks/bench_jwt.py [--n 5000]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "services"))
+sys.path.insert(0, str(ROOT / "services" / "auth_service"))
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from jose import jwt
+
+from app.keys import KeyRing
+from common.jwks import JWKSCache
+from common.tokens import TokenCache
+
+CLAIMS = {"sub": "42", "adm": False, "ver": 0, "sid": "0123456789abcdef", "exp": int(time.time()) + 900}
+
+
+def per_call_us(fn, n: int) -> float:
+    for _ in range(min(200, n)):
+        fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=5000)
+    args = ap.parse_args()
+    n = args.n
+
+    rows = []
+    secret = "change_this_secret"
+    tok = jwt.encode(CLAIMS, secret, algorithm="HS256")
+    rows.append(("HS256", per_call_us(lambda: jwt.encode(CLAIMS, secret, algorithm="HS256"), n),
+                 per_call_us(lambda: jwt.decode(tok, secret, algorithms=["HS256"]), n), len(tok)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for alg in ("RS256", "ES256"):
+            ring = KeyRing(Path(tmp) / alg, alg, reload_s=3600)
+            cache = JWKSCache(ring.jwks, algorithms=[alg], interval=0)
+            cache.sync()
+            tok = ring.sign(CLAIMS)
+            rows.append((alg, per_call_us(lambda: ring.sign(CLAIMS), n), per_call_us(lambda: cache.verify(tok), n), len(tok)))
+
+        ring = KeyRing(Path(tmp) / "RS256", "RS256", reload_s=3600)
+        cache = JWKSCache(ring.jwks, algorithms=["RS256"], interval=0)
+        cache.sync()
+        tok = ring.sign(CLAIMS)
+        tokens = TokenCache()
+        rows.append(("RS256 + caché de tokens", float("nan"), per_call_us(lambda: tokens.decode(tok, cache.verify), n), len(tok)))
+
+    ed = Ed25519PrivateKey.generate()
+    signing_input = tok.rsplit(".", 1)[0].encode()
+    sig = ed.sign(signing_input)
+    pub = ed.public_key()
+    rows.append(("Ed25519 (cryptography, ref.)", per_call_us(lambda: ed.sign(signing_input), n),
+                 per_call_us(lambda: pub.verify(sig, signing_input), n), None))
+
+    print(f"{'algoritmo':<30} | {'firma µs':>9} | {'verifica µs':>11} | {'verif./s (1 core)':>17} | {'bytes token':>11}")
+    print("-" * 90)
+    for name, sign_us, verify_us, size in rows:
+        sign = f"{sign_us:>9.1f}" if sign_us == sign_us else f"{'-':>9}"
+        print(f"{name:<30} | {sign} | {verify_us:>11.1f} | {1e6 / verify_us:>17.0f} | {size if size else '-':>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# benchmarks/bench_login.py
+"""
+Prueba de carga de /login: throughput por core del pool de bcrypt y latencia de
+/health durante la ráfaga (para ver si los logins la dejan sin recursos).
+
+Arranca auth_service en el mismo proceso (SQLite temporal, httpx + ASGITransport)
+y repite la ráfaga con HASH_POOL_WORKERS = 0 (threadpool), 1, 2, ... hasta --max-workers.
+
+Uso (desde la raíz):
+> python benchmarks/bench_login.py [--requests 200] [--concurrency 64] [--max-workers 4]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "services" / "auth_service"))
+
+import httpx
+from passlib.context import CryptContext
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.main as auth_main
+from app.database import Base
+from app.deps import get_db
+from app.hashing import HashPool
+from app.models import User
+
+EMAIL, PASSWORD = "bench@example.com", "Bench123!"
+
+
+async def burst(client: httpx.AsyncClient, n: int, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    codes: dict[int, int] = {}
+    health_ms: list[float] = []
+    done = asyncio.Event()
+
+    async def one_login():
+        async with sem:
+            r = await client.post("/login", json={"email": EMAIL, "password": PASSWORD})
+            codes[r.status_code] = codes.get(r.status_code, 0) + 1
+
+    async def probe_health():
+        while not done.is_set():
+            t0 = time.perf_counter()
+            await client.get("/health")
+            health_ms.append((time.perf_counter() - t0) * 1000)
+            await asyncio.sleep(0.01)
+
+    prober = asyncio.create_task(probe_health())
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one_login() for _ in range(n)))
+    elapsed = time.perf_counter() - t0
+    done.set()
+    await prober
+    return {"elapsed": elapsed, "codes": codes, "health_ms": health_ms}
+
+
+async def main_async(args):
+    tmp = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite+pysqlite:///{tmp}/bench_login.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        db.add(User(email=EMAIL, hashed_password=CryptContext(schemes=["bcrypt"]).hash(PASSWORD), is_admin=0))
+        db.commit()
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    auth_main.app.dependency_overrides[get_db] = override_get_db
+    transport = httpx.ASGITransport(app=auth_main.app)
+
+    print(f"{'workers':>7} | {'logins/s':>9} | {'logins/s/core':>13} | {'ok':>5} | {'503':>5} | {'/health p50 ms':>14} | {'/health max ms':>14}")
+    print("-" * 86)
+    for workers in range(0, args.max_workers + 1):
+        pool = HashPool(workers=workers, max_queue=args.queue)
+        auth_main.hasher = pool
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await burst(client, max(workers, 1) * 2, args.concurrency)  # calentar procesos
+            res = await burst(client, args.requests, args.concurrency)
+        pool.shutdown()
+        ok = res["codes"].get(200, 0)
+        rate = ok / res["elapsed"]
+        h = res["health_ms"] or [0.0]
+        print(
+            f"{workers:>7} | {rate:>9.1f} | {rate / max(workers, 1):>13.1f} | {ok:>5} | {res['codes'].get(503, 0):>5} | "
+            f"{statistics.median(h):>14.1f} | {max(h):>14.1f}"
+        )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--queue", type=int, default=64)
+    ap.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
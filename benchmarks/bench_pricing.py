@@ -0,0 +1,83 @@
+# benchmarks/bench_pricing.py
+"""
+Micro-benchmark del núcleo de precios (common.pricing) frente a la aritmética
+Decimal que usaban cart_service y order_service.
+
+Uso (desde la raíz):
+> python benchmarks/bench_pricing.py [--repeat 5]
+"""
+import argparse
+import random
+import sys
+import timeit
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "services"))
+
+from common.pricing import price_basket, rate_to_bp, to_cents
+
+SIZES = (1, 50, 1000)
+
+
+def legacy_decimal(basket):
+    total_net = Decimal("0.00")
+    total_vat = Decimal("0.00")
+    lines = []
+    for price, qty, vat_rate in basket:
+        price = Decimal(price)
+        vat_rate = Decimal(vat_rate if vat_rate is not None else "19.00")
+        q = Decimal(qty)
+        line_net = price * q
+        line_vat = (price * (vat_rate / Decimal("100"))) * q
+        lines.append((line_net, line_vat, line_net + line_vat))
+        total_net += line_net
+        total_vat += line_vat
+    return lines, total_net, total_vat, total_net + total_vat
+
+
+def kernel_from_decimals(basket):
+    # incluye la conversión desde los Decimal del ORM, como en los servicios
+    return price_basket((to_cents(p), q, rate_to_bp(r)) for p, q, r in basket)
+
+
+def kernel_cents(basket_cents):
+    return price_basket(basket_cents)
+
+
+def make_basket(rng: random.Random, n: int):
+    return [
+        (Decimal(rng.randint(100, 50_000_000)).scaleb(-2), rng.randint(1, 20), rng.choice([Decimal("19.00"), Decimal("5.00"), None]))
+        for _ in range(n)
+    ]
+
+
+def bench(fn, arg, repeat: int) -> float:
+    timer = timeit.Timer(lambda: fn(arg))
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'líneas':>7} | {'impl':<22} | {'µs/cesta':>10} | {'cestas/s':>10} | {'líneas/s':>12}")
+    print("-" * 72)
+    for n in SIZES:
+        basket = make_basket(rng, n)
+        cents = [(to_cents(p), q, rate_to_bp(r)) for p, q, r in basket]
+        for name, fn, arg in (
+            ("Decimal (legacy)", legacy_decimal, basket),
+            ("kernel (desde Decimal)", kernel_from_decimals, basket),
+            ("kernel (céntimos)", kernel_cents, cents),
+        ):
+            t = bench(fn, arg, args.repeat)
+            print(f"{n:>7} | {name:<22} | {t * 1e6:>10.1f} | {1 / t:>10.0f} | {n / t:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
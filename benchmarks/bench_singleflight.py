@@ -0,0 +1,92 @@
+# benchmarks/bench_singleflight.py
+"""
+Ráfaga de requests a la misma clave del catálogo, con y sin common.singleflight.
+
+Cada "consulta" duerme --query-ms (un SELECT a MySQL bajo carga) y se atiende en un
+threadpool de 40 hilos, como el de FastAPI para los endpoints síncronos:
+
+- directo:     cada request lanza su consulta (lo de antes: N consultas)
+- coalescido:  CoalescingCache con ttl=0, solo single-flight de las cargas simultáneas
+- fría:        clave sin caché, ttl por defecto (CATALOG_CACHE_TTL_S=1)
+- caducada:    la entrada acaba de caducar y la ráfaga llega encima (stale-while-revalidate)
+
+Resultado de referencia (--requests 400, --query-ms 20; latencia desde que llega la
+ráfaga, con la cola del threadpool):
+
+    directo     400 consultas   p50 ~113 ms   p99 ~204 ms
+    coalescido   10 consultas   p50 ~113 ms   p99 ~205 ms   (una por tanda de 40 hilos)
+    fría          1 consulta    p50  ~21 ms   p99  ~23 ms
+    caducada      1 consulta    p50   ~4 ms   p99   ~7 ms
+
+Sin caché (ttl=0) la coalescencia quita carga a la BD pero no latencia: cada tanda sigue
+esperando su consulta. Lo que quita la cola es poder responder desde la caché.
+
+Uso (desde la raíz):
+> python benchmarks/bench_singleflight.py [--requests 400] [--query-ms 20]
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "services"))
+
+from common.singleflight import CoalescingCache
+
+
+def burst(requests: int, query_s: float, cache: CoalescingCache | None) -> tuple[int, list[float]]:
+    queries = []
+    lock = threading.Lock()
+
+    def load():
+        with lock:
+            queries.append(1)
+        time.sleep(query_s)
+        return b'{"id": 1}'
+
+    def request(_):
+        if cache is None:
+            load()
+        else:
+            cache.get(("product", 1), load)
+        return time.perf_counter() - t0  # desde que llega la ráfaga: incluye la cola
+
+    with ThreadPoolExecutor(max_workers=40) as pool:
+        t0 = time.perf_counter()
+        latencies = list(pool.map(request, range(requests)))
+    return len(queries), latencies
+
+
+def report(name: str, queries: int, latencies: list[float]) -> None:
+    ms = sorted(x * 1000 for x in latencies)
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    print(f"{name:<12} consultas={queries:>5}  p50={statistics.median(ms):7.1f} ms  p99={p99:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--query-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    query_s = args.query_ms / 1000
+
+    report("directo", *burst(args.requests, query_s, None))
+
+    cache = CoalescingCache("bench", ttl=0, stale=0)
+    report("coalescido", *burst(args.requests, query_s, cache))
+
+    report("fría", *burst(args.requests, query_s, CoalescingCache("bench", ttl=1.0, stale=30)))
+
+    cache = CoalescingCache("bench", ttl=0.05, stale=30)
+    cache.get(("product", 1), lambda: b'{"id": 1}')
+    time.sleep(0.06)  # caducada, pero aún servible
+    report("caducada", *burst(args.requests, query_s, cache))
+    print(f"folded por clave: {cache.stats()['top_folded']}")
+
+
+if __name__ == "__main__":
+    main()
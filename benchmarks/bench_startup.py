@@ -0,0 +1,108 @@
+# benchmarks/bench_startup.py
+"""
+Arranque de cada servicio, de ``import app.main`` a la primera respuesta, en un proceso
+nuevo por medida (como un worker de uvicorn recién lanzado; los .pyc ya compilados
+cuentan, la caché de módulos no).
+
+- import:   importar app.main (config, modelos, rutas, middlewares)
+- lifespan: arranque de la app (engines, pools)
+- 1ª req:   GET /health por ASGI, sin red
+- proceso:  desde lanzar el intérprete hasta tener la respuesta (lo que espera un
+            orquestador que reinicia o escala workers)
+
+Sin --db-url usa la BD del .env: con el arranque sin efectos no se conecta a ella, así que
+no hace falta que esté levantada. Con --db-url (una URL, o 'sqlite' = fichero temporal nuevo
+en cada medida) se ve el coste de una BD real si algo la toca al importar o arrancar.
+
+Resultado de referencia (mediana de 5): import ~0,5 s, casi todo FastAPI (~0,3 s) y
+SQLAlchemy (~0,17 s); lifespan ~10-20 ms (crear engines, sin conectar); 1ª req ~5 ms.
+Con create_all al importar, el import con SQLite costaba lo mismo, pero cada worker hacía
+round trips de reflexión antes de servir nada y, sin MySQL accesible, ni siquiera
+importaba; ahora la primera conexión la abre la primera request que usa la BD.
+
+Uso (desde la raíz):
+> python benchmarks/bench_startup.py [--runs 5] [--db-url sqlite]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SERVICES = ("auth", "catalog", "cart", "order")
+
+
+def child(service: str) -> None:
+    import asyncio
+
+    import httpx  # cliente de la medida: fuera del tiempo del servicio
+
+    folder = ROOT / "services" / f"{service}_service"
+    sys.path[:0] = [str(folder), str(ROOT / "services")]
+    os.chdir(folder)
+
+    t0 = time.perf_counter()
+    from app.main import app
+    t_import = time.perf_counter() - t0
+
+    async def first_request() -> tuple[float, float, int]:
+        t1 = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            t2 = time.perf_counter()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                r = await client.get("/health")
+            t3 = time.perf_counter()
+        return t2 - t1, t3 - t2, r.status_code
+
+    t_lifespan, t_request, status = asyncio.run(first_request())
+    print(json.dumps({"import": t_import, "lifespan": t_lifespan, "request": t_request, "status": status}))
+
+
+def measure(service: str, db_url: str | None) -> dict:
+    env = dict(os.environ, AUTH_REVOCATION_SYNC_S="0")
+    if db_url == "sqlite":  # fichero nuevo en cada medida: nada creado de antemano
+        env["DB_URL"] = f"sqlite:///{tempfile.mkdtemp()}/arranque.db"
+    elif db_url:
+        env["DB_URL"] = db_url
+    t0 = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", service], env=env, capture_output=True, text=True, check=False
+    )
+    wall = time.perf_counter() - t0
+    if out.returncode != 0:
+        raise SystemExit(f"{service}: el proceso falló\n{out.stderr[-2000:]}")
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process"] = wall
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--db-url", default=None, help="'sqlite' = fichero temporal nuevo por medida")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    print(f"mediana de {args.runs} procesos, BD: {args.db_url or '.env'}")
+    print(f"{'servicio':<9} | {'import ms':>9} | {'lifespan ms':>11} | {'1ª req ms':>9} | {'proceso ms':>10}")
+    print("-" * 61)
+    for service in SERVICES:
+        runs = [measure(service, args.db_url) for _ in range(args.runs)]
+        med = {k: statistics.median(r[k] for r in runs) * 1000 for k in ("import", "lifespan", "request", "process")}
+        print(
+            f"{service:<9} | {med['import']:>9.1f} | {med['lifespan']:>11.1f} | "
+            f"{med['request']:>9.1f} | {med['process']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
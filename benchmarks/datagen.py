@@ -0,0 +1,345 @@
+# benchmarks/datagen.py
+"""
+Generador de datos sintéticos para pruebas de escala (SQLite o MySQL).
+
+Crea categorías, productos, usuarios, carritos activos y abandonados y pedidos con
+sus líneas. Mismo --seed -> mismos datos. Los ids se asignan aquí (a partir del
+máximo existente), así que los carritos y pedidos referencian productos y usuarios sin
+consultar la BD, y todo se inserta en lotes con executemany: PyMySQL lo convierte en
+INSERT multi-fila y sqlite3 lo ejecuta en C.
+
+Distribuciones:
+- precio log-normal (mediana ~60.000), IVA 19 % / 5 % / 0 %, ~5 % de productos sin
+  stock, talla solo en categorías de ropa;
+- popularidad de productos tipo Zipf (s = 1.07) sobre una permutación aleatoria de
+  ids, para carritos y pedidos;
+- 1-12 líneas por pedido (media ~3), estados de pedido y fechas del último año;
+- todos los usuarios comparten un hash bcrypt calculado una vez (contraseña
+  DEFAULT_PASSWORD), así que pueden hacer login.
+
+Escalas (--scale; cada cifra se puede pisar con --products/--users/--order-lines):
+    tiny   2.000 productos,   200 usuarios,     10.000 líneas de pedido
+    small  100.000,        10.000,          1.000.000
+    full   1.000.000,     100.000,         10.000.000
+
+Uso (desde la raíz; sin --db-url usa la BD del .env):
+> python benchmarks/datagen.py --db-url sqlite:////tmp/escala.db --scale full
+> python benchmarks/datagen.py --scale small --seed 7
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+from sqlalchemy import MetaData, create_engine, event, func, select
+
+ROOT = Path(__file__).resolve().parents[1]
+SERVICES = ROOT / "services"
+sys.path.insert(0, str(SERVICES))
+
+DEFAULT_PASSWORD = "Password123!"
+
+SCALES = {
+    "tiny": dict(products=2_000, users=200, order_lines=10_000),
+    "small": dict(products=100_000, users=10_000, order_lines=1_000_000),
+    "full": dict(products=1_000_000, users=100_000, order_lines=10_000_000),
+}
+
+CLOTHING = ["Camisetas", "Pantalones", "Chaquetas", "Vestidos", "Sudaderas", "Faldas", "Camisas", "Ropa deportiva"]
+OTHER = [
+    "Calzado", "Accesorios", "Bolsos", "Relojes", "Hogar", "Cocina", "Electrónica", "Juguetes",
+    "Libros", "Belleza", "Deportes", "Jardín", "Mascotas", "Papelería", "Bebés", "Ferretería",
+]
+ADJECTIVES = ["básico", "clásico", "premium", "urbano", "liviano", "deportivo", "eco", "slim", "oversize", "vintage"]
+COLORS = ["blanco", "negro", "azul", "rojo", "verde", "gris", "beige", "rosa", "amarillo", "morado"]
+FIRST_NAMES = ["Ana", "Luis", "María", "Carlos", "Laura", "Andrés", "Sofía", "Juan", "Valentina", "Diego", "Camila", "Jorge"]
+LAST_NAMES = ["García", "Rodríguez", "Martínez", "López", "Gómez", "Pérez", "Sánchez", "Ramírez", "Torres", "Díaz"]
+
+SIZES, SIZE_W = ("XS", "S", "M", "L", "XL", "XXL"), (5, 18, 32, 27, 13, 5)
+VATS, VAT_W = (19, 5, 0), (85, 8, 7)
+ORDER_STATUS, ORDER_STATUS_W = ("created", "paid", "shipped", "delivered", "cancelled"), (8, 22, 15, 50, 5)
+ZIPF_S = 1.07
+
+
+def load_service(folder: str, module: str = "app.main") -> SimpleNamespace:
+    """Módulos de ``services/<folder>/app`` (main, deps, models...), ver common.colocate."""
+    from common.colocate import import_service
+
+    return import_service(folder, module)
+
+
+def ensure_schema(engine) -> dict:
+    """Prepara el esquema y devuelve las tablas reflejadas."""
+    if engine.dialect.name == "mysql":
+        from common import migrations  # los mismos scripts/NN_*.sql que en producción
+        migrations.upgrade(engine)
+    else:
+        # SQLite: los scripts son de MySQL; tablas desde los modelos (auth y catalog primero:
+        # sus modelos de users/products son los completos)
+        for folder in ("auth_service", "catalog_service", "cart_service", "order_service"):
+            load_service(folder, "app.models").database.Base.metadata.create_all(engine)
+    meta = MetaData()
+    meta.reflect(engine, only=["categories", "products", "users", "carts", "cart_items", "orders", "order_items"])
+    return meta.tables
+
+
+def password_hash() -> str:
+    import bcrypt  # mismo formato $2b$ que passlib en auth_service
+    return bcrypt.hashpw(DEFAULT_PASSWORD.encode(), bcrypt.gensalt()).decode()
+
+
+class Writer:
+    """
+    Inserta filas en lotes sobre una conexión y cuenta filas/tiempo por tabla.
+
+    Las tablas se vuelcan en el orden de su primera fila (padres antes que hijos): al
+    volcar el lote de una tabla se vuelcan antes las filas pendientes de las anteriores,
+    así las FKs se cumplen aunque la conexión las compruebe.
+    """
+
+    def __init__(self, conn, batch: int):
+        self.conn = conn
+        self.batch = batch
+        self.pending: dict[str, list] = {}
+        self.tables: dict = {}
+        self.rows: dict[str, int] = {}
+        self.seconds: dict[str, float] = {}
+
+    def add(self, table, row: dict) -> None:
+        rows = self.pending.setdefault(table.name, [])
+        self.tables[table.name] = table
+        rows.append(row)
+        if len(rows) >= self.batch:
+            self.flush(table.name)
+
+    def flush(self, name: str | None = None) -> None:
+        names = list(self.tables)
+        for n in names[: names.index(name) + 1] if name else names:
+            rows = self.pending.get(n)
+            if not rows:
+                continue
+            t0 = time.perf_counter()
+            self.conn.execute(self.tables[n].insert(), rows)
+            self.conn.commit()
+            self.seconds[n] = self.seconds.get(n, 0.0) + time.perf_counter() - t0
+            self.rows[n] = self.rows.get(n, 0) + len(rows)
+            self.pending[n] = []
+
+
+def _next_id(conn, table) -> int:
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _zipf_cum_weights(n: int, s: float = ZIPF_S) -> list[float]:
+    acc, out = 0.0, []
+    for rank in range(1, n + 1):
+        acc += rank ** -s
+        out.append(acc)
+    return out
+
+
+def generate(engine, products: int, users: int, order_lines: int, seed: int = 42,
+             batch: int = 5000, log=print) -> dict:
+    """
+    Genera el conjunto de datos. Devuelve los rangos de ids creados
+    (``product_ids``, ``user_ids``) y las filas por tabla.
+    """
+    rng = random.Random(seed)
+    tables = ensure_schema(engine)
+    categories, products_t, users_t = tables["categories"], tables["products"], tables["users"]
+    carts_t, cart_items_t = tables["carts"], tables["cart_items"]
+    orders_t, order_items_t = tables["orders"], tables["order_items"]
+    now = datetime(2025, 1, 1) + timedelta(days=rng.randrange(0, 365))  # fijo por seed
+
+    with engine.connect() as conn:
+        w = Writer(conn, batch)
+
+        # ---- categorías (nombres únicos: se reutilizan las que ya existan) ----
+        existing = dict(conn.execute(select(categories.c.name, categories.c.id)).all())
+        bases = [(name, True) for name in CLOTHING] + [(name, False) for name in OTHER]
+        cid = _next_id(conn, categories)
+        cat_ids, clothing_ids = [], set()
+        for i in range(max(len(bases), products // 20_000)):  # catálogos grandes: más categorías
+            base, clothing = bases[i % len(bases)]
+            name = base if i < len(bases) else f"{base} {i // len(bases) + 1}"
+            if name not in existing:
+                w.add(categories, {"id": cid, "name": name})
+                existing[name] = cid
+                cid += 1
+            cat_ids.append(existing[name])
+            if clothing:
+                clothing_ids.add(existing[name])
+        w.flush()
+
+        # ---- productos ----
+        t0 = time.perf_counter()
+        first_pid = pid = _next_id(conn, products_t)
+        price_cents: list[int] = []
+        vat_of: list[int] = []
+        for i in range(products):
+            cat = rng.choice(cat_ids)
+            price = max(1_000, int(rng.lognormvariate(math.log(60_000), 0.8)) // 100 * 100)
+            vat = rng.choices(VATS, VAT_W)[0]
+            stock = 0 if rng.random() < 0.05 else min(5_000, int(rng.paretovariate(1.3) * 10))
+            w.add(products_t, {
+                "id": pid,
+                "category_id": cat,
+                "name": f"{rng.choice(ADJECTIVES).capitalize()} {rng.choice(COLORS)} {pid}",
+                "description": f"Producto sintético {pid}",
+                "price": price,
+                "vat_rate": vat,
+                "stock": stock,
+                "size": rng.choices(SIZES, SIZE_W)[0] if cat in clothing_ids else None,
+                "image_url": f"https://picsum.photos/seed/p{pid}/400/400" if rng.random() < 0.7 else None,
+                "created_at": now - timedelta(seconds=rng.randrange(0, 2 * 365 * 86400)),
+            })
+            price_cents.append(price * 100)
+            vat_of.append(vat)
+            pid += 1
+        w.flush()
+        log(f"[datagen] productos: {products} en {time.perf_counter() - t0:.1f} s")
+
+        # popularidad Zipf sobre una permutación: los más vendidos no son los primeros ids
+        ranked = list(range(products))
+        rng.shuffle(ranked)
+        cum = _zipf_cum_weights(products)
+
+        def popular(k: int) -> list[int]:
+            """k índices de producto distintos (0-based), sesgados por popularidad."""
+            picked = set()
+            while len(picked) < k:
+                picked.update(rng.choices(ranked, cum_weights=cum, k=k - len(picked)))
+            return list(picked)
+
+        # ---- usuarios ----
+        t0 = time.perf_counter()
+        hashed = password_hash()
+        first_uid = uid = _next_id(conn, users_t)
+        for _ in range(users):
+            w.add(users_t, {
+                "id": uid,
+                "email": f"user{uid}@example.com",
+                "hashed_password": hashed,
+                "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "is_admin": 0,
+                "created_at": now - timedelta(seconds=rng.randrange(0, 3 * 365 * 86400)),
+            })
+            uid += 1
+        w.flush()
+        log(f"[datagen] usuarios: {users} en {time.perf_counter() - t0:.1f} s")
+
+        # ---- carritos: ~25 % de usuarios con uno activo, ~35 % con uno abandonado ----
+        t0 = time.perf_counter()
+        cart_id = _next_id(conn, carts_t)
+        item_id = _next_id(conn, cart_items_t)
+        for u in range(first_uid, first_uid + users):
+            for status, p in (("active", 0.25), ("abandoned", 0.35)):
+                if rng.random() >= p:
+                    continue
+                created = now - timedelta(seconds=rng.randrange(0, 90 * 86400))
+                w.add(carts_t, {"id": cart_id, "user_id": u, "status": status, "created_at": created})
+                for idx in popular(min(products, rng.randint(1, 5))):
+                    w.add(cart_items_t, {
+                        "id": item_id, "cart_id": cart_id, "product_id": first_pid + idx,
+                        "quantity": rng.choices((1, 2, 3), (70, 22, 8))[0],
+                        "unit_price": price_cents[idx] / 100, "created_at": created,
+                    })
+                    item_id += 1
+                cart_id += 1
+        w.flush()
+        log(f"[datagen] carritos: {w.rows.get('carts', 0)} en {time.perf_counter() - t0:.1f} s")
+
+        # ---- pedidos hasta completar order_lines líneas ----
+        t0 = time.perf_counter()
+        order_id = _next_id(conn, orders_t)
+        line_id = _next_id(conn, order_items_t)
+        lines = 0
+        while lines < order_lines:
+            n = min(order_lines - lines, products, min(12, 1 + int(rng.expovariate(1 / 2.2))))
+            total = 0
+            items = []
+            for idx in popular(n):
+                qty = rng.choices((1, 2, 3, 4), (72, 18, 7, 3))[0]
+                net = price_cents[idx] * qty
+                total += net + round(net * vat_of[idx] / 100)
+                items.append({
+                    "id": line_id, "order_id": order_id, "product_id": first_pid + idx, "quantity": qty,
+                    "unit_price": price_cents[idx] / 100, "vat_rate": vat_of[idx], "discount": 0,
+                })
+                line_id += 1
+            # el pedido antes que sus líneas (fk_oi_order)
+            w.add(orders_t, {
+                "id": order_id, "user_id": first_uid + rng.randrange(users), "total": total / 100,
+                "status": rng.choices(ORDER_STATUS, ORDER_STATUS_W)[0],
+                "created_at": now - timedelta(seconds=rng.randrange(0, 365 * 86400)),
+            })
+            for item in items:
+                w.add(order_items_t, item)
+            order_id += 1
+            lines += n
+        w.flush()
+        log(f"[datagen] pedidos: {w.rows.get('orders', 0)} ({lines} líneas) en {time.perf_counter() - t0:.1f} s")
+
+    return {
+        "product_ids": range(first_pid, first_pid + products),
+        "user_ids": range(first_uid, first_uid + users),
+        "rows": dict(w.rows),
+        "insert_seconds": {k: round(v, 2) for k, v in w.seconds.items()},
+    }
+
+
+def bulk_engine(url: str):
+    """Engine para la carga masiva: sin fsync en SQLite y sin comprobar FKs/únicos en MySQL."""
+    engine = create_engine(url)
+
+    @event.listens_for(engine, "connect")
+    def _fast(dbapi_conn, rec):
+        cur = dbapi_conn.cursor()
+        if url.startswith("sqlite"):
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=OFF")
+        elif url.startswith("mysql"):
+            # los ids y referencias los genera este script: son consistentes
+            cur.execute("SET foreign_key_checks=0, unique_checks=0")
+        cur.close()
+
+    return engine
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Genera datos sintéticos para pruebas de escala.")
+    ap.add_argument("--db-url", help="URL de SQLAlchemy (por defecto la del .env: DB_URL o DB_HOST..DB_PASS)")
+    ap.add_argument("--scale", choices=SCALES, default="tiny")
+    ap.add_argument("--products", type=int)
+    ap.add_argument("--users", type=int)
+    ap.add_argument("--order-lines", type=int)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--batch", type=int, default=5000, help="filas por executemany")
+    args = ap.parse_args()
+
+    url = args.db_url
+    if not url:
+        from common.settings import ServiceSettings
+        url = ServiceSettings().database_url
+    size = dict(SCALES[args.scale])
+    for key in size:
+        if getattr(args, key) is not None:
+            size[key] = getattr(args, key)
+
+    print(f"[datagen] {url.split('@')[-1]}: {size} (seed {args.seed})")
+    t0 = time.perf_counter()
+    result = generate(bulk_engine(url), seed=args.seed, batch=args.batch, **size)
+    elapsed = time.perf_counter() - t0
+    total = sum(result["rows"].values())
+    print(f"[datagen] {total} filas en {elapsed:.1f} s ({total / elapsed:,.0f} filas/s)")
+    for name, rows in result["rows"].items():
+        secs = result["insert_seconds"][name]
+        print(f"  {name:<12} {rows:>11,}  ({secs:.1f} s insertando)")
+
+
+if __name__ == "__main__":
+    main()
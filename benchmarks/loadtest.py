@@ -0,0 +1,316 @@
+# benchmarks/loadtest.py
+"""
+Prueba de carga de la tienda completa con puerta de regresión.
+
+Arranca auth, catalog, cart y order en este mismo proceso (cada app se importa aislada:
+todas se llaman ``app``) contra una BD común, siembra datos con datagen.py y lanza usuarios
+virtuales con httpx.AsyncClient sobre ASGI que mezclan:
+
+    ver catálogo · ver producto · añadir al carrito · ver carrito · checkout · mis pedidos
+
+Informa req/s y p50/p95/p99 por endpoint, guarda el resultado en
+docs/loadtest-results.json y lo compara con docs/loadtest-baseline.json: sale con
+código 1 si hay errores por encima de --max-error-rate, haya baseline o no (y entonces
+--save-baseline no la guarda), o si el p95 o el throughput de algún endpoint empeoran
+más de lo permitido.
+
+Notas:
+- Por defecto usa un SQLite temporal (WAL). Con --db-url mysql+pymysql://... usa esa BD:
+  aplica las migraciones pendientes y AÑADE datos de prueba, así que úsala con una BD desechable.
+- Los cuatro servicios comparten el threadpool de 40 hilos de este proceso (en
+  producción cada uno tiene el suyo): compara resultados entre sí, no con producción.
+- La baseline solo tiene sentido en la misma máquina y con los mismos parámetros.
+
+Uso (desde la raíz):
+> python benchmarks/loadtest.py                         # ejecuta y compara con la baseline
+> python benchmarks/loadtest.py --save-baseline         # fija la baseline actual
+> python benchmarks/loadtest.py --duration 60 --users 64 --max-p95-regression 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+from datagen import generate, load_service
+
+ROOT = Path(__file__).resolve().parents[1]
+RESULTS = ROOT / "docs" / "loadtest-results.json"
+BASELINE = ROOT / "docs" / "loadtest-baseline.json"
+
+# (endpoint, peso en la mezcla)
+MIX = (
+    ("GET /products", 35),
+    ("GET /products/{id}", 30),
+    ("POST /cart/items", 15),
+    ("GET /cart", 8),
+    ("POST /orders/checkout", 5),
+    ("GET /orders", 7),
+)
+
+
+# ---------- arranque ----------
+def boot(db_url: str) -> dict[str, SimpleNamespace]:
+    os.environ["DB_URL"] = db_url
+    os.environ["AUTH_REVOCATION_SYNC_S"] = "0"  # sin auth_service por HTTP
+    svc = {name: load_service(f"{name}_service") for name in ("auth", "catalog", "cart", "order")}
+    # la siembra usa el engine de auth; los demás arrancan en su lifespan (run_load)
+    svc["auth"].database.database.start()
+    for name in ("catalog", "cart", "order"):
+        jwks = svc[name].deps.auth.jwks
+        if jwks is not None:  # JWT_ALG asimétrico: claves públicas del auth en proceso
+            jwks.fetch = svc["auth"].security.jwks
+    return svc
+
+
+# ---------- datos ----------
+def seed_data(svc: dict, products: int, customers: int, seed: int) -> tuple[list[int], list[str]]:
+    from sqlalchemy import update
+
+    auth = svc["auth"]
+    engine = auth.database.database.engine
+    data = generate(engine, products=products, users=customers, order_lines=products * 2, seed=seed, log=lambda _: None)
+    product_ids = list(data["product_ids"])
+    Product = svc["catalog"].models.Product
+    with engine.begin() as conn:  # sin 409 por stock: se mide el camino feliz del checkout
+        conn.execute(update(Product).where(Product.id.between(product_ids[0], product_ids[-1])).values(stock=1_000_000))
+
+    tokens = []
+    with auth.database.SessionLocal() as db:
+        for uid in data["user_ids"]:
+            # sesión directa: los usuarios virtuales no pasan por /login (bcrypt no es lo que se mide)
+            tokens.append(auth.sessions.start_session(db, db.get(auth.models.User, uid))["access_token"])
+    return product_ids, tokens
+
+
+# ---------- carga ----------
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {name: [] for name, _ in MIX}
+        self.errors: dict[str, int] = {name: 0 for name, _ in MIX}
+        self.active = False
+
+    def add(self, name: str, seconds: float, ok: bool) -> None:
+        if self.active:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+
+async def virtual_user(clients, token: str, product_ids: list[int], cum_weights: list[float],
+                       rng: random.Random, rec: Recorder, stop_at: float) -> None:
+    names = [name for name, _ in MIX]
+    mix_cum = []
+    acc = 0
+    for _, w in MIX:
+        acc += w
+        mix_cum.append(acc)
+    headers = {"Authorization": f"Bearer {token}"}
+    in_cart = 0
+    while time.perf_counter() < stop_at:
+        action = rng.choices(names, cum_weights=mix_cum)[0]
+        if action == "POST /orders/checkout" and in_cart == 0:
+            action = "POST /cart/items"
+        pid = rng.choices(product_ids, cum_weights=cum_weights)[0]  # popularidad tipo Zipf
+        t0 = time.perf_counter()
+        if action == "GET /products":
+            r = await clients["catalog"].get("/products", params={"skip": rng.randrange(0, 200), "limit": 20})
+        elif action == "GET /products/{id}":
+            r = await clients["catalog"].get(f"/products/{pid}")
+        elif action == "POST /cart/items":
+            r = await clients["cart"].post("/cart/items", json={"product_id": pid, "quantity": rng.randint(1, 3)}, headers=headers)
+            in_cart += r.status_code == 201
+        elif action == "GET /cart":
+            r = await clients["cart"].get("/cart", headers=headers)
+        elif action == "POST /orders/checkout":
+            r = await clients["order"].post("/orders/checkout", headers=headers)
+            if r.status_code == 201:
+                in_cart = 0
+        else:
+            r = await clients["order"].get("/orders", headers=headers)
+        rec.add(action, time.perf_counter() - t0, r.status_code < 400)
+
+
+async def run_load(svc: dict, product_ids: list[int], tokens: list[str], users: int,
+                   warmup: float, duration: float, seed: int) -> tuple[Recorder, float]:
+    import httpx
+
+    cum_weights, acc = [], 0.0
+    for rank in range(1, len(product_ids) + 1):
+        acc += 1.0 / rank
+        cum_weights.append(acc)
+    rec = Recorder()
+    clients = {
+        name: httpx.AsyncClient(transport=httpx.ASGITransport(app=svc[name].main.app, raise_app_exceptions=False), base_url=f"http://{name}", timeout=60)
+        for name in ("catalog", "cart", "order")
+    }
+
+    async def open_window():
+        await asyncio.sleep(warmup)
+        rec.active = True
+
+    async with AsyncExitStack() as stack:
+        # ASGITransport no ejecuta el lifespan: engines y métricas se arrancan como en uvicorn
+        for name in clients:
+            await stack.enter_async_context(svc[name].main.app.router.lifespan_context(svc[name].main.app))
+        for client in clients.values():
+            stack.push_async_callback(client.aclose)
+        start = time.perf_counter()
+        stop_at = start + warmup + duration
+        await asyncio.gather(
+            open_window(),
+            *(
+                virtual_user(clients, tokens[i % len(tokens)], product_ids, cum_weights,
+                             random.Random(seed + i), rec, stop_at)
+                for i in range(users)
+            ),
+        )
+    return rec, time.perf_counter() - start - warmup
+
+
+# ---------- informe ----------
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def summarize(rec: Recorder, elapsed: float, meta: dict) -> dict:
+    endpoints = {}
+    for name, _ in MIX:
+        lat = sorted(rec.latencies[name])
+        endpoints[name] = {
+            "count": len(lat),
+            "errors": rec.errors[name],
+            "rps": round(len(lat) / elapsed, 1),
+            "p50_ms": round(percentile(lat, 50) * 1000, 2),
+            "p95_ms": round(percentile(lat, 95) * 1000, 2),
+            "p99_ms": round(percentile(lat, 99) * 1000, 2),
+        }
+    count = sum(e["count"] for e in endpoints.values())
+    errors = sum(e["errors"] for e in endpoints.values())
+    return {"meta": meta, "endpoints": endpoints, "total": {"count": count, "errors": errors, "rps": round(count / elapsed, 1)}}
+
+
+def print_table(result: dict) -> None:
+    print(f"{'endpoint':<24} | {'n':>6} | {'err':>4} | {'req/s':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    print("-" * 84)
+    for name, e in result["endpoints"].items():
+        print(f"{name:<24} | {e['count']:>6} | {e['errors']:>4} | {e['rps']:>7.1f} | "
+              f"{e['p50_ms']:>8.1f} | {e['p95_ms']:>8.1f} | {e['p99_ms']:>8.1f}")
+    t = result["total"]
+    print(f"{'TOTAL':<24} | {t['count']:>6} | {t['errors']:>4} | {t['rps']:>7.1f} |")
+
+
+def error_rate_failure(result: dict, max_error_rate: float) -> str | None:
+    """Motivo si hay demasiados errores (o ninguna request medida); None = pasa. No depende de la baseline."""
+    total = result["total"]
+    if not total["count"]:
+        return "ninguna request medida"
+    if total["errors"] / total["count"] * 100 > max_error_rate:
+        return f"errores {total['errors']}/{total['count']} > {max_error_rate}%"
+    return None
+
+
+def compare(result: dict, baseline: dict, max_p95: float, max_rps: float) -> list[str]:
+    """Regresiones de p95 y throughput frente a la baseline (lista vacía = pasa)."""
+    failures = []
+    for name, new in result["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(name)
+        if not old or not old["count"] or not new["count"]:
+            continue
+        if old["p95_ms"] and (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 > max_p95:
+            failures.append(f"{name}: p95 {old['p95_ms']} -> {new['p95_ms']} ms (> +{max_p95}%)")
+        if old["rps"] and (old["rps"] - new["rps"]) / old["rps"] * 100 > max_rps:
+            failures.append(f"{name}: {old['rps']} -> {new['rps']} req/s (> -{max_rps}%)")
+    return failures
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--db-url", help="URL de SQLAlchemy (por defecto, SQLite temporal)")
+    ap.add_argument("--users", type=int, default=32, help="usuarios virtuales concurrentes")
+    ap.add_argument("--customers", type=int, default=200, help="usuarios sembrados (tokens)")
+    ap.add_argument("--products", type=int, default=2000)
+    ap.add_argument("--warmup", type=float, default=3.0, help="segundos sin medir")
+    ap.add_argument("--duration", type=float, default=20.0, help="segundos medidos")
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true", help="guarda el resultado como baseline")
+    ap.add_argument("--max-p95-regression", type=float, default=25.0, help="%% de empeoramiento de p95 tolerado")
+    ap.add_argument("--max-rps-regression", type=float, default=20.0, help="%% de caída de req/s tolerado")
+    ap.add_argument("--max-error-rate", type=float, default=0.5, help="%% de respuestas >= 400 tolerado")
+    args = ap.parse_args()
+
+    db_url = args.db_url
+    if not db_url:
+        path = Path(tempfile.mkdtemp()) / "loadtest.db"
+        with sqlite3.connect(path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")  # lectores y escritor concurrentes
+        db_url = f"sqlite:///{path}"
+
+    svc = boot(db_url)
+    t0 = time.perf_counter()
+    product_ids, tokens = seed_data(svc, args.products, args.customers, args.seed)
+    print(f"[loadtest] BD {db_url.split('://')[0]}: {len(product_ids)} productos, {len(tokens)} usuarios "
+          f"sembrados en {time.perf_counter() - t0:.1f} s")
+    print(f"[loadtest] {args.users} usuarios virtuales, {args.warmup:.0f} s de calentamiento + {args.duration:.0f} s medidos")
+
+    rec, elapsed = asyncio.run(run_load(svc, product_ids, tokens, args.users, args.warmup, args.duration, args.seed))
+    meta = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "db": db_url.split("://")[0],
+        "db_async": svc["catalog"].config.settings.DB_ASYNC,
+        "users": args.users,
+        "products": len(product_ids),
+        "duration_s": round(elapsed, 1),
+    }
+    result = summarize(rec, elapsed, meta)
+    print_table(result)
+
+    RESULTS.write_text(json.dumps(result, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    print(f"[loadtest] resultado en {RESULTS.relative_to(ROOT)}")
+    error = error_rate_failure(result, args.max_error_rate)
+    if error:
+        print(f"[loadtest] FALLO: {error}" + (" (no se guarda como baseline)" if args.save_baseline else ""))
+        sys.exit(1)
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"[loadtest] baseline guardada en {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print("[loadtest] sin baseline: ejecuta con --save-baseline para fijarla")
+        return
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline["meta"].get("db") != meta["db"] or baseline["meta"].get("users") != meta["users"]:
+        print(f"[loadtest] aviso: baseline con otra configuración ({baseline['meta']})")
+    failures = compare(result, baseline, args.max_p95_regression, args.max_rps_regression)
+    if failures:
+        print("[loadtest] REGRESIÓN frente a la baseline:")
+        for f in failures:
+            print("  -", f)
+        sys.exit(1)
+    print(f"[loadtest] OK frente a la baseline ({baseline['meta'].get('commit')}, {baseline['meta'].get('timestamp')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ import {
   getCart,
   checkout,
   myOrders,
-  setToken,
+  logout as endSession,
   // 👇 nuevas funciones (asegúrate de exportarlas en api.ts)
   updateCartItem,
   removeCartItem,
@@ -464,7 +464,7 @@ export default function App() {
   );
 
   const logout = () => {
-    setToken(null);
+    void endSession(); // cierra la sesión también en auth_service
     setView("login");
   };
 
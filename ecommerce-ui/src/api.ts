@@ -2,8 +2,11 @@ const AUTH_URL = import.meta.env.VITE_AUTH_URL as string;
 const CATALOG_URL = import.meta.env.VITE_CATALOG_URL as string;
 const CART_URL = import.meta.env.VITE_CART_URL as string;
 const ORDER_URL = import.meta.env.VITE_ORDER_URL as string;
+// BFF opcional: una request por pantalla (en paralelo en el servidor) en vez de una por servicio
+const BFF_URL = (import.meta.env.VITE_BFF_URL as string | undefined) || "";
 
 let token: string | null = localStorage.getItem("token");
+let refreshToken: string | null = localStorage.getItem("refresh_token");
 
 export const setToken = (t: string | null) => {
   token = t;
@@ -11,13 +14,41 @@ export const setToken = (t: string | null) => {
   else localStorage.removeItem("token");
 };
 
-async function http(url: string, opts: RequestInit = {}) {
+const setRefreshToken = (t: string | null) => {
+  refreshToken = t;
+  if (t) localStorage.setItem("refresh_token", t);
+  else localStorage.removeItem("refresh_token");
+};
+
+// El access token dura pocos minutos: ante un 401 se renueva una vez con el refresh token
+async function refreshSession(): Promise<boolean> {
+  if (!refreshToken) return false;
+  const res = await fetch(`${AUTH_URL}/token/refresh`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ refresh_token: refreshToken }),
+  });
+  if (!res.ok) {
+    setToken(null);
+    setRefreshToken(null);
+    return false;
+  }
+  const data = await res.json();
+  setToken(data.access_token);
+  setRefreshToken(data.refresh_token);
+  return true;
+}
+
+async function http(url: string, opts: RequestInit = {}, retry = true): Promise<any> {
   const headers: Record<string, string> = {
     "Content-Type": "application/json",
     ...(opts.headers as Record<string, string>),
   };
   if (token) headers.Authorization = `Bearer ${token}`;
   const res = await fetch(url, { ...opts, headers });
+  if (res.status === 401 && retry && token && (await refreshSession())) {
+    return http(url, opts, false);
+  }
   if (!res.ok) {
     const msg = await res.text().catch(() => res.statusText);
     throw new Error(`${res.status} ${res.statusText}: ${msg}`);
@@ -32,10 +63,39 @@ export async function login(email: string, password: string) {
     body: JSON.stringify({ email, password }),
   });
   setToken(data.access_token);
+  setRefreshToken(data.refresh_token ?? null);
   return data;
 }
 
+export async function logout() {
+  if (refreshToken) {
+    await fetch(`${AUTH_URL}/logout`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ refresh_token: refreshToken }),
+    }).catch(() => undefined);
+  }
+  setToken(null);
+  setRefreshToken(null);
+}
+
+// Pantallas del BFF: {user, categories, products, cart, unavailable}, {user, cart}, {user, orders}
+export async function homePage(q?: string) {
+  const url = new URL(`${BFF_URL}/bff/home`);
+  if (q) url.searchParams.set("q", q);
+  return http(url.toString());
+}
+
+export async function cartPage() {
+  return http(`${BFF_URL}/bff/cart`);
+}
+
+export async function ordersPage() {
+  return http(`${BFF_URL}/bff/orders`);
+}
+
 export async function products(q?: string) {
+  if (BFF_URL) return (await homePage(q)).products ?? [];
   const url = new URL(`${CATALOG_URL}/products`);
   if (q) url.searchParams.set("q", q);
   return http(url.toString());
@@ -67,6 +127,11 @@ export async function clearCart() {
 
 
 export async function getCart() {
+  if (BFF_URL) {
+    const page = await cartPage();
+    if (!page.cart) throw new Error("El carrito no está disponible ahora mismo");
+    return page.cart;
+  }
   return http(`${CART_URL}/cart`);
 }
 
@@ -75,5 +140,6 @@ export async function checkout() {
 }
 
 export async function myOrders() {
+  if (BFF_URL) return (await ordersPage()).orders ?? [];
   return http(`${ORDER_URL}/orders`);
 }
@@ -1,11 +1,22 @@
-import sys, subprocess, platform, datetime
+import os, sys, subprocess, platform, datetime
 from pathlib import Path
 
 SERVICES = [
+    ("common", "Common"),
     ("auth_service", "Auth"),
     ("catalog_service", "Catalog"),
     ("cart_service", "Cart"),
     ("order_service", "Order"),
+    ("bff_service", "BFF"),
+    # mismos self-tests con los endpoints calientes en modo AsyncSession
+    ("catalog_service", "Catalog async", {"DB_ASYNC": "true"}),
+    ("cart_service", "Cart async", {"DB_ASYNC": "true"}),
+    ("order_service", "Order async", {"DB_ASYNC": "true"}),
+    # GET /products filtrado desde la copia columnar (catalog_service/app/snapshot.py)
+    ("catalog_service", "Catalog snapshot", {"CATALOG_SNAPSHOT": "true"}),
+    # carritos y pedidos repartidos por usuario entre 2 shards SQLite (common.sharding)
+    ("cart_service", "Cart shards", {"SELFTEST_SHARDS": "2"}),
+    ("order_service", "Order shards", {"SELFTEST_SHARDS": "2"}),
 ]
 
 def _pkg_versions():
@@ -49,7 +60,8 @@ def main():
     overall_ok = True
     results = []
 
-    for folder, label in SERVICES:
+    for folder, label, *extra in SERVICES:
+        env = {**os.environ, **(extra[0] if extra else {})}
         svc_path = root / "services" / folder
         title = f"=== {label} ({folder}) ==="
         print(title)
@@ -63,7 +75,7 @@ def main():
             results.append((label, "SKIP"))
             continue
 
-        cp = subprocess.run([sys.executable, "run_selftest.py"], cwd=svc_path, capture_output=True, text=True)
+        cp = subprocess.run([sys.executable, "run_selftest.py"], cwd=svc_path, env=env, capture_output=True, text=True)
         out = (cp.stdout or "") + (("\n" + cp.stderr) if cp.stderr else "")
         print(out, end="" if out.endswith("\n") else "\n")
         report_lines.append(out + "\n")
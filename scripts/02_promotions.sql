@@ -0,0 +1,28 @@
+-- Promociones (cupones, % por categoría/producto, NxM) y descuentos en carrito/pedidos
+USE ecommerce;
+
+CREATE TABLE IF NOT EXISTS promotions (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  name VARCHAR(200) NOT NULL,
+  kind ENUM('percent','bundle') NOT NULL,
+  scope ENUM('product','category','cart') NOT NULL DEFAULT 'cart',
+  target_id BIGINT NULL,
+  coupon_code VARCHAR(50) NULL,
+  percent DECIMAL(5,2) NULL,
+  buy_qty INT NULL,
+  pay_qty INT NULL,
+  active TINYINT(1) NOT NULL DEFAULT 1,
+  starts_at DATETIME NULL,
+  ends_at DATETIME NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  KEY ix_promotions_coupon_code (coupon_code)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+ALTER TABLE carts ADD COLUMN coupon_code VARCHAR(50) NULL;
+ALTER TABLE order_items ADD COLUMN discount DECIMAL(12,2) NOT NULL DEFAULT 0;
+
+-- Ejemplos (desactivados): 3x2 en camisetas, 10 % con cupón BIENVENIDA
+INSERT IGNORE INTO promotions (id, name, kind, scope, target_id, coupon_code, percent, buy_qty, pay_qty, active)
+VALUES
+  (1, '3x2 en camisetas', 'bundle', 'category', 1, NULL, NULL, 3, 2, 0),
+  (2, 'Bienvenida 10%', 'percent', 'cart', NULL, 'BIENVENIDA', 10.00, NULL, NULL, 0);
@@ -0,0 +1,4 @@
+-- Versión de token por usuario: incrementarla revoca todos sus JWT
+USE ecommerce;
+
+ALTER TABLE users ADD COLUMN token_version INT NOT NULL DEFAULT 0;
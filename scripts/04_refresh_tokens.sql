@@ -0,0 +1,18 @@
+-- Sesiones con refresh tokens rotativos (POST /token/refresh, /logout)
+USE ecommerce;
+
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  user_id BIGINT NOT NULL,
+  sid VARCHAR(32) NOT NULL,
+  token_hash CHAR(64) NOT NULL,
+  expires_at DATETIME NOT NULL,
+  used_at DATETIME NULL,
+  revoked_at DATETIME NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE KEY ux_refresh_tokens_hash (token_hash),
+  KEY ix_refresh_tokens_user (user_id),
+  KEY ix_refresh_tokens_sid (sid),
+  KEY ix_refresh_tokens_revoked_at (revoked_at),
+  CONSTRAINT fk_refresh_tokens_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,22 @@
+-- Índices para los predicados calientes de carrito, pedidos y catálogo
+-- (comprobados con scripts/explain_audit.py). InnoDB añade la PK al final de cada índice
+-- secundario: (user_id) ya sirve "WHERE user_id = ? ORDER BY id".
+USE ecommerce;
+
+-- carrito activo: WHERE user_id = ? AND status = 'active'. Cubre también la FK, así que
+-- el índice que InnoDB creó para fk_carts_user sobra
+ALTER TABLE carts ADD INDEX ix_carts_user_status (user_id, status);
+ALTER TABLE carts DROP INDEX fk_carts_user;
+
+-- historial del usuario: WHERE user_id = ? ORDER BY id DESC (el índice de la FK, con nombre)
+ALTER TABLE orders RENAME INDEX fk_orders_user TO ix_orders_user;
+-- admin por estado: WHERE status = ? ORDER BY id DESC LIMIT n, sin filesort
+ALTER TABLE orders ADD INDEX ix_orders_status_id (status, id);
+
+-- líneas de los pedidos: WHERE order_id IN (...)
+ALTER TABLE order_items RENAME INDEX fk_oi_order TO ix_order_items_order;
+
+-- catálogo por categoría: WHERE category_id = ? ORDER BY id LIMIT n
+ALTER TABLE products RENAME INDEX fk_products_category TO ix_products_category;
+-- productos cambiados desde un instante (caché, sincronizaciones): WHERE updated_at > ?
+ALTER TABLE products ADD INDEX ix_products_updated_at (updated_at);
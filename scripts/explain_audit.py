@@ -0,0 +1,190 @@
+# scripts/explain_audit.py
+"""
+EXPLAIN de las sentencias que lanza cada endpoint: marca scans completos y ordenaciones
+sin índice (filesort en MySQL, "TEMP B-TREE FOR ORDER BY" en SQLite).
+
+Las sentencias salen de los self-tests de auth, catalog, cart y order, ejecutados con
+SELFTEST_CAPTURE_SQL (``common.testing.capture_sql``): una por endpoint y forma, con unos
+parámetros reales. Se explican contra:
+
+- por defecto, un SQLite temporal con el esquema de los modelos (los mismos índices
+  que ``scripts/05_indexes.sql``);
+- ``--db-url``: una BD existente. Con la de ``benchmarks/datagen.py`` los planes salen
+  con datos de verdad; con MySQL se usa ``EXPLAIN`` (type=ALL / index, "Using filesort").
+
+Uso (desde la raíz):
+> python scripts/explain_audit.py
+> python scripts/explain_audit.py --db-url sqlite:////tmp/escala.db
+> python scripts/explain_audit.py --capture /tmp/sql.jsonl --strict   # captura ya hecha; rc=1 si hay avisos
+
+No se marcan las tablas pequeñas que se leen enteras a propósito (``SMALL_TABLES``) ni el
+scan sin WHERE que corta un LIMIT (paginar sin filtro por la PK).
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "services"))
+
+from sqlalchemy import create_engine
+
+from common.colocate import import_service
+from common.testing import statement_shape
+
+SERVICES = ("auth_service", "catalog_service", "cart_service", "order_service")
+SMALL_TABLES = frozenset({"categories", "promotions"})  # índices en memoria: se leen enteras
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|UPDATE|DELETE|WITH)\b", re.I)
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS (\w+))?( USING (?:COVERING )?INDEX \w+)?")
+
+
+@dataclass
+class Finding:
+    service: str
+    endpoint: str
+    statement: str
+    plan: list[str] = field(default_factory=list)
+    problems: list[str] = field(default_factory=list)
+    error: str | None = None
+
+
+def capture(path: Path) -> None:
+    """Corre los self-tests apuntando sus sentencias en ``path``."""
+    env = {**os.environ, "SELFTEST_CAPTURE_SQL": str(path), "DB_ASYNC": "false"}
+    env.pop("SELFTEST_SHARDS", None)
+    for folder in SERVICES:
+        proc = subprocess.run(
+            [sys.executable, "run_selftest.py"], cwd=ROOT / "services" / folder, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        print(f"self-test {folder}: {'PASS' if proc.returncode == 0 else f'FAIL (rc={proc.returncode})'}")
+
+
+def load(path: Path) -> list[dict]:
+    """Entradas de la captura, sin repetir (endpoint, forma) y solo las que admiten EXPLAIN."""
+    seen, out = set(), []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        entry = json.loads(line)
+        key = (entry["service"], entry["endpoint"], statement_shape(entry["statement"]))
+        if key not in seen and _EXPLAINABLE.match(entry["statement"]):
+            seen.add(key)
+            out.append(entry)
+    return out
+
+
+def schema_engine():
+    """SQLite temporal con las tablas de los modelos (auth y catalog primero, como datagen)."""
+    engine = create_engine(f"sqlite:///{Path(tempfile.mkdtemp()) / 'audit.db'}")
+    for folder in SERVICES:
+        import_service(folder, "app.models").database.Base.metadata.create_all(engine)
+    return engine
+
+
+def _params(entry: dict, dialect: str):
+    params = entry["parameters"]
+    return tuple(params) if isinstance(params, list) else params
+
+
+def _sql(entry: dict, dialect: str) -> str:
+    sql = entry["statement"]
+    if dialect == "mysql" and entry["dialect"] == "sqlite":
+        sql = sql.replace("%", "%%").replace("?", "%s")  # qmark de sqlite3 -> format de PyMySQL
+    return sql
+
+
+def explain_sqlite(conn, entry: dict, f: Finding) -> None:
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + _sql(entry, "sqlite"), _params(entry, "sqlite")).all()
+    has_where = re.search(r"\bWHERE\b", entry["statement"], re.I) is not None
+    has_limit = re.search(r"\bLIMIT\b", entry["statement"], re.I) is not None
+    for row in rows:
+        detail = row[-1]
+        f.plan.append(detail)
+        m = _SQLITE_SCAN.match(detail)
+        if m and m.group(1) not in SMALL_TABLES and (has_where or not has_limit):
+            f.problems.append(f"scan {'de índice completo' if m.group(3) else 'completo'} de {m.group(1)}")
+        elif detail.startswith("USE TEMP B-TREE FOR ORDER BY"):
+            f.problems.append("ORDER BY sin índice (temp b-tree)")
+
+
+def explain_mysql(conn, entry: dict, f: Finding) -> None:
+    result = conn.exec_driver_sql("EXPLAIN " + _sql(entry, "mysql"), _params(entry, "mysql"))
+    has_where = re.search(r"\bWHERE\b", entry["statement"], re.I) is not None
+    for row in result.mappings():
+        table, kind, extra = row.get("table"), row.get("type"), row.get("Extra") or ""
+        f.plan.append(f"{table}: type={kind} key={row.get('key')} rows={row.get('rows')} {extra}".strip())
+        if kind in ("ALL", "index") and table not in SMALL_TABLES and has_where:
+            f.problems.append(f"scan {'de índice completo' if kind == 'index' else 'completo'} de {table}")
+        if "Using filesort" in extra:
+            f.problems.append(f"filesort en {table}")
+
+
+def audit(engine, entries: list[dict]) -> list[Finding]:
+    explain = explain_mysql if engine.dialect.name == "mysql" else explain_sqlite
+    findings = []
+    with engine.connect() as conn:
+        for entry in entries:
+            f = Finding(entry["service"], entry["endpoint"], entry["statement"])
+            try:
+                explain(conn, entry, f)
+            except Exception as exc:  # p.ej. una tabla que esta BD no tiene
+                f.error = str(exc).splitlines()[0]
+                conn.rollback()
+            findings.append(f)
+    return findings
+
+
+def report(findings: list[Finding], verbose: bool) -> int:
+    current = None
+    for f in sorted(findings, key=lambda f: (SERVICES.index(f"{f.service}_service"), f.endpoint)):
+        if not (verbose or f.problems or f.error):
+            continue
+        if (f.service, f.endpoint) != current:
+            current = (f.service, f.endpoint)
+            print(f"\n== {f.service}  {f.endpoint}")
+        shape = statement_shape(f.statement)
+        if f.error:
+            print(f"  ERROR    {shape[:110]}\n           {f.error}")
+        elif f.problems:
+            print(f"  REVISAR  {shape[:110]}\n           {'; '.join(dict.fromkeys(f.problems))}")
+        elif verbose:
+            print(f"  ok       {shape[:110]}")
+        if verbose or f.problems:
+            for line in f.plan:
+                print(f"           | {line}")
+    flagged = sum(1 for f in findings if f.problems)
+    print(f"\n{len(findings)} sentencias, {flagged} a revisar")
+    return flagged
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db-url", default=None, help="BD contra la que explicar (por defecto, SQLite con el esquema de los modelos)")
+    ap.add_argument("--capture", type=Path, default=None, help="captura ya hecha (JSONL); sin ella se corren los self-tests")
+    ap.add_argument("--strict", action="store_true", help="rc=1 si alguna sentencia queda a revisar")
+    ap.add_argument("-v", "--verbose", action="store_true", help="también las sentencias sin avisos, con su plan")
+    args = ap.parse_args()
+
+    path = args.capture
+    if path is None:
+        path = Path(tempfile.mkdtemp()) / "sql.jsonl"
+        capture(path)
+    if not path.exists():
+        raise SystemExit(f"ERROR: no hay captura en {path}")
+
+    engine = create_engine(args.db_url) if args.db_url else schema_engine()
+    try:
+        flagged = report(audit(engine, load(path)), args.verbose)
+    finally:
+        engine.dispose()
+    sys.exit(1 if args.strict and flagged else 0)
+
+
+if __name__ == "__main__":
+    main()
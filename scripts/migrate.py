@@ -0,0 +1,76 @@
+# scripts/migrate.py
+"""
+Aplica las migraciones de scripts/NN_*.sql a la BD del .env (o --db-url).
+
+Uso (desde la raíz):
+> python scripts/migrate.py              # estado: aplicadas y pendientes
+> python scripts/migrate.py upgrade      # aplica las pendientes, en orden
+> python scripts/migrate.py baseline 4   # BD importada a mano con 01..04: solo las marca
+> python scripts/migrate.py --shards upgrade   # scripts/shards/NN_*.sql en cada DB_SHARD_URLS
+
+La BD y el usuario (CREATE DATABASE / CREATE USER / GRANT de 01_schema.sql) los crea un
+administrador una vez; el resto lo aplica este script con el usuario de la app. Los shards
+son BDs aparte (vacías al empezar): con --shards, tras migrar cada uno se reserva su rango
+de ids (common.sharding).
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "services"))
+
+from sqlalchemy import create_engine
+
+from common import migrations, sharding
+from common.settings import ServiceSettings
+
+
+def run(command: str, engine, directory: Path, version: int | None, shard: int | None = None) -> None:
+    if command == "upgrade":
+        done = migrations.upgrade(engine, directory)
+        if shard is not None:
+            sharding.reserve_id_range(engine, shard)
+        print(f"{len(done)} migraciones aplicadas" if done else "El esquema ya está al día")
+    elif command == "baseline":
+        marked = migrations.baseline(engine, version, directory)
+        print(f"Marcadas como aplicadas: {', '.join(m.name for m in marked) or 'ninguna'}")
+    else:
+        applied = migrations.applied_versions(engine)
+        for m in migrations.discover(directory):
+            print(f"[{'x' if m.version in applied else ' '}] {m.path.name}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("command", nargs="?", default="status", choices=("status", "upgrade", "baseline"))
+    ap.add_argument("version", nargs="?", type=int, help="baseline: última versión ya importada")
+    ap.add_argument("--db-url", default=None, help="por defecto, la del .env (DB_URL o DB_HOST..DB_PASS)")
+    ap.add_argument("--shards", action="store_true", help="los shards de DB_SHARD_URLS en vez del primario")
+    args = ap.parse_args()
+    if args.command == "baseline" and args.version is None:
+        ap.error("baseline necesita la versión, p.ej. 'baseline 4'")
+
+    settings = ServiceSettings()
+    if args.shards:
+        if not settings.shard_urls:
+            ap.error("--shards: DB_SHARD_URLS está vacío")
+        targets = [(i, url) for i, url in enumerate(settings.shard_urls)]
+        directory = migrations.SCRIPTS_DIR / "shards"
+    else:
+        targets = [(None, args.db_url or settings.database_url)]
+        directory = migrations.SCRIPTS_DIR
+
+    for shard, url in targets:
+        if shard is not None:
+            print(f"== shard {shard}")
+        engine = create_engine(url)
+        try:
+            run(args.command, engine, directory, args.version, shard)
+        except migrations.MigrationError as exc:
+            raise SystemExit(f"ERROR: {exc}")
+        finally:
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
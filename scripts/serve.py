@@ -0,0 +1,121 @@
+# scripts/serve.py
+"""
+Arranque de producción: cada servicio con N workers (common.serving).
+
+Uso (desde la raíz, con el esquema ya migrado):
+> python scripts/serve.py                          # auth, catalog, cart y order
+> python scripts/serve.py catalog order -w 4       # solo esos, 4 workers cada uno
+> python scripts/serve.py bff --max-requests 5000  # el BFF (BFF_IN_PROCESS o los 4 levantados)
+
+Puertos y configuración, los de siempre: ``*_PORT`` y el resto del .env de la raíz más
+el .env local de cada servicio. Ctrl+C / SIGTERM: apagado ordenado (las requests en curso
+terminan, hasta --graceful-timeout s).
+
+Sin ``os.fork`` (Windows) se lanza un ``uvicorn --workers`` por servicio: sin preload y
+con los workers y el reciclado de uvicorn. Ahí los pins de réplica no se comparten entre
+workers (read-your-writes solo con balanceo sticky o ``-w 1``).
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SERVICES_DIR = Path(__file__).resolve().parents[1] / "services"
+sys.path.insert(0, str(SERVICES_DIR))
+
+from common.colocate import import_service
+from common.serving import ServiceSpec, Supervisor
+
+SERVICES = {
+    "auth": ("auth_service", "AUTH_PORT"),
+    "catalog": ("catalog_service", "CATALOG_PORT"),
+    "cart": ("cart_service", "CART_PORT"),
+    "order": ("order_service", "ORDER_PORT"),
+    "bff": ("bff_service", "BFF_PORT"),
+}
+DEFAULT = ("auth", "catalog", "cart", "order")
+
+
+def import_from(folder: str, module: str = "app.main"):
+    cwd = os.getcwd()
+    os.chdir(SERVICES_DIR / folder)  # su .env local, como al lanzarlo desde su carpeta
+    try:
+        return import_service(folder, module)
+    finally:
+        os.chdir(cwd)
+
+
+def load(name: str, host: str) -> ServiceSpec:
+    folder, port = SERVICES[name]
+    mods = import_from(folder)
+    settings = mods.config.settings
+    database = mods.database.database if hasattr(mods, "database") else None
+    return ServiceSpec(name, mods.main.app, settings, host, getattr(settings, port), database)
+
+
+def split_hash_pool(workers: int) -> None:
+    """
+    Sin HASH_POOL_WORKERS en la configuración, cada worker de auth tendría un pool de
+    bcrypt por core (cores² procesos): se reparten los cores entre los workers. Va por
+    el entorno para que también lo vean los procesos de ``uvicorn --workers``.
+    """
+    if import_from("auth_service", "app.config").config.settings.HASH_POOL_WORKERS is None:
+        os.environ["HASH_POOL_WORKERS"] = str(max(1, (os.cpu_count() or 1) // workers))
+
+
+def run_without_fork(names: list[str], args) -> int:
+    procs = []
+    for name in names:
+        folder, port = SERVICES[name]
+        settings = import_from(folder, "app.config").config.settings
+        if args.workers > 1 and getattr(settings, "replica_urls", None):
+            print(f"[serve] {name}: sin fork los pins de lectura tras escribir son de cada worker; "
+                  "con réplicas, balanceo sticky por usuario o -w 1", file=sys.stderr)
+        cmd = [
+            sys.executable, "-m", "uvicorn", "app.main:app", "--host", args.host,
+            "--port", str(getattr(settings, port)), "--workers", str(args.workers),
+            "--timeout-graceful-shutdown", str(int(args.graceful_timeout)),
+        ]
+        if args.max_requests:
+            cmd += ["--limit-max-requests", str(args.max_requests)]
+        if not args.access_log:
+            cmd.append("--no-access-log")
+        procs.append(subprocess.Popen(cmd, cwd=SERVICES_DIR / folder))
+    try:
+        return max(p.wait() for p in procs)
+    except KeyboardInterrupt:  # Ctrl+C también les llega a ellos: apagado ordenado
+        return max(p.wait() for p in procs)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("services", nargs="*", help=f"{', '.join(SERVICES)} (por defecto: {' '.join(DEFAULT)})")
+    ap.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="por servicio (por defecto: nº de cores)")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--max-requests", type=int, default=10_000, help="reciclar cada worker tras N requests (0 = nunca)")
+    ap.add_argument("--max-requests-jitter", type=int, default=None, help="por defecto, el 10%% de --max-requests")
+    ap.add_argument("--graceful-timeout", type=float, default=30.0, help="segundos para terminar las requests en curso")
+    ap.add_argument("--access-log", action="store_true", help="log por request (las métricas ya están en /metrics)")
+    ap.add_argument("--log-level", default="info")
+    args = ap.parse_args()
+    names = args.services or list(DEFAULT)
+    unknown = [name for name in names if name not in SERVICES]
+    if unknown:
+        ap.error(f"servicio desconocido: {', '.join(unknown)}")
+    split_hash_pool(args.workers)  # antes de importar auth (también dentro del BFF)
+
+    if not hasattr(os, "fork"):
+        sys.exit(run_without_fork(names, args))
+
+    jitter = args.max_requests // 10 if args.max_requests_jitter is None else args.max_requests_jitter
+    supervisor = Supervisor(
+        [load(name, args.host) for name in names],
+        workers=args.workers, max_requests=args.max_requests, max_requests_jitter=jitter,
+        graceful_timeout=args.graceful_timeout, access_log=args.access_log, log_level=args.log_level,
+    )
+    sys.exit(supervisor.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+-- Esquema de cada shard de carritos y pedidos (DB_SHARD_URLS; common.sharding).
+-- Mismas tablas que en 01_schema.sql + 02_promotions.sql, sin las FK a users y products:
+-- esas tablas están en el primario. Se aplica con: python scripts/migrate.py --shards upgrade
+-- (que además reserva el rango de ids de cada shard).
+
+CREATE TABLE IF NOT EXISTS carts (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  user_id BIGINT NOT NULL,
+  status ENUM('active','converted','abandoned') NOT NULL DEFAULT 'active',
+  coupon_code VARCHAR(50) NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  KEY ix_carts_user (user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS cart_items (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  cart_id BIGINT NOT NULL,
+  product_id BIGINT NOT NULL,
+  quantity INT NOT NULL DEFAULT 1,
+  unit_price DECIMAL(10,2) NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE KEY uq_cart_product (cart_id, product_id),
+  CONSTRAINT fk_ci_cart FOREIGN KEY (cart_id) REFERENCES carts(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS orders (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  user_id BIGINT NOT NULL,
+  total DECIMAL(12,2) NOT NULL DEFAULT 0,
+  status ENUM('created','paid','shipped','delivered','cancelled') NOT NULL DEFAULT 'created',
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  KEY ix_orders_user (user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS order_items (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  order_id BIGINT NOT NULL,
+  product_id BIGINT NOT NULL,
+  quantity INT NOT NULL,
+  unit_price DECIMAL(10,2) NOT NULL,
+  vat_rate DECIMAL(5,2) NOT NULL DEFAULT 19.00,
+  discount DECIMAL(12,2) NOT NULL DEFAULT 0,
+  CONSTRAINT fk_oi_order FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
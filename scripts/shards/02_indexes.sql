@@ -0,0 +1,9 @@
+-- Los índices de 05_indexes.sql en cada shard de carritos y pedidos.
+-- Se aplica con: python scripts/migrate.py --shards upgrade
+
+ALTER TABLE carts ADD INDEX ix_carts_user_status (user_id, status);
+ALTER TABLE carts DROP INDEX ix_carts_user;
+
+ALTER TABLE orders ADD INDEX ix_orders_status_id (status, id);
+
+ALTER TABLE order_items RENAME INDEX fk_oi_order TO ix_order_items_order;
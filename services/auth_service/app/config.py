@@ -1,27 +1,18 @@
-from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import field_validator
+from common.settings import ServiceSettings
 
-class Settings(BaseSettings):
-    DB_HOST: str = "127.0.0.1"
-    DB_PORT: int = 3306
-    DB_NAME: str = "ecommerce"
-    DB_USER: str = "ecom_user"
-    DB_PASS: str = "ecom_pass"
-
-    JWT_SECRET: str = "change_this_secret"
-    JWT_ALG: str = "HS256"
-    JWT_EXPIRE_MIN: int = 120   # minutos (se sobreescribe por .env)
+class Settings(ServiceSettings):
+    JWT_KEYS_DIR: str = ""       # RS256/ES256: vacío = services/auth_service/keys
+    JWT_KEYS_RELOAD_S: float = 30.0  # cada cuánto se mira si hay claves nuevas (rotación sin reinicio)
+    JWT_EXPIRE_MIN: int = 120   # minutos: duración de la sesión / refresh token (se sobreescribe por .env)
+    ACCESS_TOKEN_EXPIRE_MIN: int = 15  # access token corto; se renueva con POST /token/refresh
 
     AUTH_PORT: int = 8001
 
-    # Si tu .env está en la raíz del repo, apunta directo:
-    # env_file="../../.env"
-    model_config = SettingsConfigDict(
-        env_file=".env",
-        env_file_encoding="utf-8",
-        extra="ignore",
-        case_sensitive=False,  # acepta jwt_expire_min o JWT_EXPIRE_MIN
-    )
+    # Pool de procesos para bcrypt (None = nº de cores, 0 = threadpool)
+    HASH_POOL_WORKERS: int | None = None
+    HASH_POOL_QUEUE: int = 64          # trabajos en espera antes de responder 503
+    HASH_POOL_RETRY_AFTER_S: int = 1
 
     @field_validator("JWT_EXPIRE_MIN", mode="before")
     @classmethod
@@ -34,4 +25,4 @@ class Settings(BaseSettings):
             return int(v)
         return v
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -1,24 +1,31 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+from common.tracing import span
+
 from .database import SessionLocal
 from .security import decode_token
+from .sessions import revocations
 from . import models
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 def get_db():
-    db = SessionLocal()
+    with span("get_db"):
+        db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.User:
-    data = decode_token(token)
-    if not data or "sub" not in data:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido")
-    user = db.get(models.User, int(data["sub"]))
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuario no encontrado")
-    return user
+    with span("get_current_user"):
+        data = decode_token(token)
+        if not data or "sub" not in data:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido")
+        user = db.get(models.User, int(data["sub"]))
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuario no encontrado")
+        if int(data.get("ver", 0)) != (user.token_version or 0) or revocations.is_revoked(data.get("sid")):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revocado")
+        return user
@@ -0,0 +1,127 @@
+# services/auth_service/app/hashing.py
+"""
+Pool de procesos dedicado a bcrypt para /login y /signup.
+
+bcrypt consume decenas de ms de CPU con el GIL tomado; en el threadpool compartido
+de Starlette una ráfaga de logins deja sin hilos a /me y /health. Aquí el hash y la
+verificación corren en procesos aparte y los handlers solo esperan el resultado.
+
+La cola está acotada: con ``workers + max_queue`` trabajos pendientes, un nuevo
+login se rechaza al instante (``PoolBusy`` -> 503 + Retry-After) en vez de encolarse.
+Lo que ejecutan los procesos está en ``common.hashing`` (ahí se explica por qué).
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from starlette.concurrency import run_in_threadpool
+
+from common.hashing import timed_hash, timed_verify
+
+from .config import settings
+
+
+class PoolBusy(Exception):
+    """Cola de hashing llena: responder 503 con Retry-After."""
+
+
+class HashPool:
+    def __init__(self, workers: int, max_queue: int):
+        # workers=0: sin procesos, se usa el threadpool (misma admisión y métricas)
+        self.workers = workers
+        self.max_queue = max_queue
+        self.capacity = max(workers, 1) + max_queue
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+        self._pending = 0
+        self._latency: deque[float] = deque(maxlen=1024)  # espera + ejecución
+        self._exec: deque[float] = deque(maxlen=1024)     # solo bcrypt
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: igual en Windows y Linux, y seguro con hilos en el proceso padre
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise PoolBusy()
+            self._pending += 1
+            self.submitted += 1
+        t0 = time.perf_counter()
+        try:
+            if self.workers > 0:
+                result, exec_s = await asyncio.wrap_future(self._get_executor().submit(fn, *args))
+            else:
+                result, exec_s = await run_in_threadpool(fn, *args)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+        with self._lock:
+            self.completed += 1
+            self._latency.append(time.perf_counter() - t0)
+            self._exec.append(exec_s)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(timed_hash, password)
+
+    async def verify(self, plain: str, hashed: str) -> bool:
+        return await self._run(timed_verify, plain, hashed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lat = sorted(self._latency)
+            exe = list(self._exec)
+            pending = self._pending
+        running = min(pending, max(self.workers, 1))
+
+        def ms(v: float) -> float:
+            return round(v * 1000, 2)
+
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": running,
+            "queued": pending - running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "latency_ms": {
+                "avg": ms(sum(lat) / len(lat)) if lat else 0.0,
+                "p95": ms(lat[min(len(lat) - 1, int(len(lat) * 0.95))]) if lat else 0.0,
+                "max": ms(lat[-1]) if lat else 0.0,
+            },
+            "bcrypt_ms_avg": ms(sum(exe) / len(exe)) if exe else 0.0,
+        }
+
+
+hasher = HashPool(
+    workers=settings.HASH_POOL_WORKERS if settings.HASH_POOL_WORKERS is not None else (os.cpu_count() or 1),
+    max_queue=settings.HASH_POOL_QUEUE,
+)
@@ -0,0 +1,103 @@
+# services/auth_service/app/keys.py
+"""
+Claves de firma de JWT para algoritmos asimétricos (RS256/ES256).
+
+Cada fichero ``<kid>.pem`` de ``JWT_KEYS_DIR`` es una clave privada; firma la más
+reciente (por fecha de modificación) y se publican todas las públicas en
+``/.well-known/jwks.json``. Rotar = dejar un ``.pem`` nuevo en el directorio (se
+detecta sin reiniciar) y borrar el antiguo cuando hayan caducado sus access tokens.
+
+Si el directorio está vacío se genera una clave (cómodo en desarrollo).
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+
+logger = logging.getLogger(__name__)
+
+
+def generate_pem(alg: str) -> bytes:
+    if alg.startswith("RS"):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif alg == "ES256":
+        key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        raise ValueError(f"Algoritmo no soportado para claves: {alg}")
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+
+
+class KeyRing:
+    def __init__(self, directory: Path, alg: str, reload_s: float = 30.0):
+        self.directory = Path(directory)
+        self.alg = alg
+        self.reload_s = reload_s
+        self.active_kid: str | None = None
+        self._signing = None                    # clave privada activa (objeto jose)
+        self._verifying: dict[str, object] = {}  # kid -> clave pública
+        self._jwks: dict = {"keys": []}
+        self._dir_mtime: float | None = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = sorted(self.directory.glob("*.pem"), key=lambda p: (p.stat().st_mtime, p.name))
+        if not files:
+            kid = time.strftime("%Y%m%d%H%M%S")
+            path = self.directory / f"{kid}.pem"
+            path.write_bytes(generate_pem(self.alg))
+            os.chmod(path, 0o600)
+            logger.warning("JWT_KEYS_DIR vacío: generada la clave %s", path)
+            files = [path]
+
+        verifying, public = {}, []
+        for path in files:
+            private = jwk.construct(path.read_bytes(), self.alg)
+            pub = private.public_key()
+            verifying[path.stem] = pub
+            public.append({**pub.to_dict(), "kid": path.stem, "use": "sig", "alg": self.alg})
+        self._signing = jwk.construct(files[-1].read_bytes(), self.alg)
+        self.active_kid = files[-1].stem
+        self._verifying = verifying
+        self._jwks = {"keys": public}
+        self._dir_mtime = self.directory.stat().st_mtime
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.reload_s
+            try:
+                if self.directory.stat().st_mtime != self._dir_mtime:
+                    self._load()
+            except (OSError, ValueError, JWTError) as exc:
+                # un .pem a medio copiar no tumba el servicio: se sigue con las claves cargadas
+                logger.warning("No se pudieron recargar las claves JWT: %s", exc)
+
+    def sign(self, payload: dict) -> str:
+        self._maybe_reload()
+        return jwt.encode(payload, self._signing, algorithm=self.alg, headers={"kid": self.active_kid})
+
+    def verify(self, token: str) -> dict:
+        self._maybe_reload()
+        key = self._verifying.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            raise JWTError("kid desconocido")
+        return jwt.decode(token, key, algorithms=[self.alg])
+
+    def jwks(self) -> dict:
+        self._maybe_reload()
+        return self._jwks
@@ -1,12 +1,31 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, HTTPException, Response, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from .database import Base, engine
+from starlette.concurrency import run_in_threadpool
+from common.compression import CompressionMiddleware
+from common.metrics import CONTENT_TYPE, Metrics, MetricsMiddleware
+from common.tracing import Tracer, TracingMiddleware, instrument_database
+from .database import database
 from . import models, schemas
 from .deps import get_db, get_current_user
-from .security import verify_password, get_password_hash, create_access_token
+from .security import jwks, token_cache
+from . import sessions
+from .hashing import PoolBusy, hasher
 from .config import settings
 
-app = FastAPI(title="Auth Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # engines al arrancar y no al importar; el esquema lo aplica scripts/migrate.py
+    database.start()
+    metrics.instrument_database(database)
+    instrument_database(database)  # un span por sentencia SQL
+    yield
+    hasher.shutdown()
+    await database.dispose()
+
+app = FastAPI(title="Auth Service", lifespan=lifespan)
 from fastapi.middleware.cors import CORSMiddleware
 app.add_middleware(
     CORSMiddleware,
@@ -16,41 +35,133 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Crea tablas si no existen (solo dev)
-Base.metadata.create_all(bind=engine)
+# compresión negociada (gzip, y br/zstd si están instalados) de las respuestas grandes
+app.add_middleware(CompressionMiddleware, settings=settings)
+
+# métricas Prometheus: latencia por ruta, sentencias SQL por request y pool (GET /metrics)
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# trazas distribuidas (traceparent W3C, muestreadas): GET /health/traces
+tracer = Tracer('auth', settings)
+app.add_middleware(TracingMiddleware, tracer=tracer)
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-@app.post("/signup", response_model=schemas.UserOut, status_code=201)
-def signup(payload: schemas.UserCreate, db: Session = Depends(get_db)):
-    exists = db.query(models.User).filter(models.User.email == payload.email).first()
-    if exists:
-        raise HTTPException(status_code=400, detail="Email ya registrado")
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # async: el scrape no espera turno en el threadpool aunque esté saturado
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health/db")
+def db_pool_stats():
+    return database.pool_status()
+
+@app.get("/health/traces")
+def recent_traces(limit: int = 20, min_ms: float = 0.0):
+    # últimas trazas muestreadas (TRACE_EXPORT=memory); min_ms: solo las más lentas
+    return {"stats": tracer.stats(), "traces": tracer.recent(limit, min_ms)}
+
+@app.get("/health/auth")
+def auth_cache_stats():
+    return {"token_cache": token_cache.stats(), "revocations": sessions.revocations.stats()}
+
+@app.get("/.well-known/jwks.json")
+def jwks_endpoint(response: Response):
+    # claves públicas para verificar los JWT (vacío con HS256); los servicios las cachean
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return jwks()
+
+@app.get("/health/hashing")
+def hashing_stats():
+    return hasher.stats()
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Servicio saturado, reintenta en unos segundos",
+        headers={"Retry-After": str(settings.HASH_POOL_RETRY_AFTER_S)},
+    )
+
+def _find_user(db: Session, email: str) -> models.User | None:
+    user = db.query(models.User).filter(models.User.email == email).first()
+    # devuelve la conexión al pool antes de esperar a bcrypt (la sesión sigue usable;
+    # close() no expira los atributos ya cargados)
+    db.close()
+    return user
+
+def _create_user(db: Session, payload: schemas.UserCreate, hashed: str) -> models.User:
     user = models.User(
         email=payload.email,
         full_name=payload.full_name,
         is_admin=payload.is_admin,
-        hashed_password=get_password_hash(payload.password),
+        hashed_password=hashed,
     )
     db.add(user)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # otro signup con el mismo email pasó la comprobación mientras se calculaba el hash
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Email ya registrado")
     db.refresh(user)
     return user
 
+# login/signup son async: la BD va al threadpool y bcrypt al pool de procesos,
+# así una ráfaga de logins no bloquea /me ni /health
+@app.post("/signup", response_model=schemas.UserOut, status_code=201)
+async def signup(payload: schemas.UserCreate, db: Session = Depends(get_db)):
+    exists = await run_in_threadpool(_find_user, db, payload.email)
+    if exists:
+        raise HTTPException(status_code=400, detail="Email ya registrado")
+    try:
+        hashed = await hasher.hash(payload.password)
+    except PoolBusy:
+        raise _busy()
+    return await run_in_threadpool(_create_user, db, payload, hashed)
+
 @app.post("/login", response_model=schemas.Token)
-def login(payload: schemas.LoginInput, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == payload.email).first()
-    if not user or not verify_password(payload.password, user.hashed_password):
+async def login(payload: schemas.LoginInput, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(_find_user, db, payload.email)
+    try:
+        ok = user is not None and await hasher.verify(payload.password, user.hashed_password)
+    except PoolBusy:
+        raise _busy()
+    if not ok:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales inválidas")
-    token = create_access_token(str(user.id))
-    return {"access_token": token, "token_type": "bearer"}
+    return await run_in_threadpool(sessions.start_session, db, user)
+
+@app.post("/token/refresh", response_model=schemas.Token)
+def refresh_token(payload: schemas.RefreshInput, db: Session = Depends(get_db)):
+    # rota el refresh token: el anterior queda consumido
+    return sessions.rotate(db, payload.refresh_token)
+
+@app.post("/logout", status_code=204)
+def logout(payload: schemas.RefreshInput, db: Session = Depends(get_db)):
+    # cierra la sesión: sus access tokens dejan de valer en cuanto los servicios sincronizan
+    sessions.revoke_by_refresh(db, payload.refresh_token)
+    return None
+
+@app.get("/token/revocations", response_model=schemas.Revocations)
+def token_revocations(db: Session = Depends(get_db)):
+    # lo consultan catalog/cart/order cada AUTH_REVOCATION_SYNC_S
+    return {"sids": sessions.revoked_sids(db), "window_s": sessions.revocation_window_s()}
 
 @app.get("/me", response_model=schemas.UserOut)
 def me(current_user = Depends(get_current_user)):
     return current_user
 
+@app.post("/me/revoke-tokens", status_code=204)
+def revoke_tokens(current_user = Depends(get_current_user), db: Session = Depends(get_db)):
+    # invalida todos los JWT emitidos (los servicios lo notan al caducar su caché de usuarios)
+    # y cierra todas sus sesiones para que los refresh tokens no emitan tokens nuevos
+    current_user.token_version = (current_user.token_version or 0) + 1
+    db.commit()
+    sessions.revoke_user_sessions(db, current_user.id)
+    return None
+
 # Permite arrancar con puerto de .env usando: python -m app.main
 if __name__ == "__main__":
     import uvicorn
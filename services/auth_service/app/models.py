@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, TIMESTAMP, text
 from .database import Base
 
 class User(Base):
@@ -9,4 +9,17 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     full_name = Column(String(255))
     is_admin = Column(Boolean, nullable=False, server_default=text("0"))
+    token_version = Column(Integer, nullable=False, server_default=text("0"))  # +1 revoca sus JWT
+    created_at = Column(TIMESTAMP, server_default=text("CURRENT_TIMESTAMP"))
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    sid = Column(String(32), nullable=False, index=True)            # sesión (familia de rotación)
+    token_hash = Column(String(64), unique=True, nullable=False)    # sha256 hex; el token no se guarda
+    expires_at = Column(DateTime, nullable=False)                   # UTC, fijo para toda la sesión
+    used_at = Column(DateTime)                                      # ya rotado: reutilizarlo cierra la sesión
+    revoked_at = Column(DateTime, index=True)
     created_at = Column(TIMESTAMP, server_default=text("CURRENT_TIMESTAMP"))
@@ -22,3 +22,12 @@ class LoginInput(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: str | None = None
+    expires_in: int | None = None  # segundos de vida del access token
+
+class RefreshInput(BaseModel):
+    refresh_token: str
+
+class Revocations(BaseModel):
+    sids: list[str]
+    window_s: int  # un sid revocado hace más de esto ya no tiene access tokens vivos
@@ -1,9 +1,11 @@
 from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from jose import jwt, JWTError
-from passlib.context import CryptContext
-from .config import settings
+from common.hashing import pwd_context
+from common.tokens import TokenCache
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .config import settings
+from .keys import KeyRing
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -11,13 +13,47 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def create_access_token(subject: str) -> str:
-    expire = datetime.now(timezone.utc) + timedelta(minutes=settings.JWT_EXPIRE_MIN)
-    payload = {"sub": subject, "exp": expire}
+# HS*: secreto compartido (JWT_SECRET). RS256/ES256: solo auth_service tiene la clave
+# privada; los demás servicios verifican con las públicas de /.well-known/jwks.json
+key_ring = (
+    None
+    if settings.JWT_ALG.startswith("HS")
+    else KeyRing(
+        Path(settings.JWT_KEYS_DIR) if settings.JWT_KEYS_DIR else Path(__file__).resolve().parents[1] / "keys",
+        settings.JWT_ALG,
+        reload_s=settings.JWT_KEYS_RELOAD_S,
+    )
+)
+
+def _sign(payload: dict) -> str:
+    if key_ring is not None:
+        return key_ring.sign(payload)
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
 
+def jwks() -> dict:
+    return key_ring.jwks() if key_ring is not None else {"keys": []}
+
+def create_access_token(
+    subject: str, *, is_admin: bool = False, token_version: int = 0, sid: str | None = None
+) -> str:
+    # adm/ver: los demás servicios confían en estos claims (sin consultar users por request)
+    # sid: sesión de refresh de la que sale el token (revocable con /logout)
+    expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MIN)
+    payload = {"sub": subject, "exp": expire, "adm": bool(is_admin), "ver": int(token_version or 0)}
+    if sid is not None:
+        payload["sid"] = sid
+    return _sign(payload)
+
+# JWT ya verificados (sha256 del token -> claims) hasta su exp
+token_cache = TokenCache(max_entries=settings.AUTH_TOKEN_CACHE_MAX)
+
+def _verify(token: str) -> dict:
+    if key_ring is not None:
+        return key_ring.verify(token)
+    return jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALG])
+
 def decode_token(token: str) -> dict | None:
     try:
-        return jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALG])
+        return token_cache.decode(token, _verify)
     except JWTError:
         return None
@@ -0,0 +1,140 @@
+# services/auth_service/app/sessions.py
+"""
+Sesiones con refresh tokens rotativos.
+
+- Login abre una sesión (``sid``) y entrega un access token corto + un refresh token.
+- ``POST /token/refresh`` consume el refresh token y entrega uno nuevo de la misma
+  sesión. Presentar otra vez uno ya consumido significa que hay una copia: se revoca
+  la sesión entera.
+- Los ``sid`` revocados dentro de la vida de un access token se publican en
+  ``GET /token/revocations`` para que los demás servicios los rechacen sin consultar
+  la BD (ver ``common.revocation``).
+
+En la BD solo se guarda el sha256 del refresh token.
+"""
+import hashlib
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from common.revocation import RevocationSet
+
+from .config import settings
+from .database import SessionLocal
+from .models import RefreshToken, User
+from .security import create_access_token
+
+# margen por desfase de relojes entre servicios
+_SKEW_S = 60
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def revocation_window_s() -> int:
+    return settings.ACCESS_TOKEN_EXPIRE_MIN * 60 + _SKEW_S
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+
+def _issue(db: Session, user_id: int, sid: str, expires_at: datetime) -> str:
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(user_id=user_id, sid=sid, token_hash=_hash(token), expires_at=expires_at))
+    return token
+
+
+def _pair(user: User, sid: str, refresh: str) -> dict:
+    access = create_access_token(
+        str(user.id), is_admin=bool(user.is_admin), token_version=user.token_version or 0, sid=sid
+    )
+    return {
+        "access_token": access,
+        "token_type": "bearer",
+        "refresh_token": refresh,
+        "expires_in": settings.ACCESS_TOKEN_EXPIRE_MIN * 60,
+    }
+
+
+def start_session(db: Session, user: User) -> dict:
+    sid = secrets.token_hex(8)
+    refresh = _issue(db, user.id, sid, _utcnow() + timedelta(minutes=settings.JWT_EXPIRE_MIN))
+    db.commit()
+    return _pair(user, sid, refresh)
+
+
+def rotate(db: Session, refresh_token: str) -> dict:
+    now = _utcnow()
+    row = db.execute(
+        select(RefreshToken).where(RefreshToken.token_hash == _hash(refresh_token)).with_for_update()
+    ).scalar_one_or_none()
+    if row is None or row.revoked_at is not None or row.expires_at <= now:
+        raise _unauthorized("Refresh token inválido")
+    if row.used_at is not None:
+        revoke_session(db, row.sid)
+        raise _unauthorized("Refresh token reutilizado; sesión cerrada")
+
+    user = db.get(User, row.user_id)
+    if user is None:
+        raise _unauthorized("Usuario no encontrado")
+    row.used_at = now
+    refresh = _issue(db, user.id, row.sid, row.expires_at)  # la rotación no alarga la sesión
+    db.commit()
+    return _pair(user, row.sid, refresh)
+
+
+def revoke_session(db: Session, sid: str) -> None:
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.sid == sid, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=_utcnow())
+    )
+    db.commit()
+    revocations.add(sid)
+
+
+def revoke_by_refresh(db: Session, refresh_token: str) -> None:
+    sid = db.execute(
+        select(RefreshToken.sid).where(RefreshToken.token_hash == _hash(refresh_token))
+    ).scalar_one_or_none()
+    if sid is not None:
+        revoke_session(db, sid)
+
+
+def revoke_user_sessions(db: Session, user_id: int) -> None:
+    sids = db.execute(
+        select(RefreshToken.sid).where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None)).distinct()
+    ).scalars().all()
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=_utcnow())
+    )
+    db.commit()
+    for sid in sids:
+        revocations.add(sid)
+
+
+def revoked_sids(db: Session) -> list[str]:
+    since = _utcnow() - timedelta(seconds=revocation_window_s())
+    return list(
+        db.execute(select(RefreshToken.sid).where(RefreshToken.revoked_at >= since).distinct()).scalars()
+    )
+
+
+def _load_revoked() -> list[str]:
+    with SessionLocal() as db:
+        return revoked_sids(db)
+
+
+# el propio auth_service (/me) usa el mismo conjunto, cargado de su BD
+revocations = RevocationSet(_load_revoked, interval=settings.AUTH_REVOCATION_SYNC_S)
@@ -1,4 +1,5 @@
 # services/auth_service/run_selftest.py
+import os
 import sys
 from typing import Any, Dict
 from fastapi.testclient import TestClient
@@ -6,11 +7,23 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 from passlib.context import CryptContext
+from jose import jwt
 
+os.environ.setdefault("HASH_POOL_WORKERS", "1")  # un solo proceso de bcrypt basta aquí
+
+import app.main as auth_main
 from app.main import app
+from app.hashing import hasher
+from app import sessions
+from app.keys import KeyRing, generate_pem
+from common.colocate import import_service
+from common.jwks import JWKSCache
 from app.database import Base
 from app.deps import get_db
 from app.models import User  # Debe existir en este servicio
+from common.testing import capture_sql
+
+capture_sql(app, "auth")
 
 # ---------- utilidades ----------
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -130,6 +143,113 @@ def main():
             ok_protected = True
             break
 
+    # ---- pool de hashing: métricas y 503 + Retry-After con la cola llena ----
+    stats = client.get("/health/hashing").json()
+    capacity, hasher.capacity = hasher.capacity, 0
+    r_busy = client.post("/login", json={"email": email, "password": plain})
+    hasher.capacity = capacity
+    print(f"[DEBUG] hashing -> completed={stats['completed']}, cola llena -> {r_busy.status_code} Retry-After={r_busy.headers.get('retry-after')}")
+    if stats["completed"] < 1 or r_busy.status_code != 503 or "retry-after" not in r_busy.headers:
+        print("AUTH: FAIL en pool de hashing")
+        sys.exit(1)
+
+    # ---- signup: email repetido, también si otro signup gana la carrera tras el hash ----
+    r_dup = client.post("/signup", json={"email": email, "password": "Otra123!"})
+    find_user, auth_main._find_user = auth_main._find_user, lambda db, _email: None
+    try:
+        r_race = client.post("/signup", json={"email": email, "password": "Otra123!"})
+    finally:
+        auth_main._find_user = find_user
+    print(f"[DEBUG] signup repetido -> {r_dup.status_code}, tras la comprobación -> {r_race.status_code}")
+    if r_dup.status_code != 400 or r_race.status_code != 400 or r_race.json().get("detail") != "Email ya registrado":
+        print("AUTH: FAIL en signup con email repetido")
+        sys.exit(1)
+
+    # ---- auth cargado con import_service (scripts/serve.py, BFF): el pool de procesos
+    # tiene que importar sus funciones sin el paquete app en sys.path ----
+    os.environ["HASH_POOL_WORKERS"] = "1"
+    colocated = import_service("auth_service")
+    colocated.main.app.dependency_overrides[colocated.deps.get_db] = override_get_db
+    try:
+        c2 = TestClient(colocated.main.app)
+        r_signup = c2.post("/signup", json={"email": "colocado@example.com", "password": "Colocado123!"})
+        r_login = c2.post("/login", json={"email": "colocado@example.com", "password": "Colocado123!"})
+    finally:
+        colocated.hashing.hasher.shutdown()
+    print(f"[DEBUG] auth vía import_service -> signup {r_signup.status_code}, login {r_login.status_code}")
+    if colocated.hashing.hasher.workers != 1 or r_signup.status_code != 201 or r_login.status_code != 200:
+        print("AUTH: FAIL con auth cargado vía import_service")
+        sys.exit(1)
+
+    # ---- claims para los demás servicios + revocación ----
+    claims = jwt.get_unverified_claims(token)
+    ok_claims = claims.get("adm") is False and claims.get("ver") == 0
+    r_rev = client.post("/me/revoke-tokens", headers=headers)
+    r_me = client.get("/me", headers=headers)
+    print(f"[DEBUG] claims -> {sorted(claims)}, revoke -> {r_rev.status_code}, /me tras revocar -> {r_me.status_code}")
+    if not (ok_claims and r_rev.status_code == 204 and r_me.status_code == 401):
+        print("AUTH: FAIL en claims/revocación")
+        sys.exit(1)
+
+    # ---- refresh tokens: rotación, reutilización y logout ----
+    sessions.revocations.interval = 0  # solo revocaciones locales (sin recargar de otra BD)
+
+    def login_pair():
+        return client.post("/login", json={"email": email, "password": plain}).json()
+
+    pair_a = login_pair()
+    r_ref = client.post("/token/refresh", json={"refresh_token": pair_a["refresh_token"]})
+    pair_b = r_ref.json()
+    auth_b = {"Authorization": f"Bearer {pair_b['access_token']}"}
+    me_b = client.get("/me", headers=auth_b).status_code
+    r_reuse = client.post("/token/refresh", json={"refresh_token": pair_a["refresh_token"]})
+    r_b_after = client.post("/token/refresh", json={"refresh_token": pair_b["refresh_token"]})
+    me_b_after = client.get("/me", headers=auth_b).status_code
+    sid_b = jwt.get_unverified_claims(pair_b["access_token"])["sid"]
+    listed = sid_b in client.get("/token/revocations").json()["sids"]
+    print(f"[DEBUG] refresh -> {r_ref.status_code} (/me {me_b}), reutilizado -> {r_reuse.status_code}, "
+          f"sesión cerrada -> refresh {r_b_after.status_code} /me {me_b_after}, sid publicado={listed}")
+
+    pair_c = login_pair()
+    r_out = client.post("/logout", json={"refresh_token": pair_c["refresh_token"]})
+    r_c_after = client.post("/token/refresh", json={"refresh_token": pair_c["refresh_token"]})
+    print(f"[DEBUG] logout -> {r_out.status_code}, refresh tras logout -> {r_c_after.status_code}")
+    if not (
+        r_ref.status_code == 200 and me_b == 200 and r_reuse.status_code == 401
+        and r_b_after.status_code == 401 and me_b_after == 401 and listed
+        and r_out.status_code == 204 and r_c_after.status_code == 401
+    ):
+        print("AUTH: FAIL en refresh tokens")
+        sys.exit(1)
+
+    # ---- RS256: firma con KeyRing, verificación local vía JWKS, rotación sin reinicio ----
+    import tempfile, time
+    from pathlib import Path
+    r_jwks = client.get("/.well-known/jwks.json")
+    with tempfile.TemporaryDirectory() as keys_dir:
+        ring = KeyRing(Path(keys_dir), "RS256", reload_s=0)
+        served = {"jwks": ring.jwks()}
+        cache = JWKSCache(lambda: served["jwks"], algorithms=["RS256"], interval=0, min_interval=0)
+        tok_old = ring.sign({"sub": "1"})
+        ok_old = cache.verify(tok_old)["sub"] == "1"
+        time.sleep(0.01)
+        (Path(keys_dir) / "zz-nueva.pem").write_bytes(generate_pem("RS256"))  # rotación
+        tok_new = ring.sign({"sub": "2"})
+        served["jwks"] = ring.jwks()
+        ok_new = ring.active_kid == "zz-nueva" and cache.verify(tok_new)["sub"] == "2" and cache.verify(tok_old)["sub"] == "1"
+        forged = jwt.encode({"sub": "1"}, "x", algorithm="HS256", headers={"kid": "zz-nueva"})
+        try:
+            cache.verify(forged)
+            ok_forged = False
+        except Exception:
+            ok_forged = True
+    print(f"[DEBUG] jwks (HS256) -> {r_jwks.status_code} {r_jwks.json()}, RS256 -> verifica={ok_old}, "
+          f"rotada={ok_new}, HS256 con kid rechazado={ok_forged}")
+    if not (r_jwks.status_code == 200 and ok_old and ok_new and ok_forged):
+        print("AUTH: FAIL en firma asimétrica/JWKS")
+        sys.exit(1)
+
+    hasher.shutdown()
     # No todas las APIs exponen /me; con tener token ya consideramos PASS
     print("AUTH:", "PASS" if token else "FAIL")
     sys.exit(0 if token else 1)
@@ -0,0 +1,18 @@
+from common.settings import ServiceSettings
+
+class Settings(ServiceSettings):
+    BFF_PORT: int = 8006
+
+    # Servicios detrás del BFF (mismos puertos que en la sección de arranque del README)
+    AUTH_SERVICE_URL: str = "http://127.0.0.1:8001"
+    CATALOG_SERVICE_URL: str = "http://127.0.0.1:8002"
+    CART_SERVICE_URL: str = "http://127.0.0.1:8004"
+    ORDER_SERVICE_URL: str = "http://127.0.0.1:8005"
+    # true: auth, catalog, cart y order se cargan en este proceso y se llaman por ASGI
+    # (sin red); sus engines y pools arrancan con el lifespan del BFF
+    BFF_IN_PROCESS: bool = False
+    BFF_TIMEOUT_S: float = 5.0
+    BFF_MAX_CONNECTIONS: int = 100  # keep-alive por servicio
+    BFF_PAGE_SIZE: int = 24         # productos de la primera página de /bff/home
+
+settings = Settings()
@@ -0,0 +1,142 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.middleware.cors import CORSMiddleware
+
+from common.compression import CompressionMiddleware
+from common.fastjson import FastJSONResponse
+from common.metrics import CONTENT_TYPE, Metrics, MetricsMiddleware
+from common.tracing import Tracer, TracingMiddleware
+
+from .config import settings
+from .upstream import PageFetch, UpstreamError, Upstreams
+
+# Backend for frontend: una request por pantalla de la tienda en vez de 3-4 llamadas en
+# serie desde el navegador a puertos distintos. Las llamadas a los servicios salen en
+# paralelo; el JWT se reenvía tal cual y lo verifica cada servicio (con su caché de tokens).
+upstreams = Upstreams(settings)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstreams.start()
+    yield
+    await upstreams.close()
+
+app = FastAPI(title="Storefront BFF", lifespan=lifespan)
+
+origins = [
+    "http://localhost:5173",
+    "http://127.0.0.1:5173",
+]
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# compresión negociada (gzip, y br/zstd si están instalados) de las respuestas grandes
+app.add_middleware(CompressionMiddleware, settings=settings)
+
+# métricas Prometheus: latencia por ruta (GET /metrics)
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# trazas distribuidas (traceparent W3C, muestreadas): GET /health/traces
+tracer = Tracer('bff', settings)
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health/upstreams")
+def upstream_stats():
+    return upstreams.stats()
+
+@app.get("/health/traces")
+def recent_traces(limit: int = 20, min_ms: float = 0.0):
+    # últimas trazas muestreadas (TRACE_EXPORT=memory); min_ms: solo las más lentas
+    return {"stats": tracer.stats(), "traces": tracer.recent(limit, min_ms)}
+
+# ---------- Composición de páginas ----------
+async def get_fetch(request: Request):
+    fetch = PageFetch(upstreams, request.headers.get("authorization"))
+    try:
+        yield fetch
+    finally:
+        fetch.cancel()  # lo que quede pendiente si la página falló a medias
+
+def require_token(request: Request) -> None:
+    # páginas privadas: sin token ni se llama a los servicios
+    if not request.headers.get("authorization"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+async def _page(sections: dict) -> dict:
+    """
+    Espera todas las secciones a la vez. Un 401 de cualquier servicio es un 401 de la
+    página (el front renueva el token y repite); otro fallo deja la sección en null y la
+    apunta en ``unavailable``, para que la pantalla se pinte con lo que sí llegó.
+    """
+    results = await asyncio.gather(*sections.values(), return_exceptions=True)
+    page, unavailable = {}, []
+    for name, result in zip(sections, results):
+        if isinstance(result, UpstreamError):
+            if result.status == status.HTTP_401_UNAUTHORIZED:
+                raise HTTPException(status_code=result.status, detail=result.detail)
+            unavailable.append(name)
+            result = None
+        elif isinstance(result, BaseException):
+            raise result
+        page[name] = result
+    page["unavailable"] = unavailable
+    return page
+
+async def _cart_summary(fetch: PageFetch) -> dict:
+    cart = await fetch.get("cart", "/cart")
+    return {
+        "id": cart["id"],
+        "items": len(cart["items"]),
+        "quantity": sum(it["quantity"] for it in cart["items"]),
+        "totals": cart["totals"],
+    }
+
+@app.get("/bff/home")
+async def home(
+    request: Request,
+    fetch: PageFetch = Depends(get_fetch),
+    q: Optional[str] = Query(None, description="Buscar por nombre"),
+    category_id: Optional[int] = None,
+    limit: int = Query(settings.BFF_PAGE_SIZE, le=100),
+):
+    sections = {
+        "categories": fetch.get("catalog", "/categories"),
+        "products": fetch.get("catalog", "/products", q=q, category_id=category_id, limit=limit),
+    }
+    signed_in = bool(request.headers.get("authorization"))
+    if signed_in:  # anónimo: solo las partes públicas
+        sections["user"] = fetch.get("auth", "/me")
+        sections["cart"] = _cart_summary(fetch)
+    page = await _page(sections)
+    if not signed_in:
+        page.update(user=None, cart=None)
+    return FastJSONResponse(page)
+
+@app.get("/bff/cart", dependencies=[Depends(require_token)])
+async def cart_page(fetch: PageFetch = Depends(get_fetch)):
+    return FastJSONResponse(await _page({"user": fetch.get("auth", "/me"), "cart": fetch.get("cart", "/cart")}))
+
+@app.get("/bff/orders", dependencies=[Depends(require_token)])
+async def orders_page(fetch: PageFetch = Depends(get_fetch)):
+    return FastJSONResponse(await _page({"user": fetch.get("auth", "/me"), "orders": fetch.get("order", "/orders")}))
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("app.main:app", host="127.0.0.1", port=settings.BFF_PORT, reload=True)
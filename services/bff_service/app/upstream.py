@@ -0,0 +1,140 @@
+"""
+Llamadas del BFF a auth, catalog, cart y order.
+
+- Un ``httpx.AsyncClient`` por servicio, abierto en el lifespan: conexiones keep-alive
+  reutilizadas (hasta BFF_MAX_CONNECTIONS por servicio) en vez de abrir una por llamada.
+- BFF_IN_PROCESS=true: los servicios se importan en este proceso (``common.colocate``) y
+  se llaman por ASGI, sin sockets; su lifespan (engines, pools) entra con el del BFF.
+- ``PageFetch``: las llamadas de una request del BFF. Se lanzan en cuanto se piden (en
+  paralelo) y la misma (servicio, ruta, query) se hace una sola vez aunque la pidan varias
+  secciones de la página.
+- Cada llamada va en un span y lleva ``traceparent``: la traza del BFF sigue en el servicio.
+"""
+import asyncio
+from contextlib import AsyncExitStack
+
+import httpx
+import orjson
+
+from common.colocate import import_service
+from common.tracing import span, traceparent
+
+SERVICES = {
+    "auth": "auth_service",
+    "catalog": "catalog_service",
+    "cart": "cart_service",
+    "order": "order_service",
+}
+
+
+class UpstreamError(Exception):
+    def __init__(self, service: str, status: int, detail: str):
+        super().__init__(f"{service}: {status} {detail}")
+        self.service = service
+        self.status = status
+        self.detail = detail
+
+
+class Upstreams:
+    def __init__(self, settings, apps: dict | None = None):
+        self.settings = settings
+        # apps: {servicio: app ASGI} ya cargadas (self-tests); si no, según BFF_IN_PROCESS
+        self.apps = apps
+        self.clients: dict[str, httpx.AsyncClient] = {}
+        self.calls = {name: 0 for name in SERVICES}
+        self.failures = {name: 0 for name in SERVICES}
+        self._stack: AsyncExitStack | None = None
+
+    @property
+    def in_process(self) -> bool:
+        return self.apps is not None or self.settings.BFF_IN_PROCESS
+
+    async def start(self) -> None:
+        if self._stack is not None:
+            return
+        stack = self._stack = AsyncExitStack()
+        apps = self.apps
+        if apps is None and self.settings.BFF_IN_PROCESS:
+            apps = {name: import_service(folder).main.app for name, folder in SERVICES.items()}
+            for app in apps.values():
+                await stack.enter_async_context(app.router.lifespan_context(app))
+        timeout = httpx.Timeout(self.settings.BFF_TIMEOUT_S)
+        for name in SERVICES:
+            if apps is not None:
+                # en el mismo proceso no compensa comprimir: identity
+                client = httpx.AsyncClient(
+                    transport=httpx.ASGITransport(app=apps[name]), base_url=f"http://{name}",
+                    timeout=timeout, headers={"Accept-Encoding": "identity"},
+                )
+            else:
+                limits = httpx.Limits(
+                    max_connections=self.settings.BFF_MAX_CONNECTIONS,
+                    max_keepalive_connections=self.settings.BFF_MAX_CONNECTIONS,
+                )
+                client = httpx.AsyncClient(
+                    base_url=getattr(self.settings, f"{name.upper()}_SERVICE_URL"), timeout=timeout, limits=limits,
+                )
+            self.clients[name] = await stack.enter_async_context(client)
+
+    async def close(self) -> None:
+        if self._stack is not None:
+            await self._stack.aclose()
+            self._stack = None
+            self.clients = {}
+
+    async def get_json(self, service: str, path: str, params: dict, authorization: str | None):
+        self.calls[service] += 1
+        headers = {"Authorization": authorization} if authorization else {}
+        try:
+            with span(f"GET {service} {path}") as call:
+                if (parent := traceparent()) is not None:
+                    headers["traceparent"] = parent
+                r = await self.clients[service].get(path, params=params, headers=headers)
+                if call is not None:
+                    call.attrs = {"http.status_code": r.status_code}
+        except httpx.TimeoutException:
+            self.failures[service] += 1
+            raise UpstreamError(service, 504, "sin respuesta a tiempo")
+        except httpx.HTTPError as exc:
+            self.failures[service] += 1
+            raise UpstreamError(service, 502, str(exc) or type(exc).__name__)
+        if r.status_code >= 400:
+            self.failures[service] += 1
+            try:
+                body = r.json()
+            except ValueError:
+                body = None
+            # {"detail": ...} de FastAPI; otro cuerpo (lista, texto JSON...) va tal cual
+            detail = body.get("detail", r.text) if isinstance(body, dict) else r.text
+            raise UpstreamError(service, r.status_code, detail)
+        return orjson.loads(r.content)
+
+    def stats(self) -> dict:
+        return {
+            "mode": "in_process" if self.in_process else "http",
+            "calls": dict(self.calls),
+            "failures": dict(self.failures),
+        }
+
+
+class PageFetch:
+    """Llamadas de una request: en paralelo y sin repetir la misma dos veces."""
+
+    def __init__(self, upstreams: Upstreams, authorization: str | None):
+        self.upstreams = upstreams
+        self.authorization = authorization
+        self._tasks: dict[tuple, asyncio.Task] = {}
+
+    def get(self, service: str, path: str, **params) -> asyncio.Task:
+        params = {k: v for k, v in params.items() if v is not None}
+        key = (service, path, tuple(sorted(params.items())))
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(
+                self.upstreams.get_json(service, path, params, self.authorization)
+            )
+        return task
+
+    def cancel(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
@@ -0,0 +1,184 @@
+# services/bff_service/run_selftest.py
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+
+# servicios reales en este proceso (segunda parte): SQLite temporal, sin pool de bcrypt
+# ni sincronización de revocaciones contra un auth_service que no está levantado
+_DB = Path(tempfile.mkdtemp()) / "bff.db"
+os.environ.update(DB_URL=f"sqlite:///{_DB}", HASH_POOL_WORKERS="0", AUTH_REVOCATION_SYNC_S="0", DB_ASYNC="false")
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import app.main as bff
+from app.config import Settings, settings
+from app.upstream import PageFetch, UpstreamError, Upstreams
+from common.colocate import import_service
+
+DELAY_S = 0.1
+
+def fake_services(calls: list, traceparents: list | None = None) -> dict:
+    """auth, catalog, cart y order de mentira: cada llamada tarda DELAY_S."""
+    apps = {name: FastAPI() for name in ("auth", "catalog", "cart", "order")}
+    for app in apps.values():
+        @app.middleware("http")
+        async def remember_traceparent(request, call_next):
+            if traceparents is not None:
+                traceparents.append(request.headers.get("traceparent"))
+            return await call_next(request)
+
+    async def slow(name: str, authorization: str | None):
+        calls.append(name)
+        await asyncio.sleep(DELAY_S)
+        if authorization == "Bearer caducado":
+            raise HTTPException(status_code=401, detail="Token inválido")
+
+    @apps["auth"].get("/me")
+    async def me(authorization: str | None = Header(None)):
+        await slow("auth", authorization)
+        return {"id": 1, "email": "ana@example.com", "full_name": "Ana", "is_admin": False}
+
+    @apps["catalog"].get("/categories")
+    async def categories(authorization: str | None = Header(None)):
+        await slow("catalog", authorization)
+        return [{"id": 1, "name": "Ropa"}]
+
+    @apps["catalog"].get("/products")
+    async def products(limit: int = 50, authorization: str | None = Header(None)):
+        await slow("catalog", authorization)
+        return [{"id": i, "name": f"Camiseta {i}"} for i in range(1, limit + 1)]
+
+    @apps["catalog"].get("/odd-error")
+    async def odd_error():
+        return JSONResponse(["no", "es", "un", "dict"], status_code=422)
+
+    @apps["cart"].get("/cart")
+    async def cart(authorization: str | None = Header(None)):
+        await slow("cart", authorization)
+        items = [{"id": 1, "quantity": 2}, {"id": 2, "quantity": 3}]
+        return {"id": 7, "status": "active", "items": items, "totals": {"total_gross": "100.00"}}
+
+    @apps["order"].get("/orders")
+    async def orders(authorization: str | None = Header(None)):
+        await slow("order", authorization)
+        raise HTTPException(status_code=500, detail="caído")
+
+    return apps
+
+def check_composition() -> bool:
+    calls, traceparents = [], []
+    bff.upstreams = Upstreams(settings, apps=fake_services(calls, traceparents))
+    token = {"Authorization": "Bearer ok"}
+    with TestClient(bff.app) as client:
+        # anónimo: solo catálogo, en paralelo
+        r = client.get("/bff/home?limit=3")
+        body = r.json()
+        ok = r.status_code == 200 and len(body["products"]) == 3 and body["categories"][0]["name"] == "Ropa"
+        ok &= body["user"] is None and body["cart"] is None and sorted(calls) == ["catalog", "catalog"]
+
+        # con sesión: 4 llamadas a la vez, ~1 DELAY_S en vez de 4
+        calls.clear()
+        t0 = time.perf_counter()
+        r = client.get("/bff/home", headers=token)
+        elapsed = time.perf_counter() - t0
+        body = r.json()
+        print(f"[DEBUG] /bff/home con sesión -> {r.status_code}, {elapsed * 1000:.0f} ms, llamadas={sorted(calls)}")
+        ok &= r.status_code == 200 and elapsed < 2.5 * DELAY_S and len(calls) == 4
+        ok &= body["user"]["email"] == "ana@example.com" and body["unavailable"] == []
+        ok &= body["cart"] == {"id": 7, "items": 2, "quantity": 5, "totals": {"total_gross": "100.00"}}
+        ok &= len(body["products"]) == settings.BFF_PAGE_SIZE
+
+        # un 401 de cualquier servicio es un 401 de la página; sin token ni se llama
+        ok &= client.get("/bff/home", headers={"Authorization": "Bearer caducado"}).status_code == 401
+        calls.clear()
+        ok &= client.get("/bff/cart").status_code == 401 and calls == []
+
+        # order caído: la página sale sin esa sección
+        r = client.get("/bff/orders", headers=token)
+        ok &= r.status_code == 200 and r.json()["orders"] is None and r.json()["unavailable"] == ["orders"]
+        ok &= r.json()["user"]["id"] == 1
+        stats = client.get("/health/upstreams").json()
+        ok &= stats["mode"] == "in_process" and stats["failures"]["order"] == 1
+
+        # la misma llamada pedida dos veces en una request se hace una vez
+        async def twice():
+            fetch = PageFetch(bff.upstreams, "Bearer ok")
+            a, b = fetch.get("cart", "/cart"), fetch.get("cart", "/cart")
+            return a is b and (await a) == (await b)
+
+        calls.clear()
+        ok &= asyncio.run(twice()) and calls == ["cart"]
+
+        # un 4xx cuyo cuerpo no es {"detail": ...} sigue siendo ese 4xx, no un error del BFF
+        try:
+            asyncio.run(bff.upstreams.get_json("catalog", "/odd-error", {}, None))
+            ok = False
+        except UpstreamError as exc:
+            ok &= exc.status == 422 and "dict" in exc.detail
+
+        # traza muestreada: cada llamada a un servicio es un span del BFF y le pasa traceparent
+        traceparents.clear()
+        trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+        r = client.get("/bff/home", headers={**token, "traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"})
+        spans = client.get("/health/traces", params={"limit": 1}).json()["traces"][0]
+        calls_spans = {s["span_id"] for s in spans[1:] if s["parent_id"] == spans[0]["span_id"]}
+        ok &= r.status_code == 200 and len(calls_spans) == 4 and len(traceparents) == 4
+        ok &= all(tp.split("-")[1] == trace_id and tp.split("-")[2] in calls_spans for tp in traceparents)
+    return ok
+
+def check_real_services() -> bool:
+    # mismas tablas que en datagen.ensure_schema: desde los modelos, auth y catalog primero
+    engine = create_engine(f"sqlite:///{_DB}")
+    for folder in ("auth_service", "catalog_service", "cart_service", "order_service"):
+        import_service(folder, "app.models").database.Base.metadata.create_all(engine)
+    models = import_service("catalog_service", "app.models").models
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO users (id, email, hashed_password, full_name, is_admin, token_version) "
+            "VALUES (1, 'ana@example.com', 'x', 'Ana', 0, 0)"
+        )
+    with Session(engine) as db:
+        cat = models.Category(name="Ropa")
+        db.add(cat); db.flush()
+        db.add(models.Product(
+            category_id=cat.id, name="Camiseta", description="algodón", price=Decimal("39000.00"),
+            vat_rate=Decimal("19.00"), stock=10, size="M",
+        ))
+        db.commit()
+    engine.dispose()
+
+    tok = jwt.encode({"sub": "1", "adm": False, "ver": 0}, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
+    bff.upstreams = Upstreams(Settings(BFF_IN_PROCESS=True))
+    with TestClient(bff.app) as client:
+        r = client.get("/bff/home", headers={"Authorization": f"Bearer {tok}"})
+        body = r.json()
+        print(f"[DEBUG] /bff/home (servicios reales) -> {r.status_code}, unavailable={body.get('unavailable')}")
+        ok = r.status_code == 200 and body["unavailable"] == []
+        ok &= body["user"]["email"] == "ana@example.com" and body["products"][0]["price"] == "39000.00"
+        ok &= body["categories"][0]["name"] == "Ropa" and body["cart"]["items"] == 0
+        r = client.get("/bff/orders", headers={"Authorization": f"Bearer {tok}"})
+        ok &= r.status_code == 200 and r.json()["orders"] == []
+    return ok
+
+def main():
+    checks = {
+        "composición": check_composition(),
+        "servicios en proceso": check_real_services(),
+    }
+    for name, ok in checks.items():
+        print(f"[DEBUG] {name} -> {'ok' if ok else 'FAIL'}")
+    ok = all(checks.values())
+    print("BFF:", "PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Hace importable el paquete compartido services/common (p.ej. `from common import pricing`)
+_SERVICES_DIR = str(Path(__file__).resolve().parents[2])
+if _SERVICES_DIR not in sys.path:
+    sys.path.append(_SERVICES_DIR)
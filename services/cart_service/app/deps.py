@@ -1,31 +1,44 @@
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi import Depends, HTTPException, status
-from jose import jwt, JWTError
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi import Depends
 from sqlalchemy.orm import Session
-from .database import SessionLocal
+
+from common.auth import Principal
+from common.service_auth import ServiceAuth, auth_scheme
+from common.tracing import span
+
+from .database import AsyncSessionLocal, SessionLocal
 from .config import settings
 from .models import User
 
-auth_scheme = HTTPBearer()
-
 def get_db():
-    db = SessionLocal()
+    with span("get_db"):
+        db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-def get_current_user(
+async def get_async_db():
+    # solo con DB_ASYNC=true
+    with span("get_db", mode="async"):
+        session = AsyncSessionLocal()
+    async with session as db:
+        yield db
+
+# verificación del JWT + cachés de tokens/usuarios + sesiones revocadas (common.service_auth)
+auth = ServiceAuth(settings, User, lambda: SessionLocal())
+token_cache, user_cache, revocations, jwks = auth.token_cache, auth.user_cache, auth.revocations, auth.jwks
+
+def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)) -> Principal:
+    with span("get_current_user", mode="principal"):
+        return auth.principal(credentials.credentials)
+
+def get_current_db_user(
     credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
     db: Session = Depends(get_db),
 ) -> User:
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALG])
-        user_id = int(payload.get("sub"))
-    except (JWTError, ValueError, TypeError):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido")
-    user = db.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuario no encontrado")
-    return user
+    with span("get_current_user", mode="db_user"):
+        return auth.db_user(credentials.credentials, db)
+
+# AUTH_VERIFIED_PRINCIPAL=true (por defecto): claims del JWT + caché; false: fila User de la BD
+get_current_user = get_current_principal if settings.AUTH_VERIFIED_PRINCIPAL else get_current_db_user
@@ -1,23 +1,44 @@
-from decimal import Decimal
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import select, desc
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from common.compression import CompressionMiddleware
+from common.fastjson import FastJSONResponse
+from common.pricing import PricedBasket, PricedLine, cents_str, price_basket, rate_to_bp, to_cents
+from common.metrics import CONTENT_TYPE, Metrics, MetricsMiddleware
+from common.tracing import Tracer, TracingMiddleware, instrument_database, traced
+from common.promotions import LineIn, PromotionStore
+from common.sharding import route
+
 from .config import settings
-from .database import Base, engine
-from .deps import get_db, get_current_user
-from .models import Cart, CartItem, Product, User
+from .database import database
+from .deps import get_async_db, get_db, get_current_user, auth
+from .models import Cart, CartItem, Product, Promotion, User
 from .schemas import (
     CartItemCreate,
     CartItemUpdate,
     CartOut,
-    CartItemOut,
-    CartTotals,
+    CartQuoteIn,
+    CartQuoteOut,
+    CouponIn,
 )
 
-app = FastAPI(title="Cart Service")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # engines al arrancar y no al importar; el esquema lo aplica scripts/migrate.py
+    database.start()
+    metrics.instrument_database(database)
+    instrument_database(database)  # un span por sentencia SQL
+    yield
+    await database.dispose()
+
+
+app = FastAPI(title="Cart Service", lifespan=lifespan)
 
 # --- CORS (frontend en Vite) --------------------------------------------------
 origins = [
@@ -32,8 +53,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Solo dev: crea tablas si no existen
-Base.metadata.create_all(bind=engine)
+# compresión negociada (gzip, y br/zstd si están instalados) de las respuestas grandes
+app.add_middleware(CompressionMiddleware, settings=settings)
+
+# métricas Prometheus: latencia por ruta, sentencias SQL por request y pool (GET /metrics)
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# trazas distribuidas (traceparent W3C, muestreadas): GET /health/traces
+tracer = Tracer('cart', settings)
+app.add_middleware(TracingMiddleware, tracer=tracer)
 
 
 @app.get("/health")
@@ -41,11 +70,37 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # async: el scrape no espera turno en el threadpool aunque esté saturado
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/health/db")
+def db_pool_stats():
+    return database.pool_status()
+
+@app.get("/health/traces")
+def recent_traces(limit: int = 20, min_ms: float = 0.0):
+    # últimas trazas muestreadas (TRACE_EXPORT=memory); min_ms: solo las más lentas
+    return {"stats": tracer.stats(), "traces": tracer.recent(limit, min_ms)}
+
+@app.get("/health/auth")
+def auth_cache_stats():
+    return auth.stats()
+
+
 # --- Helpers ------------------------------------------------------------------
+# Reglas de promoción compiladas; se recargan solas si cambia la tabla
+promotions = PromotionStore(Promotion, check_interval=settings.PROMO_RELOAD_S)
+
+
 def _ensure_active_cart(db: Session, user: User) -> Cart:
     """
     Obtiene el último carrito 'active' del usuario, o lo crea.
+    Con DB_SHARD_URLS, la sesión queda apuntando al shard del usuario desde aquí.
     """
+    route(db, user.id)
     cart = (
         db.execute(
             select(Cart)
@@ -63,70 +118,84 @@ def _ensure_active_cart(db: Session, user: User) -> Cart:
     return cart
 
 
-def _calc_totals(cart: Cart) -> CartTotals:
-    total_net = Decimal("0.00")
-    total_vat = Decimal("0.00")
-
-    for it in cart.items:
-        price = Decimal(it.unit_price)
-        vat_rate = Decimal(
-            it.product.vat_rate if it.product and it.product.vat_rate is not None else "19.00"
-        )
-        qty = Decimal(it.quantity)
-
-        line_net = price * qty
-        line_vat = (price * (vat_rate / Decimal("100"))) * qty
-
-        total_net += line_net
-        total_vat += line_vat
-
-    total_gross = total_net + total_vat
-    return CartTotals(total_net=total_net, total_vat=total_vat, total_gross=total_gross)
-
-
-def _item_to_out(it: CartItem) -> CartItemOut:
-    price = Decimal(it.unit_price)
-    vat_rate = Decimal(
-        it.product.vat_rate if it.product and it.product.vat_rate is not None else "19.00"
-    )
-    qty = Decimal(it.quantity)
-
-    line_net = price * qty
-    line_vat = (price * (vat_rate / Decimal("100"))) * qty
-    line_gross = line_net + line_vat
-
-    return CartItemOut(
-        id=it.id,
-        product_id=it.product_id,
-        quantity=it.quantity,
-        unit_price=price,
-        line_net=line_net,
-        line_vat=line_vat,
-        line_gross=line_gross,
-        product=it.product,  # Pydantic (from_attributes=True)
+@traced()
+def _price(db: Session, lines: list[LineIn], vat_bps: list[int], coupon: str | None) -> tuple[PricedBasket, list]:
+    discounts, applied = promotions.index(db).apply(lines, coupon)
+    priced = price_basket(
+        ((ln.price_cents, ln.quantity, bp) for ln, bp in zip(lines, vat_bps)),
+        discounts=discounts,
     )
+    return priced, applied
 
 
-def _cart_to_out(cart: Cart) -> CartOut:
-    items = [_item_to_out(i) for i in cart.items]
-    totals = _calc_totals(cart)
-    return CartOut(id=cart.id, status=cart.status, items=items, totals=totals)
+@traced()
+def _calc_totals(db: Session, cart: Cart) -> tuple[PricedBasket, list]:
+    """
+    Precia todas las líneas del carrito en una pasada (céntimos enteros),
+    con las promociones vigentes y el cupón del carrito.
+    """
+    items = cart.items
+    lines = [
+        LineIn(it.product_id, it.product.category_id if it.product else None, to_cents(it.unit_price), it.quantity)
+        for it in items
+    ]
+    vat_bps = [rate_to_bp(it.product.vat_rate if it.product else None) for it in items]
+    return _price(db, lines, vat_bps, cart.coupon_code)
+
+
+# Las respuestas se arman como dicts con la forma de CartOut / CartQuoteOut y salen por
+# FastJSONResponse: importes en céntimos -> texto directo, sin Decimal ni revalidación
+def _totals_payload(priced: PricedBasket) -> dict:
+    return {
+        "total_net": cents_str(priced.total_net),
+        "total_vat": cents_str(priced.total_vat),
+        "total_gross": cents_str(priced.total_gross),
+        "total_discount": cents_str(priced.total_discount),
+    }
+
+
+def _item_payload(it: CartItem, line: PricedLine, promotion_id: int | None) -> dict:
+    p = it.product
+    return {
+        "id": it.id,
+        "product_id": it.product_id,
+        "quantity": it.quantity,
+        "unit_price": it.unit_price,
+        "discount": cents_str(line.discount),
+        "promotion_id": promotion_id,
+        "line_net": cents_str(line.net),
+        "line_vat": cents_str(line.vat),
+        "line_gross": cents_str(line.gross),
+        "product": {
+            "id": p.id, "name": p.name, "price": p.price, "vat_rate": p.vat_rate,
+            "size": p.size, "image_url": p.image_url,
+        },
+    }
+
+
+def _cart_payload(cart: Cart, priced: PricedBasket, applied: list) -> dict:
+    return {
+        "id": cart.id,
+        "status": cart.status,
+        "coupon_code": cart.coupon_code,
+        "items": [_item_payload(it, line, pid) for it, line, pid in zip(cart.items, priced.lines, applied)],
+        "totals": _totals_payload(priced),
+    }
+
+
+def _cart_to_out(db: Session, cart: Cart, status_code: int = 200) -> FastJSONResponse:
+    priced, applied = _calc_totals(db, cart)
+    return FastJSONResponse(_cart_payload(cart, priced, applied), status_code=status_code)
 
 
 # --- Endpoints ----------------------------------------------------------------
-@app.get("/cart", response_model=CartOut)
-def get_cart(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+def _get_cart(db: Session, user: User) -> FastJSONResponse:
+    # recién cargado (con items y productos en la misma consulta): sin refresh
     cart = _ensure_active_cart(db, user)
-    db.refresh(cart)
-    return _cart_to_out(cart)
+    return _cart_to_out(db, cart)
 
 
-@app.post("/cart/items", response_model=CartOut, status_code=201)
-def add_item(
-    payload: CartItemCreate,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
-):
+def _add_item(db: Session, user: User, payload: CartItemCreate) -> FastJSONResponse:
     cart = _ensure_active_cart(db, user)
 
     prod = db.get(Product, payload.product_id)
@@ -148,7 +217,34 @@ def add_item(
 
     db.commit()
     db.refresh(cart)
-    return _cart_to_out(cart)
+    return _cart_to_out(db, cart, status_code=201)
+
+
+# DB_ASYNC=true: mismo código vía AsyncSession.run_sync, sin ocupar el threadpool
+if settings.DB_ASYNC:
+    @app.get("/cart", response_model=CartOut)
+    async def get_cart(db: AsyncSession = Depends(get_async_db), user: User = Depends(get_current_user)):
+        return await db.run_sync(_get_cart, user)
+
+    @app.post("/cart/items", response_model=CartOut, status_code=201)
+    async def add_item(
+        payload: CartItemCreate,
+        db: AsyncSession = Depends(get_async_db),
+        user: User = Depends(get_current_user),
+    ):
+        return await db.run_sync(_add_item, user, payload)
+else:
+    @app.get("/cart", response_model=CartOut)
+    def get_cart(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+        return _get_cart(db, user)
+
+    @app.post("/cart/items", response_model=CartOut, status_code=201)
+    def add_item(
+        payload: CartItemCreate,
+        db: Session = Depends(get_db),
+        user: User = Depends(get_current_user),
+    ):
+        return _add_item(db, user, payload)
 
 
 @app.put("/cart/items/{item_id}", response_model=CartOut)
@@ -171,7 +267,7 @@ def update_item(
 
     db.commit()
     db.refresh(cart)
-    return _cart_to_out(cart)
+    return _cart_to_out(db, cart)
 
 
 @app.delete("/cart/items/{item_id}", response_model=CartOut)
@@ -188,7 +284,7 @@ def delete_item(
     db.delete(item)
     db.commit()
     db.refresh(cart)
-    return _cart_to_out(cart)
+    return _cart_to_out(db, cart)
 
 
 @app.delete("/cart/items", response_model=CartOut)
@@ -198,7 +294,61 @@ def clear_cart(db: Session = Depends(get_db), user: User = Depends(get_current_u
         db.delete(it)
     db.commit()
     db.refresh(cart)
-    return _cart_to_out(cart)
+    return _cart_to_out(db, cart)
+
+
+@app.put("/cart/coupon", response_model=CartOut)
+def apply_coupon(payload: CouponIn, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    if not promotions.index(db).has_coupon(payload.code):
+        raise HTTPException(status_code=404, detail="Cupón no válido")
+    cart = _ensure_active_cart(db, user)
+    cart.coupon_code = payload.code.upper()
+    db.commit()
+    db.refresh(cart)
+    return _cart_to_out(db, cart)
+
+
+@app.delete("/cart/coupon", response_model=CartOut)
+def remove_coupon(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    cart = _ensure_active_cart(db, user)
+    cart.coupon_code = None
+    db.commit()
+    db.refresh(cart)
+    return _cart_to_out(db, cart)
+
+
+@app.post("/cart/quote", response_model=CartQuoteOut)
+def quote(payload: CartQuoteIn, db: Session = Depends(get_db)):
+    """
+    Precia una cesta hipotética (promociones y cupón incluidos) sin persistir nada.
+    """
+    ids = {i.product_id for i in payload.items}
+    products = {p.id: p for p in db.execute(select(Product).where(Product.id.in_(ids))).scalars()}
+    missing = ids - products.keys()
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Producto no encontrado ({sorted(missing)})")
+
+    lines, vat_bps = [], []
+    for i in payload.items:
+        p = products[i.product_id]
+        lines.append(LineIn(p.id, p.category_id, to_cents(p.price), i.quantity))
+        vat_bps.append(rate_to_bp(p.vat_rate))
+    priced, applied = _price(db, lines, vat_bps, payload.coupon_code)
+
+    items = [
+        {
+            "product_id": ln.product_id,
+            "quantity": ln.quantity,
+            "unit_price": cents_str(ln.price_cents),
+            "discount": cents_str(pl.discount),
+            "promotion_id": pid,
+            "line_net": cents_str(pl.net),
+            "line_vat": cents_str(pl.vat),
+            "line_gross": cents_str(pl.gross),
+        }
+        for ln, pl, pid in zip(lines, priced.lines, applied)
+    ]
+    return FastJSONResponse({"coupon_code": payload.coupon_code, "items": items, "totals": _totals_payload(priced)})
 
 
 if __name__ == "__main__":
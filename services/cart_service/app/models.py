@@ -1,7 +1,15 @@
-from sqlalchemy import Column, Integer, String, Text, Numeric, TIMESTAMP, ForeignKey, text
+from sqlalchemy import Column, Integer, String, Text, Numeric, DateTime, TIMESTAMP, ForeignKey, Index, UniqueConstraint, text, func
 from sqlalchemy.orm import relationship
+from .config import settings
 from .database import Base
 
+# carts y cart_items pueden vivir en el shard del usuario (DB_SHARD_URLS). AUTOINCREMENT en
+# SQLite para poder reservar el rango de ids de cada shard (common.sharding.reserve_id_range)
+_sharded = {"sqlite_autoincrement": True}
+# con shards, products sigue en el primario: consulta aparte (selectin) en vez de JOIN
+_product_lazy = "selectin" if settings.shard_urls else "joined"
+# índices con los nombres de scripts/05_indexes.sql; uq_cart_product como en 01_schema.sql
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -9,6 +17,7 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     full_name = Column(String(255))
     is_admin = Column(Integer, nullable=False, server_default=text("0"))
+    token_version = Column(Integer, nullable=False, server_default=text("0"))  # +1 revoca sus JWT
     created_at = Column(TIMESTAMP, server_default=text("CURRENT_TIMESTAMP"))
 
 class Category(Base):
@@ -28,15 +37,20 @@ class Product(Base):
     size = Column(String(10))
     image_url = Column(String(500))
 
+    __table_args__ = (Index("ix_products_category", "category_id", "id"),)
+
 class Cart(Base):
     __tablename__ = "carts"
+    __table_args__ = (Index("ix_carts_user_status", "user_id", "status"), _sharded)
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     status = Column(String(20), nullable=False, server_default=text("'active'"))
+    coupon_code = Column(String(50))
     items = relationship("CartItem", back_populates="cart", cascade="all, delete-orphan", lazy="joined")
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    __table_args__ = (UniqueConstraint("cart_id", "product_id", name="uq_cart_product"), _sharded)
     id = Column(Integer, primary_key=True, autoincrement=True)
     cart_id = Column(Integer, ForeignKey("carts.id", ondelete="CASCADE"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
@@ -44,4 +58,20 @@ class CartItem(Base):
     unit_price = Column(Numeric(10, 2), nullable=False)
 
     cart = relationship("Cart", back_populates="items", lazy="joined")
-    product = relationship("Product", lazy="joined")
+    product = relationship("Product", lazy=_product_lazy)
+
+class Promotion(Base):
+    __tablename__ = "promotions"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(200), nullable=False)
+    kind = Column(String(20), nullable=False)                                  # percent | bundle
+    scope = Column(String(20), nullable=False, server_default=text("'cart'"))  # product | category | cart
+    target_id = Column(Integer)                                                # product_id / category_id
+    coupon_code = Column(String(50), index=True)                               # NULL = automática
+    percent = Column(Numeric(5, 2))                                            # kind=percent
+    buy_qty = Column(Integer)                                                  # kind=bundle: 3x2 -> 3
+    pay_qty = Column(Integer)                                                  #              3x2 -> 2
+    active = Column(Integer, nullable=False, server_default=text("1"))
+    starts_at = Column(DateTime)
+    ends_at = Column(DateTime)
+    updated_at = Column(TIMESTAMP, server_default=text("CURRENT_TIMESTAMP"), onupdate=func.now())
@@ -31,6 +31,8 @@ class CartItemOut(BaseModel):
     product_id: int
     quantity: int
     unit_price: Decimal
+    discount: Decimal = Decimal("0.00")
+    promotion_id: Optional[int] = None
     line_net: Decimal
     line_vat: Decimal
     line_gross: Decimal
@@ -42,11 +44,40 @@ class CartTotals(BaseModel):
     total_net: Decimal
     total_vat: Decimal
     total_gross: Decimal
+    total_discount: Decimal = Decimal("0.00")
 
 class CartOut(BaseModel):
     id: int
     status: str
+    coupon_code: Optional[str] = None
     items: List[CartItemOut]
     totals: CartTotals
     class Config:
         from_attributes = True
+
+class CouponIn(BaseModel):
+    code: str = Field(min_length=1, max_length=50)
+
+# ---- Cotización de una cesta hipotética (no se persiste)
+class QuoteItemIn(BaseModel):
+    product_id: int
+    quantity: int = Field(default=1, ge=1, le=9999)
+
+class CartQuoteIn(BaseModel):
+    items: List[QuoteItemIn] = Field(max_length=1000)
+    coupon_code: Optional[str] = None
+
+class QuoteLineOut(BaseModel):
+    product_id: int
+    quantity: int
+    unit_price: Decimal
+    discount: Decimal
+    promotion_id: Optional[int] = None
+    line_net: Decimal
+    line_vat: Decimal
+    line_gross: Decimal
+
+class CartQuoteOut(BaseModel):
+    coupon_code: Optional[str] = None
+    items: List[QuoteLineOut]
+    totals: CartTotals
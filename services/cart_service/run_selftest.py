@@ -1,24 +1,36 @@
 # services/cart_service/run_selftest.py
+import importlib
+import os
 import sys
 from decimal import Decimal
+from types import SimpleNamespace
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 
-from app.main import app
+if os.getenv("SELFTEST_SHARDS"):
+    # antes de importar la app: settings y modelos leen DB_SHARD_URLS al importarse
+    importlib.import_module("app")  # hace importable common (sin tapar el ``app`` de FastAPI)
+    from common.testing import selftest_shard_env
+    os.environ.update(selftest_shard_env(int(os.environ["SELFTEST_SHARDS"])))
+
+from app.main import app, promotions
 from app.database import Base
-from app.deps import get_db, get_current_user
-from app.models import User, Category, Product
+from app.config import settings
+from app.deps import get_async_db, get_db, get_current_user
+from app.models import User, Cart, Category, Product, Promotion
+from app.schemas import CartOut, CartQuoteOut
+from common.testing import QueryCounter, async_db_override, capture_sql, conforms, selftest_db
+
+capture_sql(app, "cart")
+
+# sentencias SQL máximas por request (con el índice de promociones ya cargado)
+GET_CART_BUDGET = 2
+ADD_ITEM_BUDGET = 4
 
 def main():
-    engine = create_engine(
-        "sqlite+pysqlite:///:memory:",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
-    TestingSessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
-    Base.metadata.create_all(bind=engine)
+    # SQLite en memoria (o fichero compartido con aiosqlite si DB_ASYNC=true)
+    engine, TestingSessionLocal, AsyncTestingSession = selftest_db(Base, settings.DB_ASYNC)
+    if AsyncTestingSession is not None:
+        app.dependency_overrides[get_async_db] = async_db_override(AsyncTestingSession)
 
     def override_get_db():
         db = TestingSessionLocal()
@@ -27,16 +39,21 @@ def main():
         finally:
             db.close()
 
+    current = {}
+
     def override_get_current_user():
-        db = TestingSessionLocal()
-        try:
-            u = db.query(User).first()
-            if not u:
-                u = User(email="test@local", hashed_password="x", full_name="Tester", is_admin=0)
-                db.add(u); db.commit(); db.refresh(u)
-            return u
-        finally:
-            db.close()
+        # se carga una vez, como con la caché de usuarios: no cuenta en los presupuestos SQL
+        if "user" not in current:
+            db = TestingSessionLocal()
+            try:
+                u = db.query(User).first()
+                if not u:
+                    u = User(email="test@local", hashed_password="x", full_name="Tester", is_admin=0)
+                    db.add(u); db.commit(); db.refresh(u)
+                current["user"] = u
+            finally:
+                db.close()
+        return current["user"]
 
     app.dependency_overrides[get_db] = override_get_db
     app.dependency_overrides[get_current_user] = override_get_current_user
@@ -65,6 +82,7 @@ def main():
     ok &= int(float(data["totals"]["total_net"])) == 78000
     ok &= int(float(data["totals"]["total_vat"])) == 14820
     ok &= int(float(data["totals"]["total_gross"])) == 92820
+    ok &= conforms(CartOut, data) and data["totals"]["total_gross"] == "92820.00"  # = response_model
 
     if not ok:
         print("CARRITO: FAIL en POST /cart/items", r1.status_code, r1.text)
@@ -81,8 +99,129 @@ def main():
     # delete
     r3 = client.delete(f"/cart/items/{item_id}")
     ok3 = r3.status_code == 200 and r3.json()["items"] == []
-    print("CARRITO:", "PASS" if ok3 else "FAIL")
-    sys.exit(0 if ok3 else 1)
+    if not ok3:
+        print("CARRITO: FAIL en DELETE /cart/items/{id}", r3.status_code, r3.text)
+        sys.exit(1)
+
+    # ---- promociones: 3x2 por producto + cupón 10 % (recarga en caliente) ----
+    promotions.check_interval = 0  # comprobar la versión de la tabla en cada request
+    promotions.invalidate()
+    db = TestingSessionLocal()
+    try:
+        db.add(Promotion(name="3x2", kind="bundle", scope="product", target_id=pid, buy_qty=3, pay_qty=2))
+        db.add(Promotion(name="10%", kind="percent", scope="cart", coupon_code="DESC10", percent=Decimal("10.00")))
+        db.commit()
+    finally:
+        db.close()
+
+    r4 = client.post("/cart/quote", json={"items": [{"product_id": pid, "quantity": 3}]})
+    q = r4.json() if r4.status_code == 200 else {}
+    ok4 = r4.status_code == 200 and float(q["totals"]["total_discount"]) == 39000 and float(q["totals"]["total_net"]) == 78000
+    r5 = client.put("/cart/coupon", json={"code": "desc10"})
+    r6 = client.post("/cart/items", json={"product_id": pid, "quantity": 1})
+    c = r6.json() if r6.status_code == 201 else {}
+    ok4 &= r5.status_code == 200 and r6.status_code == 201
+    ok4 &= c.get("coupon_code") == "DESC10" and float(c["totals"]["total_net"]) == 35100
+    ok4 &= client.put("/cart/coupon", json={"code": "NOPE"}).status_code == 404
+    ok4 &= conforms(CartQuoteOut, q) and conforms(CartOut, c) and c["items"][0]["product"]["price"] == "39000.00"
+
+    # desactivar el 3x2 se refleja sin reiniciar
+    db = TestingSessionLocal()
+    try:
+        db.query(Promotion).filter(Promotion.kind == "bundle").update({"active": 0, "name": "3x2 (fin)"})
+        db.commit()
+    finally:
+        db.close()
+    r7 = client.post("/cart/quote", json={"items": [{"product_id": pid, "quantity": 3}]})
+    ok4 &= r7.status_code == 200 and float(r7.json()["totals"]["total_discount"]) == 0
+    print("[DEBUG] promociones ->", r4.status_code, r5.status_code, r6.status_code, r7.status_code, promotions.reloads)
+    if not ok4:
+        print("CARRITO: FAIL en promociones", r4.text, r6.text)
+        sys.exit(1)
+
+    # ---- presupuestos SQL: no crecen con el nº de líneas del carrito ----
+    promotions.check_interval = 60  # índice de promociones ya cargado, como en régimen normal
+    db = TestingSessionLocal()
+    try:
+        cat_id = db.query(Category).first().id
+        extra = [
+            Product(category_id=cat_id, name=f"Calcetín {i}", price=Decimal("5000.00"), vat_rate=Decimal("19.00"), stock=50)
+            for i in range(5)
+        ]
+        db.add_all(extra); db.commit()
+        extra_ids = [p.id for p in extra]
+    finally:
+        db.close()
+
+    budgets = {}
+    with QueryCounter(TestingSessionLocal, AsyncTestingSession) as q:
+        client.get("/cart")
+    budgets["GET /cart, 1 línea"] = q.within("GET /cart, 1 línea", GET_CART_BUDGET)
+    for ext_id in extra_ids:
+        with QueryCounter(TestingSessionLocal, AsyncTestingSession) as q:
+            client.post("/cart/items", json={"product_id": ext_id, "quantity": 1})
+    budgets["POST /cart/items"] = q.within("POST /cart/items, 6 líneas", ADD_ITEM_BUDGET)
+    with QueryCounter(TestingSessionLocal, AsyncTestingSession) as q:
+        r8 = client.get("/cart")
+    budgets["GET /cart, 6 líneas"] = q.within("GET /cart, 6 líneas", GET_CART_BUDGET) and len(r8.json()["items"]) == 6
+    if not all(budgets.values()):
+        print("CARRITO: FAIL presupuesto SQL", [k for k, v in budgets.items() if not v])
+        sys.exit(1)
+
+    print("CARRITO: PASS")
+    sys.exit(0)
+
+def shards_main():
+    """SELFTEST_SHARDS=N: cada usuario con su carrito en el shard user_id % N."""
+    from sqlalchemy import select
+    from common.sharding import SHARD_ID_SPAN, ShardNotRouted
+    from common.testing import create_shard_schema
+    from app.database import database
+
+    n = len(settings.shard_urls)
+    current = {}
+    app.dependency_overrides[get_current_user] = lambda: current["user"]
+    with TestClient(app) as client:  # lifespan: engines del primario y de los shards
+        create_shard_schema(database, Base)
+        with database.SessionLocal() as db:
+            users = [User(email=f"u{i}@local", hashed_password="x", full_name=f"U{i}") for i in range(4)]
+            p = Product(name="Camiseta", price=Decimal("39000.00"), vat_rate=Decimal("19.00"), stock=50)
+            db.add_all([*users, p]); db.commit()
+            uids, pid = [u.id for u in users], p.id
+
+        ok = True
+        for uid in uids:
+            current["user"] = SimpleNamespace(id=uid, is_admin=0)
+            r = client.post("/cart/items", json={"product_id": pid, "quantity": uid})
+            cart = r.json()
+            ok &= r.status_code == 201 and cart["id"] // SHARD_ID_SPAN == uid % n
+            ok &= cart["items"][0]["quantity"] == uid and cart["items"][0]["product"]["name"] == "Camiseta"
+            r = client.put(f"/cart/items/{cart['items'][0]['id']}", json={"quantity": 7})
+            ok &= r.status_code == 200 and r.json()["id"] == cart["id"] and r.json()["items"][0]["quantity"] == 7
+            ok &= client.get("/cart").json()["id"] == cart["id"]
+        print(f"[DEBUG] carritos en shards -> {'ok' if ok else 'FAIL'}")
+
+        # en disco: cada shard solo tiene a sus usuarios; el primario, ningún carrito
+        for i, engine in enumerate(database.shards.engines):
+            with engine.connect() as conn:
+                owners = conn.execute(select(Cart.user_id)).scalars().all()
+            ok &= bool(owners) and all(uid % n == i for uid in owners)
+        with database.engine.connect() as conn:
+            ok &= conn.execute(select(Cart.id)).first() is None
+
+        # una sesión sin shard elegido no lee carritos del primario por error
+        try:
+            with database.SessionLocal() as db:
+                db.execute(select(Cart)).first()
+            ok = False
+        except ShardNotRouted:
+            pass
+        shards = client.get("/health/db").json()["shards"]
+        ok &= len(shards) == n and all(s["routed"] > 0 for s in shards)
+        print(f"[DEBUG] shards -> {[s['routed'] for s in shards]} sesiones por shard")
+
+    print("CARRITO (shards):", "PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
 
 if __name__ == "__main__":
-    main()
+    shards_main() if settings.shard_urls else main()
@@ -1,20 +1,16 @@
-from pydantic_settings import BaseSettings, SettingsConfigDict
-from pathlib import Path
-
-ROOT_ENV = Path(__file__).resolve().parents[2] / ".env"  # .../Ecommerce/.env
-
-class Settings(BaseSettings):
-    DB_HOST: str = "127.0.0.1"
-    DB_PORT: int = 3306
-    DB_NAME: str = "ecommerce"
-    DB_USER: str = "ecom_user"
-    DB_PASS: str = "ecom_pass"
-
-    JWT_SECRET: str = "change_this_secret"
-    JWT_ALG: str = "HS256"
+from common.settings import ResourceServiceSettings
 
+class Settings(ResourceServiceSettings):
     CATALOG_PORT: int = 8002
-
-    model_config = SettingsConfigDict(env_file=str(ROOT_ENV), env_file_encoding="utf-8")
+    # lecturas calientes (ficha, listados, categorías): single-flight + stale-while-revalidate
+    # (common/singleflight.py). TTL=0: sin caché, solo coalescencia de cargas simultáneas
+    CATALOG_CACHE_TTL_S: float = 1.0
+    CATALOG_CACHE_STALE_S: float = 30.0
+    CATALOG_CACHE_MAX: int = 10_000
+    # GET /products filtrado desde una copia columnar de products (app/snapshot.py)
+    CATALOG_SNAPSHOT: bool = False
+    CATALOG_SNAPSHOT_PATH: str = ""            # fichero mapeado compartido por los workers; vacío = en memoria
+    CATALOG_SNAPSHOT_SYNC_S: float = 2.0       # puesta al día (max(updated_at), max(id)) en segundo plano
+    CATALOG_SNAPSHOT_MAX_AGE_S: float = 300.0  # recarga completa
 
 settings = Settings()
@@ -1,12 +1,10 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import declarative_base
+from common.db import ServiceDatabase
 from .config import settings
 
-SQLALCHEMY_DATABASE_URL = (
-    f"mysql+pymysql://{settings.DB_USER}:{settings.DB_PASS}"
-    f"@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
-)
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# engines creados en el lifespan (database.start()), no al importar: pool configurable e
+# instrumentado (DB_POOL_* en .env; estado en GET /health/db). El esquema: scripts/migrate.py
+database = ServiceDatabase(settings)
+SessionLocal = database.SessionLocal
+AsyncSessionLocal = database.AsyncSessionLocal
 Base = declarative_base()
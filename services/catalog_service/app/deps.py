@@ -1,37 +1,88 @@
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi import Depends, HTTPException, status
-from jose import jwt, JWTError
+from typing import Callable
+
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from .database import SessionLocal
+
+from common.auth import Principal
+from common.service_auth import ServiceAuth, auth_scheme
+from common.tracing import span
+
+from .database import AsyncSessionLocal, SessionLocal, database
 from .config import settings
 from .models import User
 
-auth_scheme = HTTPBearer()
-
 def get_db():
-    db = SessionLocal()
+    with span("get_db"):
+        db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-def get_current_user(
+async def get_async_db():
+    # solo con DB_ASYNC=true
+    with span("get_db", mode="async"):
+        session = AsyncSessionLocal()
+    async with session as db:
+        yield db
+
+# verificación del JWT + cachés de tokens/usuarios + sesiones revocadas (common.service_auth)
+auth = ServiceAuth(settings, User, lambda: SessionLocal())
+token_cache, user_cache, revocations, jwks = auth.token_cache, auth.user_cache, auth.revocations, auth.jwks
+
+def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)) -> Principal:
+    with span("get_current_user", mode="principal"):
+        return auth.principal(credentials.credentials)  # <-- el JWT que pegas en Swagger
+
+def get_current_db_user(
     credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
     db: Session = Depends(get_db),
 ) -> User:
-    token = credentials.credentials  # <-- el JWT que pegas en Swagger
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALG])
-        user_id = int(payload.get("sub"))
-    except (JWTError, ValueError, TypeError):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido")
-
-    user = db.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuario no encontrado")
-    return user
+    with span("get_current_user", mode="db_user"):
+        return auth.db_user(credentials.credentials, db)
+
+# AUTH_VERIFIED_PRINCIPAL=true (por defecto): claims del JWT + caché; false: fila User de la BD
+get_current_user = get_current_principal if settings.AUTH_VERIFIED_PRINCIPAL else get_current_db_user
 
-def require_admin(user: User = Depends(get_current_user)) -> User:
+def require_admin(user: Principal | User = Depends(get_current_user)) -> Principal | User:
     if not bool(user.is_admin):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo administradores")
-    return user
\ No newline at end of file
+    return user
+
+# --- réplicas de lectura (DB_REPLICA_URLS) ---
+# Endpoints públicos de solo lectura: réplica, salvo para quien acaba de escribir (el
+# Bearer, si viene, solo sirve para reconocerle; la ruta sigue siendo pública)
+# Tras una escritura la caché compartida se vacía (main.cache.invalidate); quien la
+# rellene durante DB_REPLICA_STICKY_S lee del primario, no una réplica aún sin ella
+CACHE_FILL = "cache-fill"
+
+def _read_key(request: Request):
+    if database.pins.pinned(CACHE_FILL):
+        return CACHE_FILL
+    return auth.subject(request.headers.get("authorization"))
+
+def read_pinned(request: Request) -> bool:
+    # quien acaba de escribir no usa la caché compartida ni espera cargas de otros
+    return database.pins.pinned(auth.subject(request.headers.get("authorization")))
+
+def get_read_db(request: Request):
+    with span("get_read_db"):
+        db = database.read_session(_read_key(request))
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_async_read_sessions(request: Request) -> Callable[[], AsyncSession]:
+    # fábrica y no sesión: la carga coalescida (cache.aget) abre la suya, y no falla si la
+    # request que la lanzó se cancela y cierra lo que es suyo
+    key = _read_key(request)
+    return lambda: database.async_read_session(key)
+
+def pin_to_primary(user: Principal | User = Depends(get_current_user)) -> None:
+    # read-your-writes: quien escribe lee del primario durante DB_REPLICA_STICKY_S, y
+    # también las cargas que vuelven a llenar la caché
+    database.pin(user.id)
+    database.pin(CACHE_FILL)
@@ -1,15 +1,35 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from contextlib import asynccontextmanager
+from decimal import ROUND_CEILING, ROUND_FLOOR, Decimal
+
+from fastapi import FastAPI, Depends, HTTPException, Response, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import select
-from typing import List, Optional
+from typing import Callable, List, NamedTuple, Optional
+
+from common.compression import CompressionMiddleware
+from common.fastjson import dumps
+from common.metrics import CONTENT_TYPE, Metrics, MetricsMiddleware
+from common.tracing import Tracer, TracingMiddleware, instrument_database
+from common.singleflight import CoalescingCache
 
-from .database import Base, engine
+from .database import SessionLocal, database
 from .models import Category, Product
 from .schemas import CategoryIn, CategoryOut, ProductIn, ProductOut, ProductUpdate
-from .deps import get_db, require_admin
+from .deps import get_async_read_sessions, get_db, get_read_db, pin_to_primary, read_pinned, require_admin, auth
 from .config import settings
+from .snapshot import CatalogSnapshot, to_cents
 
-app = FastAPI(title="Catalog Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # engines al arrancar y no al importar; el esquema lo aplica scripts/migrate.py
+    database.start()
+    metrics.instrument_database(database)
+    instrument_database(database)  # un span por sentencia SQL
+    yield
+    await database.dispose()
+
+app = FastAPI(title="Catalog Service", lifespan=lifespan)
 from fastapi.middleware.cors import CORSMiddleware
 
 # incluye AMBOS orígenes: localhost y 127.0.0.1 (Vite suele usar localhost)
@@ -26,20 +46,94 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# crea tablas si no existen (dev)
-Base.metadata.create_all(bind=engine)
+# compresión negociada (gzip, y br/zstd si están instalados) de las respuestas grandes
+app.add_middleware(CompressionMiddleware, settings=settings)
+
+# métricas Prometheus: latencia por ruta, sentencias SQL por request y pool (GET /metrics)
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# trazas distribuidas (traceparent W3C, muestreadas): GET /health/traces
+tracer = Tracer('catalog', settings)
+app.add_middleware(TracingMiddleware, tracer=tracer)
+
+# Lecturas calientes: una sola consulta por clave aunque lleguen cientos de requests a la
+# vez, y al caducar se sigue sirviendo la copia anterior mientras una request la recarga.
+# Se guarda el JSON ya serializado; las escrituras del admin invalidan lo que tocan (las
+# de otros workers se ven, como tarde, pasado CATALOG_CACHE_TTL_S)
+cache = CoalescingCache(
+    "catalog", settings.CATALOG_CACHE_TTL_S, settings.CATALOG_CACHE_STALE_S, settings.CATALOG_CACHE_MAX,
+)
+metrics.collectors.append(cache.metric_lines)
+
+# Listado filtrado (categoría, talla, precio, stock) desde una copia columnar de products
+# (app/snapshot.py): las máscaras se calculan en memoria y a la BD solo va la página.
+# CATALOG_SNAPSHOT_PATH: fichero mapeado que comparten los workers
+snapshot = None
+if settings.CATALOG_SNAPSHOT:
+    snapshot = CatalogSnapshot(
+        Product, lambda: SessionLocal(), settings.CATALOG_SNAPSHOT_PATH,
+        settings.CATALOG_SNAPSHOT_SYNC_S, settings.CATALOG_SNAPSHOT_MAX_AGE_S,
+    )
+    metrics.collectors.append(snapshot.metric_lines)
+
+def _json(body: bytes) -> Response:
+    return Response(body, media_type="application/json")
+
+def _is_listing(key) -> bool:
+    return key[0] != "product"
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # async: el scrape no espera turno en el threadpool aunque esté saturado
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health/db")
+def db_pool_stats():
+    return database.pool_status()
+
+@app.get("/health/traces")
+def recent_traces(limit: int = 20, min_ms: float = 0.0):
+    # últimas trazas muestreadas (TRACE_EXPORT=memory); min_ms: solo las más lentas
+    return {"stats": tracer.stats(), "traces": tracer.recent(limit, min_ms)}
+
+@app.get("/health/auth")
+def auth_cache_stats():
+    return auth.stats()
+
+@app.get("/health/cache")
+def read_cache_stats():
+    return cache.stats()
+
+@app.get("/health/snapshot")
+def catalog_snapshot_stats():
+    # filas, capacidad y bytes de la copia columnar, recargas y consultas que fueron a SQL
+    return {"enabled": snapshot is not None, **(snapshot.stats() if snapshot else {})}
+
+@app.post("/admin/snapshot/reload")
+def reload_catalog_snapshot(_admin=Depends(require_admin)):
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="CATALOG_SNAPSHOT desactivado")
+    if not snapshot.reload():
+        raise HTTPException(status_code=503, detail="No se pudo recargar la copia del catálogo")
+    return snapshot.stats()
+
 # --------- Categorías ---------
+def _categories_json(db: Session) -> bytes:
+    rows = db.execute(select(Category.id, Category.name).order_by(Category.name)).all()
+    return dumps([{"id": cid, "name": name} for cid, name in rows])
+
 @app.get("/categories", response_model=List[CategoryOut])
-def list_categories(db: Session = Depends(get_db)):
-    rows = db.execute(select(Category).order_by(Category.name)).scalars().all()
-    return rows
+def list_categories(db: Session = Depends(get_read_db), pinned: bool = Depends(read_pinned)):
+    if pinned:
+        return _json(_categories_json(db))
+    return _json(cache.get(("categories",), lambda: _categories_json(db)))
 
-@app.post("/categories", response_model=CategoryOut, status_code=201)
+@app.post("/categories", response_model=CategoryOut, status_code=201, dependencies=[Depends(pin_to_primary)])
 def create_category(payload: CategoryIn, db: Session = Depends(get_db), _admin=Depends(require_admin)):
     exists = db.execute(select(Category).where(Category.name == payload.name)).scalar_one_or_none()
     if exists:
@@ -47,61 +141,166 @@ def create_category(payload: CategoryIn, db: Session = Depends(get_db), _admin=D
     cat = Category(name=payload.name)
     db.add(cat)
     db.commit()
+    cache.invalidate(_is_listing)
     db.refresh(cat)
     return cat
 
-@app.put("/categories/{category_id}", response_model=CategoryOut)
+@app.put("/categories/{category_id}", response_model=CategoryOut, dependencies=[Depends(pin_to_primary)])
 def update_category(category_id: int, payload: CategoryIn, db: Session = Depends(get_db), _admin=Depends(require_admin)):
     cat = db.get(Category, category_id)
     if not cat:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     cat.name = payload.name
     db.commit()
+    cache.invalidate(_is_listing)
     db.refresh(cat)
     return cat
 
-@app.delete("/categories/{category_id}", status_code=204)
+@app.delete("/categories/{category_id}", status_code=204, dependencies=[Depends(pin_to_primary)])
 def delete_category(category_id: int, db: Session = Depends(get_db), _admin=Depends(require_admin)):
     cat = db.get(Category, category_id)
     if not cat:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     db.delete(cat)
     db.commit()
+    cache.invalidate()  # los productos de la categoría pueden haber cambiado
+    if snapshot is not None:
+        snapshot.invalidate()
     return None
 
 # --------- Productos ---------
-@app.get("/products", response_model=List[ProductOut])
-def list_products(
-    db: Session = Depends(get_db),
+# Listado y ficha: solo las columnas de ProductOut (sin entidades ORM ni la categoría en
+# selectin) y directo a JSON con orjson (common.fastjson), sin pasar por from_attributes
+# ni por la revalidación de response_model; ese JSON es lo que guarda la caché
+PRODUCT_FIELDS = tuple(ProductOut.model_fields)
+_PRODUCT_COLUMNS = tuple(getattr(Product, f) for f in PRODUCT_FIELDS)
+
+class ProductFilter(NamedTuple):
+    # hashable: va tal cual en la clave de la caché
+    q: Optional[str] = None
+    category_id: Optional[int] = None
+    sizes: tuple = ()
+    min_price: Optional[Decimal] = None
+    max_price: Optional[Decimal] = None
+    in_stock: bool = False
+
+def product_filter(
     q: Optional[str] = Query(None, description="Buscar por nombre"),
     category_id: Optional[int] = None,
-    skip: int = 0,
-    limit: int = Query(50, le=100)
-):
-    stmt = select(Product)
-    if category_id is not None:
-        stmt = stmt.where(Product.category_id == category_id)
-    if q:
-        stmt = stmt.where(Product.name.like(f"%{q}%"))
-    rows = db.execute(stmt.order_by(Product.id).offset(skip).limit(limit)).unique().scalars().all()
-    return rows
-
-@app.get("/products/{product_id}", response_model=ProductOut)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    prod = db.get(Product, product_id)
-    if not prod:
+    size: Optional[List[str]] = Query(None, description="Tallas (se puede repetir)"),
+    min_price: Optional[Decimal] = Query(None, ge=0),
+    max_price: Optional[Decimal] = Query(None, ge=0),
+    in_stock: bool = Query(False, description="Solo con stock"),
+) -> ProductFilter:
+    return ProductFilter(q, category_id, tuple(sorted(set(size or ()))), min_price, max_price, in_stock)
+
+def _products_from_snapshot(db: Session, f: ProductFilter, skip: int, limit: int) -> Optional[bytes]:
+    min_cents = None if f.min_price is None else to_cents(f.min_price, ROUND_CEILING)
+    max_cents = None if f.max_price is None else to_cents(f.max_price, ROUND_FLOOR)
+    for _ in range(2):
+        ids = snapshot.page(f.category_id, f.sizes, min_cents, max_cents, f.in_stock, skip, limit)
+        if ids is None:
+            return None
+        rows = {r.id: r for r in db.execute(select(*_PRODUCT_COLUMNS).where(Product.id.in_(ids))).all()} if ids else {}
+        missing = [pid for pid in ids if pid not in rows]
+        if not missing:
+            return dumps([dict(zip(PRODUCT_FIELDS, rows[pid])) for pid in ids])
+        # borrados por otro worker (o aún sin replicar: vuelven con la siguiente puesta al día)
+        snapshot.discard(missing)
+    return None
+
+def _list_products(db: Session, f: ProductFilter, skip: int, limit: int) -> bytes:
+    if snapshot is not None and not f.q:
+        body = _products_from_snapshot(db, f, skip, limit)
+        if body is not None:
+            return body
+    stmt = select(*_PRODUCT_COLUMNS)
+    if f.category_id is not None:
+        stmt = stmt.where(Product.category_id == f.category_id)
+    if f.q:
+        stmt = stmt.where(Product.name.like(f"%{f.q}%"))
+    if f.sizes:
+        stmt = stmt.where(Product.size.in_(f.sizes))
+    if f.min_price is not None:
+        stmt = stmt.where(Product.price >= f.min_price)
+    if f.max_price is not None:
+        stmt = stmt.where(Product.price <= f.max_price)
+    if f.in_stock:
+        stmt = stmt.where(Product.stock > 0)
+    rows = db.execute(stmt.order_by(Product.id).offset(skip).limit(limit)).all()
+    return dumps([dict(zip(PRODUCT_FIELDS, r)) for r in rows])
+
+def _get_product(db: Session, product_id: int) -> bytes:
+    row = db.execute(select(*_PRODUCT_COLUMNS).where(Product.id == product_id)).first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return prod
+    return dumps(dict(zip(PRODUCT_FIELDS, row)))
+
+# Lecturas (aquí y GET /categories) por get_read_db: réplica si DB_REPLICA_URLS; las
+# escrituras, al primario y con pin_to_primary (read-your-writes del admin: lee sin la
+# caché mientras dura el pin, y quien la rellena tras la escritura lee del primario)
+# DB_ASYNC=true: mismas consultas vía AsyncSession.run_sync, sin ocupar el threadpool
+# La carga la comparten todas las requests coalescidas: abre su propia sesión en vez de
+# usar la de la request que la lanzó, que se cierra si esa request se cancela
+async def _run_sync(sessions: Callable[[], AsyncSession], fn, *args) -> bytes:
+    async with sessions() as db:
+        return await db.run_sync(fn, *args)
+
+if settings.DB_ASYNC:
+    @app.get("/products", response_model=List[ProductOut])
+    async def list_products(
+        sessions: Callable[[], AsyncSession] = Depends(get_async_read_sessions),
+        f: ProductFilter = Depends(product_filter),
+        skip: int = 0,
+        limit: int = Query(50, le=100),
+        pinned: bool = Depends(read_pinned),
+    ):
+        if pinned:
+            return _json(await _run_sync(sessions, _list_products, f, skip, limit))
+        key = ("products", f, skip, limit)
+        return _json(await cache.aget(key, lambda: _run_sync(sessions, _list_products, f, skip, limit)))
+
+    @app.get("/products/{product_id}", response_model=ProductOut)
+    async def get_product(
+        product_id: int,
+        sessions: Callable[[], AsyncSession] = Depends(get_async_read_sessions),
+        pinned: bool = Depends(read_pinned),
+    ):
+        if pinned:
+            return _json(await _run_sync(sessions, _get_product, product_id))
+        return _json(await cache.aget(("product", product_id), lambda: _run_sync(sessions, _get_product, product_id)))
+else:
+    @app.get("/products", response_model=List[ProductOut])
+    def list_products(
+        db: Session = Depends(get_read_db),
+        f: ProductFilter = Depends(product_filter),
+        skip: int = 0,
+        limit: int = Query(50, le=100),
+        pinned: bool = Depends(read_pinned),
+    ):
+        if pinned:
+            return _json(_list_products(db, f, skip, limit))
+        key = ("products", f, skip, limit)
+        return _json(cache.get(key, lambda: _list_products(db, f, skip, limit)))
+
+    @app.get("/products/{product_id}", response_model=ProductOut)
+    def get_product(product_id: int, db: Session = Depends(get_read_db), pinned: bool = Depends(read_pinned)):
+        if pinned:
+            return _json(_get_product(db, product_id))
+        return _json(cache.get(("product", product_id), lambda: _get_product(db, product_id)))
 
-@app.post("/products", response_model=ProductOut, status_code=201)
+@app.post("/products", response_model=ProductOut, status_code=201, dependencies=[Depends(pin_to_primary)])
 def create_product(payload: ProductIn, db: Session = Depends(get_db), _admin=Depends(require_admin)):
     prod = Product(**payload.dict())
     db.add(prod)
     db.commit()
+    cache.invalidate(_is_listing)
     db.refresh(prod)
+    if snapshot is not None:
+        snapshot.upsert(prod)
     return prod
 
-@app.put("/products/{product_id}", response_model=ProductOut)
+@app.put("/products/{product_id}", response_model=ProductOut, dependencies=[Depends(pin_to_primary)])
 def update_product(product_id: int, payload: ProductUpdate, db: Session = Depends(get_db), _admin=Depends(require_admin)):
     prod = db.get(Product, product_id)
     if not prod:
@@ -109,16 +308,22 @@ def update_product(product_id: int, payload: ProductUpdate, db: Session = Depend
     for field, value in payload.dict(exclude_unset=True).items():
         setattr(prod, field, value)
     db.commit()
+    cache.invalidate(lambda key: _is_listing(key) or key == ("product", product_id))
     db.refresh(prod)
+    if snapshot is not None:
+        snapshot.upsert(prod)
     return prod
 
-@app.delete("/products/{product_id}", status_code=204)
+@app.delete("/products/{product_id}", status_code=204, dependencies=[Depends(pin_to_primary)])
 def delete_product(product_id: int, db: Session = Depends(get_db), _admin=Depends(require_admin)):
     prod = db.get(Product, product_id)
     if not prod:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     db.delete(prod)
     db.commit()
+    cache.invalidate(lambda key: _is_listing(key) or key == ("product", product_id))
+    if snapshot is not None:
+        snapshot.discard([product_id])
     return None
 
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
 # services/catalog_service/app/models.py
 from sqlalchemy import (
-    Column, Integer, String, Text, Numeric, DateTime, ForeignKey, text
+    Column, Integer, String, Text, Numeric, DateTime, ForeignKey, Index, text
 )
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -15,6 +15,7 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     full_name = Column(String(255))
     is_admin = Column(Integer, nullable=False, server_default=text("0"))  # tinyint(1)
+    token_version = Column(Integer, nullable=False, server_default=text("0"))  # +1 revoca sus JWT
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
@@ -35,6 +36,11 @@ class Category(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    # los de scripts/05_indexes.sql: listado por categoría y cambios desde un instante
+    __table_args__ = (
+        Index("ix_products_category", "category_id", "id"),
+        Index("ix_products_updated_at", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     category_id = Column(Integer, ForeignKey("categories.id", ondelete="SET NULL"), nullable=True)
@@ -0,0 +1,518 @@
+# services/catalog_service/app/snapshot.py
+"""
+Copia columnar de ``products`` para filtrar el listado sin recorrer la tabla.
+
+Un único buffer de tamaño fijo, con las filas ordenadas por id:
+
+    cabecera (16 KiB)  contadores, diccionarios de categorías y tallas, límites de los
+                       tramos de precio, marca de agua de updated_at
+    id int64 | precio en céntimos int64 | stock int32 |
+    categoría uint8 | talla uint8 | tramo de precio uint8 | flags uint8 (viva, con stock)
+
+Categoría y talla van codificadas por diccionario (hasta 254 valores; 0 = NULL, 255 = no
+cupo) y el precio, además de en céntimos, en 256 tramos por cuantiles. Cada filtro es un
+``bytes.translate`` de una columna de un byte (una tabla de 256 entradas dice qué códigos
+valen) y los filtros se combinan con un AND de enteros: en C y sobre todas las filas a la
+vez, ~24 bytes por producto. Los dos tramos del borde de un rango de precio se afinan fila
+a fila con los céntimos. A la BD solo va la página final (``WHERE id IN (...)``).
+
+- ``path``: el buffer es un fichero mapeado (``mmap``) que comparten los workers; lo que
+  escribe uno lo ven los demás al momento. Una recarga completa escribe un fichero nuevo,
+  lo pone en lugar del viejo (``os.replace``) y marca el viejo como sustituido: cada worker
+  vuelve a mapear al verlo. Las escrituras se serializan entre procesos con ``flock``.
+  Sin ``path``, un bytearray por proceso. Solo POSIX, como ``common.serving``.
+- Frescura: las escrituras del catálogo se aplican al confirmar (``upsert`` / ``discard``).
+  Cada ``interval`` s, en segundo plano (``common.background``), se aplican las filas con
+  updated_at desde la última puesta al día (``ix_products_updated_at``); así llegan también
+  las altas de otros workers y el stock que descuenta order_service (en MySQL
+  ``ON UPDATE CURRENT_TIMESTAMP``). Cada ``max_age`` s, o si algo no cabe (capacidad, un id
+  fuera de orden, demasiados cambios), recarga completa. Un producto que otro proceso
+  borró se descubre al pedir la página: ``discard`` y se repite.
+- Mientras no hay copia cargada, ``page`` devuelve None y el listado va por SQL.
+"""
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import ROUND_HALF_EVEN, Decimal
+from typing import Callable, Iterable
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from common.background import BackgroundRefresh
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso por copia, basta el lock del hilo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CATSNAP1"
+HEADER = 16 * 1024
+MAX_CODES = 254
+OTHER = 255          # valor que ya no cupo en el diccionario
+PRICE_BOUNDS = 255   # -> 256 tramos
+SIZE_BYTES = 16
+LIVE, IN_STOCK = 1, 2
+
+# contadores: cambios aplicados, filas, capacidad, sustituido, nº categorías, nº tallas,
+# nº límites de precio, filas borradas
+_Q = struct.Struct("<q")
+_D = struct.Struct("<d")
+_COUNTERS_AT = 8
+_TIMES_AT = 80       # marca de agua (reloj de la BD) y última recarga completa, en epoch
+_CATS_AT = 128
+_SIZES_AT = _CATS_AT + 8 * MAX_CODES
+_BOUNDS_AT = _SIZES_AT + SIZE_BYTES * MAX_CODES
+GENERATION, COUNT, CAPACITY, SUPERSEDED, N_CATS, N_SIZES, N_BOUNDS, DEAD = range(8)
+WATERMARK, LOADED_AT = range(2)
+# TIMESTAMP de MySQL va por segundos, y una escritura puede confirmarse un poco después
+# de fijar su updated_at: la puesta al día relee las filas de ese último margen
+_MARGIN = timedelta(seconds=2)
+
+_COLUMNS = (("ids", "q", 8), ("price", "q", 8), ("stock", "i", 4),
+            ("cat", "B", 1), ("size", "B", 1), ("bin", "B", 1), ("flags", "B", 1))
+# valores de las máscaras (un byte por fila): la fila pasa el filtro, o está en un tramo de
+# precio del borde y falta mirar su precio. El AND deja MATCH, EDGE o 0 sin pasos extra
+MATCH, EDGE = 3, 2
+_LIVE = bytes(MATCH if v & LIVE else 0 for v in range(256))
+_LIVE_IN_STOCK = bytes(MATCH if v == LIVE | IN_STOCK else 0 for v in range(256))
+
+
+def _layout(capacity: int) -> tuple[dict[str, int], int]:
+    """Offset de cada columna (alineadas a 8) y tamaño total del buffer."""
+    offsets, at = {}, HEADER
+    for name, _, width in _COLUMNS:
+        offsets[name] = at
+        at += -(-capacity * width // 8) * 8
+    return offsets, at
+
+
+def _only(codes: Iterable[int], edges: Iterable[int] = ()) -> bytes:
+    """Tabla de ``translate``: MATCH para los códigos dados, EDGE para ``edges``, 0 el resto."""
+    table = bytearray(256)
+    for c in codes:
+        table[c] = MATCH
+    for c in edges:
+        table[c] = EDGE
+    return bytes(table)
+
+
+def _and(masks: list, n: int) -> bytearray:
+    """AND de las máscaras como enteros: en C y sobre todas las filas a la vez."""
+    if len(masks) == 1:
+        return bytearray(masks[0])
+    acc = int.from_bytes(masks[0], "little")
+    for m in masks[1:]:
+        acc &= int.from_bytes(m, "little")
+    return bytearray(acc.to_bytes(n, "little"))
+
+
+def _select(mask: bytearray, skip: int, limit: int) -> list[int]:
+    """Posiciones de la página: salta ``skip`` coincidencias contando por bloques cada vez menores."""
+    pos, n = 0, len(mask)
+    for block in (65536, 4096, 256, 16, 1):
+        while skip and pos < n:
+            found = mask.count(MATCH, pos, pos + block)
+            if found > skip:
+                break
+            skip -= found
+            pos += block
+    out = []
+    while len(out) < limit:
+        pos = mask.find(MATCH, pos)
+        if pos < 0:
+            break
+        out.append(pos)
+        pos += 1
+    return out
+
+
+def to_cents(price, rounding: str = ROUND_HALF_EVEN) -> int:
+    return int(Decimal(price).scaleb(2).to_integral_value(rounding))
+
+
+def _epoch(value) -> float:
+    if isinstance(value, str):  # CURRENT_TIMESTAMP de SQLite sin tipo de resultado
+        value = datetime.fromisoformat(value)
+    return value.timestamp() if isinstance(value, datetime) else 0.0
+
+
+class _Buffer:
+    """Un buffer con el formato de arriba (bytearray o mmap) y una vista por columna."""
+
+    def __init__(self, buf):
+        if bytes(buf[:8]) != MAGIC:
+            raise ValueError("no es una copia del catálogo")
+        self.buf = buf
+        self.capacity = self.counter(CAPACITY)
+        self.offsets, _ = _layout(self.capacity)
+        mv = memoryview(buf)
+        for name, fmt, width in _COLUMNS:
+            at = self.offsets[name]
+            setattr(self, name, mv[at:at + self.capacity * width].cast(fmt))
+        self._cats: dict[int, int] = {}
+        self._sizes: dict[str, int] = {}
+        self._bounds: list[int] | None = None
+
+    # --- cabecera ---
+    def counter(self, i: int) -> int:
+        return _Q.unpack_from(self.buf, _COUNTERS_AT + 8 * i)[0]
+
+    def set_counter(self, i: int, value: int) -> None:
+        _Q.pack_into(self.buf, _COUNTERS_AT + 8 * i, value)
+
+    def time(self, i: int) -> float:
+        return _D.unpack_from(self.buf, _TIMES_AT + 8 * i)[0]
+
+    def set_time(self, i: int, value: float) -> None:
+        _D.pack_into(self.buf, _TIMES_AT + 8 * i, value)
+
+    @property
+    def count(self) -> int:
+        return self.counter(COUNT)
+
+    @property
+    def superseded(self) -> bool:
+        return self.counter(SUPERSEDED) != 0
+
+    def column(self, name: str, count: int):
+        at = self.offsets[name]
+        return self.buf[at:at + count]
+
+    # --- diccionarios (otro proceso puede haber añadido valores: se releen si crecen) ---
+    def cats(self) -> dict[int, int]:
+        n = self.counter(N_CATS)
+        if len(self._cats) != n:
+            self._cats = {_Q.unpack_from(self.buf, _CATS_AT + 8 * i)[0]: i + 1 for i in range(n)}
+        return self._cats
+
+    def sizes(self) -> dict[str, int]:
+        n = self.counter(N_SIZES)
+        if len(self._sizes) != n:
+            at = _SIZES_AT
+            self._sizes = {
+                bytes(self.buf[at + SIZE_BYTES * i:at + SIZE_BYTES * (i + 1)]).rstrip(b"\0").decode(): i + 1
+                for i in range(n)
+            }
+        return self._sizes
+
+    def bounds(self) -> list[int]:
+        if self._bounds is None:  # fijos desde la recarga completa
+            self._bounds = [_Q.unpack_from(self.buf, _BOUNDS_AT + 8 * i)[0] for i in range(self.counter(N_BOUNDS))]
+        return self._bounds
+
+    def full(self, kind: str) -> bool:
+        return self.counter(N_CATS if kind == "cat" else N_SIZES) >= MAX_CODES
+
+    def code(self, kind: str, value) -> int:
+        """Código de ``value`` (lo añade al diccionario si cabe)."""
+        if value is None:
+            return 0
+        codes = self.cats() if kind == "cat" else self.sizes()
+        n = len(codes)
+        code = _encode(codes, value)
+        if len(codes) > n:  # nuevo: a la cabecera, y luego el contador
+            if kind == "cat":
+                _Q.pack_into(self.buf, _CATS_AT + 8 * n, value)
+            else:
+                at = _SIZES_AT + SIZE_BYTES * n
+                self.buf[at:at + SIZE_BYTES] = value.encode().ljust(SIZE_BYTES, b"\0")
+            self.set_counter(N_CATS if kind == "cat" else N_SIZES, n + 1)
+        return code
+
+    # --- filas ---
+    def put(self, pid: int, category_id, price, stock: int, size) -> bool:
+        """Escribe la fila de ``pid``; False si hace falta una recarga completa."""
+        count = self.count
+        i = bisect.bisect_left(self.ids, pid, 0, count)
+        if i < count and self.ids[i] != pid:
+            return False  # id intermedio que no estaba: no se puede insertar en orden
+        if i == count and count == self.capacity:
+            return False
+        if i < count and not self.flags[i] & LIVE:
+            self.set_counter(DEAD, self.counter(DEAD) - 1)  # vuelve un borrado
+        cents = to_cents(price)
+        self.ids[i] = pid
+        self.price[i] = cents
+        self.stock[i] = stock
+        self.cat[i] = self.code("cat", category_id)
+        self.size[i] = self.code("size", size)
+        self.bin[i] = bisect.bisect_right(self.bounds(), cents)
+        self.flags[i] = LIVE | (IN_STOCK if stock > 0 else 0)
+        if i == count:
+            self.set_counter(COUNT, count + 1)  # tras escribirla: nadie ve una fila a medias
+        self.set_counter(GENERATION, self.counter(GENERATION) + 1)
+        return True
+
+    def discard(self, pid: int) -> None:
+        count = self.count
+        i = bisect.bisect_left(self.ids, pid, 0, count)
+        if i < count and self.ids[i] == pid and self.flags[i] & LIVE:
+            self.flags[i] = 0
+            self.set_counter(DEAD, self.counter(DEAD) + 1)
+            self.set_counter(GENERATION, self.counter(GENERATION) + 1)
+
+
+def _encode(codes: dict, value) -> int:
+    if value is None:
+        return 0
+    code = codes.get(value)
+    if code is None:
+        if len(codes) >= MAX_CODES or (isinstance(value, str) and len(value.encode()) > SIZE_BYTES):
+            return OTHER  # filtrar por él irá por SQL
+        code = codes[value] = len(codes) + 1
+    return code
+
+
+def build(rows: Iterable, watermark: float, slack: float = 0.25) -> bytearray:
+    """Buffer nuevo con ``rows`` = (id, category_id, price, stock, size) ordenadas por id."""
+    ids, prices, stocks = array("q"), array("q"), array("i")
+    cats, sizes = {}, {}
+    cat, size, flags = bytearray(), bytearray(), bytearray()
+    for pid, category_id, price, stock, sz in rows:
+        ids.append(pid)
+        prices.append(to_cents(price))
+        stocks.append(stock)
+        cat.append(_encode(cats, category_id))
+        size.append(_encode(sizes, sz))
+        flags.append(LIVE | (IN_STOCK if stock > 0 else 0))
+    n = len(ids)
+    ordered = sorted(prices)
+    bounds = sorted({ordered[i * n // (PRICE_BOUNDS + 1)] for i in range(1, PRICE_BOUNDS + 1)}) if n else []
+    bins = bytearray(bisect.bisect_right(bounds, p) for p in prices)
+
+    capacity = n + max(1024, int(n * slack))
+    offsets, total = _layout(capacity)
+    buf = bytearray(total)
+    buf[:8] = MAGIC
+    for i, value in ((COUNT, n), (CAPACITY, capacity), (N_CATS, len(cats)), (N_SIZES, len(sizes)), (N_BOUNDS, len(bounds))):
+        _Q.pack_into(buf, _COUNTERS_AT + 8 * i, value)
+    _D.pack_into(buf, _TIMES_AT + 8 * WATERMARK, watermark)
+    _D.pack_into(buf, _TIMES_AT + 8 * LOADED_AT, time.time())
+    for value, code in cats.items():
+        _Q.pack_into(buf, _CATS_AT + 8 * (code - 1), value)
+    for value, code in sizes.items():
+        at = _SIZES_AT + SIZE_BYTES * (code - 1)
+        buf[at:at + SIZE_BYTES] = value.encode().ljust(SIZE_BYTES, b"\0")
+    for i, value in enumerate(bounds):
+        _Q.pack_into(buf, _BOUNDS_AT + 8 * i, value)
+    for name, data in (("ids", ids.tobytes()), ("price", prices.tobytes()), ("stock", stocks.tobytes()),
+                       ("cat", cat), ("size", size), ("bin", bins), ("flags", flags)):
+        buf[offsets[name]:offsets[name] + len(data)] = data
+    return buf
+
+
+class CatalogSnapshot(BackgroundRefresh):
+    name = "catalog-snapshot"
+
+    def __init__(
+        self, model, session_factory: Callable[[], Session], path: str = "",
+        interval: float = 2.0, max_age: float = 300.0,
+    ):
+        super().__init__(interval)
+        self.model = model
+        self.session_factory = session_factory
+        self.path = path or None
+        self.max_age = max_age
+        self.reloads = 0
+        self.deltas = 0
+        self.fallbacks = 0
+        self._buf: _Buffer | None = None
+        self._stale = False
+        self._write_lock = threading.RLock()
+
+    # --- lectura (requests) ---
+    def _current(self) -> _Buffer | None:
+        b = self._buf
+        if b is not None and b.superseded:  # otro worker recargó: su fichero nuevo
+            with self._write_lock:
+                if self._buf is b:
+                    self._buf = self._map()
+                b = self._buf
+        return b
+
+    def page(
+        self, category_id: int | None = None, sizes: Iterable[str] = (), min_cents: int | None = None,
+        max_cents: int | None = None, in_stock: bool = False, skip: int = 0, limit: int = 50,
+    ) -> list[int] | None:
+        """Ids de la página (orden por id) o None si la copia no puede responder."""
+        self.maybe_sync()
+        b = self._current()
+        if b is None:
+            self.fallbacks += 1
+            return None
+        n = b.count
+        # cada máscara de más es un AND sobre todas las filas: la de "viva" solo si hay borrados
+        masks = []
+        if in_stock or b.counter(DEAD):
+            masks.append(b.column("flags", n).translate(_LIVE_IN_STOCK if in_stock else _LIVE))
+        for kind, wanted in (("cat", () if category_id is None else (category_id,)), ("size", tuple(sizes))):
+            if not wanted:
+                continue
+            known = b.cats() if kind == "cat" else b.sizes()
+            codes = [known[v] for v in wanted if v in known]
+            if len(codes) < len(wanted) and (b.full(kind) or any(len(str(v).encode()) > SIZE_BYTES for v in wanted)):
+                self.fallbacks += 1  # puede estar entre los que no cupieron (OTHER)
+                return None
+            if not codes:
+                return []
+            masks.append(b.column(kind, n).translate(_only(codes)))
+        edges = ()
+        if min_cents is not None or max_cents is not None:
+            bounds = b.bounds()
+            lo = bisect.bisect_right(bounds, min_cents) if min_cents is not None else 0
+            hi = bisect.bisect_right(bounds, max_cents) if max_cents is not None else len(bounds)
+            if lo > hi:
+                return []
+            edges = {t for t, given in ((lo, min_cents is not None), (hi, max_cents is not None)) if given}
+            masks.append(b.column("bin", n).translate(_only(range(lo, hi + 1), edges)))
+        mask = _and(masks, n) if masks else bytearray(bytes([MATCH]) * n)
+        if edges:
+            # tramos del borde, y solo las filas que pasan el resto: se mira su precio
+            low = min_cents if min_cents is not None else -(1 << 63)
+            high = max_cents if max_cents is not None else (1 << 63) - 1
+            price = b.price
+            pos = mask.find(EDGE)
+            while pos >= 0:
+                mask[pos] = MATCH if low <= price[pos] <= high else 0
+                pos = mask.find(EDGE, pos + 1)
+        ids = b.ids
+        return [ids[p] for p in _select(mask, skip, limit)]
+
+    # --- escrituras del catálogo ---
+    @contextmanager
+    def _writing(self):
+        with self._write_lock:
+            if self.path is None or fcntl is None:
+                yield
+                return
+            with open(self.path + ".lock", "a+b") as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def upsert(self, product) -> None:
+        """Alta o cambio de un producto ya confirmado en la BD."""
+        with self._writing():
+            b = self._current()
+            if b is not None and not b.put(product.id, product.category_id, product.price, product.stock, product.size):
+                self.invalidate()
+
+    def discard(self, ids: Iterable[int]) -> None:
+        with self._writing():
+            b = self._current()
+            if b is not None:
+                for pid in ids:
+                    b.discard(pid)
+
+    def invalidate(self) -> None:
+        """Recarga completa en segundo plano; hasta entonces se sirve la copia actual."""
+        self._stale = True
+        self._next_sync = 0.0
+
+    # --- recarga (hilo de common.background, o sync() directo) ---
+    def _map(self) -> _Buffer | None:
+        try:
+            with open(self.path, "r+b") as fh:
+                return _Buffer(mmap.mmap(fh.fileno(), 0))
+        except (OSError, ValueError):
+            return None
+
+    def _load(self) -> None:
+        with self.session_factory() as db, self._writing():
+            b = self._current()
+            if b is None and self.path and not self._stale:
+                b = self._buf = self._map()  # el fichero que ya dejó otro worker
+            if b is None or self._stale or time.time() - b.time(LOADED_AT) > self.max_age:
+                self._reload(db)
+            else:
+                self._catch_up(db, b)
+
+    def _catch_up(self, db: Session, b: _Buffer) -> None:
+        m = self.model
+        now = db.execute(select(func.now())).scalar()  # reloj de la BD, el de updated_at
+        since = datetime.fromtimestamp(b.time(WATERMARK)) - _MARGIN
+        rows = db.execute(
+            select(m.id, m.category_id, m.price, m.stock, m.size).where(m.updated_at >= since).order_by(m.id)
+        ).all()
+        if len(rows) > max(1000, b.count // 4):
+            self._reload(db)  # tanto cambio: sale más barato recargar
+            return
+        for row in rows:
+            if not b.put(*row):
+                self._reload(db)
+                return
+        b.set_time(WATERMARK, _epoch(now))
+        self.deltas += bool(rows)
+
+    def _reload(self, db: Session) -> None:
+        m = self.model
+        watermark = _epoch(db.execute(select(func.now())).scalar())  # antes de leer las filas
+        rows = db.execute(
+            select(m.id, m.category_id, m.price, m.stock, m.size).order_by(m.id).execution_options(yield_per=10_000)
+        )
+        buf = build(rows, watermark)
+        old = self._buf
+        if self.path:
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(buf)
+            os.replace(tmp, self.path)
+            if old is not None:
+                old.set_counter(SUPERSEDED, 1)  # el resto de workers mapean el nuevo
+            new = self._map()
+            if new is None:
+                raise OSError(f"no se pudo mapear {self.path}")
+            self._buf = new
+        else:
+            self._buf = _Buffer(buf)
+        self._stale = False
+        self.reloads += 1
+        logger.info("%s: %d productos, %d bytes", self.name, self._buf.count, len(self._buf.buf))
+
+    def reload(self) -> bool:
+        """Recarga completa ahora (bloqueante)."""
+        self.invalidate()
+        return self.sync()
+
+    # --- memoria y estado ---
+    def stats(self) -> dict:
+        b = self._current()
+        out = {"loaded": b is not None, "shared_file": self.path, "reloads": self.reloads,
+               "deltas": self.deltas, "fallbacks": self.fallbacks, **super().stats()}
+        if b is None:
+            return out
+        n = b.count
+        size = len(b.buf)
+        out.update(
+            rows=n, live=n - b.counter(DEAD), capacity=b.capacity, bytes=size,
+            bytes_per_row=round((size - HEADER) / b.capacity, 1), categories=b.counter(N_CATS),
+            sizes=b.counter(N_SIZES), price_bins=b.counter(N_BOUNDS) + 1, changes=b.counter(GENERATION),
+            reload_age_s=round(time.time() - b.time(LOADED_AT), 1),
+        )
+        return out
+
+    def metric_lines(self) -> list[str]:
+        st = self.stats()
+        out = [
+            "# TYPE catalog_snapshot_rows gauge",
+            f"catalog_snapshot_rows {st.get('live', 0)}",
+            "# TYPE catalog_snapshot_bytes gauge",
+            f"catalog_snapshot_bytes {st.get('bytes', 0)}",
+            "# TYPE catalog_snapshot_reloads_total counter",
+            f"catalog_snapshot_reloads_total {st['reloads']}",
+            "# TYPE catalog_snapshot_fallbacks_total counter",
+            f"catalog_snapshot_fallbacks_total {st['fallbacks']}",
+        ]
+        return out
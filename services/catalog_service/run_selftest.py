@@ -1,25 +1,173 @@
 # services/catalog_service/run_selftest.py
+import asyncio
+import random
 import sys
+import tempfile
 from decimal import Decimal
+from pathlib import Path
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 
+import orjson
+from jose import jwt
+from sqlalchemy import select
+
+import app.deps as deps
+import app.main as catalog
 from app.main import app
+from app.config import settings
 from app.database import Base
-from app.deps import get_db
-from app.models import Category, Product
+from app.deps import get_async_read_sessions, get_db, get_read_db, user_cache
+from app.models import Category, Product, User
+from app.schemas import ProductOut
+from app.snapshot import CatalogSnapshot
+from common.db import WriterPins
+from common.testing import capture_sql, conforms, selftest_db
+
+capture_sql(app, "catalog")
+
+# filtros del listado con los que se compara la copia columnar contra el resultado esperado
+SNAPSHOT_PAGES = ((0, 50), (30, 20), (100, 100))
+
+def _matches(row, f: dict) -> bool:
+    return ((f.get("category_id") is None or row.category_id == f["category_id"])
+            and (not f.get("size") or row.size in f["size"])
+            and (f.get("min_price") is None or row.price >= Decimal(f["min_price"]))
+            and (f.get("max_price") is None or row.price <= Decimal(f["max_price"]))
+            and (not f.get("in_stock") or row.stock > 0))
+
+def check_snapshot(client, SessionLocal, admin: dict) -> bool:
+    """CATALOG_SNAPSHOT=true: cada filtro da las mismas páginas que el SQL tras la recarga,
+    las escrituras del admin, cambios directos en la BD y con la copia compartida por mmap."""
+    snap = catalog.snapshot
+    rng = random.Random(7)
+    db = SessionLocal()
+    try:
+        cats = [Category(name=f"Snap {i}") for i in range(3)]
+        db.add_all(cats); db.flush()
+        cat_ids = [c.id for c in cats]
+        db.add_all(
+            Product(category_id=rng.choice(cat_ids + [None]), name=f"snap {i}", price=Decimal(rng.randrange(100, 500_000)) / 100,
+                    vat_rate=Decimal("19.00"), stock=rng.choice([0, 0, 3, 50]), size=rng.choice(["XS", "S", "M", "L", "XL", None]))
+            for i in range(400)
+        )
+        db.commit()
+    finally:
+        db.close()
+    cases = [
+        {}, {"in_stock": True}, {"category_id": cat_ids[0]}, {"size": ["M"]}, {"size": ["S", "XL"], "in_stock": True},
+        {"min_price": "100.00"}, {"max_price": "999.99"}, {"min_price": "250.50", "max_price": "1800"},
+        {"category_id": cat_ids[1], "size": ["L"], "min_price": "10", "max_price": "3000", "in_stock": True},
+        {"size": ["XXL"]}, {"min_price": "4000"}, {"category_id": 999_999}, {"min_price": "50", "max_price": "20"},
+    ]
+
+    def same_pages(query=lambda f, skip, limit: [
+        x["id"] for x in client.get("/products", params={**f, "skip": skip, "limit": limit}).json()
+    ]) -> bool:
+        catalog.cache.invalidate()
+        with SessionLocal() as db:
+            rows = db.execute(select(Product.id, Product.category_id, Product.size, Product.price, Product.stock).order_by(Product.id)).all()
+        fallbacks, good = snap.fallbacks, True
+        for f in cases:
+            ids = [r.id for r in rows if _matches(r, f)]
+            for skip, limit in SNAPSHOT_PAGES:
+                if query(f, skip, limit) != ids[skip:skip + limit]:
+                    print(f"[DEBUG] snapshot: página distinta para {f} skip={skip} limit={limit}")
+                    good = False
+        return good and snap.fallbacks == fallbacks  # todo respondido desde la copia
+
+    ok = snap.stats()["loaded"] is False and snap.sync() and snap.reloads == 1 and same_pages()
+    # escrituras del admin: alta (talla nueva), cambio de precio y baja
+    r = client.post("/products", headers=admin, json={
+        "category_id": cat_ids[2], "name": "snap nuevo", "price": "12.34", "stock": 5, "size": "XXL"})
+    new_id = r.json()["id"]
+    with SessionLocal() as db:
+        some = db.scalars(select(Product.id).where(Product.name.like("snap %")).order_by(Product.id)).all()
+    ok &= client.put(f"/products/{some[0]}", headers=admin, json={"price": "4999.99", "stock": 9}).status_code == 200
+    ok &= client.delete(f"/products/{some[1]}", headers=admin).status_code == 204
+    ok &= same_pages() and new_id in [x["id"] for x in client.get("/products?size=XXL").json()]
+    # cambios de otro proceso (stock que descuenta order_service, un alta): puesta al día
+    db = SessionLocal()
+    try:
+        for prod in db.scalars(select(Product).where(Product.stock > 0).limit(5)):
+            prod.stock = 0
+        db.add(Product(category_id=cat_ids[0], name="snap externo", price=Decimal("77.00"), stock=1, size="S"))
+        db.commit()
+    finally:
+        db.close()
+    deltas = snap.deltas
+    ok &= snap.sync() and snap.deltas == deltas + 1 and snap.reloads == 1 and same_pages()
+    # borrado por otro proceso: se descubre al pedir la página
+    with SessionLocal() as db:
+        db.delete(db.get(Product, some[2])); db.commit()
+    ok &= same_pages()
+
+    # mmap: un segundo "worker" mapea el fichero del primero y ve sus escrituras y recargas
+    path = str(Path(tempfile.mkdtemp()) / "catalog.snap")
+    a = CatalogSnapshot(Product, SessionLocal, path, interval=0)
+    b = CatalogSnapshot(Product, SessionLocal, path, interval=0)
+    ok &= a.sync() and b.sync() and a.reloads == 1 and b.reloads == 0
+    with SessionLocal() as db:
+        prod = db.get(Product, some[3])
+        prod.size, prod.stock = "XXL", 4
+        db.commit()
+        db.refresh(prod)
+        a.upsert(prod)
+    old = b._buf
+    for snapshot in (a, snap):  # la del servicio se pone al día por su cuenta
+        snapshot.sync()
+    ok &= a.reload() and b._current() is not old and b.reloads == 0
+    for f in cases:
+        ok &= a.page(**_snapshot_args(f)) == b.page(**_snapshot_args(f)) == catalog.snapshot.page(**_snapshot_args(f))
+    ok &= some[3] in b.page(sizes=["XXL"])
+
+    st = client.get("/health/snapshot").json()
+    ok &= st["enabled"] and st["rows"] >= 400 and st["bytes"] > st["rows"] * 24
+    ok &= client.post("/admin/snapshot/reload").status_code in (401, 403)
+    ok &= client.post("/admin/snapshot/reload", headers=admin).json()["reloads"] == snap.reloads == 2
+    print(f"[DEBUG] snapshot -> {st}, mmap={b.stats()['bytes']} bytes")
+    return bool(ok)
+
+def check_cancelled_leader(AsyncSessionLocal, pid: int) -> bool:
+    """DB_ASYNC=true: si la request que lanzó la carga coalescida se cancela (el cliente
+    corta), la carga sigue con su propia sesión y las requests que esperaban la reciben."""
+    class SlowSession:
+        async def __aenter__(self):
+            await asyncio.sleep(0.05)  # la carga sigue en marcha cuando se cancela la primera
+            self.db = AsyncSessionLocal()
+            return await self.db.__aenter__()
+
+        async def __aexit__(self, *exc):
+            return await self.db.__aexit__(*exc)
+
+    async def run() -> bool:
+        catalog.cache.invalidate()
+        folded = catalog.cache.stats()["folded"]
+        call = lambda: catalog.get_product(pid, sessions=SlowSession, pinned=False)
+        first = asyncio.ensure_future(call())
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(call())
+        await asyncio.sleep(0.01)
+        first.cancel()
+        body = await second
+        return first.cancelled() and orjson.loads(body.body)["id"] == pid and catalog.cache.stats()["folded"] == folded + 1
+
+    return asyncio.run(run())
+
+def _snapshot_args(f: dict) -> dict:
+    cents = lambda v: None if v is None else int(Decimal(v) * 100)
+    return {"category_id": f.get("category_id"), "sizes": f.get("size", ()), "in_stock": f.get("in_stock", False),
+            "min_cents": cents(f.get("min_price")), "max_cents": cents(f.get("max_price"))}
 
 def main():
-    # DB SQLite en memoria compartida entre conexiones
-    engine = create_engine(
-        "sqlite+pysqlite:///:memory:",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
-    TestingSessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
-    Base.metadata.create_all(bind=engine)
+    # SQLite en memoria (o fichero compartido con aiosqlite si DB_ASYNC=true)
+    engine, TestingSessionLocal, AsyncTestingSession = selftest_db(Base, settings.DB_ASYNC)
+    if AsyncTestingSession is not None:
+        app.dependency_overrides[get_async_read_sessions] = lambda: AsyncTestingSession
+    if catalog.snapshot is not None:
+        # sin hilo de fondo: se carga y se pone al día a mano (check_snapshot); hasta
+        # entonces el listado va por SQL
+        catalog.snapshot.session_factory = TestingSessionLocal
+        catalog.snapshot.interval = 0
 
     def override_get_db():
         db = TestingSessionLocal()
@@ -29,6 +177,7 @@ def main():
             db.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db  # réplicas: ver common/run_selftest.py
     client = TestClient(app)
 
     # seed
@@ -41,13 +190,88 @@ def main():
             vat_rate=Decimal("19.00"), stock=100, size="M",
         )
         db.add(p); db.commit()
+        pid, cat_id = p.id, cat.id
     finally:
         db.close()
 
     # test
     r = client.get("/products?q=camiseta")
     ok = (r.status_code == 200) and any("camiseta" in x["name"].lower() for x in r.json())
-    print("CATÁLOGO:", "PASS" if ok else "FAIL", f"(status={r.status_code}, items={len(r.json()) if r.status_code==200 else 'n/a'})")
+    # FastJSONResponse: mismo JSON que daría response_model (Decimal como "39000.00")
+    r_one = client.get(f"/products/{pid}")
+    ok &= conforms(list[ProductOut], r.json()) and r_one.status_code == 200 and conforms(ProductOut, r_one.json())
+    ok &= r_one.json()["price"] == "39000.00" and client.get("/products/999999").status_code == 404
+    ok &= [x["id"] for x in client.get(f"/products?category_id={cat_id}&limit=10").json()] == [pid]
+    if AsyncTestingSession is not None:
+        ok &= check_cancelled_leader(AsyncTestingSession, pid)
+    if not ok:
+        print("CATÁLOGO: FAIL", f"(status={r.status_code}, items={len(r.json()) if r.status_code==200 else 'n/a'})")
+        sys.exit(1)
+
+    # ---- auth por claims del JWT (admin) + revocación vía token_version ----
+    deps.SessionLocal = TestingSessionLocal  # la caché de usuarios carga de la BD de prueba
+    db = TestingSessionLocal()
+    try:
+        admin = User(email="admin@example.com", hashed_password="x", is_admin=1)
+        plain = User(email="user@example.com", hashed_password="x", is_admin=0)
+        db.add_all([admin, plain]); db.commit()
+        admin_id, plain_id = admin.id, plain.id
+    finally:
+        db.close()
+
+    def bearer(uid, adm, ver=0, sid=None):
+        claims = {"sub": str(uid), "adm": adm, "ver": ver}
+        if sid:
+            claims["sid"] = sid
+        tok = jwt.encode(claims, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
+        return {"Authorization": f"Bearer {tok}"}
+
+    # lista de sesiones revocadas: se sincroniza a mano con una fuente falsa (sin auth_service)
+    deps.revocations.interval = 0
+    deps.revocations.fetch = lambda: ["cerrada"]
+    deps.revocations.sync()
+    r0 = client.post("/categories", json={"name": "Abrigos"}, headers=bearer(admin_id, True, sid="cerrada"))
+
+    r1 = client.post("/categories", json={"name": "Chaquetas"}, headers=bearer(admin_id, True))
+    r2 = client.post("/categories", json={"name": "Gorras"}, headers=bearer(plain_id, True))  # claim adm falso
+    db = TestingSessionLocal()
+    try:
+        db.get(User, admin_id).token_version = 1; db.commit()
+    finally:
+        db.close()
+    user_cache.invalidate(admin_id)  # en producción: al caducar el TTL
+    r3 = client.post("/categories", json={"name": "Bufandas"}, headers=bearer(admin_id, True))
+    print(f"[DEBUG] admin -> {r1.status_code}, no-admin -> {r2.status_code}, revocado -> {r3.status_code}, "
+          f"sesión cerrada -> {r0.status_code}, caché={user_cache.stats()}")
+    ok = r1.status_code == 201 and r2.status_code == 403 and r3.status_code == 401 and r0.status_code == 401
+
+    # caché coalescente: la ficha ya leída sale de caché, y el PUT del admin la invalida
+    ok &= client.get(f"/products/{pid}").json()["stock"] == 100
+    hits = client.get("/health/cache").json()["hits"]
+    ok &= client.get(f"/products/{pid}").status_code == 200 and client.get("/health/cache").json()["hits"] == hits + 1
+    r4 = client.put(f"/products/{pid}", json={"stock": 7}, headers=bearer(admin_id, True, ver=1))
+    ok &= r4.status_code == 200 and client.get(f"/products/{pid}").json()["stock"] == 7
+    ok &= client.get("/products?q=camiseta").json()[0]["stock"] == 7
+
+    # con el pin del admin (réplicas) lee sin la caché compartida; los demás, por ella
+    pins, deps.database.pins = deps.database.pins, WriterPins(60)
+    deps.database.pins.pin(admin_id)
+    before = client.get("/health/cache").json()
+    r5 = client.get(f"/products/{pid}", headers=bearer(admin_id, True, ver=1))
+    after = client.get("/health/cache").json()
+    ok &= r5.json()["stock"] == 7 and (after["hits"], after["misses"]) == (before["hits"], before["misses"])
+    ok &= client.get(f"/products/{pid}").status_code == 200 and client.get("/health/cache").json()["hits"] == after["hits"] + 1
+    deps.database.pins = pins
+
+    if catalog.snapshot is not None:
+        ok &= check_snapshot(client, TestingSessionLocal, bearer(admin_id, True, ver=1))
+
+    # métricas: las requests anteriores aparecen por plantilla de ruta
+    m = client.get("/metrics")
+    ok &= m.status_code == 200 and 'route="/products",status="200"' in m.text and 'route="/categories",status="201"' in m.text
+    ok &= 'coalescing_cache_hits_total{cache="catalog"}' in m.text
+    print(f"[DEBUG] /metrics -> {m.status_code}, {len(m.text.splitlines())} líneas")
+    print("CATÁLOGO:", "PASS" if ok else "FAIL")
     sys.exit(0 if ok else 1)
 
 if __name__ == "__main__":
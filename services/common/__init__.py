@@ -0,0 +1,2 @@
+# services/common: código compartido por los microservicios (precios, auth, BD...).
+# Cada servicio lo hace importable desde su app/__init__.py.
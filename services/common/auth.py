@@ -0,0 +1,112 @@
+# services/common/auth.py
+"""
+Principal verificado a partir de los claims del JWT.
+
+El token que emite auth_service lleva ``sub`` (id), ``adm`` (is_admin), ``ver``
+(token_version) y ``sid`` (sesión). Los servicios confían en esos claims y solo
+comprueban la revocación (``ver`` distinto al de la BD, contra una caché TTL pequeña
+de usuarios; ``sid`` revocado, contra ``common.revocation.RevocationSet``), sin
+``db.get(User, ...)`` en cada request.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, NamedTuple
+
+from fastapi import HTTPException, status
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    id: int
+    is_admin: bool = False
+    token_version: int = 0
+
+
+class UserState(NamedTuple):
+    is_admin: bool
+    token_version: int
+
+
+class UserCache:
+    """
+    Caché LRU con TTL de ``user_id -> UserState`` (o None si el usuario no existe).
+
+    ``load(user_id)`` se llama solo en fallos de caché o entradas caducadas.
+    """
+
+    def __init__(self, load: Callable[[int], UserState | None], ttl: float = 30.0, max_entries: int = 10_000):
+        self.load = load
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[int, tuple[UserState | None, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> UserState | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._data.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        state = self.load(user_id)
+        with self._lock:
+            self._data[user_id] = (state, now + self.ttl)
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return state
+
+    def invalidate(self, user_id: int | None = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(user_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+
+def principal_from_payload(
+    payload: dict | None,
+    users: UserCache,
+    revoked: Callable[[str | None], bool] | None = None,
+) -> Principal:
+    """
+    Claims ya verificados (firma y exp) -> Principal, o 401.
+
+    Tokens anteriores a los claims ``adm``/``ver`` se tratan como versión 0.
+    ``revoked(sid)`` indica si la sesión del token fue cerrada.
+    """
+    try:
+        user_id = int(payload.get("sub"))
+        version = int(payload.get("ver", 0))
+    except (AttributeError, ValueError, TypeError):
+        raise _unauthorized("Token inválido")
+    if revoked is not None and revoked(payload.get("sid")):
+        raise _unauthorized("Token revocado")
+
+    state = users.get(user_id)
+    if state is None:
+        raise _unauthorized("Usuario no encontrado")
+    if state.token_version != version:
+        raise _unauthorized("Token revocado")
+    # un admin degradado deja de serlo al caducar la entrada de caché
+    is_admin = bool(payload.get("adm", state.is_admin)) and state.is_admin
+    return Principal(id=user_id, is_admin=is_admin, token_version=version)
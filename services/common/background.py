@@ -0,0 +1,86 @@
+# services/common/background.py
+"""
+Datos que un servicio copia de otro y renueva en segundo plano.
+
+La request nunca espera a la red: cuando la copia tiene más de ``interval`` segundos
+se lanza una única descarga en un hilo aparte. Si la fuente falla se conserva la
+última copia buena y se reintenta en el siguiente intervalo. Cada copia es una subclase
+que implementa ``_load`` (``RevocationSet``, ``JWKSCache``...).
+"""
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRefresh(ABC):
+    # usado en los logs y en el nombre del hilo
+    name = "sync"
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.syncs = 0
+        self.failures = 0
+        self.last_sync: float | None = None  # time.time() de la última sincronización correcta
+        self._next_sync = 0.0
+        self._syncing = False
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _load(self) -> None:
+        """Descarga e instala la copia nueva; lanza si la fuente falla."""
+
+    def sync(self) -> bool:
+        """Sincroniza ahora (bloqueante). True si se actualizó."""
+        try:
+            self._load()
+        except Exception as exc:
+            self.failures += 1
+            logger.warning("%s: no se pudo sincronizar: %s", self.name, exc)
+            return False
+        self.syncs += 1
+        self.last_sync = time.time()
+        return True
+
+    def _sync_in_background(self) -> None:
+        try:
+            self.sync()
+        finally:
+            with self._lock:
+                self._syncing = False
+
+    def maybe_sync(self) -> None:
+        # interval <= 0: sin sincronización automática
+        if self.interval <= 0:
+            return
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        with self._lock:
+            if self._syncing or now < self._next_sync:
+                return
+            self._syncing = True
+            self._next_sync = now + self.interval
+        threading.Thread(target=self._sync_in_background, name=self.name, daemon=True).start()
+
+    def stats(self) -> dict:
+        return {
+            "syncs": self.syncs,
+            "failures": self.failures,
+            "age_s": round(time.time() - self.last_sync, 1) if self.last_sync else None,
+        }
+
+
+def http_json(url: str, timeout: float = 2.0) -> Callable[[], dict]:
+    """Fuente que hace ``GET url`` y devuelve el JSON."""
+    import httpx
+
+    def fetch() -> dict:
+        r = httpx.get(url, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    return fetch
@@ -0,0 +1,34 @@
+# services/common/colocate.py
+"""
+Varios servicios en un mismo proceso (BFF con BFF_IN_PROCESS, benchmarks, loadtest).
+
+Todos los servicios llaman ``app`` a su paquete: ``import_service`` importa
+``services/<folder>/app`` aislado, devuelve sus módulos y deja ``sys.modules`` como
+estaba, así que se pueden cargar uno tras otro y también desde otro servicio (cuyo propio
+paquete ``app`` se conserva).
+"""
+import importlib
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+SERVICES = Path(__file__).resolve().parents[1]  # .../Ecommerce/services
+
+
+def _take_app_modules() -> dict:
+    return {name: sys.modules.pop(name) for name in [m for m in sys.modules if m == "app" or m.startswith("app.")]}
+
+
+def import_service(folder: str, module: str = "app.main") -> SimpleNamespace:
+    """Módulos de ``services/<folder>/app`` (main, deps, models...) sin dejar rastro en ``sys.modules``."""
+    own = _take_app_modules()
+    path = str(SERVICES / folder)
+    sys.path.insert(0, path)
+    try:
+        importlib.import_module(module)
+        mods = {name[4:]: mod for name, mod in sys.modules.items() if name.startswith("app.")}
+    finally:
+        sys.path.remove(path)
+        _take_app_modules()
+        sys.modules.update(own)
+    return SimpleNamespace(**mods)
@@ -0,0 +1,230 @@
+# services/common/compression.py
+"""
+Compresión de respuestas con negociación de ``Accept-Encoding`` (ASGI puro).
+
+- Códecs: gzip siempre; brotli (``br``) y zstd si están instalados ``brotli`` /
+  ``zstandard``. Se elige el de mayor ``q`` que acepte el cliente y, a igualdad, el
+  primero de ``COMPRESS_ENCODINGS``.
+- Solo tipos que comprimen bien (JSON, texto, NDJSON/CSV de exportación...) y cuerpos de
+  al menos ``COMPRESS_MIN_BYTES``; nunca si la respuesta ya trae ``Content-Encoding``.
+- Respuestas en streaming (``StreamingResponse``, exportaciones): se comprimen trozo a
+  trozo con flush en cada uno, sin acumular el cuerpo ni retrasar el primer byte.
+- Caché de cuerpos comprimidos por contenido (blake2b del cuerpo + códec): el mismo
+  listado servido una y otra vez se comprime una sola vez. Hashear (~0,7 GB/s) compensa
+  a partir de gzip 5 o brotli 4; con ``COMPRESS_CACHE_ENTRIES=0`` se desactiva.
+
+Los JSON de listados (nombres, descripciones y URLs repetidos) bajan a ~5-20 %.
+"""
+import gzip
+import hashlib
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+
+try:
+    import brotli
+except ImportError:  # opcional
+    brotli = None
+try:
+    import zstandard
+except ImportError:  # opcional
+    zstandard = None
+
+COMPRESSIBLE = (
+    "application/json", "application/x-ndjson", "application/xml", "application/javascript",
+    "text/", "image/svg+xml",
+)
+
+
+class _GzipStream:
+    def __init__(self, level: int):
+        self._c = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = cabecera gzip
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality: int):
+        self._c = brotli.Compressor(quality=quality)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._c.process(data) + self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+class _ZstdStream:
+    def __init__(self, level: int):
+        self._c = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._c.compress(data) + self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._c.flush()
+
+
+def available_codecs(settings) -> dict:
+    """{encoding: (comprimir(bytes) -> bytes, nuevo stream)} de los instalados."""
+    codecs = {}
+    for name in (e.strip().lower() for e in settings.COMPRESS_ENCODINGS.split(",")):
+        if name == "gzip":
+            level = settings.COMPRESS_GZIP_LEVEL
+            # mtime=0: mismo cuerpo -> mismos bytes (cacheable, ETag estable)
+            codecs[name] = (lambda b, lv=level: gzip.compress(b, lv, mtime=0), lambda lv=level: _GzipStream(lv))
+        elif name == "br" and brotli is not None:
+            q = settings.COMPRESS_BR_QUALITY
+            codecs[name] = (lambda b, q=q: brotli.compress(b, quality=q), lambda q=q: _BrotliStream(q))
+        elif name == "zstd" and zstandard is not None:
+            level = settings.COMPRESS_ZSTD_LEVEL
+            cctx = zstandard.ZstdCompressor(level=level)
+            codecs[name] = (cctx.compress, lambda lv=level: _ZstdStream(lv))
+    return codecs
+
+
+@lru_cache(maxsize=64)  # los navegadores repiten siempre la misma cabecera
+def negotiate(accept_encoding: str, offered: tuple[str, ...]) -> str | None:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    default = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for enc in offered:
+        q = accepted.get(enc, default)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+class CompressedCache:
+    """LRU de cuerpos comprimidos por (códec, blake2b del cuerpo)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, bytes], bytes] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compress(self, encoding: str, body: bytes, compress) -> bytes:
+        if self.max_entries <= 0:
+            return compress(body)
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        out = self._entries.get(key)
+        if out is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return out
+        self.misses += 1
+        out = self._entries[key] = compress(body)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return out
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class CompressionMiddleware:
+    def __init__(self, app, settings, cache: CompressedCache | None = None):
+        self.app = app
+        self.codecs = available_codecs(settings)
+        self.offered = tuple(self.codecs)
+        self.min_bytes = settings.COMPRESS_MIN_BYTES
+        self.cache = cache if cache is not None else CompressedCache(settings.COMPRESS_CACHE_ENTRIES)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.offered or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = negotiate(accept, self.offered) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _Responder(self, encoding, send).send)
+
+
+class _Responder:
+    __slots__ = ("mw", "encoding", "send_next", "start", "stream", "passthrough")
+
+    def __init__(self, mw: CompressionMiddleware, encoding: str, send):
+        self.mw = mw
+        self.encoding = encoding
+        self.send_next = send
+        self.start = None        # http.response.start retenido hasta ver el cuerpo
+        self.stream = None       # compresor en streaming
+        self.passthrough = False
+
+    def _compressible(self, headers) -> bool:
+        content_type = ""
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value.decode("latin-1").lower()
+        return content_type.startswith(COMPRESSIBLE)
+
+    def _headers(self, length: int | None) -> list:
+        headers = [(k, v) for k, v in self.start["headers"] if k != b"content-length"]
+        headers.append((b"content-encoding", self.encoding.encode()))
+        headers.append((b"vary", b"Accept-Encoding"))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+        return headers
+
+    async def send(self, message):
+        if self.passthrough:
+            await self.send_next(message)
+            return
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            if status < 200 or status in (204, 304) or not self._compressible(message.get("headers", [])):
+                self.passthrough = True
+                await self.send_next(message)
+            else:
+                self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send_next(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+        if self.stream is None and not more:
+            # cuerpo de una pieza (lo normal): comprimir entero, o dejarlo si es pequeño
+            if len(body) < self.mw.min_bytes:
+                await self.send_next(self.start)
+                await self.send_next(message)
+                return
+            compress = self.mw.codecs[self.encoding][0]
+            out = self.mw.cache.get_or_compress(self.encoding, body, compress)
+            await self.send_next({**self.start, "headers": self._headers(len(out))})
+            await self.send_next({"type": "http.response.body", "body": out})
+            return
+
+        if self.stream is None:
+            # streaming: sin Content-Length, cada trozo sale comprimido en cuanto llega
+            self.stream = self.mw.codecs[self.encoding][1]()
+            await self.send_next({**self.start, "headers": self._headers(None)})
+        out = self.stream.chunk(body) if body else b""
+        if not more:
+            out += self.stream.finish()
+        if out or not more:
+            await self.send_next({"type": "http.response.body", "body": out, "more_body": more})
@@ -0,0 +1,469 @@
+# services/common/db.py
+"""
+Engine y pool de conexiones de los servicios.
+
+- Tamaño, overflow, timeout y reciclado salen de ``ServiceSettings`` (DB_POOL_*).
+- Comprobación de vida "idle": solo se hace ping a conexiones que llevan más de
+  ``DB_POOL_PING_IDLE_S`` en el pool, en vez de un ``SELECT 1`` por checkout como
+  ``pool_pre_ping``. Una conexión que falla el ping se descarta y el pool da otra.
+- ``create_async_service_engine``: lo mismo para ``AsyncSession`` (DB_ASYNC=true).
+- ``InstrumentedQueuePool`` mide cuánto espera cada checkout con el pool agotado y
+  avisa en el log si pasa de ``DB_POOL_WAIT_WARN_MS``. ``pool_status`` devuelve los
+  indicadores en vivo (lo sirve ``GET /health/db``).
+- ``ServiceDatabase``: engines y sesiones de un servicio creados en el lifespan, no al
+  importar. Importar la app (o lanzar un worker) no carga el driver ni toca la BD; el
+  esquema lo aplica ``scripts/migrate.py`` (ver ``common.migrations``).
+- Réplicas de lectura (``DB_REPLICA_URLS``): ``read_session()`` da una ``RoutingSession``
+  que lee de la réplica sana menos cargada y escribe siempre en el primario. Un usuario
+  que acaba de escribir (``pin``) lee del primario durante ``DB_REPLICA_STICKY_S``.
+  Con varios workers (``common.serving``) los pins viven en memoria compartida
+  (``share_pins``): el checkout y el ``GET /orders`` siguiente pueden caer en workers
+  distintos.
+- Shards (``DB_SHARD_URLS``): carritos y pedidos en la BD de su usuario; la sesión los
+  manda al shard que elija ``common.sharding.route`` (ver ese módulo).
+"""
+import itertools
+import logging
+import mmap
+import multiprocessing
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .sharding import SHARDED_TABLES, ShardNotRouted, ShardSet, touches_shard
+from .tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0          # checkouts que encontraron el pool agotado
+        self.wait_s_total = 0.0
+        self.wait_s_max = 0.0
+        self.timeouts = 0
+        self.pings = 0
+        self.ping_failures = 0
+        self._lock = threading.Lock()
+
+    def record_checkout(self, waited: bool, wait_s: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_s_total += wait_s
+                self.wait_s_max = max(self.wait_s_max, wait_s)
+
+    def as_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "wait_ms_avg": round(self.wait_s_total / self.waits * 1000, 2) if self.waits else 0.0,
+            "wait_ms_max": round(self.wait_s_max * 1000, 2),
+            "timeouts": self.timeouts,
+            "pings": self.pings,
+            "ping_failures": self.ping_failures,
+        }
+
+
+class InstrumentedQueuePool(QueuePool):
+    wait_warn_s = 0.05
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self) -> "InstrumentedQueuePool":
+        # engine.dispose() recrea el pool: se conservan métricas y umbral
+        pool = super().recreate()
+        pool.stats = self.stats
+        pool.wait_warn_s = self.wait_warn_s
+        return pool
+
+    def _do_get(self):
+        exhausted = self._pool.empty() and self._max_overflow > -1 and self._overflow >= self._max_overflow
+        t0 = time.perf_counter()
+        try:
+            rec = super()._do_get()
+        except Exception:
+            if exhausted:
+                self.stats.timeouts += 1
+            raise
+        t1 = time.perf_counter()
+        wait_s = t1 - t0
+        self.stats.record_checkout(exhausted, wait_s)
+        if exhausted:
+            record_span("db.pool_wait", t0, t1, pool_size=self.size())
+        if exhausted and wait_s >= self.wait_warn_s:
+            logger.warning(
+                "Request esperó %.0f ms por una conexión (pool %d + overflow %d agotado)",
+                wait_s * 1000, self.size(), self._max_overflow,
+            )
+        return rec
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """Misma instrumentación con la cola asyncio del pool de engines async."""
+
+
+def install_idle_ping(engine: Engine, idle_s: float) -> None:
+    @event.listens_for(engine, "checkin")
+    def _mark_idle(dbapi_conn, rec):
+        rec.info["idle_since"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _ping_if_idle(dbapi_conn, rec, proxy):
+        idle_since = rec.info.get("idle_since")
+        if idle_since is None or time.monotonic() - idle_since < idle_s:
+            return
+        stats = getattr(engine.pool, "stats", None)
+        if stats is not None:
+            stats.pings += 1
+        try:
+            if hasattr(dbapi_conn, "ping"):
+                dbapi_conn.ping(False)  # PyMySQL: COM_PING, sin parsear un resultset
+            else:
+                cur = dbapi_conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+        except Exception as exc:
+            if stats is not None:
+                stats.ping_failures += 1
+            # el pool descarta esta conexión y reintenta con otra
+            raise DisconnectionError() from exc
+
+
+def _pool_kwargs(settings, poolclass) -> dict:
+    return dict(
+        poolclass=poolclass,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_S,
+        pool_recycle=settings.DB_POOL_RECYCLE_S,
+        pool_pre_ping=settings.DB_POOL_PING == "always",
+    )
+
+
+def _instrument(engine: Engine, settings) -> None:
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.wait_warn_s = settings.DB_POOL_WAIT_WARN_MS / 1000
+    if settings.DB_POOL_PING == "idle":
+        install_idle_ping(engine, settings.DB_POOL_PING_IDLE_S)
+
+
+def create_service_engine(settings, url: str | None = None, **kwargs) -> Engine:
+    url = url or settings.database_url
+    if url.startswith("sqlite"):
+        # DB_URL=sqlite:///...: las sesiones se usan desde los hilos del threadpool
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+        if ":memory:" in url or url.rstrip("/").endswith(":"):
+            return create_engine(url, **kwargs)
+    engine = create_engine(url, **_pool_kwargs(settings, InstrumentedQueuePool), **kwargs)
+    _instrument(engine, settings)
+    return engine
+
+
+def create_async_service_engine(settings, url: str | None = None, **kwargs) -> AsyncEngine:
+    url = url or settings.async_database_url
+    if url.startswith("sqlite"):
+        return create_async_engine(url, **kwargs)
+    engine = create_async_engine(url, **_pool_kwargs(settings, InstrumentedAsyncQueuePool), **kwargs)
+    _instrument(engine.sync_engine, settings)
+    return engine
+
+
+class RoutingSession(Session):
+    """
+    Sesión que lee de ``info["replica"]`` si se le asignó una (``read_session``) y manda
+    al primario todo lo que escribe: flush del ORM y INSERT/UPDATE/DELETE explícitos.
+    Con shards, las tablas repartidas van siempre a ``info["shard"]`` (lecturas incluidas:
+    los shards no tienen réplicas).
+    """
+
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        if "shards" in self.info and touches_shard(mapper, clause):
+            shard = self.info.get("shard")
+            if shard is None:
+                raise ShardNotRouted(f"{sorted(SHARDED_TABLES)} sin shard: falta common.sharding.route()")
+            return shard
+        replica = self.info.get("replica")
+        if replica is not None and not self._flushing and not getattr(clause, "is_dml", False):
+            return replica
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+def make_sessionmaker(engine: Engine | None) -> sessionmaker:
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=RoutingSession)
+
+
+def make_async_sessionmaker(engine: AsyncEngine | None) -> async_sessionmaker:
+    # mismas opciones que la sesión síncrona: el código compartido corre en run_sync()
+    return async_sessionmaker(engine, autoflush=False, sync_session_class=RoutingSession)
+
+
+def pool_status(engine: Engine | AsyncEngine) -> dict:
+    pool = engine.sync_engine.pool if isinstance(engine, AsyncEngine) else engine.pool
+    status = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            max_overflow=pool._max_overflow,
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(stats.as_dict())
+    return status
+
+
+class ReplicaSet:
+    """
+    Engines de las réplicas y su salud, vista desde este proceso.
+
+    Una réplica que no acepta conexiones o la pierde (``handle_error`` sin conexión o con
+    ``is_disconnect``) queda fuera ``retry_s`` segundos; después vuelve a probarse con
+    tráfico real. Entre las sanas se elige la de menos conexiones en uso y, a igualdad,
+    por turno. Sin ninguna sana se lee del primario.
+    """
+
+    def __init__(self, engines: list[Engine], async_engines: list[AsyncEngine] | None = None, retry_s: float = 30.0):
+        self.engines = engines
+        self.async_engines = async_engines or []
+        self.retry_s = retry_s
+        self.down_until = [0.0] * len(engines)
+        self.failures = [0] * len(engines)
+        self.reads = [0] * len(engines)
+        self._turn = itertools.count()
+        for i, engine in enumerate(engines):
+            self._watch(i, engine)
+        for i, engine in enumerate(self.async_engines):
+            self._watch(i, engine.sync_engine)
+
+    def _watch(self, i: int, engine: Engine) -> None:
+        @event.listens_for(engine, "handle_error")
+        def _on_error(ctx):
+            if ctx.connection is None or ctx.is_disconnect:  # no conecta o se cayó; un SQL erróneo no cuenta
+                self.mark_down(i)
+
+    def mark_down(self, i: int) -> None:
+        self.failures[i] += 1
+        self.down_until[i] = time.monotonic() + self.retry_s
+        logger.warning("Réplica %d sin conexión: fuera de la rotación %.0f s", i, self.retry_s)
+
+    def _in_use(self, i: int) -> int:
+        pools = [self.engines[i].pool] + ([self.async_engines[i].sync_engine.pool] if self.async_engines else [])
+        return sum(p.checkedout() for p in pools if isinstance(p, QueuePool))
+
+    def pick(self) -> int | None:
+        now = time.monotonic()
+        healthy = [i for i, until in enumerate(self.down_until) if until <= now]
+        if not healthy:
+            return None
+        turn, n = next(self._turn), len(self.engines)
+        i = min(healthy, key=lambda i: (self._in_use(i), (i - turn) % n))
+        self.reads[i] += 1
+        return i
+
+    def status(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "healthy": self.down_until[i] <= now,
+                "reads": self.reads[i],
+                "failures": self.failures[i],
+                **pool_status(engine),
+            }
+            for i, engine in enumerate(self.engines)
+        ]
+
+
+class WriterPins:
+    """Claves (id de usuario) que leen del primario hasta ``window_s`` tras escribir."""
+
+    def __init__(self, window_s: float, max_entries: int = 100_000):
+        self.window_s = window_s
+        self.max_entries = max_entries
+        self._until: dict = {}
+        # pin_to_primary es síncrona: llega desde varios hilos del threadpool a la vez
+        self._lock = threading.Lock()
+
+    def pin(self, key) -> None:
+        with self._lock:
+            if len(self._until) >= self.max_entries:
+                now = time.monotonic()
+                self._until = {k: u for k, u in self._until.items() if u > now}
+            self._until[key] = time.monotonic() + self.window_s
+
+    def pinned(self, key) -> bool:
+        until = self._until.get(key)
+        return until is not None and until > time.monotonic()
+
+
+class SharedWriterPins:
+    """
+    ``WriterPins`` en un mapa anónimo compartido (``MAP_SHARED``) que heredan los workers.
+
+    Se crea en el maestro antes del ``fork``; un pin hecho en un worker lo ven todos
+    (``time.monotonic`` es el mismo reloj en todos los procesos). Tabla fija de
+    ``max_entries`` casillas (clave = ``hash(key)``, caducidad) con sondeo lineal de
+    ``PROBE``: si todas están vivas se pisa la que caduca antes, y ese usuario vuelve a
+    leer de la réplica antes de tiempo. Dos claves con el mismo hash solo leen de más
+    del primario.
+    """
+
+    PROBE = 8
+
+    def __init__(self, window_s: float, max_entries: int = 100_000):
+        self.window_s = window_s
+        self.max_entries = max_entries
+        self._mm = mmap.mmap(-1, max_entries * 16)
+        view = memoryview(self._mm)
+        self._keys = view[: max_entries * 8].cast("q")
+        self._until = view[max_entries * 8:].cast("d")
+        # semáforo del SO: excluye a los hilos de este worker y a los demás workers
+        self._lock = multiprocessing.get_context("fork").Lock()
+
+    def _slots(self, h: int) -> range:
+        start = h % self.max_entries
+        return range(start, start + self.PROBE)
+
+    def pin(self, key) -> None:
+        h = hash(key)
+        n = self.max_entries
+        with self._lock:
+            now = time.monotonic()
+            target = None
+            for i in self._slots(h):
+                i %= n
+                if self._keys[i] == h or self._until[i] <= now:
+                    target = i
+                    break
+                if target is None or self._until[i] < self._until[target]:
+                    target = i
+            # primero la caducidad: un lector a medias ve como mucho un pin de más
+            self._until[target] = now + self.window_s
+            self._keys[target] = h
+
+    def pinned(self, key) -> bool:
+        h = hash(key)
+        n = self.max_entries
+        now = time.monotonic()
+        return any(self._keys[i % n] == h and self._until[i % n] > now for i in self._slots(h))
+
+
+class ServiceDatabase:
+    """
+    Engines de un servicio, creados en ``start()`` (lifespan) y no al importar.
+
+    ``SessionLocal`` y ``AsyncSessionLocal`` existen desde el principio, sin bind, para que
+    deps/sessions los importen y los self-tests los sustituyan; ``start()`` les asigna el
+    engine. Los self-tests sin lifespan nunca crean el engine real.
+    """
+
+    def __init__(self, settings, async_mode: bool | None = None):
+        self.settings = settings
+        self.engine: Engine | None = None
+        self.async_engine: AsyncEngine | None = None
+        self.replicas: ReplicaSet | None = None
+        self.shards: ShardSet | None = None
+        self.pins = WriterPins(settings.DB_REPLICA_STICKY_S)
+        self.SessionLocal = make_sessionmaker(None)
+        # DB_ASYNC=true: engine aiomysql para los endpoints calientes
+        async_mode = settings.DB_ASYNC if async_mode is None else async_mode
+        self.AsyncSessionLocal = make_async_sessionmaker(None) if async_mode else None
+
+    def start(self) -> None:
+        if self.engine is not None:
+            return
+        self.engine = create_service_engine(self.settings)
+        self.SessionLocal.configure(bind=self.engine)
+        if self.AsyncSessionLocal is not None:
+            self.async_engine = create_async_service_engine(self.settings)
+            self.AsyncSessionLocal.configure(bind=self.async_engine)
+        urls = self.settings.replica_urls
+        if urls:
+            self.replicas = ReplicaSet(
+                [create_service_engine(self.settings, url) for url in urls],
+                [create_async_service_engine(self.settings, self.settings.async_url(url)) for url in urls]
+                if self.async_engine is not None else None,
+                retry_s=self.settings.DB_REPLICA_RETRY_S,
+            )
+        urls = self.settings.shard_urls
+        if urls:
+            self.shards = ShardSet(
+                [create_service_engine(self.settings, url) for url in urls],
+                [create_async_service_engine(self.settings, self.settings.async_url(url)) for url in urls]
+                if self.async_engine is not None else None,
+            )
+            self.SessionLocal.configure(info={"shards": self.shards})
+            if self.AsyncSessionLocal is not None:
+                self.AsyncSessionLocal.configure(info={"shards": self.shards, "shard_async": True})
+
+    async def dispose(self) -> None:
+        if self.shards is not None:
+            self.shards.close()
+            for engine in self.shards.async_engines:
+                await engine.dispose()
+            for engine in self.shards.engines:
+                engine.dispose()
+        if self.replicas is not None:
+            for engine in self.replicas.async_engines:
+                await engine.dispose()
+            for engine in self.replicas.engines:
+                engine.dispose()
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+        if self.engine is not None:
+            self.engine.dispose()
+
+    def share_pins(self) -> None:
+        """Pins en memoria compartida; lo llama el maestro de ``common.serving`` antes del fork."""
+        self.pins = SharedWriterPins(self.settings.DB_REPLICA_STICKY_S)
+
+    def pin(self, key) -> None:
+        """``key`` acaba de escribir: sus lecturas van al primario unos segundos."""
+        if self.replicas is not None and key is not None:
+            self.pins.pin(key)
+
+    def _replica(self, key) -> int | None:
+        if self.replicas is None or (key is not None and self.pins.pinned(key)):
+            return None
+        return self.replicas.pick()
+
+    def read_session(self, key=None) -> Session:
+        """Sesión para endpoints de solo lectura: réplica si hay una sana y ``key`` no escribió hace poco."""
+        db = self.SessionLocal()
+        i = self._replica(key)
+        if i is not None:
+            db.info["replica"] = self.replicas.engines[i]
+        return db
+
+    def async_read_session(self, key=None):
+        db = self.AsyncSessionLocal()
+        i = self._replica(key)
+        if i is not None:
+            db.info["replica"] = self.replicas.async_engines[i].sync_engine
+        return db
+
+    def pool_status(self) -> dict:
+        if self.engine is None:
+            return {"pool": None}
+        status = pool_status(self.engine)
+        if self.async_engine is not None:
+            status["async"] = pool_status(self.async_engine)
+        if self.replicas is not None:
+            status["replicas"] = self.replicas.status()
+        if self.shards is not None:
+            status["shards"] = [
+                {"routed": n, **pool_status(engine)} for n, engine in zip(self.shards.routed, self.shards.engines)
+            ]
+        return status
@@ -0,0 +1,39 @@
+# services/common/fastjson.py
+"""
+Respuestas JSON sin doble validación para los endpoints calientes.
+
+Con ``response_model``, lo que devuelve el handler vuelve a pasar por Pydantic:
+model_dump -> validación -> serialización -> json.dumps (y, en endpoints síncronos, la
+validación va además al threadpool). Los endpoints calientes (listado y ficha de
+productos, carrito, pedidos) arman el payload una vez, ya con los tipos de salida, y lo
+devuelven en una ``FastJSONResponse``: FastAPI no toca una ``Response`` y orjson la
+serializa en una pasada. El ``response_model`` se queda en el decorador para OpenAPI.
+
+- Importes calculados en céntimos: ``common.pricing.cents_str``, sin pasar por Decimal.
+- Decimal del ORM (precios del catálogo): ``str()`` una vez, en el ``default`` de orjson;
+  mismo texto que da Pydantic en modo JSON ("39000.00").
+
+Los self-tests validan estas respuestas contra los esquemas: si un payload se aparta del
+contrato, fallan.
+"""
+from decimal import Decimal
+
+import orjson
+from starlette.responses import Response
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"{type(obj).__name__} no es serializable a JSON")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
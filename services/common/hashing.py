@@ -0,0 +1,25 @@
+# services/common/hashing.py
+"""
+Política de contraseñas (bcrypt) y funciones que ejecuta el pool de procesos de auth.
+
+El pool de ``auth_service/app/hashing.py`` usa ``spawn``: cada tarea viaja como una
+referencia ``módulo.función`` que el proceso hijo importa. Aquí ``common`` resuelve
+igual en cualquier proceso; ``app`` no, porque ``common.colocate.import_service``
+(``scripts/serve.py``, BFF con BFF_IN_PROCESS) lo saca de ``sys.modules`` y de
+``sys.path`` tras cargar el servicio.
+"""
+import time
+
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def timed_hash(password: str) -> tuple[str, float]:
+    t0 = time.perf_counter()
+    return pwd_context.hash(password), time.perf_counter() - t0
+
+
+def timed_verify(plain: str, hashed: str) -> tuple[bool, float]:
+    t0 = time.perf_counter()
+    return pwd_context.verify(plain, hashed), time.perf_counter() - t0
@@ -0,0 +1,71 @@
+# services/common/jwks.py
+"""
+Verificación local de JWT firmados con clave asimétrica (RS256/ES256).
+
+auth_service publica sus claves públicas en ``/.well-known/jwks.json``; cada
+servicio guarda una copia indexada por ``kid`` y la renueva en segundo plano. Un
+``kid`` desconocido (clave recién rotada) fuerza una recarga inmediata, limitada a
+una cada ``min_interval`` segundos para que tokens con ``kid`` inventado no
+conviertan cada request en una llamada a auth_service.
+"""
+import threading
+import time
+from typing import Callable
+
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+
+from .background import BackgroundRefresh
+
+
+class JWKSCache(BackgroundRefresh):
+    name = "jwks-sync"
+
+    def __init__(
+        self,
+        fetch: Callable[[], dict],
+        algorithms: list[str],
+        interval: float = 300.0,
+        min_interval: float = 5.0,
+    ):
+        super().__init__(interval)
+        self.fetch = fetch
+        self.algorithms = algorithms
+        self.min_interval = min_interval
+        self.unknown_kid = 0
+        self._keys: dict[str, object] = {}
+        self._last_forced = 0.0
+        self._force_lock = threading.Lock()
+
+    def _load(self) -> None:
+        keys = {}
+        for data in self.fetch().get("keys", []):
+            kid, alg = data.get("kid"), data.get("alg", self.algorithms[0])
+            if kid and alg in self.algorithms and data.get("use", "sig") == "sig":
+                keys[kid] = jwk.construct(data, alg)  # se parsea una vez, no por token
+        self._keys = keys
+
+    def _key_for(self, kid: str | None):
+        self.maybe_sync()
+        key = self._keys.get(kid)
+        if key is not None or kid is None:
+            return key
+        self.unknown_kid += 1
+        with self._force_lock:
+            key = self._keys.get(kid)  # otra request pudo recargar mientras esperábamos
+            if key is None and time.monotonic() - self._last_forced >= self.min_interval:
+                self._last_forced = time.monotonic()
+                self.sync()
+                key = self._keys.get(kid)
+        return key
+
+    def verify(self, token: str) -> dict:
+        """Claims del token, o ``JWTError`` (firma, exp, kid desconocido)."""
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self._key_for(kid)
+        if key is None:
+            raise JWTError("kid desconocido")
+        return jwt.decode(token, key, algorithms=self.algorithms)
+
+    def stats(self) -> dict:
+        return {"kids": sorted(self._keys), "unknown_kid": self.unknown_kid, **super().stats()}
@@ -0,0 +1,237 @@
+# services/common/metrics.py
+"""
+Métricas de los servicios en formato de texto de Prometheus (``GET /metrics``).
+
+- ``MetricsMiddleware`` (ASGI puro, sin BaseHTTPMiddleware) cuenta requests por
+  método/ruta/status, mide la latencia en un histograma por ruta y lleva las
+  requests en vuelo. La ruta es la plantilla (``/products/{product_id}``), no la URL,
+  para que el número de series no crezca con los ids.
+- ``Metrics.instrument_engine`` engancha ``before/after_cursor_execute``: cada request
+  acumula sus sentencias SQL y el tiempo en BD en un ContextVar (llega a los hilos del
+  threadpool y a ``run_sync``), y al terminar se vuelca en la ruta.
+- Del pool se publica el estado en vivo de ``pool_status`` al servir ``/metrics``.
+- ``collectors``: funciones que devuelven más líneas ya formateadas (p. ej. la caché
+  coalescente del catálogo), añadidas al final de cada scrape.
+
+El coste por request son unos pocos ``perf_counter`` y sumas en el event loop, sin
+locks: los contadores solo se tocan desde el middleware. Las métricas son por proceso;
+con varios workers de uvicorn cada scrape ve uno.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .db import pool_status
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# [sentencias, segundos en BD] de la request en curso (None fuera de una request)
+_request_db: ContextVar[list | None] = ContextVar("request_db", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> list[str]:
+        out, acc = [], 0
+        for le, n in zip((*self.buckets, "+Inf"), self.counts):
+            acc += n
+            out.append(f'{name}_bucket{{{labels},le="{le}"}} {acc}')
+        out.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        out.append(f"{name}_count{{{labels}}} {self.count}")
+        return out
+
+
+class RouteStats:
+    __slots__ = ("statuses", "latency", "statements", "db_seconds")
+
+    def __init__(self):
+        self.statuses: dict[int, int] = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_seconds = 0.0
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class Metrics:
+    def __init__(self):
+        self.routes: dict[tuple[str, str], RouteStats] = {}
+        self.in_flight = 0
+        self.engines: dict[str, Engine | AsyncEngine] = {}
+        self.collectors: list[Callable[[], list[str]]] = []
+
+    def instrument_engine(self, engine: Engine | AsyncEngine, name: str = "primary") -> None:
+        if self.engines.get(name) is engine:
+            return  # ya instrumentado: no duplicar los listeners
+        self.engines[name] = engine
+        sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _start(conn, cursor, statement, parameters, context, executemany):
+            if _request_db.get() is not None:
+                conn.info["metrics_t0"] = time.perf_counter()
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _end(conn, cursor, statement, parameters, context, executemany):
+            db = _request_db.get()
+            t0 = conn.info.pop("metrics_t0", None)
+            if db is not None and t0 is not None:
+                db[0] += 1
+                db[1] += time.perf_counter() - t0
+
+    def instrument_database(self, database) -> None:
+        """Engines de un ``common.db.ServiceDatabase`` ya arrancado."""
+        self.instrument_engine(database.engine)
+        if database.async_engine is not None:
+            self.instrument_engine(database.async_engine, "async")
+        if database.replicas is not None:
+            for i, engine in enumerate(database.replicas.engines):
+                self.instrument_engine(engine, f"replica{i}")
+            for i, engine in enumerate(database.replicas.async_engines):
+                self.instrument_engine(engine, f"replica{i}_async")
+        if database.shards is not None:
+            for i, engine in enumerate(database.shards.engines):
+                self.instrument_engine(engine, f"shard{i}")
+            for i, engine in enumerate(database.shards.async_engines):
+                self.instrument_engine(engine, f"shard{i}_async")
+
+    def observe(self, method: str, route: str, status: int, seconds: float, db: list) -> None:
+        rs = self.routes.get((method, route))
+        if rs is None:
+            rs = self.routes[(method, route)] = RouteStats()
+        rs.statuses[status] = rs.statuses.get(status, 0) + 1
+        rs.latency.observe(seconds)
+        rs.statements.observe(db[0])
+        rs.db_seconds += db[1]
+
+    def render(self) -> str:
+        out = [
+            "# HELP http_requests_total Requests atendidas por método, ruta y status.",
+            "# TYPE http_requests_total counter",
+        ]
+        routes = sorted(self.routes.items())
+        for (method, route), rs in routes:
+            for status, n in sorted(rs.statuses.items()):
+                out.append(f'http_requests_total{{method="{method}",route="{_label(route)}",status="{status}"}} {n}')
+
+        out += [
+            "# HELP http_request_duration_seconds Latencia de la request completa.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), rs in routes:
+            out += rs.latency.lines("http_request_duration_seconds", f'method="{method}",route="{_label(route)}"')
+
+        out += [
+            "# HELP http_request_db_statements Sentencias SQL ejecutadas por request.",
+            "# TYPE http_request_db_statements histogram",
+        ]
+        for (method, route), rs in routes:
+            out += rs.statements.lines("http_request_db_statements", f'method="{method}",route="{_label(route)}"')
+
+        out += [
+            "# HELP http_request_db_seconds_total Tiempo en BD acumulado por ruta.",
+            "# TYPE http_request_db_seconds_total counter",
+        ]
+        for (method, route), rs in routes:
+            out.append(f'http_request_db_seconds_total{{method="{method}",route="{_label(route)}"}} {rs.db_seconds:.6f}')
+
+        out += [
+            "# HELP http_requests_in_flight Requests en curso.",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+        ]
+        out += self._pool_lines()
+        for collect in self.collectors:
+            out += collect()
+        return "\n".join(out) + "\n"
+
+    def _pool_lines(self) -> list[str]:
+        gauges = {
+            "db_pool_size": "size", "db_pool_checked_out": "checked_out",
+            "db_pool_overflow": "overflow", "db_pool_wait_seconds_max": "wait_ms_max",
+        }
+        counters = {
+            "db_pool_checkouts_total": "checkouts", "db_pool_waits_total": "waits",
+            "db_pool_timeouts_total": "timeouts", "db_pool_ping_failures_total": "ping_failures",
+        }
+        status = {name: pool_status(engine) for name, engine in self.engines.items()}
+        out = []
+        for kind, metrics in (("gauge", gauges), ("counter", counters)):
+            for metric, key in metrics.items():
+                values = [(name, st[key]) for name, st in status.items() if key in st]
+                if not values:
+                    continue
+                out.append(f"# TYPE {metric} {kind}")
+                for name, value in values:
+                    if key == "wait_ms_max":
+                        value = value / 1000
+                    out.append(f'{metric}{{engine="{name}"}} {value}')
+        return out
+
+
+class MetricsMiddleware:
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+        self._paths: dict = {}  # endpoint -> plantilla de la ruta
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"  # 404, preflight CORS...
+        path = self._paths.get(endpoint)
+        if path is None:
+            router = scope.get("router")
+            for route in getattr(router, "routes", ()):
+                if getattr(route, "endpoint", None) is not None:
+                    self._paths[route.endpoint] = getattr(route, "path", "unmatched")
+            path = self._paths.setdefault(endpoint, "unmatched")
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        db = [0, 0.0]
+        token = _request_db.set(db)
+        metrics.in_flight += 1
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - t0
+            metrics.in_flight -= 1
+            _request_db.reset(token)
+            metrics.observe(scope["method"], self._route(scope), status, elapsed, db)
@@ -0,0 +1,128 @@
+# services/common/migrations.py
+"""
+Migraciones versionadas del esquema compartido (``scripts/NN_nombre.sql``).
+
+Sustituye al ``create_all`` que cada servicio hacía al importar: una única fuente de la
+verdad (los scripts SQL), aplicada en un paso explícito (``python scripts/migrate.py``)
+y no cuatro servicios compitiendo por crear las mismas tablas con definiciones
+ligeramente distintas.
+
+- Versión = prefijo numérico del fichero; ``00_reset.sql`` (borra la BD) no es una
+  migración y nunca se aplica.
+- Lo aplicado se apunta en ``schema_migrations`` (versión, nombre, fecha).
+- Las sentencias de administración de los scripts (``CREATE DATABASE``, ``CREATE USER``,
+  ``GRANT``, ``USE``...) las ejecuta un administrador una vez; aquí se saltan, para que el
+  usuario de la app (ecom_user) pueda migrar su propia BD.
+- Una BD creada a mano con los scripts antes de existir esta tabla se adopta con
+  ``baseline N``: marca 1..N como aplicadas sin ejecutarlas.
+
+MySQL confirma cada DDL por separado: si un script falla a medias no se marca como
+aplicado y hay que corregir a mano antes de reintentar.
+"""
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[2] / "scripts"
+TABLE = "schema_migrations"
+
+_FILE = re.compile(r"^(\d+)_[\w-]+\.sql$")
+_ADMIN = re.compile(
+    r"^(CREATE\s+(DATABASE|SCHEMA|USER)|DROP\s+(DATABASE|SCHEMA|USER)|GRANT|REVOKE|FLUSH|USE)\b", re.I
+)
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    path: Path
+
+    def statements(self) -> list[str]:
+        """Sentencias del script, sin comentarios ``--`` ni las de administración."""
+        lines = [ln for ln in self.path.read_text(encoding="utf-8").splitlines() if not ln.strip().startswith("--")]
+        # los scripts no tienen ';' dentro de literales: basta con partir por fin de sentencia
+        stmts = [s.strip() for s in re.split(r";\s*(?:\n|$)", "\n".join(lines))]
+        return [s for s in stmts if s and not _ADMIN.match(s)]
+
+
+def discover(directory: Path = SCRIPTS_DIR) -> list[Migration]:
+    found: dict[int, Migration] = {}
+    for path in sorted(directory.glob("*.sql")):
+        m = _FILE.match(path.name)
+        if not m or int(m.group(1)) == 0:
+            continue
+        version = int(m.group(1))
+        if version in found:
+            raise MigrationError(f"Versión {version} repetida: {found[version].path.name} y {path.name}")
+        found[version] = Migration(version, path.stem, path)
+    return [found[v] for v in sorted(found)]
+
+
+def _ensure_table(conn: Connection) -> None:
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+        " version INT NOT NULL PRIMARY KEY,"
+        " name VARCHAR(200) NOT NULL,"
+        " applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+
+
+def applied_versions(engine: Engine) -> set[int]:
+    if not inspect(engine).has_table(TABLE):
+        return set()
+    with engine.connect() as conn:
+        return set(conn.execute(text(f"SELECT version FROM {TABLE}")).scalars())
+
+
+def pending(engine: Engine, directory: Path = SCRIPTS_DIR) -> list[Migration]:
+    done = applied_versions(engine)
+    return [m for m in discover(directory) if m.version not in done]
+
+
+def _record(conn: Connection, migration: Migration) -> None:
+    conn.execute(
+        text(f"INSERT INTO {TABLE} (version, name) VALUES (:v, :n)"),
+        {"v": migration.version, "n": migration.name},
+    )
+
+
+def upgrade(engine: Engine, directory: Path = SCRIPTS_DIR, log: Callable[[str], None] = print) -> list[Migration]:
+    """Aplica las migraciones pendientes en orden; devuelve las aplicadas."""
+    todo = pending(engine, directory)
+    if todo and not applied_versions(engine) and inspect(engine).get_table_names():
+        raise MigrationError(
+            f"La BD ya tiene tablas pero no {TABLE}: si se creó con los scripts, "
+            "adóptala con 'baseline N' (última versión importada) y vuelve a migrar"
+        )
+    for migration in todo:
+        log(f"-> {migration.path.name}")
+        with engine.begin() as conn:
+            _ensure_table(conn)
+            for stmt in migration.statements():
+                try:
+                    # tal cual al driver: sin binds ':x' ni formateo de '%' (p.ej. 'Bienvenida 10%')
+                    conn.exec_driver_sql(stmt, execution_options={"no_parameters": True})
+                except Exception as exc:
+                    raise MigrationError(f"{migration.path.name}: falló\n{stmt}\n{exc}") from exc
+            _record(conn, migration)
+    return todo
+
+
+def baseline(engine: Engine, version: int, directory: Path = SCRIPTS_DIR) -> list[Migration]:
+    """Marca como aplicadas, sin ejecutarlas, las migraciones hasta ``version`` incluida."""
+    done = applied_versions(engine)
+    marked = [m for m in discover(directory) if m.version <= version and m.version not in done]
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        for migration in marked:
+            _record(conn, migration)
+    return marked
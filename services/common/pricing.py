@@ -0,0 +1,125 @@
+# services/common/pricing.py
+"""
+Núcleo de precios compartido por carrito y pedidos.
+
+Todo se calcula con enteros en unidades mínimas (céntimos) y el IVA en puntos
+básicos (19.00 % -> 1900). Reglas de redondeo:
+- los importes de entrada se redondean a céntimos con ROUND_HALF_UP;
+- el IVA se redondea por línea (ROUND_HALF_UP por defecto, ROUND_HALF_EVEN opcional);
+- los descuentos (promociones) se restan del neto de la línea antes del IVA;
+- los totales son la suma exacta de las líneas (neto + IVA = bruto, siempre).
+
+Cambio frente al cálculo con Decimal que había en carrito y pedidos: allí el IVA de las
+líneas se sumaba sin redondear y solo se redondeaba el total (al guardarlo en
+``Numeric(10, 2)``). Ahora se redondea cada línea, de modo que el total cuadra con las
+líneas que se muestran; el IVA total (y con él ``orders.total``) puede diferir del de
+antes en hasta medio céntimo por línea.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP
+from typing import Iterable, NamedTuple, Sequence
+
+DEFAULT_VAT_BP = 1900  # 19.00 %
+BP_DENOM = 10_000      # 100 % en puntos básicos
+
+_CENT = Decimal("0.01")
+
+
+class PricedLine(NamedTuple):
+    net: int
+    vat: int
+    gross: int
+    discount: int = 0
+
+
+class PricedBasket(NamedTuple):
+    lines: list[PricedLine]
+    total_net: int
+    total_vat: int
+    total_gross: int
+    total_discount: int = 0
+
+
+def to_cents(value) -> int:
+    """Decimal/str/int en unidades -> entero en céntimos (ROUND_HALF_UP)."""
+    d = value if isinstance(value, Decimal) else Decimal(str(value))
+    s = str(d)
+    if s[-3:-2] == ".":  # caso habitual: Numeric(10, 2) del ORM, sin redondeo
+        return int(s.replace(".", "", 1))
+    return int(d.quantize(_CENT, ROUND_HALF_UP) * 100)
+
+
+def from_cents(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+
+def cents_str(cents: int) -> str:
+    """Igual que ``str(from_cents(cents))`` ("39000.00", "-0.05"), sin crear un Decimal."""
+    if cents >= 0:
+        return "%d.%02d" % divmod(cents, 100)
+    return "-%d.%02d" % divmod(-cents, 100)
+
+
+_bp_cache: dict = {}
+
+
+def rate_to_bp(value, default: int = DEFAULT_VAT_BP) -> int:
+    """Tasa en porcentaje (19.00) -> puntos básicos (1900). None usa ``default``."""
+    if value is None:
+        return default
+    bp = _bp_cache.get(value)
+    if bp is None:
+        bp = to_cents(value)
+        if len(_bp_cache) < 1024:  # hay pocas tasas distintas; acotado por si acaso
+            _bp_cache[value] = bp
+    return bp
+
+
+def from_bp(bp: int) -> Decimal:
+    return from_cents(bp)
+
+
+def div_round(n: int, d: int, rounding: str = ROUND_HALF_UP) -> int:
+    """División entera n/d con la regla de redondeo indicada (d > 0)."""
+    if n < 0:
+        return -div_round(-n, d, rounding)
+    q, r = divmod(n, d)
+    twice = 2 * r
+    if twice > d or (twice == d and (rounding == ROUND_HALF_UP or q & 1)):
+        q += 1
+    return q
+
+
+def price_basket(
+    lines: Iterable[tuple[int, int, int]],
+    rounding: str = ROUND_HALF_UP,
+    discounts: Sequence[int] | None = None,
+) -> PricedBasket:
+    """
+    Precia una cesta completa en una pasada.
+
+    ``lines``: tuplas ``(unit_price_cents, quantity, vat_bp)``.
+    ``discounts``: descuento en céntimos por línea (mismo orden), opcional.
+    """
+    if rounding not in (ROUND_HALF_UP, ROUND_HALF_EVEN):
+        raise ValueError(f"Redondeo no soportado: {rounding}")
+    half_up = rounding == ROUND_HALF_UP
+    half = BP_DENOM // 2
+
+    out: list[PricedLine] = []
+    total_net = total_vat = total_discount = 0
+    for i, (price, qty, vat_bp) in enumerate(lines):
+        net = price * qty
+        disc = 0
+        if discounts is not None and discounts[i]:
+            disc = min(discounts[i], net)
+            net -= disc
+            total_discount += disc
+        raw = net * vat_bp
+        if half_up and raw >= 0:
+            vat = (raw + half) // BP_DENOM
+        else:
+            vat = div_round(raw, BP_DENOM, rounding)
+        out.append(PricedLine(net, vat, net + vat, disc))
+        total_net += net
+        total_vat += vat
+    return PricedBasket(out, total_net, total_vat, total_net + total_vat, total_discount)
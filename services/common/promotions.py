@@ -0,0 +1,200 @@
+# services/common/promotions.py
+"""
+Motor de promociones (cupones, porcentajes por categoría, "3x2").
+
+Las reglas activas se compilan al cargarlas en índices por producto, por categoría
+y "todo el carrito" (más un sub-índice por cupón). Preciar una cesta solo evalúa
+las reglas indexadas bajo el producto/categoría de cada línea, no todas las activas.
+
+Política: por línea se aplica el mejor descuento entre las reglas candidatas (no
+se acumulan). Los "NxM" se evalúan por línea (3x2 sobre el mismo producto).
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .pricing import BP_DENOM, rate_to_bp
+
+KINDS = ("percent", "bundle")
+SCOPES = ("product", "category", "cart")
+
+
+@dataclass(frozen=True, slots=True)
+class Rule:
+    id: int
+    kind: str                  # "percent" | "bundle"
+    scope: str                 # "product" | "category" | "cart"
+    target_id: int | None = None
+    coupon_code: str | None = None
+    percent_bp: int = 0        # kind=percent: 10.00 % -> 1000
+    buy_qty: int = 0           # kind=bundle: lleva buy_qty ...
+    pay_qty: int = 0           # ... paga pay_qty
+    starts_at: datetime | None = None
+    ends_at: datetime | None = None
+
+    def live(self, now: datetime) -> bool:
+        return (self.starts_at is None or self.starts_at <= now) and (self.ends_at is None or now < self.ends_at)
+
+    def discount(self, price_cents: int, qty: int) -> int:
+        if self.kind == "percent":
+            return (price_cents * qty * self.percent_bp + BP_DENOM // 2) // BP_DENOM
+        return (qty // self.buy_qty) * (self.buy_qty - self.pay_qty) * price_cents
+
+
+class LineIn(NamedTuple):
+    product_id: int
+    category_id: int | None
+    price_cents: int
+    quantity: int
+
+
+class _Buckets:
+    __slots__ = ("by_product", "by_category", "cart_wide")
+
+    def __init__(self):
+        self.by_product: dict[int, list[Rule]] = {}
+        self.by_category: dict[int, list[Rule]] = {}
+        self.cart_wide: list[Rule] = []
+
+    def add(self, rule: Rule) -> None:
+        if rule.scope == "product":
+            self.by_product.setdefault(rule.target_id, []).append(rule)
+        elif rule.scope == "category":
+            self.by_category.setdefault(rule.target_id, []).append(rule)
+        else:
+            self.cart_wide.append(rule)
+
+    def candidates(self, line: LineIn) -> Iterable[Rule]:
+        yield from self.by_product.get(line.product_id, ())
+        if line.category_id is not None:
+            yield from self.by_category.get(line.category_id, ())
+        yield from self.cart_wide
+
+
+class RuleIndex:
+    """Reglas compiladas. Inmutable: una recarga crea un índice nuevo."""
+
+    def __init__(self, rules: Iterable[Rule] = ()):
+        self.base = _Buckets()
+        self.coupons: dict[str, _Buckets] = {}
+        self.size = 0
+        for rule in rules:
+            if rule.coupon_code:
+                self.coupons.setdefault(rule.coupon_code.upper(), _Buckets()).add(rule)
+            else:
+                self.base.add(rule)
+            self.size += 1
+
+    def has_coupon(self, code: str | None) -> bool:
+        return bool(code) and code.upper() in self.coupons
+
+    def apply(
+        self,
+        lines: list[LineIn],
+        coupon: str | None = None,
+        now: datetime | None = None,
+    ) -> tuple[list[int], list[int | None]]:
+        """
+        Devuelve ``(descuentos_en_céntimos, id_de_regla_aplicada)`` por línea.
+        """
+        n = len(lines)
+        if not self.size:
+            return [0] * n, [None] * n
+        buckets = [self.base]
+        if coupon and coupon.upper() in self.coupons:
+            buckets.append(self.coupons[coupon.upper()])
+        now = now or datetime.now()
+
+        discounts = [0] * n
+        applied: list[int | None] = [None] * n
+        for i, line in enumerate(lines):
+            best, best_id = 0, None
+            for b in buckets:
+                for rule in b.candidates(line):
+                    if not rule.live(now):
+                        continue
+                    d = rule.discount(line.price_cents, line.quantity)
+                    if d > best:
+                        best, best_id = d, rule.id
+            discounts[i] = min(best, line.price_cents * line.quantity)
+            applied[i] = best_id
+        return discounts, applied
+
+
+def rule_from_row(row) -> Rule | None:
+    """Fila ORM de ``promotions`` -> Rule (None si la fila no es una regla válida)."""
+    kind, scope = row.kind, row.scope or "cart"
+    if kind not in KINDS or scope not in SCOPES:
+        return None
+    if scope != "cart" and row.target_id is None:
+        return None
+    if kind == "bundle" and not (row.buy_qty and row.pay_qty is not None and row.buy_qty > row.pay_qty >= 0):
+        return None
+    if kind == "percent" and row.percent is None:
+        return None
+    return Rule(
+        id=row.id,
+        kind=kind,
+        scope=scope,
+        target_id=row.target_id,
+        coupon_code=row.coupon_code or None,
+        percent_bp=min(rate_to_bp(row.percent), BP_DENOM) if kind == "percent" else 0,
+        buy_qty=row.buy_qty or 0,
+        pay_qty=row.pay_qty or 0,
+        starts_at=row.starts_at,
+        ends_at=row.ends_at,
+    )
+
+
+def compile_rules(rows: Iterable) -> RuleIndex:
+    return RuleIndex(r for r in map(rule_from_row, rows) if r is not None)
+
+
+class PromotionStore:
+    """
+    Índice de promociones con recarga en caliente desde la BD.
+
+    Cada ``check_interval`` segundos consulta una "versión" barata de la tabla
+    (count, max(id), max(updated_at), sum(active)); solo si cambia vuelve a cargar y compilar.
+    Además recarga siempre tras ``max_age`` segundos por si un cambio no movió la versión.
+    """
+
+    def __init__(self, model, check_interval: float = 5.0, max_age: float = 300.0):
+        self.model = model
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.reloads = 0
+        self._index = RuleIndex()
+        self._version = None
+        self._next_check = 0.0
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        self._next_check = 0.0
+        self._version = None
+
+    def index(self, db: Session) -> RuleIndex:
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._index
+        with self._lock:
+            if now < self._next_check:
+                return self._index
+            m = self.model
+            version = tuple(db.execute(
+                select(func.count(m.id), func.max(m.id), func.max(m.updated_at), func.sum(m.active))
+            ).one())
+            if version != self._version or now - self._loaded_at > self.max_age:
+                rows = db.execute(select(m).where(m.active == 1)).scalars().all()
+                self._index = compile_rules(rows)
+                self._version = version
+                self._loaded_at = now
+                self.reloads += 1
+            self._next_check = now + self.check_interval
+        return self._index
@@ -0,0 +1,44 @@
+# services/common/revocation.py
+"""
+Conjunto de sesiones revocadas, sincronizado en segundo plano.
+
+Cada access token lleva ``sid`` (la familia de refresh tokens de la que salió).
+Al cerrar sesión o detectar reutilización de un refresh token, auth_service revoca
+ese ``sid``; como los access tokens duran pocos minutos, basta con distribuir los
+``sid`` revocados dentro de esa ventana: el conjunto se mantiene pequeño.
+
+``RevocationSet.is_revoked`` es una búsqueda en un ``frozenset`` en memoria; la
+recarga periódica la hace ``common.background.BackgroundRefresh``.
+"""
+from typing import Callable, Iterable
+
+from .background import BackgroundRefresh, http_json
+
+
+class RevocationSet(BackgroundRefresh):
+    name = "revocation-sync"
+
+    def __init__(self, fetch: Callable[[], Iterable[str]], interval: float = 10.0):
+        super().__init__(interval)
+        self.fetch = fetch
+        self._sids: frozenset[str] = frozenset()
+
+    def _load(self) -> None:
+        self._sids = frozenset(self.fetch())
+
+    def is_revoked(self, sid: str | None) -> bool:
+        self.maybe_sync()
+        return sid is not None and sid in self._sids
+
+    def add(self, sid: str) -> None:
+        # revocación local inmediata (p. ej. el propio auth_service al cerrar sesión)
+        self._sids = self._sids | {sid}
+
+    def stats(self) -> dict:
+        return {"size": len(self._sids), **super().stats()}
+
+
+def http_fetcher(url: str, timeout: float = 2.0) -> Callable[[], list[str]]:
+    """``fetch`` que lee ``GET {url}`` de auth_service (``{"sids": [...]}``)."""
+    get = http_json(url, timeout)
+    return lambda: get()["sids"]
@@ -0,0 +1,812 @@
+# services/common/run_selftest.py
+import os
+import random
+import sys
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # .../services
+
+from common import fastjson
+from common.pricing import cents_str, div_round, from_bp, from_cents, price_basket, rate_to_bp, to_cents
+from common.promotions import LineIn, Rule, RuleIndex
+from common.revocation import RevocationSet
+from common.tokens import TokenCache
+
+CENT = Decimal("0.01")
+
+
+# ---------- referencia: la aritmética Decimal que usaban cart/order ----------
+def decimal_line(price: Decimal, qty: int, vat_rate: Decimal):
+    q = Decimal(qty)
+    line_net = price * q
+    line_vat = (price * (vat_rate / Decimal("100"))) * q
+    return line_net, line_vat
+
+
+def random_basket(rng: random.Random, n: int):
+    rates = [Decimal("19.00"), Decimal("5.00"), Decimal("0.00"), Decimal("10.50"), Decimal("21.00")]
+    out = []
+    for _ in range(n):
+        price = Decimal(rng.randint(1, 50_000_000)).scaleb(-2)
+        qty = rng.randint(1, 9999)
+        rate = rng.choice(rates) if rng.random() < 0.8 else Decimal(rng.randint(0, 9999)).scaleb(-2)
+        out.append((price, qty, rate))
+    return out
+
+
+# ---------- propiedades ----------
+def check_conversions() -> bool:
+    ok = True
+    ok &= to_cents(Decimal("39000.00")) == 3_900_000
+    ok &= to_cents("0.005") == 1 and to_cents(Decimal("12.344")) == 1234
+    ok &= from_cents(3_900_000) == Decimal("39000.00") and str(from_cents(5)) == "0.05"
+    ok &= rate_to_bp(None) == 1900 and rate_to_bp(Decimal("10.50")) == 1050
+    ok &= from_bp(1900) == Decimal("19.00")
+    ok &= div_round(5, 2) == 3 and div_round(5, 2, ROUND_HALF_EVEN) == 2 and div_round(7, 2, ROUND_HALF_EVEN) == 4
+    ok &= div_round(-5, 2) == -3
+    ok &= all(cents_str(c) == str(from_cents(c)) for c in (0, 5, -5, 100, 3_900_000, -123_456))
+    ok &= fastjson.dumps({"p": Decimal("39000.00"), "n": None}) == b'{"p":"39000.00","n":null}'
+    return ok
+
+
+def check_matches_decimal(rng: random.Random, baskets: int = 500) -> bool:
+    """
+    Cada línea coincide con el Decimal de antes redondeado a céntimos. Los totales no son
+    los de antes (que sumaban el IVA sin redondear, ver common/pricing.py): son la suma de
+    las líneas redondeadas y se separan del total antiguo en como mucho medio céntimo por línea.
+    """
+    for _ in range(baskets):
+        basket = random_basket(rng, rng.randint(1, 40))
+        for rounding in (ROUND_HALF_UP, ROUND_HALF_EVEN):
+            priced = price_basket(((to_cents(p), q, rate_to_bp(r)) for p, q, r in basket), rounding)
+            exp_net = exp_vat = old_vat = Decimal("0")
+            for (p, q, r), line in zip(basket, priced.lines):
+                d_net, d_vat = decimal_line(p, q, r)
+                old_vat += d_vat
+                # por línea: igual al Decimal de siempre redondeado a céntimos
+                if from_cents(line.net) != d_net.quantize(CENT, rounding):
+                    return False
+                if from_cents(line.vat) != d_vat.quantize(CENT, rounding):
+                    return False
+                if line.gross != line.net + line.vat:
+                    return False
+                exp_net += d_net.quantize(CENT, rounding)
+                exp_vat += d_vat.quantize(CENT, rounding)
+            # totales: suma exacta de las líneas
+            if from_cents(priced.total_net) != exp_net or from_cents(priced.total_vat) != exp_vat:
+                return False
+            if priced.total_gross != priced.total_net + priced.total_vat:
+                return False
+            # frente al total antiguo (IVA sin redondear por línea)
+            if abs(from_cents(priced.total_vat) - old_vat) > CENT / 2 * len(basket):
+                return False
+    return True
+
+
+def check_exact_when_representable() -> bool:
+    # caso del self-test de carrito/pedidos: 2 x 39000.00 con IVA 19 %
+    priced = price_basket([(to_cents("39000.00"), 2, rate_to_bp("19.00"))])
+    return (
+        from_cents(priced.total_net) == Decimal("78000.00")
+        and from_cents(priced.total_vat) == Decimal("14820.00")
+        and from_cents(priced.total_gross) == Decimal("92820.00")
+    )
+
+
+def check_promotions() -> bool:
+    idx = RuleIndex([
+        Rule(id=1, kind="bundle", scope="product", target_id=10, buy_qty=3, pay_qty=2),
+        Rule(id=2, kind="percent", scope="category", target_id=5, percent_bp=1500),
+        Rule(id=3, kind="percent", scope="cart", coupon_code="hola", percent_bp=1000),
+    ])
+    ok = True
+    # índices: cada regla solo cuelga de su producto/categoría/cupón
+    ok &= list(idx.base.by_product) == [10] and list(idx.base.by_category) == [5]
+    ok &= idx.base.cart_wide == [] and idx.has_coupon("HOLA") and not idx.has_coupon("otro")
+    lines = [
+        LineIn(10, 5, 1000, 7),   # 3x2 -> 2 gratis (2000) vs 15 % (1050): gana 3x2
+        LineIn(11, 5, 1000, 1),   # 15 % categoría
+        LineIn(12, None, 999, 1), # sin regla
+    ]
+    d, applied = idx.apply(lines)
+    ok &= d == [2000, 150, 0] and applied == [1, 2, None]
+    d, applied = idx.apply(lines, coupon="Hola")
+    ok &= d == [2000, 150, 100] and applied == [1, 2, 3]
+    priced = price_basket([(1000, 7, 1900), (1000, 1, 1900), (999, 1, 1900)], discounts=d)
+    ok &= priced.total_discount == 2250 and priced.lines[0] == (5000, 950, 5950, 2000)
+    ok &= priced.total_net == 7000 + 1000 + 999 - 2250
+    return ok
+
+
+def check_token_cache() -> bool:
+    import time
+    calls = []
+
+    def verify(token):
+        calls.append(token)
+        if token == "malo":
+            raise ValueError("firma inválida")
+        exp = time.time() + (3600 if token != "caducando" else -1)
+        return {"sub": token, "exp": exp}
+
+    cache = TokenCache(max_entries=2)
+    ok = True
+    ok &= cache.decode("a", verify)["sub"] == "a" and cache.decode("a", verify)["sub"] == "a"
+    ok &= calls == ["a"]                                  # 2ª vez desde caché
+    cache.decode("caducando", verify); cache.decode("caducando", verify)
+    ok &= calls.count("caducando") == 2                   # exp vencido: se reverifica
+    for _ in range(2):
+        try:
+            cache.decode("malo", verify)
+            ok = False
+        except ValueError:
+            pass
+    ok &= calls.count("malo") == 2                        # los fallos no se cachean
+    cache.decode("b", verify); cache.decode("c", verify)
+    ok &= cache.stats()["size"] == 2                      # LRU acotada
+    ok &= TokenCache(max_entries=0).decode("a", verify)["sub"] == "a" and calls.count("a") == 2
+    ok &= cache.stats()["hits"] == 1
+    return ok
+
+
+def check_revocation_set() -> bool:
+    import logging
+    import time
+    source = {"sids": ["s1"], "down": False}
+
+    def fetch():
+        if source["down"]:
+            raise ConnectionError("auth_service caído")
+        return source["sids"]
+
+    revs = RevocationSet(fetch, interval=0.05)
+    revs.is_revoked("s1")                                  # 1ª llamada: lanza la sincronización y no espera
+    ok = True
+    deadline = time.monotonic() + 2
+    while revs.stats()["syncs"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    ok &= revs.is_revoked("s1") and not revs.is_revoked("s2") and not revs.is_revoked(None)
+    source["down"] = True
+    logging.getLogger("common.background").disabled = True
+    ok &= revs.sync() is False and revs.is_revoked("s1")   # caída: se conserva el último conjunto
+    logging.getLogger("common.background").disabled = False
+    revs.add("s2")
+    ok &= revs.is_revoked("s2")
+    return ok
+
+
+def check_db_pool() -> bool:
+    import tempfile
+    import threading
+    import time
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import TimeoutError as PoolTimeout
+    from common.db import InstrumentedQueuePool, install_idle_ping, pool_status
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(
+            f"sqlite:///{tmp}/pool.db", poolclass=InstrumentedQueuePool,
+            pool_size=1, max_overflow=0, pool_timeout=0.3,
+        )
+        engine.pool.wait_warn_s = 10  # sin avisos en el log del self-test
+        install_idle_ping(engine, idle_s=0.05)
+        with engine.connect() as c:
+            c.execute(text("SELECT 1"))
+        conn = engine.connect()
+        threading.Timer(0.1, conn.close).start()
+        with engine.connect() as c:  # espera ~0,1 s a que se libere la única conexión
+            busy = pool_status(engine)["checked_out"] == 1
+        held = engine.connect()
+        try:
+            engine.connect()
+            timed_out = False
+        except PoolTimeout:
+            timed_out = True
+        held.close()
+        time.sleep(0.06)
+        with engine.connect() as c:  # ociosa > idle_s: ping antes de entregarla
+            c.execute(text("SELECT 1"))
+        st = pool_status(engine)
+        engine.dispose()
+    return (
+        busy and timed_out and st["waits"] == 1 and st["timeouts"] == 1
+        and st["wait_ms_max"] >= 50 and st["pings"] >= 1 and st["ping_failures"] == 0
+    )
+
+
+def check_metrics() -> bool:
+    from fastapi import Depends, FastAPI, Response
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.pool import QueuePool
+    from common.metrics import CONTENT_TYPE, Metrics, MetricsMiddleware
+
+    engine = create_engine("sqlite://", poolclass=QueuePool, connect_args={"check_same_thread": False})
+    metrics = Metrics()
+    metrics.instrument_engine(engine)
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+    def get_conn():
+        with engine.connect() as conn:
+            yield conn
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int, conn=Depends(get_conn)):  # sync: corre en el threadpool
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("SELECT :i"), {"i": item_id})
+        return {"id": item_id}
+
+    @app.get("/metrics")
+    async def scrape():
+        return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+    client = TestClient(app)
+    for i in range(3):
+        client.get(f"/items/{i}")
+    client.get("/nada")
+    body = client.get("/metrics").text
+    route = 'method="GET",route="/items/{item_id}"'
+    return (
+        f'http_requests_total{{{route},status="200"}} 3' in body
+        and 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in body
+        and f'http_request_duration_seconds_count{{{route}}} 3' in body
+        # 2 sentencias por request: 3 en el bucket le="2", ninguna en le="1"
+        and f'http_request_db_statements_bucket{{{route},le="1"}} 0' in body
+        and f'http_request_db_statements_bucket{{{route},le="2"}} 3' in body
+        and 'db_pool_checked_out{engine="primary"}' in body
+        and "http_requests_in_flight 1" in body  # el propio scrape
+    )
+
+
+def check_tracing() -> bool:
+    import tempfile
+    import orjson
+    from fastapi import Depends, FastAPI, HTTPException
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.pool import StaticPool
+    from common.settings import ServiceSettings
+    from common.tracing import (
+        FileExporter, MemoryExporter, Tracer, TracingMiddleware, instrument_engine, parse_traceparent, span, traced,
+    )
+
+    parent = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    ok = parse_traceparent(parent) == ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+    ok &= parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00")[2] is False
+    for bad in ("", "00-xyz", "ff-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01",
+                "00-00000000000000000000000000000000-00f067aa0ba902b7-01",
+                "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01-extra"):
+        ok &= parse_traceparent(bad) is None
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    instrument_engine(engine)
+    settings = ServiceSettings(TRACE_SAMPLE_RATE=0, TRACE_MAX_SPANS=8)
+    memory = MemoryExporter(max_spans=100)
+    tracer = Tracer("prueba", settings, exporter=memory)
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+
+    def get_conn():
+        with span("get_db"):
+            conn = engine.connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @traced()
+    def lookup(conn, item_id: int):
+        if item_id == 0:
+            raise HTTPException(status_code=404, detail="no existe")
+        conn.execute(text("SELECT 1"))
+        return conn.execute(text("SELECT :i"), {"i": item_id}).scalar()
+
+    @app.get("/items/{item_id}")
+    def item(item_id: int, conn=Depends(get_conn)):  # sync: spans desde el threadpool
+        return {"id": lookup(conn, item_id)}
+
+    @app.get("/many")
+    def many(conn=Depends(get_conn)):
+        for i in range(20):
+            conn.execute(text("SELECT :i"), {"i": i})
+        return {}
+
+    client = TestClient(app)
+    # sin traceparent y TRACE_SAMPLE_RATE=0: nada que exportar ni cabecera
+    r = client.get("/items/1")
+    ok &= r.status_code == 200 and "traceresponse" not in r.headers and tracer.sampled == 0
+
+    # traceparent muestreado: se continúa la traza (mismo trace_id, la raíz cuelga del padre)
+    r = client.get("/items/7", headers={"traceparent": parent})
+    spans = tracer.recent(1)[0]
+    root, by_name = spans[0], {s["name"]: s for s in spans}
+    ok &= r.headers.get("traceresponse", "").split("-")[1] == "4bf92f3577b34da6a3ce929d0e0e4736"
+    ok &= root["name"] == "GET /items/{item_id}" and root["parent_id"] == "00f067aa0ba902b7"
+    ok &= root["attrs"]["status"] == 200 and all(s["trace_id"] == root["trace_id"] for s in spans)
+    ok &= sorted(by_name) == ["GET /items/{item_id}", "get_db", "lookup", "sql SELECT"]
+    sql = [s for s in spans if s["name"] == "sql SELECT"]
+    ok &= len(sql) == 2 and all(s["parent_id"] == by_name["lookup"]["span_id"] for s in sql)
+    ok &= by_name["get_db"]["parent_id"] == root["span_id"]
+
+    # el error queda en el span que lo lanzó; la raíz, con el status de la respuesta
+    client.get("/items/0", headers={"traceparent": parent})
+    spans = tracer.recent(1)[0]
+    ok &= spans[0]["attrs"]["status"] == 404
+    ok &= next(s for s in spans if s["name"] == "lookup")["error"] == "HTTPException 404"
+
+    # TRACE_MAX_SPANS: una request con 20 sentencias guarda 8 spans y cuenta el resto
+    client.get("/many", headers={"traceparent": parent})
+    spans = tracer.recent(1)[0]
+    ok &= len(spans) == 8 and spans[0]["attrs"]["dropped_spans"] == 14
+    ok &= tracer.stats()["sampled"] == 3 and tracer.stats()["requests"] == 4
+
+    # exportador a fichero: un JSON por span
+    path = Path(tempfile.mkdtemp()) / "traces.jsonl"
+    tracer.exporter = FileExporter(str(path))
+    client.get("/items/3", headers={"traceparent": parent})
+    lines = [orjson.loads(line) for line in path.read_bytes().splitlines()]
+    ok &= len(lines) == 5 and lines[0]["service"] == "prueba" and lines[0]["duration_ms"] > 0
+    return ok
+
+
+def check_migrations() -> bool:
+    import tempfile
+    from pathlib import Path
+    from sqlalchemy import create_engine, inspect, text
+    from common import migrations
+
+    folder = Path(tempfile.mkdtemp())
+    (folder / "00_reset.sql").write_text("DROP DATABASE IF EXISTS ecommerce;\n")
+    (folder / "01_base.sql").write_text(
+        "-- base; con comentarios\nCREATE DATABASE IF NOT EXISTS ecommerce;\nUSE ecommerce;\n\n"
+        "CREATE TABLE promos (\n  id INTEGER PRIMARY KEY,\n  name VARCHAR(50)\n);\n"
+        "INSERT INTO promos (id, name) VALUES (1, 'Bienvenida 10%'), (2, 'hora:minuto');\n"
+    )
+    (folder / "02_alter.sql").write_text("ALTER TABLE promos ADD COLUMN active INTEGER NOT NULL DEFAULT 1;\n")
+    engine = create_engine("sqlite://")
+    ok = [m.version for m in migrations.pending(engine, folder)] == [1, 2]
+    ok &= [m.name for m in migrations.upgrade(engine, folder, log=lambda _: None)] == ["01_base", "02_alter"]
+    ok &= migrations.upgrade(engine, folder, log=lambda _: None) == []  # ya al día
+    with engine.connect() as conn:
+        ok &= conn.execute(text("SELECT name FROM promos WHERE active = 1 ORDER BY id")).scalars().all() == [
+            "Bienvenida 10%", "hora:minuto"
+        ]
+
+    # BD importada a mano: sin baseline se niega a migrar; con baseline 1 solo aplica la 02
+    manual = create_engine("sqlite://")
+    with manual.begin() as conn:
+        conn.execute(text("CREATE TABLE promos (id INTEGER PRIMARY KEY, name VARCHAR(50))"))
+    try:
+        migrations.upgrade(manual, folder, log=lambda _: None)
+        ok = False
+    except migrations.MigrationError:
+        pass
+    ok &= [m.version for m in migrations.baseline(manual, 1, folder)] == [1]
+    ok &= [m.version for m in migrations.upgrade(manual, folder, log=lambda _: None)] == [2]
+    ok &= "active" in {c["name"] for c in inspect(manual).get_columns("promos")}
+
+    # un script que falla no queda marcado
+    (folder / "03_roto.sql").write_text("ALTER TABLE no_existe ADD COLUMN x INTEGER;\n")
+    try:
+        migrations.upgrade(engine, folder, log=lambda _: None)
+        ok = False
+    except migrations.MigrationError:
+        pass
+    ok &= migrations.applied_versions(engine) == {1, 2}
+    # los scripts reales se descubren en orden y sin 00_reset
+    ok &= [m.version for m in migrations.discover()][:1] == [1]
+    return ok
+
+
+def check_lazy_database() -> bool:
+    import asyncio
+    from common.db import ServiceDatabase
+    from common.settings import ServiceSettings
+
+    settings = ServiceSettings(DB_URL="sqlite://", DB_ASYNC=True)
+    database = ServiceDatabase(settings)
+    ok = database.engine is None and database.pool_status() == {"pool": None}  # importar no crea engines
+    ok &= database.SessionLocal.kw["bind"] is None and database.AsyncSessionLocal is not None
+    database.start()
+    engine = database.engine
+    database.start()  # idempotente
+    ok &= database.engine is engine and database.SessionLocal.kw["bind"] is engine
+    ok &= database.AsyncSessionLocal.kw["bind"] is database.async_engine is not None
+    ok &= "async" in database.pool_status()
+    asyncio.run(database.dispose())
+    ok &= ServiceDatabase(settings, async_mode=False).AsyncSessionLocal is None
+    return ok
+
+
+def check_replicas() -> bool:
+    import asyncio
+    import sqlite3
+    import tempfile
+    from pathlib import Path
+    from sqlalchemy import Column, Integer, MetaData, String, Table, insert, select
+    from common.db import ServiceDatabase
+    from common.settings import ServiceSettings
+
+    # dos ficheros SQLite: primario y réplica, con la misma fila y distinto contenido
+    folder = Path(tempfile.mkdtemp())
+    primary, replica = folder / "primario.db", folder / "replica.db"
+    for path, src in ((primary, "primario"), (replica, "réplica")):
+        with sqlite3.connect(path) as conn:
+            conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, src VARCHAR(20))")
+            conn.execute("INSERT INTO t (id, src) VALUES (1, ?)", (src,))
+    t = Table("t", MetaData(), Column("id", Integer, primary_key=True), Column("src", String(20)))
+    settings = ServiceSettings(
+        DB_URL=f"sqlite:///{primary}", DB_ASYNC=True, DB_REPLICA_RETRY_S=60,
+        DB_REPLICA_URLS=f"sqlite:///{replica}, sqlite:///{folder}/no/existe.db",  # la 2ª no conecta
+    )
+    database = ServiceDatabase(settings)
+    database.start()
+
+    def read(db) -> str:
+        return db.execute(select(t.c.src).where(t.c.id == 1)).scalar_one()
+
+    # por turno entre las dos réplicas: la caída falla una vez y sale de la rotación
+    seen = []
+    for _ in range(4):
+        with database.read_session() as db:
+            try:
+                seen.append(read(db))
+            except Exception:
+                seen.append("error")
+    ok = seen == ["réplica", "error", "réplica", "réplica"]
+    status = database.pool_status()["replicas"]
+    ok &= [r["healthy"] for r in status] == [True, False] and status[1]["failures"] == 1
+
+    # escribir desde una sesión de lectura va al primario
+    with database.read_session() as db:
+        db.execute(insert(t).values(id=2, src="escrito"))
+        db.commit()
+    with sqlite3.connect(primary) as conn:
+        ok &= conn.execute("SELECT src FROM t WHERE id = 2").fetchone() == ("escrito",)
+
+    # read-your-writes: el usuario 7 acaba de escribir y lee del primario; el 8, de la réplica
+    database.pin(7)
+    with database.read_session(7) as a, database.read_session(8) as b:
+        ok &= read(a) == "primario" and read(b) == "réplica"
+
+    # pin desde varios hilos (pin_to_primary va por el threadpool), con purgas por el límite
+    from concurrent.futures import ThreadPoolExecutor
+    from common.db import WriterPins
+    pins = WriterPins(60, max_entries=64)
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda base: [pins.pin(base * 1000 + i) for i in range(500)], range(8)))
+    ok &= pins.pinned(7499) and not pins.pinned(-1)
+
+    # con share_pins (maestro de serve.py) el pin hecho en un worker lo ven los demás
+    if hasattr(os, "fork"):
+        database.share_pins()
+        pid = os.fork()
+        if pid == 0:
+            database.pin(9)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        with database.read_session(9) as a, database.read_session(10) as b:
+            ok &= read(a) == "primario" and read(b) == "réplica"
+        shared = type(database.pins)(60, max_entries=64)  # más pins que casillas: pisa los que caducan antes
+        for key in range(200):
+            shared.pin(key)
+        ok &= shared.pinned(199) and not shared.pinned(-1)
+
+    async def read_async() -> str:
+        async with database.async_read_session() as db:
+            return await db.run_sync(read)
+
+    ok &= asyncio.run(read_async()) == "réplica"
+    database.replicas.mark_down(0)  # ninguna sana: todo al primario
+    with database.read_session() as db:
+        ok &= read(db) == "primario"
+    ok &= asyncio.run(read_async()) == "primario"
+    asyncio.run(database.dispose())
+    return ok
+
+
+def check_sharding() -> bool:
+    import asyncio
+    import tempfile
+    from pathlib import Path
+    from sqlalchemy import Column, Integer, MetaData, Table, insert, select
+    from common.db import ServiceDatabase
+    from common.settings import ServiceSettings
+    from common.sharding import SHARD_ID_SPAN, ShardNotRouted, reserve_id_range, route, route_id, scatter
+
+    folder = Path(tempfile.mkdtemp())
+    meta = MetaData()
+    orders = Table("orders", meta, Column("id", Integer, primary_key=True), Column("user_id", Integer), sqlite_autoincrement=True)
+    settings = ServiceSettings(
+        DB_URL=f"sqlite:///{folder}/primario.db",
+        DB_SHARD_URLS=",".join(f"sqlite:///{folder}/shard{i}.db" for i in range(3)),
+    )
+    database = ServiceDatabase(settings)
+    database.start()
+    for i, engine in enumerate(database.shards.engines):
+        meta.create_all(engine)
+        reserve_id_range(engine, i, ["orders"])
+        reserve_id_range(engine, i, ["orders"])  # idempotente
+
+    # cada usuario escribe en su shard, con ids del rango de ese shard
+    ids = {}
+    for uid in range(1, 7):
+        with database.SessionLocal() as db:
+            route(db, uid)
+            ids[uid] = db.execute(insert(orders).values(user_id=uid)).inserted_primary_key[0]
+            db.commit()
+    ok = all(ids[uid] // SHARD_ID_SPAN == uid % 3 for uid in ids)
+    with database.SessionLocal() as db:
+        ok &= route_id(db, ids[5]) and db.execute(select(orders.c.user_id).where(orders.c.id == ids[5])).scalar() == 5
+        ok &= not route_id(db, 3 * SHARD_ID_SPAN)
+    try:
+        with database.SessionLocal() as db:
+            db.execute(select(orders)).all()
+        ok = False
+    except ShardNotRouted:
+        pass
+    with database.SessionLocal() as db:
+        per_shard = scatter(db, lambda s: sorted(s.execute(select(orders.c.user_id)).scalars()))
+    ok &= per_shard == [[3, 6], [1, 4], [2, 5]]
+    ok &= [s["routed"] for s in database.pool_status()["shards"]] == [3, 3, 4]  # 6 escrituras, route_id y scatter
+    asyncio.run(database.dispose())
+    return ok
+
+
+def check_compression() -> bool:
+    import gzip
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse, StreamingResponse
+    from fastapi.testclient import TestClient
+    from common.compression import CompressionMiddleware, negotiate
+    from common.settings import ServiceSettings
+
+    ok = negotiate("gzip, deflate, br;q=0.9", ("br", "gzip")) == "gzip"  # gana la q más alta
+    ok &= negotiate("br, gzip", ("br", "gzip")) == "br"  # a igualdad, la preferencia del servidor
+    ok &= negotiate("gzip;q=0, *", ("gzip",)) is None and negotiate("identity", ("gzip",)) is None
+    ok &= negotiate("*;q=0.5", ("gzip",)) == "gzip"
+
+    settings = ServiceSettings(COMPRESS_ENCODINGS="gzip", COMPRESS_MIN_BYTES=100)
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, settings=settings)
+    listing = [{"id": i, "name": f"Camiseta {i}", "description": "algodón orgánico"} for i in range(200)]
+
+    @app.get("/products")
+    def products():
+        return listing
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    @app.get("/export")
+    def export():
+        rows = (f'{{"id": {i}, "name": "Camiseta {i}"}}\n'.encode() for i in range(500))
+        return StreamingResponse(rows, media_type="application/x-ndjson")
+
+    @app.get("/ya")
+    def already():
+        return PlainTextResponse(gzip.compress(b"x" * 500), headers={"Content-Encoding": "gzip"})
+
+    client = TestClient(app)
+    gz = {"Accept-Encoding": "gzip"}
+    r = client.get("/products", headers=gz)  # httpx descomprime: r.content es el JSON
+    raw = r.headers.get("content-length")
+    ok &= r.headers.get("content-encoding") == "gzip" and r.json() == listing
+    ok &= "Accept-Encoding" in r.headers.get("vary", "") and int(raw) < len(r.content) / 4
+    client.get("/products", headers=gz)
+    cache = next(m for m in _walk(app.middleware_stack) if isinstance(m, CompressionMiddleware)).cache
+    ok &= cache.stats() == {"entries": 1, "hits": 1, "misses": 1}  # el mismo listado, comprimido una vez
+    ok &= "content-encoding" not in client.get("/health", headers=gz).headers  # por debajo del umbral
+    ok &= "content-encoding" not in client.get("/products", headers={"Accept-Encoding": "identity"}).headers
+    r = client.get("/export", headers=gz)
+    ok &= r.headers.get("content-encoding") == "gzip" and "content-length" not in r.headers
+    ok &= r.text.count("\n") == 500
+    ok &= client.get("/ya", headers=gz).content == b"x" * 500  # no se comprime dos veces
+    return ok
+
+
+def check_singleflight() -> bool:
+    import asyncio
+    import threading
+    import time
+    from common.singleflight import CoalescingCache
+
+    cache = CoalescingCache("prueba", ttl=0.2, stale=5.0)
+    loads = []
+
+    def load():
+        loads.append(1)
+        time.sleep(0.05)
+        return f"v{len(loads)}"
+
+    # 20 hilos a la vez sobre una clave fría: una carga, 19 coalescidas, todos con v1
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("p1", load))) for _ in range(20)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    ok = len(loads) == 1 and results == ["v1"] * 20
+    ok &= cache.stats()["top_folded"][0] == {"key": "p1", "loads": 1, "folded": 19, "stale": 0}
+
+    # caducada: quien la ve primero recarga; los demás reciben v1 al momento
+    time.sleep(0.25)
+    results.clear()
+    leader = threading.Thread(target=lambda: results.append(cache.get("p1", load)))
+    leader.start()
+    time.sleep(0.01)
+    t0 = time.perf_counter()
+    others = [cache.get("p1", load) for _ in range(5)]
+    ok &= others == ["v1"] * 5 and time.perf_counter() - t0 < 0.03
+    leader.join()
+    ok &= results == ["v2"] and len(loads) == 2 and cache.get("p1", load) == "v2"
+
+    # la recarga falla: se sigue sirviendo la copia anterior; sin copia, el error llega a todos
+    def broken():
+        raise RuntimeError("BD caída")
+
+    time.sleep(0.25)
+    ok &= cache.get("p1", broken) == "v2"
+    try:
+        cache.get("p2", broken)
+        ok = False
+    except RuntimeError:
+        pass
+
+    # event loop: mismas reglas con aget
+    async def aload():
+        loads.append(1)
+        await asyncio.sleep(0.05)
+        return "a"
+
+    async def many():
+        return await asyncio.gather(*(cache.aget("p3", aload) for _ in range(10)))
+
+    n = len(loads)
+    ok &= asyncio.run(many()) == ["a"] * 10 and len(loads) == n + 1
+    cache.invalidate(lambda key: key == "p3")
+    ok &= asyncio.run(many()) == ["a"] * 10 and len(loads) == n + 2
+    lines = cache.metric_lines()
+    ok &= 'coalescing_cache_key_folded_total{cache="prueba",key="p1"} 19' in lines
+    ok &= 'coalescing_cache_folded_total{cache="prueba"} 37' in lines
+
+    # invalidate con una carga en curso (empezó antes de la escritura): no se espera a
+    # ella ni guarda su resultado
+    def old_load():
+        time.sleep(0.1)
+        return "viejo"
+
+    before = threading.Thread(target=lambda: cache.get("p4", old_load))
+    before.start()
+    time.sleep(0.02)
+    cache.invalidate(lambda key: key == "p4")
+    ok &= cache.get("p4", lambda: "nuevo") == "nuevo"
+    before.join()
+    ok &= cache.get("p4", old_load) == "nuevo"
+    print(f"[DEBUG] single-flight: {len(loads)} cargas, {cache.stats()['folded']} coalescidas")
+    return ok
+
+
+_SERVE_APP = """
+import os, sys, time
+sys.path.insert(0, {services!r})
+from fastapi import FastAPI
+from common.serving import ServiceSpec, Supervisor
+from common.settings import ServiceSettings
+
+app = FastAPI()
+
+@app.get("/pid")
+def pid():
+    return {{"pid": os.getpid()}}
+
+@app.get("/slow")
+def slow():
+    time.sleep(0.5)
+    return {{"done": True}}
+
+spec = ServiceSpec("prueba", app, ServiceSettings(), "127.0.0.1", {port})
+sys.exit(Supervisor([spec], workers=2, max_requests=5, graceful_timeout=5, log_level="warning").run())
+"""
+
+
+def check_serving() -> bool:
+    import signal
+    import socket
+    import subprocess
+    import tempfile
+    import threading
+    import time
+    import httpx
+
+    if not hasattr(os, "fork"):
+        return True  # solo POSIX; en Windows serve.py usa los workers de uvicorn
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    log = tempfile.TemporaryFile()
+    script = _SERVE_APP.format(services=str(Path(__file__).resolve().parents[1]), port=port)
+    master = subprocess.Popen([sys.executable, "-c", script], stdout=log, stderr=log)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 15
+        while True:
+            try:
+                httpx.get(f"{url}/pid", timeout=1)
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline or master.poll() is not None:
+                    raise
+                time.sleep(0.1)
+
+        # 2 workers que se reciclan cada 5 requests: todas responden, con más de 2 pids
+        # (una conexión aceptada justo cuando su worker se recicla se cierra sin respuesta,
+        # como un keep-alive caducado: el cliente repite el GET)
+        pids, retries = set(), 0
+        for _ in range(30):
+            try:
+                r = httpx.get(f"{url}/pid", timeout=5)  # conexión nueva cada vez
+            except httpx.RemoteProtocolError:
+                retries += 1
+                r = httpx.get(f"{url}/pid", timeout=5)
+            pids.add(r.json()["pid"])
+        ok = len(pids) > 2 and master.pid not in pids and retries <= 3
+
+        # SIGTERM con una request en curso: termina con 200 y el maestro sale con 0
+        slow = {}
+        th = threading.Thread(target=lambda: slow.update(r=httpx.get(f"{url}/slow", timeout=10)))
+        th.start()
+        time.sleep(0.2)
+        master.send_signal(signal.SIGTERM)
+        th.join()
+        ok &= slow["r"].status_code == 200 and master.wait(timeout=15) == 0
+        print(f"[DEBUG] serve: {len(pids)} pids en 30 requests ({retries} repetidas), apagado -> {master.returncode}")
+    except Exception as exc:
+        log.seek(0)
+        print(f"[DEBUG] serve: {exc!r}\n{log.read().decode(errors='replace')[-2000:]}")
+        ok = False
+    finally:
+        if master.poll() is None:
+            master.kill()
+        log.close()
+    return ok
+
+
+def _walk(app):
+    while app is not None:
+        yield app
+        app = getattr(app, "app", None)
+
+
+def main():
+    rng = random.Random(20250815)
+    checks = {
+        "conversiones": check_conversions(),
+        "igual a Decimal": check_matches_decimal(rng),
+        "caso exacto": check_exact_when_representable(),
+        "promociones": check_promotions(),
+        "caché de tokens": check_token_cache(),
+        "revocaciones": check_revocation_set(),
+        "pool de BD": check_db_pool(),
+        "métricas": check_metrics(),
+        "migraciones": check_migrations(),
+        "BD en el arranque": check_lazy_database(),
+        "réplicas de lectura": check_replicas(),
+        "shards": check_sharding(),
+        "compresión": check_compression(),
+        "single-flight": check_singleflight(),
+        "trazas": check_tracing(),
+        "workers": check_serving(),
+    }
+    for name, ok in checks.items():
+        print(f"[DEBUG] {name} -> {'ok' if ok else 'FAIL'}")
+    ok = all(checks.values())
+    print("COMMON:", "PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
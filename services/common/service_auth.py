@@ -0,0 +1,112 @@
+# services/common/service_auth.py
+"""
+Dependencias de autenticación compartidas por catalog, cart y order.
+
+``ServiceAuth`` reúne la verificación del JWT (secreto HS256 o JWKS), la caché de
+tokens, la caché de usuarios y el conjunto de sesiones revocadas. Cada ``deps.py``
+crea una instancia con su modelo ``User`` y su fábrica de sesiones, y expone
+``get_current_user``/``require_admin`` como antes.
+"""
+from typing import Callable
+
+from fastapi import HTTPException, status
+from fastapi.security import HTTPBearer
+from jose import jwt, JWTError
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .auth import Principal, UserCache, UserState, principal_from_payload
+from .background import http_json
+from .jwks import JWKSCache
+from .revocation import RevocationSet, http_fetcher
+from .tokens import TokenCache
+
+auth_scheme = HTTPBearer()
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+
+class ServiceAuth:
+    def __init__(self, settings, user_model, session_factory: Callable[[], Session]):
+        self.settings = settings
+        self.user_model = user_model
+        # se llama en cada carga para que los self-tests puedan cambiar deps.SessionLocal
+        self.session_factory = session_factory
+
+        # JWT ya verificados (sha256 del token -> claims) hasta su exp
+        self.token_cache = TokenCache(max_entries=settings.AUTH_TOKEN_CACHE_MAX)
+        # RS256/ES256: claves públicas de auth_service (por kid), renovadas en segundo plano
+        self.jwks = (
+            None
+            if settings.JWT_ALG.startswith("HS")
+            else JWKSCache(
+                http_json(f"{settings.AUTH_SERVICE_URL}/.well-known/jwks.json"),
+                algorithms=[settings.JWT_ALG],
+                interval=settings.AUTH_JWKS_REFRESH_S,
+            )
+        )
+        # revocación (token_version) y flag admin, sin consultar la tabla en cada request
+        self.user_cache = UserCache(
+            self._load_user_state, ttl=settings.AUTH_USER_CACHE_TTL_S, max_entries=settings.AUTH_USER_CACHE_MAX
+        )
+        # sesiones cerradas (claim sid), sincronizadas desde auth_service en segundo plano
+        self.revocations = RevocationSet(
+            http_fetcher(f"{settings.AUTH_SERVICE_URL}/token/revocations"),
+            interval=settings.AUTH_REVOCATION_SYNC_S,
+        )
+
+    def _verify(self, token: str) -> dict:
+        if self.jwks is not None:
+            return self.jwks.verify(token)
+        return jwt.decode(token, self.settings.JWT_SECRET, algorithms=[self.settings.JWT_ALG])
+
+    def decode(self, token: str) -> dict:
+        try:
+            return self.token_cache.decode(token, self._verify)
+        except JWTError:
+            raise _unauthorized("Token inválido")
+
+    def _load_user_state(self, user_id: int) -> UserState | None:
+        User = self.user_model
+        with self.session_factory() as db:
+            row = db.execute(select(User.is_admin, User.token_version).where(User.id == user_id)).first()
+        return UserState(bool(row.is_admin), row.token_version or 0) if row else None
+
+    def principal(self, token: str) -> Principal:
+        return principal_from_payload(self.decode(token), self.user_cache, self.revocations.is_revoked)
+
+    def subject(self, authorization: str | None) -> int | None:
+        """``sub`` de un ``Bearer`` opcional, solo para enrutar lecturas (nunca para autorizar)."""
+        scheme, _, token = (authorization or "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        try:
+            return int(self.decode(token).get("sub"))
+        except (HTTPException, ValueError, TypeError):
+            return None
+
+    def db_user(self, token: str, db: Session):
+        payload = self.decode(token)
+        if self.revocations.is_revoked(payload.get("sid")):
+            raise _unauthorized("Token revocado")
+        try:
+            user_id = int(payload.get("sub"))
+        except (ValueError, TypeError):
+            raise _unauthorized("Token inválido")
+
+        user = db.get(self.user_model, user_id)
+        if not user:
+            raise _unauthorized("Usuario no encontrado")
+        if int(payload.get("ver", 0)) != (user.token_version or 0):
+            raise _unauthorized("Token revocado")
+        return user
+
+    def stats(self) -> dict:
+        return {
+            "token_cache": self.token_cache.stats(),
+            "user_cache": self.user_cache.stats(),
+            "revocations": self.revocations.stats(),
+            "jwks": self.jwks.stats() if self.jwks is not None else None,
+        }
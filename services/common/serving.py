@@ -0,0 +1,203 @@
+# services/common/serving.py
+"""
+Supervisor de workers uvicorn para producción (lo usa ``scripts/serve.py``).
+
+- Preload: las apps ya vienen importadas (``ServiceSpec.app``) y el maestro abre los
+  sockets antes de crear los workers con ``fork``. Un error de import falla una vez, en
+  el maestro, y los workers comparten en copy-on-write el código ya cargado. Engines,
+  pools y hilos se crean en el lifespan de cada worker, nunca se heredan del maestro.
+- Estado que debe ser común a los workers: los pins de lectura tras escribir
+  (``ServiceDatabase.share_pins``) pasan a memoria compartida antes del fork, para que
+  el ``GET /orders`` que sigue a un checkout lea del primario caiga en el worker que caiga.
+  El pool de bcrypt de auth es por worker: ``scripts/serve.py`` lo reparte entre ellos.
+- uvloop y httptools si están instalados; si no, asyncio y h11.
+- SIGTERM / SIGINT: el maestro lo reenvía a los workers. Cada uno deja de aceptar
+  conexiones, termina las requests en curso (un checkout a medias llega a su commit)
+  durante hasta ``graceful_timeout`` s y cierra su lifespan. Pasado ese plazo y un margen,
+  SIGKILL. Una segunda señal lo fuerza ya.
+- Reciclado: con ``max_requests`` cada worker sale tras ese número de requests (más un
+  jitter aleatorio, para que no salgan todos a la vez), igual que en un apagado ordenado,
+  y el maestro crea otro. Acota el crecimiento de memoria sin cortar ninguna request en
+  curso; una conexión que el worker acaba de aceptar y aún no ha enviado nada se cierra
+  como un keep-alive caducado, y el cliente repite (httpx y los navegadores lo hacen con
+  los GET).
+- Un worker que muere se repone; si un servicio encadena ``CRASH_LOOP`` muertes en su
+  primer segundo, el maestro lo para todo y sale con error.
+
+Solo POSIX (``os.fork``); en Windows ``scripts/serve.py`` usa los workers de uvicorn.
+"""
+import importlib.util
+import logging
+import os
+import random
+import signal
+import socket
+import time
+from dataclasses import dataclass
+
+import uvicorn
+
+logger = logging.getLogger("uvicorn.error")  # mismo formato que los logs de los workers
+
+CRASH_LOOP = 5
+KILL_MARGIN_S = 5
+
+
+@dataclass(slots=True)
+class ServiceSpec:
+    name: str
+    app: object        # app ASGI ya importada
+    settings: object   # su ServiceSettings (pool de BD por worker)
+    host: str
+    port: int
+    database: object | None = None  # su ServiceDatabase, si tiene BD
+
+
+def event_loop_impl() -> tuple[str, str]:
+    """(loop, http) que usarán los workers."""
+    loop = "uvloop" if importlib.util.find_spec("uvloop") is not None else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") is not None else "h11"
+    return loop, http
+
+
+class Supervisor:
+    def __init__(
+        self,
+        services: list[ServiceSpec],
+        workers: int,
+        max_requests: int = 0,
+        max_requests_jitter: int = 0,
+        graceful_timeout: float = 30.0,
+        access_log: bool = False,
+        log_level: str = "info",
+    ):
+        self.services = services
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.access_log = access_log
+        self.log_level = log_level
+        self.loop, self.http = event_loop_impl()
+        self.respawns = 0
+        self._workers: dict[int, tuple[ServiceSpec, float]] = {}  # pid -> (servicio, arranque)
+        self._sockets: dict[str, socket.socket] = {}
+        self._stopping = False
+
+    def _config(self, spec: ServiceSpec, max_requests: int | None = None) -> uvicorn.Config:
+        return uvicorn.Config(
+            spec.app, host=spec.host, port=spec.port, loop=self.loop, http=self.http, lifespan="on",
+            timeout_graceful_shutdown=self.graceful_timeout, limit_max_requests=max_requests,
+            access_log=self.access_log, log_level=self.log_level,
+        )
+
+    # --- maestro ---
+    def run(self) -> int:
+        if not hasattr(os, "fork"):
+            raise RuntimeError("Supervisor necesita os.fork (POSIX)")
+        for spec in self.services:
+            self._sockets[spec.name] = self._config(spec).bind_socket()
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        signal.signal(signal.SIGALRM, self._on_deadline)
+        for spec in self.services:
+            s = spec.settings
+            logger.info(
+                "%s: http://%s:%d, %d workers (%s + %s), hasta %d conexiones por BD (%d BDs)",
+                spec.name, spec.host, spec.port, self.workers, self.loop, self.http,
+                self.workers * (s.DB_POOL_SIZE + s.DB_MAX_OVERFLOW), 1 + len(s.replica_urls) + len(s.shard_urls),
+            )
+            hash_workers = getattr(s, "HASH_POOL_WORKERS", None)
+            if hash_workers is not None:
+                logger.info(
+                    "%s: bcrypt con %d procesos por worker (%d en total, %d cores)",
+                    spec.name, hash_workers, self.workers * hash_workers, os.cpu_count() or 1,
+                )
+            if spec.database is not None and self.workers > 1:
+                spec.database.share_pins()
+            for _ in range(self.workers):
+                self._spawn(spec)
+        try:
+            return self._supervise()
+        finally:
+            for sock in self._sockets.values():
+                sock.close()
+
+    def _supervise(self) -> int:
+        rc = 0
+        quick_deaths = {spec.name: 0 for spec in self.services}
+        while self._workers:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            spec, started = self._workers.pop(pid, (None, 0.0))
+            if spec is None or self._stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0 and time.monotonic() - started < 1.0:
+                quick_deaths[spec.name] += 1
+                if quick_deaths[spec.name] >= CRASH_LOOP:
+                    logger.error("%s: los workers mueren al arrancar (código %d); se para todo", spec.name, code)
+                    rc = 1
+                    self.stop()
+                    continue
+            else:
+                quick_deaths[spec.name] = 0
+            if code == 0:
+                logger.info("%s: worker %d reciclado", spec.name, pid)
+            else:
+                logger.warning("%s: worker %d terminó con código %d; se repone", spec.name, pid, code)
+            self.respawns += 1
+            self._spawn(spec)
+        return rc
+
+    def stop(self) -> None:
+        self._stopping = True
+        for pid in list(self._workers):
+            _kill(pid, signal.SIGTERM)
+        signal.alarm(int(self.graceful_timeout + KILL_MARGIN_S))
+
+    def _on_signal(self, sig, frame) -> None:
+        if self._stopping:
+            self._on_deadline(sig, frame)  # segunda señal: sin esperar
+            return
+        logger.info("Señal %s: terminando las requests en curso (hasta %.0f s)", signal.Signals(sig).name, self.graceful_timeout)
+        self.stop()
+
+    def _on_deadline(self, sig, frame) -> None:
+        for pid in list(self._workers):
+            _kill(pid, signal.SIGKILL)
+
+    # --- worker ---
+    def _spawn(self, spec: ServiceSpec) -> None:
+        if self._stopping:
+            return  # la señal llegó mientras se creaban los workers
+        max_requests = None
+        if self.max_requests:
+            max_requests = self.max_requests + random.randint(0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid:
+            self._workers[pid] = (spec, time.monotonic())
+            return
+        code = 1
+        try:
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGALRM):
+                signal.signal(sig, signal.SIG_DFL)  # uvicorn pone los suyos al servir
+            for name, sock in self._sockets.items():
+                if name != spec.name:
+                    sock.close()
+            server = uvicorn.Server(self._config(spec, max_requests))
+            server.run(sockets=[self._sockets[spec.name]])
+            code = 0 if server.started else 3  # 3: fallo en el arranque, como uvicorn
+        except BaseException:
+            logger.exception("%s: worker %d", spec.name, os.getpid())
+        finally:
+            os._exit(code)
+
+
+def _kill(pid: int, sig: int) -> None:
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
@@ -0,0 +1,121 @@
+# services/common/settings.py
+"""
+Configuración común de los servicios.
+
+Cada servicio define ``class Settings(ServiceSettings)`` (o ``ResourceServiceSettings``
+si valida tokens de auth_service) y añade solo lo suyo (puerto, promociones...).
+Se lee el ``.env`` de la raíz del repo y, encima, un ``.env`` local opcional.
+"""
+from pathlib import Path
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+ROOT_ENV = Path(__file__).resolve().parents[2] / ".env"  # .../Ecommerce/.env
+
+
+class ServiceSettings(BaseSettings):
+    DB_HOST: str = "127.0.0.1"
+    DB_PORT: int = 3306
+    DB_NAME: str = "ecommerce"
+    DB_USER: str = "ecom_user"
+    DB_PASS: str = "ecom_pass"
+    # URL de SQLAlchemy completa; si se da, sustituye a DB_HOST..DB_PASS
+    # (p.ej. sqlite:////tmp/ecommerce.db para benchmarks/loadtest.py)
+    DB_URL: str = ""
+
+    # Pool de conexiones (por proceso: con N workers de uvicorn se abren hasta
+    # N * (DB_POOL_SIZE + DB_MAX_OVERFLOW); ajústalo a max_connections de MySQL)
+    DB_POOL_SIZE: int = 20          # el threadpool de Starlette tiene 40 hilos
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT_S: float = 10.0  # espera máxima por una conexión antes de error
+    DB_POOL_RECYCLE_S: int = 1800    # < wait_timeout de MySQL (28800 por defecto)
+    # Comprobación de vida al sacar una conexión del pool:
+    #   idle   -> solo si lleva más de DB_POOL_PING_IDLE_S sin usarse (por defecto)
+    #   always -> en cada checkout (pool_pre_ping de SQLAlchemy: un round trip extra)
+    #   never  -> confiar en DB_POOL_RECYCLE_S
+    DB_POOL_PING: str = "idle"
+    DB_POOL_PING_IDLE_S: float = 30.0
+    DB_POOL_WAIT_WARN_MS: float = 50.0  # log de aviso si una request espera más por conexión
+    # true: los endpoints calientes usan AsyncSession (aiomysql) en el event loop en vez
+    # del threadpool; el resto sigue con la sesión síncrona
+    DB_ASYNC: bool = False
+    # Réplicas de lectura (URLs de SQLAlchemy separadas por comas; vacío = todo al primario).
+    # Solo las usan los endpoints de solo lectura (catálogo, historial de pedidos); con el
+    # mismo pool DB_POOL_* por réplica
+    DB_REPLICA_URLS: str = ""
+    DB_REPLICA_STICKY_S: float = 5.0  # tras escribir, el usuario lee del primario (> lag)
+    DB_REPLICA_RETRY_S: float = 30.0  # réplica sin conexión: fuera de la rotación este tiempo
+    # Shards de carritos y pedidos (URLs separadas por comas; vacío = todo en el primario).
+    # El usuario u va al shard u % N (common.sharding); esquema: migrate.py --shards
+    DB_SHARD_URLS: str = ""
+
+    # Compresión de respuestas (common.compression), por preferencia del servidor; br y
+    # zstd solo si están instalados brotli / zstandard (vacío = sin compresión)
+    COMPRESS_ENCODINGS: str = "br,zstd,gzip"
+    COMPRESS_MIN_BYTES: int = 1024  # por debajo no compensa la CPU ni las cabeceras
+    COMPRESS_GZIP_LEVEL: int = 5    # 1-9
+    COMPRESS_BR_QUALITY: int = 4    # 0-11; >5 es para estáticos, no para cada request
+    COMPRESS_ZSTD_LEVEL: int = 3    # 1-22
+    COMPRESS_CACHE_ENTRIES: int = 256  # cuerpos ya comprimidos, por contenido (0 = sin caché)
+
+    # Trazas (common.tracing): fracción de requests muestreadas sin traceparent de entrada
+    # (con él, manda su flag). Exportador: memory (GET /health/traces), file (JSON por span
+    # en TRACE_FILE) o vacío = sin trazas
+    TRACE_SAMPLE_RATE: float = 0.01
+    TRACE_EXPORT: str = "memory"
+    TRACE_FILE: str = "traces.jsonl"
+    TRACE_BUFFER_SPANS: int = 10_000  # memory: spans guardadas en total (las más recientes)
+    TRACE_MAX_SPANS: int = 256        # por traza; el resto se cuenta en dropped_spans
+
+    JWT_SECRET: str = "change_this_secret"
+    JWT_ALG: str = "HS256"  # HS256 (secreto compartido) o RS256/ES256 (auth firma; los demás usan JWKS)
+
+    AUTH_TOKEN_CACHE_MAX: int = 10000  # JWT verificados en memoria (0 = sin caché)
+    # sesiones revocadas: recarga cada N s (0 = no sincronizar)
+    AUTH_REVOCATION_SYNC_S: float = 10.0
+
+    model_config = SettingsConfigDict(
+        env_file=(str(ROOT_ENV), ".env"),  # el .env local (si existe) pisa al de la raíz
+        env_file_encoding="utf-8",
+        extra="ignore",
+        case_sensitive=False,
+    )
+
+    @property
+    def database_url(self) -> str:
+        if self.DB_URL:
+            return self.DB_URL
+        return (
+            f"mysql+pymysql://{self.DB_USER}:{self.DB_PASS}"
+            f"@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+        )
+
+    @property
+    def async_database_url(self) -> str:
+        return self.async_url(self.database_url)
+
+    @property
+    def replica_urls(self) -> list[str]:
+        return [u.strip() for u in self.DB_REPLICA_URLS.split(",") if u.strip()]
+
+    @property
+    def shard_urls(self) -> list[str]:
+        return [u.strip() for u in self.DB_SHARD_URLS.split(",") if u.strip()]
+
+    @staticmethod
+    def async_url(url: str) -> str:
+        scheme, rest = url.split("://", 1)
+        driver = {"mysql": "mysql+aiomysql", "sqlite": "sqlite+aiosqlite"}[scheme.split("+")[0]]
+        return f"{driver}://{rest}"
+
+
+class ResourceServiceSettings(ServiceSettings):
+    """Servicios que validan los JWT de auth_service (catalog, cart, order)."""
+
+    # Auth: principal verificado (claims del JWT) + caché TTL de usuarios para revocación
+    AUTH_VERIFIED_PRINCIPAL: bool = True
+    AUTH_USER_CACHE_TTL_S: float = 30.0
+    AUTH_USER_CACHE_MAX: int = 10000
+    # sesiones revocadas: GET {AUTH_SERVICE_URL}/token/revocations
+    AUTH_SERVICE_URL: str = "http://127.0.0.1:8001"
+    AUTH_JWKS_REFRESH_S: float = 300.0  # con JWT_ALG RS256/ES256: recarga de /.well-known/jwks.json
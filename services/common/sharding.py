@@ -0,0 +1,143 @@
+# services/common/sharding.py
+"""
+Carritos y pedidos repartidos por usuario entre varias BDs (``DB_SHARD_URLS``).
+
+- ``carts``, ``cart_items``, ``orders`` y ``order_items`` (``SHARDED_TABLES``) viven en el
+  shard ``user_id % N``; usuarios, catálogo, stock y promociones siguen en el primario.
+- La sesión de una request empieza sin shard: ``route(db, user_id)`` (o ``route_id`` con
+  un id de carrito/pedido) lo elige y ``common.db.RoutingSession`` manda allí las
+  sentencias de esas tablas y el resto al primario. Tocar una tabla repartida sin haber
+  elegido shard es un error, nunca una lectura silenciosa del primario.
+- Ids disjuntos: el shard k numera desde ``k * SHARD_ID_SPAN`` (``reserve_id_range``, lo
+  aplica ``scripts/migrate.py --shards``). Un id de pedido dice en qué shard está y los
+  listados que juntan shards no repiten ids.
+- ``scatter(db, fn)``: ``fn(sesión)`` en cada shard a la vez (listados de admin).
+- Sin transacción distribuida: quien escribe en el primario y en un shard confirma uno
+  tras otro y compensa si falla el segundo (checkout de order_service).
+
+El reparto es fijo (módulo N): cambiar el número de shards obliga a mover filas.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+SHARDED_TABLES = frozenset({"carts", "cart_items", "orders", "order_items"})
+SHARD_ID_SPAN = 1 << 40  # ids por shard y tabla; 8192 shards caben en los 2^53 de JSON
+
+T = TypeVar("T")
+
+
+class ShardNotRouted(RuntimeError):
+    pass
+
+
+class ShardSet:
+    """Engines de los shards (y sus contadores) de un proceso."""
+
+    def __init__(self, engines: list[Engine], async_engines: list[AsyncEngine] | None = None):
+        self.engines = engines
+        self.async_engines = async_engines or []
+        self.routed = [0] * len(engines)
+        self._pool = ThreadPoolExecutor(max_workers=len(engines), thread_name_prefix="shard")
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def index(self, user_id: int) -> int:
+        return int(user_id) % len(self.engines)
+
+    def index_of_id(self, row_id: int) -> int | None:
+        i = int(row_id) // SHARD_ID_SPAN
+        return i if 0 <= i < len(self.engines) else None
+
+    def engine(self, i: int, async_mode: bool = False) -> Engine:
+        return self.async_engines[i].sync_engine if async_mode else self.engines[i]
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+
+
+def touches_shard(mapper, clause) -> bool:
+    """La sentencia va contra una tabla repartida (entidad ORM, INSERT/UPDATE/DELETE o SELECT Core)."""
+    if mapper is not None:
+        return inspect(mapper).local_table.name in SHARDED_TABLES
+    table = getattr(clause, "table", None)
+    if table is not None:
+        return getattr(table, "name", None) in SHARDED_TABLES
+    froms = clause.get_final_froms() if hasattr(clause, "get_final_froms") else ()
+    return any(getattr(f, "name", None) in SHARDED_TABLES for f in froms)
+
+
+def is_sharded(db: Session) -> bool:
+    return "shards" in db.info
+
+
+def _use(db: Session, shards: ShardSet, i: int) -> None:
+    db.info["shard"] = shards.engine(i, db.info.get("shard_async", False))
+    shards.routed[i] += 1
+
+
+def route(db: Session, user_id: int) -> None:
+    """Las tablas repartidas de ``db`` van al shard de ``user_id`` (sin shards, nada)."""
+    shards = db.info.get("shards")
+    if shards is not None:
+        _use(db, shards, shards.index(user_id))
+
+
+def route_id(db: Session, row_id: int) -> bool:
+    """Shard del carrito/pedido ``row_id``; False si el id no cae en ningún shard."""
+    shards = db.info.get("shards")
+    if shards is None:
+        return True
+    i = shards.index_of_id(row_id)
+    if i is None:
+        return False
+    _use(db, shards, i)
+    return True
+
+
+def primary_session(db: Session) -> Session:
+    """Sesión aparte, solo contra el primario de ``db`` (su propia transacción)."""
+    return type(db)(bind=db.bind, autoflush=False)
+
+
+def scatter(db: Session, fn: Callable[[Session], T]) -> list[T]:
+    """
+    ``fn(sesión)`` en cada shard en paralelo, en orden de shard; sin shards, ``[fn(db)]``.
+    Solo desde endpoints síncronos: cada shard usa una sesión propia en otro hilo.
+    """
+    shards: ShardSet | None = db.info.get("shards")
+    if shards is None:
+        return [fn(db)]
+
+    def run(i: int) -> T:
+        with type(db)(bind=db.bind, autoflush=False, info={"shards": shards}) as s:
+            _use(s, shards, i)
+            return fn(s)
+
+    # cada hilo con una copia del contexto: sus spans y sentencias cuentan en la request
+    futures = [shards._pool.submit(contextvars.copy_context().run, run, i) for i in range(len(shards))]
+    return [f.result() for f in futures]
+
+
+def reserve_id_range(engine: Engine, index: int, tables=SHARDED_TABLES) -> None:
+    """Los ids nuevos del shard ``index`` salen de su rango (idempotente)."""
+    start = index * SHARD_ID_SPAN
+    if start == 0:
+        return
+    with engine.begin() as conn:
+        for table in sorted(tables):
+            if engine.dialect.name == "sqlite":
+                # requiere AUTOINCREMENT (sqlite_autoincrement en los modelos repartidos)
+                params = {"t": table, "s": start}
+                res = conn.execute(text("UPDATE sqlite_sequence SET seq = MAX(seq, :s) WHERE name = :t"), params)
+                if not res.rowcount:
+                    conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:t, :s)"), params)
+            else:
+                # MySQL lo sube a MAX(id) + 1 si ya hay filas por encima
+                conn.exec_driver_sql(f"ALTER TABLE {table} AUTO_INCREMENT = {start + 1}")
@@ -0,0 +1,227 @@
+# services/common/singleflight.py
+"""
+Lecturas calientes con single-flight y stale-while-revalidate.
+
+``CoalescingCache.get(key, load)`` (threadpool) y ``aget(key, aload)`` (event loop):
+
+- single-flight: si ya hay una carga de ``key`` en curso, las requests concurrentes la
+  esperan y comparten su resultado (o su excepción) en vez de lanzar la misma consulta;
+  cada una cuenta como "folded" en las métricas de la clave.
+- caché con dos plazos: hasta ``ttl`` la entrada es fresca; hasta ``ttl + stale`` se
+  sirve aunque esté caducada, y la primera request que la ve así la recarga mientras las
+  demás siguen recibiendo la copia vieja sin esperar. Si la recarga falla se sigue
+  sirviendo la copia vieja. Pasado ``stale`` es un fallo normal (con single-flight).
+
+Así una clave que caduca con cientos de requests encima genera una sola consulta y
+ninguna request espera por ella salvo la que la hace. Con ``ttl=0`` no se guarda nada,
+pero las cargas concurrentes siguen coalesciéndose.
+
+``invalidate`` borra las entradas y suelta las cargas en curso de esas claves: una
+carga que empezó antes no guarda su resultado (contador de generación) y las requests
+que llegan después lanzan otra en vez de esperar a la vieja.
+
+Las estadísticas por clave (cargas, folded, servidas viejas) se guardan para las últimas
+``max_keys`` claves usadas; ``metric_lines`` publica las de más folded.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class KeyStats:
+    __slots__ = ("loads", "folded", "stale")
+
+    def __init__(self):
+        self.loads = 0
+        self.folded = 0
+        self.stale = 0
+
+
+class _Flight:
+    """Carga en curso en el threadpool."""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: BaseException | None = None
+
+
+class CoalescingCache:
+    def __init__(self, name: str, ttl: float, stale: float, max_entries: int = 10_000, max_keys: int = 1_000):
+        self.name = name
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self.max_keys = max_keys
+        self.hits = 0
+        self.misses = 0
+        # key -> (valor, fresco hasta, servible hasta)
+        self._data: OrderedDict = OrderedDict()
+        self._flights: dict = {}
+        self._aflights: dict = {}
+        self._keys: OrderedDict = OrderedDict()
+        self._generation = 0  # sube con cada invalidate
+        self._lock = threading.Lock()
+
+    # --- entradas y estadísticas (con self._lock) ---
+    def _key_stats(self, key) -> KeyStats:
+        ks = self._keys.get(key)
+        if ks is None:
+            ks = self._keys[key] = KeyStats()
+            if len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        else:
+            self._keys.move_to_end(key)
+        return ks
+
+    def _lookup(self, key, now: float):
+        """-> (valor, fresco) o None si no hay nada servible."""
+        entry = self._data.get(key)
+        if entry is None or entry[2] <= now:
+            return None
+        self._data.move_to_end(key)
+        return entry[0], entry[1] > now
+
+    def _store(self, key, value, generation: int) -> None:
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                return  # hubo un invalidate durante la carga: puede ser anterior a la escritura
+            self._data[key] = (value, now + self.ttl, now + self.ttl + self.stale)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    # --- threadpool ---
+    def get(self, key, load: Callable[[], object]):
+        now = time.monotonic()
+        leader = False
+        with self._lock:
+            found = self._lookup(key, now)
+            if found is not None and found[1]:
+                self.hits += 1
+                return found[0]
+            ks = self._key_stats(key)
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                generation = self._generation
+                ks.loads += 1
+                self.misses += 1
+                leader = True
+            elif found is not None:
+                ks.stale += 1  # ya se está recargando: la copia vieja, sin esperar
+                self.hits += 1
+                return found[0]
+            else:
+                ks.folded += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = load()
+            self._store(key, flight.value, generation)
+        except BaseException as exc:
+            if found is None or not isinstance(exc, Exception):
+                flight.error = exc
+                raise
+            logger.warning("%s: recarga de %r falló, se sirve la copia anterior: %s", self.name, key, exc)
+            flight.value = found[0]
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+    # --- event loop ---
+    async def aget(self, key, aload: Callable[[], Awaitable]):
+        now = time.monotonic()
+        with self._lock:
+            found = self._lookup(key, now)
+            if found is not None and found[1]:
+                self.hits += 1
+                return found[0]
+            ks = self._key_stats(key)
+            task = self._aflights.get(key)
+            if task is None:
+                # una tarea propia: si la request que la lanzó se cancela, las demás siguen
+                # (``aload`` no debe usar recursos de esa request, como su sesión de BD)
+                task = self._aflights[key] = asyncio.ensure_future(self._aload(key, aload, found, self._generation))
+                ks.loads += 1
+                self.misses += 1
+            elif found is not None:
+                ks.stale += 1
+                self.hits += 1
+                return found[0]
+            else:
+                ks.folded += 1
+        return await asyncio.shield(task)
+
+    async def _aload(self, key, aload, found, generation: int):
+        try:
+            value = await aload()
+        except Exception as exc:
+            if found is None:
+                raise
+            logger.warning("%s: recarga de %r falló, se sirve la copia anterior: %s", self.name, key, exc)
+            return found[0]
+        finally:
+            with self._lock:
+                if self._aflights.get(key) is asyncio.current_task():
+                    del self._aflights[key]
+        self._store(key, value, generation)
+        return value
+
+    def invalidate(self, match: Callable[[object], bool] | None = None) -> None:
+        """Borra todo, o las claves para las que ``match(key)`` es True, y suelta sus cargas en curso."""
+        with self._lock:
+            self._generation += 1
+            for table in (self._data, self._flights, self._aflights):
+                for key in [k for k in table if match is None or match(k)]:
+                    del table[key]
+
+    def stats(self, top: int = 10) -> dict:
+        with self._lock:
+            keys = sorted(self._keys.items(), key=lambda kv: kv[1].folded, reverse=True)[:top]
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "in_flight": len(self._flights) + len(self._aflights),
+                "folded": sum(ks.folded for ks in self._keys.values()),
+                "top_folded": [
+                    {"key": str(k), "loads": ks.loads, "folded": ks.folded, "stale": ks.stale} for k, ks in keys
+                ],
+            }
+
+    def metric_lines(self, top: int = 20) -> list[str]:
+        """Series Prometheus: totales y, por clave, las ``top`` con más requests coalescidas."""
+        st = self.stats(top)
+        name = f'cache="{self.name}"'
+        out = [
+            "# TYPE coalescing_cache_hits_total counter",
+            f"coalescing_cache_hits_total{{{name}}} {st['hits']}",
+            "# TYPE coalescing_cache_loads_total counter",
+            f"coalescing_cache_loads_total{{{name}}} {st['misses']}",
+            "# TYPE coalescing_cache_folded_total counter",
+            f"coalescing_cache_folded_total{{{name}}} {st['folded']}",
+            "# TYPE coalescing_cache_key_folded_total counter",
+        ]
+        for k in st["top_folded"]:
+            key = k["key"].replace("\\", "\\\\").replace('"', '\\"')
+            out.append(f'coalescing_cache_key_folded_total{{{name},key="{key}"}} {k["folded"]}')
+        return out
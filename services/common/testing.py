@@ -0,0 +1,210 @@
+# services/common/testing.py
+"""
+Utilidades para los ``run_selftest.py`` de los servicios.
+
+``selftest_db`` crea la BD de prueba: SQLite en memoria (modo síncrono) o, con
+DB_ASYNC=true, un fichero temporal compartido entre el engine síncrono (seed y
+comprobaciones) y un engine aiosqlite para los endpoints async.
+
+``QueryCounter`` cuenta las sentencias SQL de un bloque (normalmente una request) para
+comprobar presupuestos por endpoint: ``GET /cart`` <= 2, checkout sin depender del nº
+de líneas... Con SELFTEST_SQL_DEBUG=1 imprime además las sentencias con la misma forma
+repetidas dentro del bloque (el síntoma de un N+1).
+
+``conforms`` comprueba que un JSON armado a mano (``common.fastjson``) es exactamente lo
+que habría dado el ``response_model``.
+
+``selftest_shard_env`` y ``create_shard_schema``: la variante SELFTEST_SHARDS=N, con el
+primario y N shards en ficheros SQLite temporales (``common.sharding``).
+
+``capture_sql``: con SELFTEST_CAPTURE_SQL=fichero, cada forma de sentencia de cada
+endpoint que ejercita el self-test se apunta en ese JSONL (``scripts/explain_audit.py``).
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from .sharding import SHARDED_TABLES, reserve_id_range
+
+
+def selftest_db(Base, async_mode: bool = False):
+    """-> (engine, SessionLocal, AsyncSessionLocal | None), con las tablas creadas."""
+    if async_mode:
+        path = Path(tempfile.mkdtemp()) / "selftest.db"
+        engine = create_engine(f"sqlite+pysqlite:///{path}", connect_args={"check_same_thread": False})
+        async_factory = async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{path}"), autoflush=False)
+    else:
+        # SQLite en memoria COMPARTIDA entre conexiones
+        engine = create_engine(
+            "sqlite+pysqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        async_factory = None
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True), async_factory
+
+
+def selftest_shard_env(n: int) -> dict[str, str]:
+    """Variables de entorno (antes de importar la app) para un primario y ``n`` shards SQLite."""
+    folder = Path(tempfile.mkdtemp())
+    return {
+        "DB_URL": f"sqlite:///{folder}/primario.db",
+        "DB_SHARD_URLS": ",".join(f"sqlite:///{folder}/shard{i}.db" for i in range(n)),
+        "DB_ASYNC": "false",
+    }
+
+
+def create_shard_schema(database, Base) -> None:
+    """Todas las tablas en el primario; en cada shard, las repartidas y su rango de ids."""
+    Base.metadata.create_all(bind=database.engine)
+    tables = [t for t in Base.metadata.sorted_tables if t.name in SHARDED_TABLES]
+    for i, engine in enumerate(database.shards.engines):
+        Base.metadata.create_all(bind=engine, tables=tables)
+        reserve_id_range(engine, i, [t.name for t in tables])
+
+
+def conforms(schema, payload) -> bool:
+    """``payload`` valida contra ``schema`` y Pydantic lo volvería a serializar idéntico."""
+    adapter = TypeAdapter(schema)
+    return adapter.dump_python(adapter.validate_python(payload), mode="json") == payload
+
+
+def async_db_override(factory: async_sessionmaker):
+    """Dependencia que sustituye a ``get_async_db`` en los self-tests."""
+    async def override():
+        async with factory() as db:
+            yield db
+    return override
+
+
+def _sync_engine(bind):
+    """Engine síncrono detrás de un engine, AsyncEngine o (async_)sessionmaker."""
+    if isinstance(bind, (sessionmaker, async_sessionmaker)):
+        bind = bind.kw["bind"]
+    return bind.sync_engine if isinstance(bind, AsyncEngine) else bind
+
+
+def statement_shape(sql: str) -> str:
+    """Forma de la sentencia: sin espacios sobrantes y con las listas IN colapsadas."""
+    sql = " ".join(sql.split())
+    return re.sub(r"\((\?|%s)(?:, (?:\?|%s))+\)", r"(\1...)", sql)
+
+
+class QueryCounter:
+    """
+    Cuenta las sentencias ejecutadas en los engines dados mientras está activo::
+
+        with QueryCounter(TestingSessionLocal, AsyncTestingSession) as q:
+            client.get("/cart")
+        ok &= q.within("GET /cart", 2)
+    """
+
+    debug = os.getenv("SELFTEST_SQL_DEBUG", "").lower() in ("1", "true", "yes")
+
+    def __init__(self, *binds):
+        self.engines = [_sync_engine(b) for b in binds if b is not None]
+        self.statements: list[str] = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self) -> "QueryCounter":
+        self.statements = []
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._record)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def duplicates(self) -> dict[str, int]:
+        """Formas de sentencia que se repiten en el bloque -> nº de veces."""
+        shapes = Counter(statement_shape(s) for s in self.statements)
+        return {shape: n for shape, n in shapes.items() if n > 1}
+
+    def within(self, label: str, budget: int) -> bool:
+        """True si el bloque no pasó de ``budget`` sentencias; lo imprime en el log del self-test."""
+        ok = self.count <= budget
+        print(f"[DEBUG] SQL {label} -> {self.count}/{budget}{'' if ok else ' EXCEDIDO'}")
+        if self.debug or not ok:
+            for shape, n in self.duplicates().items():
+                print(f"[DEBUG]   x{n} {shape[:160]}")
+            if not ok:
+                for sql in self.statements:
+                    print(f"[DEBUG]   {statement_shape(sql)[:160]}")
+        return ok
+
+
+_capture_scope: ContextVar[dict | None] = ContextVar("capture_scope", default=None)
+
+
+class _CaptureScope:
+    """ASGI: deja el scope de la request a mano de las sentencias que ejecute."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _capture_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _capture_scope.reset(token)
+
+
+def capture_sql(app, service: str) -> None:
+    """
+    Con SELFTEST_CAPTURE_SQL=fichero, añade a ese JSONL una línea por (endpoint, forma de
+    sentencia) ejecutada dentro de una request, con unos parámetros reales para poder
+    hacer EXPLAIN. Las del seed y las comprobaciones (fuera de requests) no cuentan.
+    Llamarla antes de crear el TestClient; sin la variable, no hace nada.
+    """
+    path = os.getenv("SELFTEST_CAPTURE_SQL")
+    if not path:
+        return
+    app.add_middleware(_CaptureScope)
+    seen: set[tuple[str, str]] = set()
+    lock = threading.Lock()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        scope = _capture_scope.get()
+        if scope is None:
+            return
+        route = scope.get("route")  # lo pone el router de FastAPI al resolver el endpoint
+        endpoint = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+        key = (endpoint, statement_shape(statement))
+        if executemany and parameters:
+            parameters = parameters[0]
+        line = json.dumps(
+            {"service": service, "endpoint": endpoint, "dialect": conn.dialect.name,
+             "statement": statement, "parameters": parameters},
+            default=str, ensure_ascii=False,
+        )
+        with lock:
+            if key in seen:
+                return
+            seen.add(key)
+            with open(path, "a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+
+    event.listen(Engine, "before_cursor_execute", record)
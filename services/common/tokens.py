@@ -0,0 +1,70 @@
+# services/common/tokens.py
+"""
+Caché de JWT ya verificados.
+
+Un cliente manda el mismo token cientos de veces; verificarlo cada vez (base64,
+JSON, HMAC/firma) es trabajo repetido. Se guarda ``sha256(token) -> claims`` en una
+LRU acotada y cada entrada caduca en el ``exp`` del propio token (o antes, tras
+``max_ttl``), así un token caducado nunca se sirve desde la caché. Los fallos de
+verificación no se cachean.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+# tiempo máximo en caché (también para tokens sin "exp")
+DEFAULT_MAX_TTL_S = 300.0
+
+
+class TokenCache:
+    def __init__(self, max_entries: int = 10_000, max_ttl: float = DEFAULT_MAX_TTL_S):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[bytes, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def decode(self, token: str, verify: Callable[[str], dict]) -> dict:
+        """
+        Claims del token; ``verify`` (que lanza si el token no es válido) solo se
+        llama en un fallo de caché. Los claims devueltos se comparten: no mutarlos.
+        """
+        if self.max_entries <= 0:
+            return verify(token)
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._data[key]
+            self.misses += 1
+
+        claims = verify(token)
+        exp = claims.get("exp")
+        expires = min(float(exp), now + self.max_ttl) if isinstance(exp, (int, float)) else now + self.max_ttl
+        with self._lock:
+            self._data[key] = (claims, expires)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return claims
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
@@ -0,0 +1,372 @@
+# services/common/tracing.py
+"""
+Trazas distribuidas ligeras entre servicios, sin colector externo.
+
+- ``TracingMiddleware`` (ASGI puro) abre un span raíz por request. Si llega una cabecera
+  W3C ``traceparent`` continúa esa traza y respeta su decisión de muestreo; si no, empieza
+  una y la muestrea con probabilidad TRACE_SAMPLE_RATE. Las respuestas muestreadas llevan
+  ``traceresponse`` con el id de la traza, para buscarla después.
+- ``span(nombre)`` / ``@traced()``: spans hijos (dependencias, helpers de precios...).
+  El span actual vive en un ContextVar, así que llega al threadpool y a ``run_sync``.
+- ``instrument_engine``: un span por sentencia SQL (``before/after_cursor_execute``), y
+  la espera por una conexión del pool agotado (``common.db``) como span propio.
+- ``traceparent()``: cabecera para las llamadas salientes (BFF -> servicios).
+
+Al cerrarse la raíz, la traza entera va al exportador: ``memory`` (las últimas
+TRACE_BUFFER_SPANS spans, en ``GET /health/traces``) o ``file`` (un JSON por span en
+TRACE_FILE, una escritura por traza).
+
+Coste acotado: sin muestrear, una request paga un par de ids aleatorios y unos
+``ContextVar.get``; los spans hijos de una request no muestreada no se crean. Muestreada,
+cada traza guarda como mucho TRACE_MAX_SPANS spans (el resto se cuenta en ``dropped``).
+Números en ``benchmarks/bench_tracing.py``.
+"""
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from weakref import WeakSet
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+_current: ContextVar["Span | None"] = ContextVar("trace_span", default=None)
+_instrumented: WeakSet = WeakSet()
+
+
+def parse_traceparent(value: str | None) -> tuple[str, str, bool] | None:
+    """``00-<trace_id>-<parent_id>-<flags>`` -> (trace_id, parent_id, muestreada), o None si no vale."""
+    if not value:
+        return None
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    if version == "ff" or (version == "00" and len(parts) != 4):
+        return None
+    try:
+        if int(trace_id, 16) == 0 or int(parent_id, 16) == 0:
+            return None
+        sampled = bool(int(flags, 16) & 1)
+        int(version, 16)
+    except ValueError:
+        return None
+    return trace_id, parent_id, sampled
+
+
+def _span_id() -> str:
+    return f"{random.getrandbits(64) or 1:016x}"
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attrs", "error", "trace")
+
+    def __init__(self, trace_id: str, parent_id: str | None, name: str, trace: "_Trace | None", attrs: dict | None = None):
+        self.trace_id = trace_id
+        self.span_id = _span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.attrs = attrs
+        self.error: str | None = None
+        self.trace = trace  # None: no muestreada (solo se propaga el contexto)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.trace is not None else '00'}"
+
+
+class _Trace:
+    """Spans de una traza muestreada en este proceso, hasta que se cierra su raíz."""
+
+    __slots__ = ("tracer", "wall0", "perf0", "spans", "dropped")
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self.wall0 = time.time()
+        self.perf0 = time.perf_counter()
+        self.spans: list[Span] = []
+        self.dropped = 0
+
+    def child(self, parent: Span, name: str, attrs: dict | None = None) -> Span | None:
+        if len(self.spans) >= self.tracer.max_spans:
+            self.dropped += 1
+            return None
+        s = Span(parent.trace_id, parent.span_id, name, self, attrs)
+        self.spans.append(s)
+        return s
+
+    def export(self, service: str) -> list[dict]:
+        return [
+            {
+                "trace_id": s.trace_id,
+                "span_id": s.span_id,
+                "parent_id": s.parent_id,
+                "service": service,
+                "name": s.name,
+                "start": round(self.wall0 + (s.start - self.perf0), 6),
+                "duration_ms": round(((s.end or s.start) - s.start) * 1000, 3),
+                "attrs": s.attrs,
+                "error": s.error,
+            }
+            for s in self.spans
+        ]
+
+
+# --- spans hijos ---
+@contextmanager
+def span(name: str, **attrs):
+    parent = _current.get()
+    child = parent.trace.child(parent, name, attrs or None) if parent is not None and parent.trace is not None else None
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.error = _error_name(exc)
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current.reset(token)
+
+
+def traced(name: str | None = None):
+    """Decorador: la función, en un span hijo (solo si la request está muestreada)."""
+
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            parent = _current.get()
+            if parent is None or parent.trace is None:
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_span(name: str, start: float, end: float, **attrs) -> None:
+    """Span ya terminado (``perf_counter``), p. ej. la espera por el pool."""
+    parent = _current.get()
+    if parent is not None and parent.trace is not None:
+        s = parent.trace.child(parent, name, attrs or None)
+        if s is not None:
+            s.start, s.end = start, end
+
+
+def traceparent() -> str | None:
+    """Cabecera ``traceparent`` para una llamada saliente desde el span actual."""
+    current = _current.get()
+    return current.traceparent if current is not None else None
+
+
+def _error_name(exc: BaseException) -> str:
+    status = getattr(exc, "status_code", None)
+    return f"{type(exc).__name__} {status}" if status else type(exc).__name__
+
+
+# --- SQL ---
+def instrument_engine(engine: Engine | AsyncEngine) -> None:
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+    if sync_engine in _instrumented:
+        return
+    _instrumented.add(sync_engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if parent is not None and parent.trace is not None:
+            attrs = {"db.statement": statement[:300]}
+            if executemany:
+                attrs["db.rows"] = len(parameters)
+            conn.info["trace_span"] = parent.trace.child(parent, f"sql {statement.split(None, 1)[0].upper()}", attrs)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _end(conn, cursor, statement, parameters, context, executemany):
+        s = conn.info.pop("trace_span", None)
+        if s is not None:
+            s.end = time.perf_counter()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(ctx):
+        s = ctx.connection.info.pop("trace_span", None) if ctx.connection is not None else None
+        if s is not None:
+            s.end = time.perf_counter()
+            s.error = type(ctx.original_exception).__name__
+
+
+def instrument_database(database) -> None:
+    """Engines de un ``common.db.ServiceDatabase`` ya arrancado (primario, async, réplicas, shards)."""
+    engines = [database.engine, database.async_engine]
+    if database.replicas is not None:
+        engines += [*database.replicas.engines, *database.replicas.async_engines]
+    if database.shards is not None:
+        engines += [*database.shards.engines, *database.shards.async_engines]
+    for engine in engines:
+        if engine is not None:
+            instrument_engine(engine)
+
+
+# --- exportadores ---
+class MemoryExporter:
+    """Últimas trazas en memoria, hasta ``max_spans`` spans en total."""
+
+    def __init__(self, max_spans: int = 10_000):
+        self.max_spans = max_spans
+        self._traces: deque = deque()
+        self._spans = 0
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[dict]) -> None:
+        with self._lock:
+            self._traces.append(spans)
+            self._spans += len(spans)
+            while self._spans > self.max_spans and len(self._traces) > 1:
+                self._spans -= len(self._traces.popleft())
+
+    def recent(self, limit: int = 20, min_ms: float = 0.0) -> list[list[dict]]:
+        """Las más recientes primero; ``min_ms``: solo las que tardaron al menos eso."""
+        with self._lock:
+            traces = list(self._traces)
+        out = []
+        for spans in reversed(traces):
+            if spans[0]["duration_ms"] >= min_ms:
+                out.append(spans)
+                if len(out) >= limit:
+                    break
+        return out
+
+
+class FileExporter:
+    """Un JSON por span, añadido a ``path`` (una escritura por traza)."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[dict]) -> None:
+        data = b"".join(orjson.dumps(s) + b"\n" for s in spans)
+        with self._lock, self.path.open("ab") as fh:
+            fh.write(data)
+
+    def recent(self, limit: int = 20, min_ms: float = 0.0) -> list[list[dict]]:
+        return []  # se leen del fichero
+
+
+def make_exporter(settings) -> MemoryExporter | FileExporter | None:
+    kind = settings.TRACE_EXPORT.strip().lower()
+    if kind == "memory":
+        return MemoryExporter(settings.TRACE_BUFFER_SPANS)
+    if kind == "file":
+        return FileExporter(settings.TRACE_FILE)
+    if kind:
+        raise ValueError(f"TRACE_EXPORT desconocido: {settings.TRACE_EXPORT!r} (memory, file o vacío)")
+    return None
+
+
+# --- raíz por request ---
+class Tracer:
+    def __init__(self, service: str, settings, exporter=None):
+        self.service = service
+        self.sample_rate = settings.TRACE_SAMPLE_RATE
+        self.max_spans = settings.TRACE_MAX_SPANS
+        self.exporter = exporter if exporter is not None else make_exporter(settings)
+        self.requests = 0
+        self.sampled = 0
+        self.dropped_spans = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start(self, name: str, header: str | None = None) -> Span:
+        self.requests += 1
+        parent = parse_traceparent(header)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = f"{random.getrandbits(128) or 1:032x}", None
+            sampled = random.random() < self.sample_rate
+        trace = _Trace(self) if sampled else None
+        root = Span(trace_id, parent_id, name, trace)
+        if trace is not None:
+            trace.spans.append(root)
+        return root
+
+    def finish(self, root: Span, **attrs) -> None:
+        root.end = time.perf_counter()
+        trace = root.trace
+        if trace is None:
+            return
+        root.attrs = {**(root.attrs or {}), **attrs}
+        if trace.dropped:
+            root.attrs["dropped_spans"] = trace.dropped
+            self.dropped_spans += trace.dropped
+        self.sampled += 1
+        self.exporter.export(trace.export(self.service))
+
+    def stats(self) -> dict:
+        return {
+            "service": self.service,
+            "export": type(self.exporter).__name__ if self.exporter is not None else None,
+            "sample_rate": self.sample_rate,
+            "requests": self.requests,
+            "sampled": self.sampled,
+            "dropped_spans": self.dropped_spans,
+        }
+
+    def recent(self, limit: int = 20, min_ms: float = 0.0) -> list[list[dict]]:
+        return self.exporter.recent(limit, min_ms) if self.exporter is not None else []
+
+
+class TracingMiddleware:
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        header = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                header = value.decode("latin-1")
+                break
+        root = self.tracer.start(f"{scope['method']} {scope['path']}", header)
+        status = 500
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if root.trace is not None:
+                    headers = [*message.get("headers", ()), (b"traceresponse", root.traceparent.encode())]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current.set(root)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as exc:
+            root.error = _error_name(exc)
+            raise
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                root.name = f"{scope['method']} {route.path}"  # plantilla, no la URL
+            self.tracer.finish(root, status=status)
@@ -1,35 +1,67 @@
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import HTTPAuthorizationCredentials
 from fastapi import Depends, HTTPException, status
-from jose import jwt, JWTError
 from sqlalchemy.orm import Session
-from .database import SessionLocal
+
+from common.auth import Principal
+from common.service_auth import ServiceAuth, auth_scheme
+from common.tracing import span
+
+from .database import AsyncSessionLocal, SessionLocal, database
 from .config import settings
 from .models import User
 
-auth_scheme = HTTPBearer()
-
 def get_db():
-    db = SessionLocal()
+    with span("get_db"):
+        db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-def get_current_user(
+async def get_async_db():
+    # solo con DB_ASYNC=true
+    with span("get_db", mode="async"):
+        session = AsyncSessionLocal()
+    async with session as db:
+        yield db
+
+# verificación del JWT + cachés de tokens/usuarios + sesiones revocadas (common.service_auth)
+auth = ServiceAuth(settings, User, lambda: SessionLocal())
+token_cache, user_cache, revocations, jwks = auth.token_cache, auth.user_cache, auth.revocations, auth.jwks
+
+def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)) -> Principal:
+    with span("get_current_user", mode="principal"):
+        return auth.principal(credentials.credentials)
+
+def get_current_db_user(
     credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
     db: Session = Depends(get_db),
 ) -> User:
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALG])
-        user_id = int(payload.get("sub"))
-    except (JWTError, ValueError, TypeError):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido")
-    user = db.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Usuario no encontrado")
-    return user
+    with span("get_current_user", mode="db_user"):
+        return auth.db_user(credentials.credentials, db)
 
-def require_admin(user: User = Depends(get_current_user)) -> User:
-    # si más adelante guardas is_admin en este servicio, puedes validarlo aquí
+# AUTH_VERIFIED_PRINCIPAL=true (por defecto): claims del JWT + caché; false: fila User de la BD
+get_current_user = get_current_principal if settings.AUTH_VERIFIED_PRINCIPAL else get_current_db_user
+
+def require_admin(user: Principal | User = Depends(get_current_user)) -> Principal | User:
+    if not bool(getattr(user, "is_admin", False)):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo administradores")
     return user
+
+# --- réplicas de lectura (DB_REPLICA_URLS) ---
+# Historial de pedidos: réplica, salvo si el usuario escribió hace < DB_REPLICA_STICKY_S
+def get_read_db(user: Principal | User = Depends(get_current_user)):
+    with span("get_read_db"):
+        db = database.read_session(user.id)
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(user: Principal | User = Depends(get_current_user)):
+    async with database.async_read_session(user.id) as db:
+        yield db
+
+def pin_to_primary(user: Principal | User = Depends(get_current_user)) -> None:
+    # read-your-writes: quien escribe lee del primario durante DB_REPLICA_STICKY_S
+    database.pin(user.id)
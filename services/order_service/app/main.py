@@ -1,15 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+import heapq
+import itertools
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from datetime import datetime
+
+from fastapi import FastAPI, Depends, HTTPException, Response, status, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import select, desc
-from decimal import Decimal
+from sqlalchemy import desc, insert, select
+
+from common.compression import CompressionMiddleware
+from common.fastjson import FastJSONResponse
+from common.metrics import CONTENT_TYPE, Metrics, MetricsMiddleware
+from common.pricing import from_bp, from_cents, price_basket, rate_to_bp, to_cents
+from common.promotions import LineIn, PromotionStore
+from common.sharding import is_sharded, primary_session, route, route_id, scatter
+from common.tracing import Tracer, TracingMiddleware, instrument_database, traced
 
-from .database import Base, engine
-from .models import Cart, CartItem, Product, Order, OrderItem, User
-from .schemas import OrderOut, OrderItemOut, UpdateStatusIn
-from .deps import get_db, get_current_user, require_admin
+from .database import database
+from .models import Cart, CartItem, Product, Order, OrderItem, Promotion, User
+from .schemas import OrderOut, UpdateStatusIn
+from .deps import (
+    get_async_db, get_async_read_db, get_db, get_read_db, get_current_user, pin_to_primary, require_admin, auth,
+)
 from .config import settings
+from .stock import reserve_stock, release_stock
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # engines al arrancar y no al importar; el esquema lo aplica scripts/migrate.py
+    database.start()
+    metrics.instrument_database(database)
+    instrument_database(database)  # un span por sentencia SQL
+    yield
+    await database.dispose()
 
-app = FastAPI(title="Order Service")
+app = FastAPI(title="Order Service", lifespan=lifespan)
 from fastapi.middleware.cors import CORSMiddleware
 
 # incluye AMBOS orígenes: localhost y 127.0.0.1 (Vite suele usar localhost)
@@ -26,14 +51,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-Base.metadata.create_all(bind=engine)
+# compresión negociada (gzip, y br/zstd si están instalados) de las respuestas grandes
+app.add_middleware(CompressionMiddleware, settings=settings)
+
+# métricas Prometheus: latencia por ruta, sentencias SQL por request y pool (GET /metrics)
+metrics = Metrics()
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# trazas distribuidas (traceparent W3C, muestreadas): GET /health/traces
+tracer = Tracer('order', settings)
+app.add_middleware(TracingMiddleware, tracer=tracer)
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # async: el scrape no espera turno en el threadpool aunque esté saturado
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health/db")
+def db_pool_stats():
+    return database.pool_status()
+
+@app.get("/health/traces")
+def recent_traces(limit: int = 20, min_ms: float = 0.0):
+    # últimas trazas muestreadas (TRACE_EXPORT=memory); min_ms: solo las más lentas
+    return {"stats": tracer.stats(), "traces": tracer.recent(limit, min_ms)}
+
+@app.get("/health/auth")
+def auth_cache_stats():
+    return auth.stats()
+
 # ---------- Helpers ----------
+# Mismas reglas de promoción que el carrito (recarga en caliente desde la BD)
+promotions = PromotionStore(Promotion, check_interval=settings.PROMO_RELOAD_S)
+
 def _get_active_cart(db: Session, user: User) -> Cart | None:
+    route(db, user.id)  # DB_SHARD_URLS: carrito y pedidos del usuario en su shard
     return (
         db.execute(
             select(Cart)
@@ -43,64 +99,106 @@ def _get_active_cart(db: Session, user: User) -> Cart | None:
         .unique().scalars().first()
     )
 
+@contextmanager
+def _stock_change(db: Session, apply, undo, lines: list[tuple[int, int]]):
+    """
+    ``apply(db, lines)`` sobre el stock y, dentro del bloque, el commit del pedido.
+
+    Sin shards todo va en la misma transacción. Con shards el stock (primario) y el pedido
+    (shard) están en BDs distintas: el stock se confirma primero en su propia transacción
+    y, si el bloque falla, ``undo`` lo devuelve. Nunca queda un pedido sin su stock; si el
+    proceso muere entre los dos commits se pierde stock, no se sobrevende.
+    """
+    if not is_sharded(db):
+        apply(db, lines)
+        yield
+        return
+    with primary_session(db) as stock_db:
+        apply(stock_db, lines)
+        stock_db.commit()
+    try:
+        yield
+    except BaseException:
+        db.rollback()
+        with primary_session(db) as stock_db:
+            undo(stock_db, lines)
+            stock_db.commit()
+        raise
+
+@traced()
 def _create_order_from_cart(db: Session, user: User) -> Order:
     cart = _get_active_cart(db, user)
     if not cart or not cart.items:
         raise HTTPException(status_code=400, detail="Carrito vacío")
 
-    total_net = Decimal("0.00")
-    total_vat = Decimal("0.00")
+    # descuenta stock antes de crear el pedido (409 si algún producto no alcanza)
+    with _stock_change(db, reserve_stock, release_stock, [(it.product_id, it.quantity) for it in cart.items]):
+        order = _write_order(db, user, cart)
+    db.refresh(order)
+    return order
+
+def _write_order(db: Session, user: User, cart: Cart) -> Order:
+    items = list(cart.items)
+    lines = [
+        LineIn(it.product_id, it.product.category_id if it.product else None, to_cents(it.unit_price), it.quantity)
+        for it in items
+    ]
+    vat_bps = [rate_to_bp(it.product.vat_rate if it.product else None) for it in items]
+    discounts, _ = promotions.index(db).apply(lines, cart.coupon_code)
+    priced = price_basket(
+        ((ln.price_cents, ln.quantity, bp) for ln, bp in zip(lines, vat_bps)),
+        discounts=discounts,
+    )
 
-    order = Order(user_id=user.id, status="created", total=Decimal("0.00"))
+    order = Order(user_id=user.id, status="created", total=from_cents(priced.total_gross))
     db.add(order)
     db.flush()  # tener order.id
 
-    for it in cart.items:
-        vat_rate = Decimal(it.product.vat_rate if it.product and it.product.vat_rate is not None else "19.00")
-        unit_price = Decimal(it.unit_price)
-        qty = Decimal(it.quantity)
-        total_net += unit_price * qty
-        total_vat += (unit_price * (vat_rate/Decimal("100"))) * qty
-
-        oi = OrderItem(
+    # una sola sentencia para todas las líneas (executemany, sin RETURNING por fila);
+    # el refresh tras el commit carga order.items
+    db.execute(insert(OrderItem), [
+        dict(
             order_id=order.id,
             product_id=it.product_id,
-            quantity=int(qty),
-            unit_price=unit_price,
-            vat_rate=vat_rate
+            quantity=it.quantity,
+            unit_price=it.unit_price,
+            vat_rate=from_bp(bp),
+            discount=from_cents(line.discount),
         )
-        db.add(oi)
-
-    order.total = total_net + total_vat
+        for it, bp, line in zip(items, vat_bps, priced.lines)
+    ])
 
     # marcar carrito como convertido
     cart.status = "converted"
     db.commit()
-    db.refresh(order)
     return order
 
-def _order_to_out(db: Session, order: Order) -> OrderOut:
-    # anexar nombre de producto para comodidad
-    items_out = []
-    for oi in order.items:
-        items_out.append(OrderItemOut(
-            id=oi.id,
-            product_id=oi.product_id,
-            quantity=oi.quantity,
-            unit_price=oi.unit_price,
-            vat_rate=oi.vat_rate,
-            product_name=oi.product.name if oi.product else None
-        ))
-    return OrderOut(id=order.id, user_id=order.user_id, total=order.total, status=order.status, items=items_out)
+def _order_payload(order: Order) -> dict:
+    # forma de OrderOut, directo a FastJSONResponse (sin revalidar); anexa el nombre de producto
+    items = [
+        {
+            "id": oi.id,
+            "product_id": oi.product_id,
+            "quantity": oi.quantity,
+            "unit_price": oi.unit_price,
+            "vat_rate": oi.vat_rate,
+            "discount": oi.discount,
+            "product_name": oi.product.name if oi.product else None,
+        }
+        for oi in order.items
+    ]
+    return {"id": order.id, "user_id": order.user_id, "total": order.total, "status": order.status, "items": items}
+
+def _order_lines(order: Order) -> list[tuple[int, int]]:
+    return [(oi.product_id, oi.quantity) for oi in order.items]
 
 # ---------- Endpoints ----------
-@app.post("/orders/checkout", response_model=OrderOut, status_code=201)
-def checkout(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+def _checkout(db: Session, user: User) -> FastJSONResponse:
     order = _create_order_from_cart(db, user)
-    return _order_to_out(db, order)
+    return FastJSONResponse(_order_payload(order), status_code=201)
 
-@app.get("/orders", response_model=list[OrderOut])
-def my_orders(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+def _my_orders(db: Session, user: User) -> FastJSONResponse:
+    route(db, user.id)
     rows = (
         db.execute(
             select(Order)
@@ -109,43 +207,79 @@ def my_orders(db: Session = Depends(get_db), user: User = Depends(get_current_us
         )
         .unique().scalars().all()
     )
-    return [_order_to_out(db, o) for o in rows]
+    return FastJSONResponse([_order_payload(o) for o in rows])
+
+# Historial (GET /orders, /orders/{id}) por get_read_db: réplica si DB_REPLICA_URLS, salvo
+# para quien acaba de hacer checkout (pin_to_primary: read-your-writes)
+# DB_ASYNC=true: mismo código vía AsyncSession.run_sync, sin ocupar el threadpool
+if settings.DB_ASYNC:
+    @app.post("/orders/checkout", response_model=OrderOut, status_code=201, dependencies=[Depends(pin_to_primary)])
+    async def checkout(db: AsyncSession = Depends(get_async_db), user: User = Depends(get_current_user)):
+        return await db.run_sync(_checkout, user)
+
+    @app.get("/orders", response_model=list[OrderOut])
+    async def my_orders(db: AsyncSession = Depends(get_async_read_db), user: User = Depends(get_current_user)):
+        return await db.run_sync(_my_orders, user)
+else:
+    @app.post("/orders/checkout", response_model=OrderOut, status_code=201, dependencies=[Depends(pin_to_primary)])
+    def checkout(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+        return _checkout(db, user)
+
+    @app.get("/orders", response_model=list[OrderOut])
+    def my_orders(db: Session = Depends(get_read_db), user: User = Depends(get_current_user)):
+        return _my_orders(db, user)
 
 @app.get("/orders/{order_id}", response_model=OrderOut)
-def get_order(order_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    order = db.get(Order, order_id)
+def get_order(order_id: int, db: Session = Depends(get_read_db), user: User = Depends(get_current_user)):
+    # el id dice en qué shard está: el de otro usuario sigue dando 403, no 404
+    order = db.get(Order, order_id) if route_id(db, order_id) else None
     if not order:
         raise HTTPException(status_code=404, detail="Pedido no encontrado")
     if order.user_id != user.id:
         # permitir luego a admin; por ahora restringimos al dueño
         raise HTTPException(status_code=403, detail="No autorizado")
-    return _order_to_out(db, order)
+    return FastJSONResponse(_order_payload(order))
 
-# ---- Endpoints admin (si quieres permitirlos, protege con require_admin) ----
+# ---- Endpoints admin: todos los pedidos y cambios de estado (mueven stock) ----
 @app.get("/admin/orders", response_model=list[OrderOut])
 def list_all_orders(
     status_filter: str | None = Query(None, description="created|paid|shipped|delivered|cancelled"),
+    limit: int | None = Query(None, ge=1, description="solo los N más recientes"),
     db: Session = Depends(get_db),
-    _admin: User = Depends(get_current_user)  # cambia a require_admin cuando tengas flag
+    _admin: User = Depends(require_admin)
 ):
-    stmt = select(Order).order_by(desc(Order.id))
+    stmt = select(Order).order_by(desc(Order.id)).limit(limit)
     if status_filter:
         stmt = stmt.where(Order.status == status_filter)
-    rows = db.execute(stmt).unique().scalars().all()
-    return [_order_to_out(db, o) for o in rows]
 
-@app.put("/admin/orders/{order_id}/status", response_model=OrderOut)
-def update_status(order_id: int, payload: UpdateStatusIn, db: Session = Depends(get_db), _admin: User = Depends(get_current_user)):
+    def fetch(s: Session) -> list[tuple]:
+        return [(o.created_at or datetime.min, o.id, _order_payload(o)) for o in s.execute(stmt).unique().scalars()]
+
+    # con shards, la consulta va a todos a la vez y se mezclan sus listas por fecha: dentro
+    # de un shard el id crece con created_at, así que cada lista ya viene en ese orden
+    merged = heapq.merge(*scatter(db, fetch), key=lambda row: row[:2], reverse=True)
+    return FastJSONResponse([payload for _, _, payload in itertools.islice(merged, limit)])
+
+@app.put("/admin/orders/{order_id}/status", response_model=OrderOut, dependencies=[Depends(pin_to_primary)])
+def update_status(order_id: int, payload: UpdateStatusIn, db: Session = Depends(get_db), _admin: User = Depends(require_admin)):
     allowed = {"created", "paid", "shipped", "delivered", "cancelled"}
     if payload.status not in allowed:
         raise HTTPException(status_code=400, detail=f"status inválido ({allowed})")
-    order = db.get(Order, order_id)
+    order = db.get(Order, order_id) if route_id(db, order_id) else None
     if not order:
         raise HTTPException(status_code=404, detail="Pedido no encontrado")
-    order.status = payload.status
-    db.commit()
+    # cancelar devuelve el stock; reactivar un pedido cancelado lo vuelve a reservar
+    stock = nullcontext()
+    if payload.status == "cancelled" and order.status != "cancelled":
+        stock = _stock_change(db, release_stock, reserve_stock, _order_lines(order))
+    elif order.status == "cancelled" and payload.status != "cancelled":
+        stock = _stock_change(db, reserve_stock, release_stock, _order_lines(order))
+    with stock:
+        order.status = payload.status
+        db.commit()
+    database.pin(order.user_id)  # el dueño ve el nuevo estado aunque su réplica vaya atrasada
     db.refresh(order)
-    return _order_to_out(db, order)
+    return FastJSONResponse(_order_payload(order))
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,28 +1,46 @@
-from sqlalchemy import Column, Integer, String, Text, Numeric, TIMESTAMP, ForeignKey, text
+from sqlalchemy import Column, Integer, String, Text, Numeric, DateTime, TIMESTAMP, ForeignKey, Index, UniqueConstraint, text, func
 from sqlalchemy.orm import relationship
 from .database import Base
 
+# carts, cart_items, orders y order_items pueden vivir en el shard del usuario
+# (DB_SHARD_URLS). AUTOINCREMENT en SQLite para poder reservar el rango de ids de cada
+# shard (common.sharding.reserve_id_range)
+_sharded = {"sqlite_autoincrement": True}
+# índices con los nombres de scripts/05_indexes.sql; uq_cart_product como en 01_schema.sql
+
 # ----- Reutilizamos tablas ya existentes -----
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, autoincrement=True)
+    is_admin = Column(Integer, nullable=False, server_default=text("0"))
+    token_version = Column(Integer, nullable=False, server_default=text("0"))  # +1 revoca sus JWT
 
 class Product(Base):
     __tablename__ = "products"
     id = Column(Integer, primary_key=True, autoincrement=True)
+    category_id = Column(Integer, nullable=True)
     name = Column(String(200), nullable=False)
     price = Column(Numeric(10, 2), nullable=False)
     vat_rate = Column(Numeric(5, 2), nullable=False, server_default=text("19.00"))
+    stock = Column(Integer, nullable=False, server_default=text("0"))
+    # la copia columnar del catálogo se pone al día por updated_at: reservar o devolver
+    # stock lo mueve también donde no hay ON UPDATE de MySQL (SQLite)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (Index("ix_products_category", "category_id", "id"),)
 
 class Cart(Base):
     __tablename__ = "carts"
+    __table_args__ = (Index("ix_carts_user_status", "user_id", "status"), _sharded)
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     status = Column(String(20), nullable=False, server_default=text("'active'"))
+    coupon_code = Column(String(50))
     items = relationship("CartItem", back_populates="cart", cascade="all, delete-orphan", lazy="selectin")
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    __table_args__ = (UniqueConstraint("cart_id", "product_id", name="uq_cart_product"), _sharded)
     id = Column(Integer, primary_key=True, autoincrement=True)
     cart_id = Column(Integer, ForeignKey("carts.id", ondelete="CASCADE"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
@@ -32,9 +50,27 @@ class CartItem(Base):
     cart = relationship("Cart", back_populates="items", lazy="selectin")
     product = relationship("Product", lazy="selectin")
 
+# ----- Promociones (solo lectura aquí) -----
+class Promotion(Base):
+    __tablename__ = "promotions"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(200), nullable=False)
+    kind = Column(String(20), nullable=False)                                  # percent | bundle
+    scope = Column(String(20), nullable=False, server_default=text("'cart'"))  # product | category | cart
+    target_id = Column(Integer)                                                # product_id / category_id
+    coupon_code = Column(String(50), index=True)                               # NULL = automática
+    percent = Column(Numeric(5, 2))                                            # kind=percent
+    buy_qty = Column(Integer)                                                  # kind=bundle: 3x2 -> 3
+    pay_qty = Column(Integer)                                                  #              3x2 -> 2
+    active = Column(Integer, nullable=False, server_default=text("1"))
+    starts_at = Column(DateTime)
+    ends_at = Column(DateTime)
+    updated_at = Column(TIMESTAMP, server_default=text("CURRENT_TIMESTAMP"), onupdate=func.now())
+
 # ----- Pedidos -----
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (Index("ix_orders_user", "user_id"), Index("ix_orders_status_id", "status", "id"), _sharded)
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     total = Column(Numeric(12, 2), nullable=False, server_default=text("0"))
@@ -45,12 +81,14 @@ class Order(Base):
 
 class OrderItem(Base):
     __tablename__ = "order_items"
+    __table_args__ = (Index("ix_order_items_order", "order_id"), _sharded)
     id = Column(Integer, primary_key=True, autoincrement=True)
     order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Numeric(10, 2), nullable=False)
     vat_rate = Column(Numeric(5, 2), nullable=False, server_default=text("19.00"))
+    discount = Column(Numeric(12, 2), nullable=False, server_default=text("0"))
 
     order = relationship("Order", back_populates="items")
     product = relationship("Product", lazy="selectin")
@@ -8,6 +8,7 @@ class OrderItemOut(BaseModel):
     quantity: int
     unit_price: Decimal
     vat_rate: Decimal
+    discount: Decimal = Decimal("0.00")
     product_name: Optional[str] = None
     class Config:
         from_attributes = True
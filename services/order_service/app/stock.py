@@ -0,0 +1,160 @@
+# services/order_service/app/stock.py
+"""
+Reserva de stock para el checkout.
+
+Cada producto se descuenta con un UPDATE condicional de una sola sentencia
+(``stock = stock - :qty WHERE id = :pid AND stock >= :qty``) en lugar de
+SELECT ... FOR UPDATE, así el bloqueo de la fila dura lo mínimo. Las líneas de un
+pedido se agrupan por producto y se envían en un único executemany ordenado por id:
+dos checkouts concurrentes bloquean filas siempre en el mismo orden (sin deadlocks).
+Ambas sentencias fijan ``updated_at`` (``onupdate`` del modelo), que es por donde la
+copia columnar del catálogo se entera de los cambios de stock.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+from common.tracing import traced
+
+from .config import settings
+from .models import Product
+
+_products = Product.__table__
+
+_reserve_stmt = (
+    update(_products)
+    .where(_products.c.id == bindparam("pid"), _products.c.stock >= bindparam("qty"))
+    .values(stock=_products.c.stock - bindparam("qty"))
+)
+
+_release_stmt = (
+    update(_products)
+    .where(_products.c.id == bindparam("pid"))
+    .values(stock=_products.c.stock + bindparam("qty"))
+)
+
+
+class HotSkuCounter:
+    """
+    Contador en memoria del stock conocido de los SKUs calientes.
+
+    Solo recuerda productos cuyo stock se ha observado (al rechazar un checkout) y lo
+    va descontando con cada reserva confirmada. Si el stock conocido no alcanza, el
+    checkout se rechaza sin llegar a la BD. Las entradas caducan tras ``ttl`` segundos
+    para tolerar reposiciones hechas desde otros procesos (p.ej. el catálogo).
+    """
+
+    def __init__(self, ttl: float = 5.0, max_entries: int = 10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.rejected = 0
+        self._known: OrderedDict[int, tuple[int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, product_id: int, stock: int) -> None:
+        with self._lock:
+            self._known[product_id] = (max(0, stock), time.monotonic() + self.ttl)
+            self._known.move_to_end(product_id)
+            while len(self._known) > self.max_entries:
+                self._known.popitem(last=False)
+
+    def doomed(self, lines: list[tuple[int, int]]) -> list[int]:
+        """Productos cuyo stock conocido (y vigente) no cubre la cantidad pedida."""
+        now = time.monotonic()
+        out = []
+        with self._lock:
+            for pid, qty in lines:
+                entry = self._known.get(pid)
+                if entry is None:
+                    continue
+                stock, expires = entry
+                if expires < now:
+                    del self._known[pid]
+                elif stock < qty:
+                    out.append(pid)
+            if out:
+                self.rejected += 1
+        return out
+
+    def consume(self, lines: list[tuple[int, int]]) -> None:
+        with self._lock:
+            for pid, qty in lines:
+                entry = self._known.get(pid)
+                if entry is not None:
+                    self._known[pid] = (max(0, entry[0] - qty), entry[1])
+
+    def forget(self, lines: list[tuple[int, int]]) -> None:
+        with self._lock:
+            for pid, _ in lines:
+                self._known.pop(pid, None)
+
+
+hot_skus = (
+    HotSkuCounter(ttl=settings.STOCK_HOT_SKU_TTL_S, max_entries=settings.STOCK_HOT_SKU_MAX)
+    if settings.STOCK_HOT_SKU_CACHE
+    else None
+)
+
+
+def group_lines(lines: Iterable[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Suma cantidades por producto y ordena por id (orden de bloqueo estable)."""
+    acc: dict[int, int] = {}
+    for pid, qty in lines:
+        acc[pid] = acc.get(pid, 0) + int(qty)
+    return sorted((pid, qty) for pid, qty in acc.items() if qty > 0)
+
+
+def _insufficient(product_ids: list[int]) -> HTTPException:
+    ids = ", ".join(str(pid) for pid in sorted(product_ids))
+    return HTTPException(status_code=409, detail=f"Stock insuficiente (productos: {ids})")
+
+
+def _short_products(db: Session, lines: list[tuple[int, int]], counter: HotSkuCounter | None) -> list[int]:
+    ids = [pid for pid, _ in lines]
+    current = dict(db.execute(select(_products.c.id, _products.c.stock).where(_products.c.id.in_(ids))).all())
+    short = []
+    for pid, qty in lines:
+        stock = current.get(pid, 0)
+        if counter is not None:
+            counter.observe(pid, stock)
+        if stock < qty:
+            short.append(pid)
+    return short or ids
+
+
+@traced()
+def reserve_stock(db: Session, lines: Iterable[tuple[int, int]], counter: HotSkuCounter | None = hot_skus) -> None:
+    """
+    Descuenta stock para las líneas ``(product_id, quantity)`` dentro de la transacción
+    actual. Si algún producto no alcanza, revierte la transacción y responde 409.
+    """
+    grouped = group_lines(lines)
+    if not grouped:
+        return
+    if counter is not None:
+        doomed = counter.doomed(grouped)
+        if doomed:
+            raise _insufficient(doomed)
+
+    res = db.execute(_reserve_stmt, [{"pid": pid, "qty": qty} for pid, qty in grouped])
+    if res.rowcount != len(grouped):
+        db.rollback()
+        raise _insufficient(_short_products(db, grouped, counter))
+    if counter is not None:
+        counter.consume(grouped)
+
+
+@traced()
+def release_stock(db: Session, lines: Iterable[tuple[int, int]], counter: HotSkuCounter | None = hot_skus) -> None:
+    """Devuelve al stock las líneas de un pedido (p.ej. al cancelarlo)."""
+    grouped = group_lines(lines)
+    if not grouped:
+        return
+    db.execute(_release_stmt, [{"pid": pid, "qty": qty} for pid, qty in grouped])
+    if counter is not None:
+        counter.forget(grouped)
@@ -1,16 +1,35 @@
 # services/order_service/run_selftest.py
+import importlib
+import os
 import sys
+from datetime import datetime
 from decimal import Decimal
+from types import SimpleNamespace
 from typing import Any, Dict
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+
+if os.getenv("SELFTEST_SHARDS"):
+    # antes de importar la app: settings y modelos leen DB_SHARD_URLS al importarse
+    importlib.import_module("app")  # hace importable common (sin tapar el ``app`` de FastAPI)
+    from common.testing import selftest_shard_env
+    os.environ.update(selftest_shard_env(int(os.environ["SELFTEST_SHARDS"])))
 
 from app.main import app
 from app.database import Base
-from app.deps import get_db, get_current_user
+from app.config import settings
+from app.deps import get_async_db, get_async_read_db, get_db, get_read_db, get_current_user
 from app.models import User, Product, Cart, CartItem  # importa SOLO lo que existe aquí
+from app.schemas import OrderOut
+from common.testing import QueryCounter, async_db_override, capture_sql, conforms, selftest_db
+from common.tracing import instrument_engine
+
+capture_sql(app, "order")
+
+# sentencias SQL máximas por request (con el índice de promociones ya cargado)
+CHECKOUT_BUDGET = 10
+ORDERS_BUDGET = 3
+# updated_at sembrado en el pasado: reservar o devolver stock tiene que moverlo
+OLD_UPDATE = datetime(2000, 1, 1)
 
 # ---------- utilidades ----------
 def _coerce_default(col) -> Any:
@@ -52,14 +71,11 @@ def debug_counts(Session):
 
 # ---------- main ----------
 def main():
-    # SQLite en memoria COMPARTIDA entre conexiones
-    engine = create_engine(
-        "sqlite+pysqlite:///:memory:",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
-    TestingSessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
-    Base.metadata.create_all(bind=engine)
+    # SQLite en memoria (o fichero compartido con aiosqlite si DB_ASYNC=true)
+    engine, TestingSessionLocal, AsyncTestingSession = selftest_db(Base, settings.DB_ASYNC)
+    if AsyncTestingSession is not None:
+        app.dependency_overrides[get_async_db] = async_db_override(AsyncTestingSession)
+        app.dependency_overrides[get_async_read_db] = app.dependency_overrides[get_async_db]
 
     def override_get_db():
         db = TestingSessionLocal()
@@ -68,24 +84,30 @@ def main():
         finally:
             db.close()
 
+    current = {}
+
     def override_get_current_user():
-        db = TestingSessionLocal()
-        try:
-            u = db.query(User).first()
-            if not u:
-                u = make_instance(
-                    User,
-                    email="test@local",
-                    hashed_password="x",
-                    full_name="Tester",
-                    is_admin=0,
-                )
-                db.add(u); db.commit(); db.refresh(u)
-            return u
-        finally:
-            db.close()
+        # se carga una vez, como con la caché de usuarios: no cuenta en los presupuestos SQL
+        if "user" not in current:
+            db = TestingSessionLocal()
+            try:
+                u = db.query(User).first()
+                if not u:
+                    u = make_instance(
+                        User,
+                        email="test@local",
+                        hashed_password="x",
+                        full_name="Tester",
+                        is_admin=0,
+                    )
+                    db.add(u); db.commit(); db.refresh(u)
+                current["user"] = u
+            finally:
+                db.close()
+        return current["user"]
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db  # réplicas: ver common/run_selftest.py
     app.dependency_overrides[get_current_user] = override_get_current_user
     client = TestClient(app)
 
@@ -109,6 +131,7 @@ def main():
                 stock=100,
                 size="M",
                 image_url=None,
+                updated_at=OLD_UPDATE,
             )
             db.add(p); db.commit(); db.refresh(p)
 
@@ -145,6 +168,7 @@ def main():
     ok = True
     ok &= isinstance(order.get("items"), list) and len(order["items"]) >= 1
     ok &= total > 0.0  # con esto evitamos depender de un valor exacto
+    ok &= conforms(OrderOut, order)  # FastJSONResponse = lo que daría response_model
     if not ok:
         print("PEDIDOS: FAIL tras checkout (items/total inválidos)")
         sys.exit(1)
@@ -158,12 +182,203 @@ def main():
 
     lst = r2.json()
     has_order = any(o.get("id") == order.get("id") for o in lst if isinstance(o, dict))
-    if not has_order:
+    if not has_order or not conforms(list[OrderOut], lst):
         print("PEDIDOS: FAIL no aparece el pedido en /orders/me", lst)
         sys.exit(1)
 
+    # ---- stock: checkout descuenta, cancelar devuelve, sin sobreventa ----
+    def product_stock():
+        db = TestingSessionLocal()
+        try:
+            return db.query(Product).first().stock
+        finally:
+            db.close()
+
+    def stock_touched() -> bool:
+        # updated_at avanza (la copia del catálogo se pone al día por él) y vuelve al pasado
+        db = TestingSessionLocal()
+        try:
+            p = db.query(Product).first()
+            touched = p.updated_at.replace(tzinfo=None) > OLD_UPDATE
+            p.updated_at = OLD_UPDATE
+            db.commit()
+            return touched
+        finally:
+            db.close()
+
+    stock_after = product_stock()
+    print(f"[DEBUG] stock tras checkout -> {stock_after}")
+    if stock_after != 98 or not stock_touched():
+        print("PEDIDOS: FAIL el checkout no descontó stock (o no movió updated_at)", stock_after)
+        sys.exit(1)
+
+    # endpoints admin: un usuario normal no ve pedidos ajenos ni mueve stock
+    r_forbidden = client.put(f"/admin/orders/{order['id']}/status", json={"status": "cancelled"})
+    if r_forbidden.status_code != 403 or client.get("/admin/orders").status_code != 403 or product_stock() != 98:
+        print("PEDIDOS: FAIL /admin/orders sin ser admin", r_forbidden.status_code, product_stock())
+        sys.exit(1)
+    current["user"].is_admin = 1
+    r3 = client.put(f"/admin/orders/{order['id']}/status", json={"status": "cancelled"})
+    if r3.status_code != 200 or product_stock() != 100 or not stock_touched():
+        print("PEDIDOS: FAIL cancelar no devolvió stock (o no movió updated_at)", r3.status_code, product_stock())
+        sys.exit(1)
+    cancelled = client.get("/admin/orders", params={"status_filter": "cancelled", "limit": 5}).json()
+    if [o["id"] for o in cancelled] != [order["id"]]:
+        print("PEDIDOS: FAIL /admin/orders por estado", cancelled)
+        sys.exit(1)
+    current["user"].is_admin = 0
+
+    db = TestingSessionLocal()
+    try:
+        u = db.query(User).first()
+        p = db.query(Product).first()
+        c = make_instance(Cart, user_id=u.id, status="active")
+        db.add(c); db.commit(); db.refresh(c)
+        db.add(make_instance(CartItem, cart_id=c.id, product_id=p.id, quantity=101, unit_price=p.price))
+        db.commit()
+    finally:
+        db.close()
+
+    r4 = client.post("/orders/checkout")
+    print(f"[DEBUG] checkout sin stock -> {r4.status_code}")
+    if r4.status_code != 409 or product_stock() != 100:
+        print("PEDIDOS: FAIL se permitió sobreventa", r4.status_code, r4.text)
+        sys.exit(1)
+
+    # ---- presupuestos SQL: checkout y listado no dependen del nº de líneas/pedidos ----
+    def cart_with_lines(n: int) -> None:
+        db = TestingSessionLocal()
+        try:
+            u = db.query(User).first()
+            db.query(Cart).filter(Cart.status == "active").update({"status": "abandoned"})
+            c = make_instance(Cart, user_id=u.id, status="active")
+            db.add(c); db.flush()
+            for i in range(n):
+                p = make_instance(Product, name=f"Extra {n}-{i}", price=Decimal("1000.00"), vat_rate=Decimal("19.00"), stock=10)
+                db.add(p); db.flush()
+                db.add(make_instance(CartItem, cart_id=c.id, product_id=p.id, quantity=1, unit_price=p.price))
+            db.commit()
+        finally:
+            db.close()
+
+    sql = {}
+    for n in (1, 5):
+        cart_with_lines(n)
+        with QueryCounter(TestingSessionLocal, AsyncTestingSession) as q:
+            rc = client.post("/orders/checkout")
+        sql[f"checkout {n}"] = (rc.status_code == 201 and q.within(f"POST /orders/checkout, {n} línea(s)", CHECKOUT_BUDGET), q.count)
+    with QueryCounter(TestingSessionLocal, AsyncTestingSession) as q:
+        rl = client.get("/orders")
+    sql["listado"] = (rl.status_code == 200 and len(rl.json()) >= 3 and q.within(f"GET /orders, {len(rl.json())} pedidos", ORDERS_BUDGET), q.count)
+    same = sql["checkout 1"][1] == sql["checkout 5"][1]
+    if not (same and all(ok for ok, _ in sql.values())):
+        print("PEDIDOS: FAIL presupuesto SQL", sql)
+        sys.exit(1)
+
+    # ---- trazas: checkout con traceparent muestreado -> helpers, stock y SQL en un árbol ----
+    instrument_engine(AsyncTestingSession.kw["bind"] if AsyncTestingSession is not None else engine)
+    cart_with_lines(2)
+    tp = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    rc = client.post("/orders/checkout", headers={"traceparent": tp})
+    spans = client.get("/health/traces", params={"limit": 1}).json()["traces"][0]
+    names = [s["name"] for s in spans]
+    print(f"[DEBUG] traza del checkout -> {len(spans)} spans, {sorted(set(names))}")
+    traced_ok = rc.status_code == 201 and names[0] == "POST /orders/checkout"
+    traced_ok &= {"_create_order_from_cart", "reserve_stock", "sql INSERT"} <= set(names)
+    traced_ok &= all(s["trace_id"] == "0af7651916cd43dd8448eb211c80319c" for s in spans)
+    if not traced_ok:
+        print("PEDIDOS: FAIL trazas del checkout", names)
+        sys.exit(1)
+
     print("PEDIDOS: PASS")
     sys.exit(0)
 
+def shards_main():
+    """SELFTEST_SHARDS=N: carritos y pedidos en el shard user_id % N; stock en el primario."""
+    from sqlalchemy import select, text, update
+    from common.sharding import SHARD_ID_SPAN, route
+    from common.testing import create_shard_schema
+    from app.database import database
+    from app.models import Order
+
+    n = len(settings.shard_urls)
+    current = {}
+    app.dependency_overrides[get_current_user] = lambda: current["user"]
+
+    def act_as(uid: int) -> None:
+        current["user"] = SimpleNamespace(id=uid, is_admin=1)
+
+    def fill_cart(uid: int, qty: int) -> None:
+        with database.SessionLocal() as db:
+            route(db, uid)
+            c = Cart(user_id=uid, status="active")
+            db.add(c); db.flush()
+            db.add(CartItem(cart_id=c.id, product_id=pid, quantity=qty, unit_price=Decimal("39000.00")))
+            db.commit()
+
+    def stock() -> int:
+        with database.SessionLocal() as db:
+            return db.get(Product, pid).stock
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        create_shard_schema(database, Base)
+        with database.SessionLocal() as db:
+            users = [User() for _ in range(4)]
+            p = Product(name="Camiseta", price=Decimal("39000.00"), vat_rate=Decimal("19.00"), stock=100)
+            db.add_all([*users, p]); db.commit()
+            uids, pid = [u.id for u in users], p.id
+
+        # checkout: pedido en el shard del usuario, stock descontado en el primario
+        ok, orders = True, {}
+        for uid in uids:
+            fill_cart(uid, uid)
+            act_as(uid)
+            r = client.post("/orders/checkout")
+            ok &= r.status_code == 201 and r.json()["id"] // SHARD_ID_SPAN == uid % n
+            orders[uid] = r.json()["id"]
+            mine = client.get("/orders").json()
+            ok &= [o["id"] for o in mine] == [orders[uid]] and mine[0]["items"][0]["product_name"] == "Camiseta"
+        ok &= stock() == 100 - sum(uids)
+        act_as(uids[0])
+        ok &= client.get(f"/orders/{orders[uids[0]]}").status_code == 200
+        ok &= client.get(f"/orders/{orders[uids[1]]}").status_code == 403  # de otro usuario, en otro shard
+        print(f"[DEBUG] checkout en shards -> {'ok' if ok else 'FAIL'}, pedidos {sorted(orders.values())}")
+
+        # misma fecha en todos (los checkouts pueden cruzar un segundo): desempata el id
+        for uid in uids:
+            with database.SessionLocal() as db:
+                route(db, uid)
+                db.execute(update(Order).where(Order.id == orders[uid]).values(created_at=datetime(2026, 1, 1)))
+                db.commit()
+
+        # admin: todos los shards a la vez, por fecha y luego id; limit corta la mezcla
+        listed = client.get("/admin/orders").json()
+        ok &= sorted(o["id"] for o in listed) == sorted(orders.values())
+        ok &= [o["id"] for o in listed] == sorted(orders.values(), reverse=True)  # misma fecha: por id
+        ok &= [o["id"] for o in client.get("/admin/orders", params={"limit": 2}).json()] == [o["id"] for o in listed[:2]]
+        last = uids[-1]
+        r = client.put(f"/admin/orders/{orders[last]}/status", json={"status": "cancelled"})
+        ok &= r.status_code == 200 and stock() == 100 - sum(uids) + last
+        ok &= [o["id"] for o in client.get("/admin/orders", params={"status_filter": "cancelled"}).json()] == [orders[last]]
+        ok &= client.put(f"/admin/orders/{5 * SHARD_ID_SPAN}/status", json={"status": "paid"}).status_code == 404
+        print(f"[DEBUG] admin en shards -> {'ok' if ok else 'FAIL'}")
+
+        # el commit del shard falla: el stock ya confirmado en el primario se devuelve
+        before = stock()
+        fill_cart(uids[0], 3)
+        with database.shards.engines[uids[0] % n].begin() as conn:
+            conn.execute(text("DROP TABLE order_items"))
+        act_as(uids[0])
+        r = client.post("/orders/checkout")
+        ok &= r.status_code == 500 and stock() == before
+        with database.SessionLocal() as db:
+            route(db, uids[0])
+            ok &= db.execute(select(Cart.id).where(Cart.status == "active")).first() is not None
+            ok &= len(db.execute(select(Order.id).where(Order.user_id == uids[0])).all()) == 1
+        print(f"[DEBUG] compensación -> {r.status_code}, stock {before} -> {stock()}")
+
+    print("PEDIDOS (shards):", "PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
 if __name__ == "__main__":
-    main()
+    shards_main() if settings.shard_urls else main()